@@ -0,0 +1,395 @@
+"""批量计算接口 - 不经过LLM，直接调用计算器
+
+面向程序化调用的REST接口：
+- POST /api/bulk/emission-factors  排放因子曲线（车型×污染物×年份×季节×道路类型）或任意点插值
+- POST /api/bulk/micro             逐秒轨迹 → 逐秒排放
+- POST /api/bulk/macro             路段数据 → 逐路段排放
+
+请求体为JSON；micro/macro 也可用 multipart/form-data 上传文件（file 字段），
+其余参数以JSON字符串放在 params 字段。结果按 ?format=jsonl（默认）或 csv 流式返回，
+计算耗时通过 Server-Timing / X-Process-Time-Ms 响应头给出。
+
+计算在工具进程池中执行（tools.bulk），与LLM工具共享队列上限，队列已满时返回503。
+上传文件分块写入临时文件，micro/macro 逐块计算并把结果写入临时结果文件后流式返回。
+"""
+import json
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+
+from tools import bulk
+
+logger = logging.getLogger(__name__)
+
+bulk_router = APIRouter(prefix="/bulk")
+
+# 流式输出时每次序列化的行数
+STREAM_BATCH_ROWS = 10000
+# 上传文件与结果文件的读写块大小
+FILE_BLOCK_BYTES = 1024 * 1024
+
+MEDIA_TYPES = {
+    "jsonl": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+async def _run_in_pool(task_name: str, func: Callable[..., Any], *args) -> Any:
+    """在工具进程池中执行计算（队列已满时返回503）"""
+    from core.worker_pool import ToolQueueFullError, get_worker_pool
+    try:
+        return await get_worker_pool().run_task(task_name, func, *args)
+    except ToolQueueFullError as e:
+        logger.warning(f"[Bulk] Worker pool full, rejected {task_name} ({e.pending} pending)")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+
+class StageTimer:
+    """按阶段记录耗时，生成 Server-Timing 响应头"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, (time.perf_counter() - started) * 1000))
+
+    def headers(self, rows: int) -> Dict[str, str]:
+        total_ms = (time.perf_counter() - self.start) * 1000
+        return {
+            "Server-Timing": ", ".join(f"{name};dur={ms:.1f}" for name, ms in self.stages),
+            "X-Process-Time-Ms": f"{total_ms:.1f}",
+            "X-Result-Rows": str(rows),
+        }
+
+
+async def _read_bulk_request(request: Request) -> Tuple[Dict[str, Any], Optional[Path]]:
+    """
+    解析请求：JSON请求体，或 multipart 的 file + params(JSON字符串)
+
+    Returns:
+        (参数字典, 上传文件的临时路径或None)
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        try:
+            params = json.loads(form.get("params") or "{}")
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"params 不是有效的JSON: {e}")
+        upload = form.get("file")
+        if upload is None or not getattr(upload, "filename", None):
+            return params, None
+        upload_path = _temp_path(Path(upload.filename).suffix)
+        try:
+            with open(upload_path, "wb") as f:
+                while block := await upload.read(FILE_BLOCK_BYTES):
+                    f.write(block)
+        except BaseException:
+            upload_path.unlink(missing_ok=True)
+            raise
+        return params, upload_path
+
+    try:
+        params = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"请求体不是有效的JSON: {e}")
+    if not isinstance(params, dict):
+        raise HTTPException(status_code=400, detail="请求体必须是JSON对象")
+    return params, None
+
+
+def _temp_path(suffix: str) -> Path:
+    from .routes import TEMP_DIR
+    return TEMP_DIR / f"bulk_{uuid.uuid4().hex}{suffix}"
+
+
+def _check_format(output_format: str) -> str:
+    output_format = (output_format or "jsonl").lower()
+    if output_format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"不支持的输出格式: {output_format}（可选: jsonl, csv）")
+    return output_format
+
+
+def _standardize_vehicles(values: List[Any]) -> List[str]:
+    """车型名标准化（无法识别时返回400）"""
+    from services.standardizer import get_standardizer
+    standardizer = get_standardizer()
+    standardized = []
+    for value in values:
+        std_value = standardizer.standardize_vehicle(str(value))
+        if std_value is None:
+            raise HTTPException(
+                status_code=400,
+                detail={
+                    "error": f"无法识别的车型: {value}",
+                    "suggestions": standardizer.get_vehicle_suggestions(),
+                }
+            )
+        standardized.append(std_value)
+    return standardized
+
+
+def _standardize_pollutants(values: List[Any]) -> List[str]:
+    """污染物名标准化（无法识别时返回400）"""
+    from services.standardizer import get_standardizer
+    standardizer = get_standardizer()
+    standardized = []
+    for value in values:
+        std_value = standardizer.standardize_pollutant(str(value))
+        if std_value is None:
+            raise HTTPException(
+                status_code=400,
+                detail={
+                    "error": f"无法识别的污染物: {value}",
+                    "suggestions": standardizer.get_pollutant_suggestions(),
+                }
+            )
+        standardized.append(std_value)
+    return standardized
+
+
+def _as_list(params: Dict[str, Any], plural: str, singular: str, default: Optional[List] = None) -> List:
+    """取列表参数，兼容单数形式（如 vehicle_types / vehicle_type）"""
+    value = params.get(plural)
+    if value is None and params.get(singular) is not None:
+        value = [params[singular]]
+    if value is None:
+        return list(default or [])
+    return value if isinstance(value, list) else [value]
+
+
+def _raise_for_error(result: Dict):
+    if result.get("status") == "error":
+        detail = {key: value for key, value in result.items() if key != "status"}
+        detail["error"] = result.get("message") or result.get("error")
+        raise HTTPException(status_code=400, detail=detail)
+
+
+def _iter_frame(frame: pd.DataFrame, output_format: str) -> Iterator[bytes]:
+    """分批序列化结果表"""
+    for start in range(0, len(frame), STREAM_BATCH_ROWS):
+        batch = frame.iloc[start:start + STREAM_BATCH_ROWS]
+        if output_format == "csv":
+            text = batch.to_csv(index=False, header=start == 0)
+        else:
+            text = batch.to_json(orient="records", lines=True, force_ascii=False)
+            if not text.endswith("\n"):
+                text += "\n"
+        yield text.encode("utf-8")
+    if output_format == "csv" and frame.empty:
+        yield frame.to_csv(index=False).encode("utf-8")
+
+
+def _stream_frame(frame: pd.DataFrame, output_format: str, timer: StageTimer) -> StreamingResponse:
+    return StreamingResponse(
+        _iter_frame(frame, output_format),
+        media_type=MEDIA_TYPES[output_format],
+        headers=timer.headers(len(frame)),
+    )
+
+
+def _iter_file(path: Path) -> Iterator[bytes]:
+    """分块读出结果文件，读完（或客户端断开）后删除"""
+    try:
+        with open(path, "rb") as f:
+            while block := f.read(FILE_BLOCK_BYTES):
+                yield block
+    finally:
+        path.unlink(missing_ok=True)
+
+
+def _stream_file(path: Path, output_format: str, rows: int, timer: StageTimer) -> StreamingResponse:
+    return StreamingResponse(
+        _iter_file(path),
+        media_type=MEDIA_TYPES[output_format],
+        headers=timer.headers(rows),
+    )
+
+
+def _curve_frame(data: Dict) -> pd.DataFrame:
+    """批量曲线结果展开为 (曲线, 速度) 行"""
+    key_columns = ["vehicle_type", "pollutant", "model_year", "season", "road_type"]
+    rows = []
+    for series in data["series"]:
+        keys = [series[key] for key in key_columns]
+        for speed_mph, speed_kph, rate in zip(data["speed_mph"], data["speed_kph"], series["emission_rate"]):
+            if rate is not None:
+                rows.append(keys + [speed_mph, speed_kph, rate])
+    return pd.DataFrame(rows, columns=key_columns + ["speed_mph", "speed_kph", "emission_rate_g_per_km"])
+
+
+@bulk_router.post("/emission-factors")
+async def bulk_emission_factors(request: Request, format: str = Query("jsonl")):
+    """
+    批量排放因子
+
+    请求体（二选一）:
+    - 曲线: vehicle_types, pollutants, model_years, seasons(可选), road_types(可选)；
+      每行为一条曲线上的一个速度点 (g/km)
+    - 插值: points [{speed_kph, vehicle_type, model_year}], pollutants, season, road_type；
+      每行为输入点加各污染物的 <污染物>_g_per_km
+    """
+    output_format = _check_format(format)
+    timer = StageTimer()
+    with timer.stage("parse"):
+        params, _ = await _read_bulk_request(request)
+
+    with timer.stage("standardize"):
+        pollutants = _standardize_pollutants(_as_list(params, "pollutants", "pollutant", ["CO2"]))
+        points = params.get("points")
+        if points is not None:
+            if not isinstance(points, list) or not points or not all(isinstance(p, dict) for p in points):
+                raise HTTPException(status_code=400, detail="points 必须是非空的对象列表")
+            frame = pd.DataFrame(points)
+            if "speed_kph" not in frame:
+                raise HTTPException(status_code=400, detail="points 缺少 speed_kph")
+            # 点上未给车型时使用 vehicle_type 参数
+            vehicles = frame["vehicle_type"] if "vehicle_type" in frame else pd.Series(None, index=frame.index, dtype=object)
+            if params.get("vehicle_type"):
+                vehicles = vehicles.fillna(params["vehicle_type"])
+            if vehicles.isna().any():
+                raise HTTPException(status_code=400, detail="缺少参数: vehicle_type")
+            names = vehicles.astype(str).unique().tolist()
+            source_types = vehicles.astype(str).map(dict(zip(names, _standardize_vehicles(names))))
+            model_years = pd.to_numeric(
+                frame["model_year"] if "model_year" in frame else pd.Series(index=frame.index, dtype=float),
+                errors="coerce"
+            ).fillna(params.get("model_year", 2020))
+            # 输出行显示实际参与计算的车型和年份（含参数补齐的默认值）
+            frame["vehicle_type"] = vehicles
+            frame["model_year"] = model_years
+        else:
+            vehicle_types = _standardize_vehicles(_as_list(params, "vehicle_types", "vehicle_type"))
+            model_years = _as_list(params, "model_years", "model_year")
+            try:
+                model_years = [int(year) for year in model_years]
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail=f"无效的年份: {model_years}")
+
+    with timer.stage("calculate"):
+        if points is not None:
+            result = await _run_in_pool(
+                "bulk_emission_factors",
+                bulk.interpolate_emission_factors,
+                pd.to_numeric(frame["speed_kph"], errors="coerce").to_numpy(dtype=float),
+                source_types.to_numpy(dtype=str),
+                model_years.to_numpy(dtype=float),
+                pollutants,
+                params.get("season", "夏季"),
+                params.get("road_type", "快速路"),
+            )
+            _raise_for_error(result)
+            for pollutant, values in result["data"]["emission_rate_g_per_km"].items():
+                frame[f"{pollutant}_g_per_km"] = values.round(6)
+        else:
+            result = await _run_in_pool(
+                "bulk_emission_factors",
+                bulk.query_emission_factor_curves,
+                vehicle_types, pollutants, model_years,
+                _as_list(params, "seasons", "season"),
+                _as_list(params, "road_types", "road_type"),
+            )
+            _raise_for_error(result)
+            frame = _curve_frame(result["data"])
+
+    logger.info(f"[Bulk] emission-factors: {len(frame)} rows, {timer.headers(len(frame))['Server-Timing']}")
+    return _stream_frame(frame, output_format, timer)
+
+
+@bulk_router.post("/micro")
+async def bulk_micro(request: Request, format: str = Query("jsonl")):
+    """
+    批量微观排放：逐秒结果 (t, speed_kph, speed_mph, vsp, opmode, 各污染物 g/s)
+
+    参数: trajectory_data（或上传轨迹文件，CSV分块读取）, vehicle_type, pollutants, model_year, season
+    """
+    output_format = _check_format(format)
+    timer = StageTimer()
+    with timer.stage("parse"):
+        params, upload_path = await _read_bulk_request(request)
+    output_path = _temp_path(f".{output_format}")
+    try:
+        with timer.stage("standardize"):
+            trajectory_data = params.get("trajectory_data")
+            if upload_path is None and (not isinstance(trajectory_data, list) or not trajectory_data):
+                raise HTTPException(status_code=400, detail="缺少轨迹数据: trajectory_data 或上传文件")
+            if not params.get("vehicle_type"):
+                raise HTTPException(status_code=400, detail="缺少参数: vehicle_type")
+            vehicle_type = _standardize_vehicles([params["vehicle_type"]])[0]
+            pollutants = _standardize_pollutants(_as_list(params, "pollutants", "pollutant", ["CO2", "NOx"]))
+
+        with timer.stage("calculate"):
+            result = await _run_in_pool(
+                "bulk_micro",
+                bulk.calculate_micro_to_file,
+                str(output_path), vehicle_type, pollutants,
+                params.get("model_year", 2020), params.get("season", "夏季"),
+                None if upload_path is not None else trajectory_data,
+                str(upload_path) if upload_path is not None else None,
+            )
+            _raise_for_error(result)
+    except BaseException:
+        output_path.unlink(missing_ok=True)
+        raise
+    finally:
+        if upload_path is not None:
+            upload_path.unlink(missing_ok=True)
+
+    rows = result["data"]["rows_written"]
+    logger.info(f"[Bulk] micro: {rows} rows, {timer.headers(rows)['Server-Timing']}")
+    return _stream_file(output_path, output_format, rows, timer)
+
+
+@bulk_router.post("/macro")
+async def bulk_macro(request: Request, format: str = Query("jsonl")):
+    """
+    批量宏观排放：逐路段结果 (link_id, 长度, 流量, 速度, 各污染物 kg/h 与 g/veh/km)
+
+    参数: links_data（或上传路段文件，CSV/Parquet分块读取）, pollutants, model_year, season, fleet_mix,
+    default_fleet_mix, model_year_distribution, rate_method
+    """
+    output_format = _check_format(format)
+    timer = StageTimer()
+    with timer.stage("parse"):
+        params, upload_path = await _read_bulk_request(request)
+    output_path = _temp_path(f".{output_format}")
+    try:
+        with timer.stage("standardize"):
+            pollutants = _standardize_pollutants(_as_list(params, "pollutants", "pollutant", ["CO2", "NOx"]))
+
+        with timer.stage("calculate"):
+            result = await _run_in_pool(
+                "bulk_macro",
+                bulk.calculate_macro_to_file,
+                str(output_path), pollutants,
+                params.get("model_year", 2020), params.get("season", "夏季"),
+                None if upload_path is not None else params.get("links_data"),
+                str(upload_path) if upload_path is not None else None,
+                params.get("fleet_mix"), params.get("default_fleet_mix"),
+                params.get("model_year_distribution"),
+                params.get("rate_method") or "average",
+            )
+            _raise_for_error(result)
+    except BaseException:
+        output_path.unlink(missing_ok=True)
+        raise
+    finally:
+        if upload_path is not None:
+            upload_path.unlink(missing_ok=True)
+
+    rows = result["data"]["rows_written"]
+    logger.info(f"[Bulk] macro: {rows} rows, {timer.headers(rows)['Server-Timing']}")
+    return _stream_file(output_path, output_format, rows, timer)
@@ -92,4 +92,6 @@ async def startup_event():
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    from core.worker_pool import get_worker_pool
+    get_worker_pool().shutdown()
     logger.info("API server shut down")
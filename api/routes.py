@@ -41,6 +41,10 @@ if not logger.handlers:
 
 router = APIRouter()
 
+# 批量计算接口（不经过LLM）
+from .bulk import bulk_router
+router.include_router(bulk_router)
+
 # 临时文件目录
 TEMP_DIR = Path(tempfile.gettempdir()) / "emission_agent"
 TEMP_DIR.mkdir(exist_ok=True)
@@ -467,14 +471,23 @@ async def chat_stream(
             # 5. 调用Router处理（带心跳保活）
             heartbeat_msg = json.dumps({"type": "heartbeat"}, ensure_ascii=False) + "\n"
             chat_task = asyncio.create_task(session.chat(message_with_file, input_file_path))
-            while not chat_task.done():
-                try:
-                    result = await asyncio.wait_for(asyncio.shield(chat_task), timeout=15)
-                    break
-                except asyncio.TimeoutError:
-                    yield heartbeat_msg
-            else:
-                result = chat_task.result()
+            try:
+                while not chat_task.done():
+                    try:
+                        result = await asyncio.wait_for(asyncio.shield(chat_task), timeout=15)
+                        break
+                    except asyncio.TimeoutError:
+                        if await request.is_disconnected():
+                            logger.info(f"客户端已断开，取消会话 {session.session_id} 的计算任务")
+                            chat_task.cancel()
+                            return
+                        yield heartbeat_msg
+                else:
+                    result = chat_task.result()
+            finally:
+                # 客户端断开（生成器被关闭）时取消仍在排队/执行的计算
+                if not chat_task.done():
+                    chat_task.cancel()
 
             # 6. 流式输出最终文本
             reply_text = result.get("text", "")
@@ -888,7 +901,18 @@ async def get_session_history(session_id: str, request: Request):
 @router.get("/health")
 async def health_check():
     """健康检查"""
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    from calculators.rate_store import get_rate_store
+    from core.worker_pool import get_worker_pool
+    # 常驻排放数据表及其内存占用，按进程列出（API进程 + 各工具worker进程）
+    emission_data = [{"process": "api", **get_rate_store().memory_report()}]
+    emission_data += [
+        {"process": "worker", **report} for report in await get_worker_pool().memory_reports()
+    ]
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "emission_data": emission_data,
+    }
 
 @router.get("/test")
 async def test_endpoint():
@@ -0,0 +1,262 @@
+"""
+排放因子速度曲线索引 - 每个季节的排放因子表在进程内只解码一次
+
+排放因子CSV的 Speed 列编码为 {速度mph}0{道路类型}（如 504 = 5 mph + 道路类型4），
+加载时对整列一次性向量化解码，按 (道路类型, 车型, 污染物, 年份, 速度) 排序后
+存为连续数组，每条速度曲线是其中的一段切片，查询为一次字典查找。
+
+EmissionFactorInterpolator 在索引之上对任意 (速度, 车型, 年份) 点做向量化插值：
+速度方向为分段线性（各段斜率预先计算），年份方向在相邻的已有年份之间线性插值。
+"""
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+CurveKey = Tuple[int, int, int, int]
+
+
+class EmissionFactorCurveIndex:
+    """单个季节排放因子表的速度曲线索引"""
+
+    def __init__(self, speed_mph: np.ndarray, rates: np.ndarray, groups: Dict[CurveKey, Tuple[int, int]],
+                 available: Dict[str, List[int]]):
+        """
+        Args:
+            speed_mph: 全部曲线点的速度 (mph)，各曲线内升序
+            rates: 对应的排放因子 (g/mile)
+            groups: (道路类型, 车型, 污染物, 年份) → 曲线在数组中的 [起, 止) 位置
+            available: 数据表中出现过的 年份/车型/污染物 ID（用于未命中时的提示）
+        """
+        self.speed_mph = speed_mph
+        self.rates = rates
+        self.speed_mph.flags.writeable = False
+        self.rates.flags.writeable = False
+        self.groups = groups
+        self.available = available
+        self._interpolators: Dict[Tuple[int, int], "EmissionFactorInterpolator"] = {}
+
+    @classmethod
+    def from_columns(cls, speed_codes: np.ndarray, source_types: np.ndarray, pollutants: np.ndarray,
+                     model_years: np.ndarray, rates: np.ndarray) -> "EmissionFactorCurveIndex":
+        """
+        由排放因子表的列数组构建索引
+
+        速度编码不足3位的行无法解码，不进入任何曲线；同一曲线内速度相同的点保留原表顺序。
+        """
+        source_types = np.asarray(source_types, dtype=np.int64)
+        pollutants = np.asarray(pollutants, dtype=np.int64)
+        model_years = np.asarray(model_years, dtype=np.int64)
+        available = {
+            "model_years": np.unique(model_years).tolist(),
+            "source_types": np.unique(source_types).tolist(),
+            "pollutants": np.unique(pollutants).tolist(),
+        }
+
+        # Speed 列为浮点数，先截断为整数再按十进制位解码
+        codes = np.asarray(speed_codes).astype(np.int64)
+        valid = codes >= 100
+        codes = codes[valid]
+        road_types = codes % 10
+        speed_mph = codes // 100
+        source_types, pollutants, model_years = source_types[valid], pollutants[valid], model_years[valid]
+        rates = np.asarray(rates, dtype=np.float64)[valid]
+
+        order = np.lexsort((speed_mph, model_years, pollutants, source_types, road_types))
+        keys = np.column_stack([road_types, source_types, pollutants, model_years])[order]
+        speed_mph, rates = speed_mph[order], rates[order]
+
+        starts = np.flatnonzero(np.r_[True, (keys[1:] != keys[:-1]).any(axis=1)]) if len(keys) else keys[:0, 0]
+        ends = np.r_[starts[1:], len(keys)].astype(np.int64)
+        groups = {
+            tuple(key): (start, end)
+            for key, start, end in zip(keys[starts].tolist(), starts.tolist(), ends.tolist())
+        }
+        return cls(np.ascontiguousarray(speed_mph), np.ascontiguousarray(rates), groups, available)
+
+    def curve(self, road_type: int, source_type: int, pollutant_id: int,
+              model_year: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(速度mph, 排放因子g/mile) 曲线，按速度升序（无数据时为None，返回的是只读视图）"""
+        span = self.groups.get((road_type, source_type, pollutant_id, model_year))
+        if span is None:
+            return None
+        start, end = span
+        return self.speed_mph[start:end], self.rates[start:end]
+
+    @staticmethod
+    def nearest(speed_mph: np.ndarray, targets) -> np.ndarray:
+        """
+        各目标速度在曲线上最近点的下标（升序数组上二分查找）
+
+        距离相同时取较低速度，同一速度有多个点时取第一个。
+        """
+        targets = np.asarray(targets, dtype=speed_mph.dtype)
+        n = len(speed_mph)
+        idx = np.searchsorted(speed_mph, targets, side="left")
+        lower = np.clip(idx - 1, 0, n - 1)
+        upper = np.clip(idx, 0, n - 1)
+        use_lower = (idx >= n) | ((idx > 0) & (targets - speed_mph[lower] <= speed_mph[upper] - targets))
+        picked = np.where(use_lower, lower, upper)
+        return np.searchsorted(speed_mph, speed_mph[picked], side="left")
+
+    def interpolator(self, road_type: int, pollutant_id: int) -> Optional["EmissionFactorInterpolator"]:
+        """(道路类型, 污染物) 的插值器，首次使用时构建（无曲线时为None）"""
+        key = (road_type, pollutant_id)
+        if key not in self._interpolators:
+            self._interpolators[key] = EmissionFactorInterpolator.from_index(self, road_type, pollutant_id)
+        return self._interpolators[key]
+
+    @property
+    def nbytes(self) -> int:
+        """曲线数组及已构建插值器的字节数"""
+        return self.speed_mph.nbytes + self.rates.nbytes + sum(
+            interpolator.nbytes for interpolator in self._interpolators.values() if interpolator is not None
+        )
+
+
+class EmissionFactorInterpolator:
+    """
+    单个 (道路类型, 污染物) 下全部 (车型, 年份) 曲线的向量化插值器
+
+    所有曲线的节点拼接为一条全局升序数组：节点键 = 曲线序号 × KEY_STRIDE + 速度，
+    一次 searchsorted 即可为任意多个点同时找到各自曲线上的区间。
+    速度超出曲线范围时取端点值；年份超出该车型已有年份范围时取最近年份的曲线。
+    """
+
+    # 曲线序号的键间隔，大于任何速度 (mph) 和年份值
+    KEY_STRIDE = 10000.0
+
+    def __init__(self, source_types: np.ndarray, year_keys: np.ndarray, years: np.ndarray,
+                 source_spans: np.ndarray, knot_keys: np.ndarray, knot_speeds: np.ndarray,
+                 knot_rates: np.ndarray, slopes: np.ndarray, curve_spans: np.ndarray):
+        """
+        Args:
+            source_types: 有曲线的车型ID（升序）
+            year_keys: 各曲线的 车型序号 × KEY_STRIDE + 年份（升序，下标即曲线序号）
+            years: 各曲线的年份
+            source_spans: 各车型的曲线序号范围 [起, 止)
+            knot_keys: 各节点的 曲线序号 × KEY_STRIDE + 速度
+            knot_speeds / knot_rates: 节点速度 (mph) 与排放因子 (g/mile)
+            slopes: 节点到下一节点的斜率 (g/mile per mph)，曲线最后一个节点为0
+            curve_spans: 各曲线的节点范围 [起, 止)
+        """
+        self.source_types = source_types
+        self.year_keys = year_keys
+        self.years = years
+        self.source_spans = source_spans
+        self.knot_keys = knot_keys
+        self.knot_speeds = knot_speeds
+        self.knot_rates = knot_rates
+        self.slopes = slopes
+        self.curve_spans = curve_spans
+
+    @classmethod
+    def from_index(cls, index: EmissionFactorCurveIndex, road_type: int,
+                   pollutant_id: int) -> Optional["EmissionFactorInterpolator"]:
+        """由曲线索引构建（同一速度有多个点时取第一个，与 query 的典型值规则一致）"""
+        # groups 按 (道路类型, 车型, 污染物, 年份) 排序，筛选后曲线按 (车型, 年份) 升序
+        curves = [
+            (source_type, model_year, start, end)
+            for (road, source_type, pollutant, model_year), (start, end) in index.groups.items()
+            if road == road_type and pollutant == pollutant_id
+        ]
+        if not curves:
+            return None
+
+        curve_sources = np.array([c[0] for c in curves], dtype=np.int64)
+        years = np.array([c[1] for c in curves], dtype=np.float64)
+        source_types, source_starts = np.unique(curve_sources, return_index=True)
+        source_spans = np.column_stack([source_starts, np.r_[source_starts[1:], len(curves)]])
+        source_pos = np.searchsorted(source_types, curve_sources)
+
+        speeds, rates, curve_no = [], [], []
+        for i, (_, _, start, end) in enumerate(curves):
+            curve_speeds, first = np.unique(index.speed_mph[start:end], return_index=True)
+            speeds.append(curve_speeds.astype(np.float64))
+            rates.append(index.rates[start:end][first])
+            curve_no.append(np.full(len(curve_speeds), i, dtype=np.int64))
+        lengths = np.array([len(s) for s in speeds], dtype=np.int64)
+        curve_starts = np.r_[0, np.cumsum(lengths)[:-1]]
+        curve_spans = np.column_stack([curve_starts, curve_starts + lengths])
+
+        knot_speeds = np.concatenate(speeds)
+        knot_rates = np.concatenate(rates)
+        curve_no = np.concatenate(curve_no)
+
+        # 分段线性系数：节点k到k+1的斜率，各曲线最后一个节点为0（右端外推取端点值）
+        slopes = np.zeros(len(knot_speeds))
+        same_curve = curve_no[1:] == curve_no[:-1]
+        slopes[:-1][same_curve] = (
+            np.diff(knot_rates)[same_curve] / np.diff(knot_speeds)[same_curve]
+        )
+
+        return cls(
+            source_types=source_types,
+            year_keys=source_pos * cls.KEY_STRIDE + years,
+            years=years,
+            source_spans=source_spans,
+            knot_keys=curve_no * cls.KEY_STRIDE + knot_speeds,
+            knot_speeds=knot_speeds,
+            knot_rates=knot_rates,
+            slopes=slopes,
+            curve_spans=curve_spans,
+        )
+
+    def _evaluate_curves(self, curves: np.ndarray, speed_mph: np.ndarray) -> np.ndarray:
+        """各点在指定曲线上的插值 (g/mile)"""
+        spans = self.curve_spans[curves]
+        low = self.knot_speeds[spans[:, 0]]
+        high = self.knot_speeds[spans[:, 1] - 1]
+        speed = np.clip(speed_mph, low, high)
+        k = np.searchsorted(self.knot_keys, curves * self.KEY_STRIDE + speed, side="right") - 1
+        k = np.clip(k, spans[:, 0], spans[:, 1] - 1)
+        return self.knot_rates[k] + self.slopes[k] * (speed - self.knot_speeds[k])
+
+    def evaluate(self, speed_mph, source_types, model_years) -> np.ndarray:
+        """
+        批量插值排放因子
+
+        Args:
+            speed_mph: 速度数组 (mph)
+            source_types: MOVES车型ID数组
+            model_years: 年份数组（可为小数）
+
+        Returns:
+            排放因子数组 (g/mile)，车型无曲线或输入为NaN的点为NaN
+        """
+        speed_mph, source_types, model_years = np.broadcast_arrays(
+            np.asarray(speed_mph, dtype=np.float64),
+            np.asarray(source_types, dtype=np.int64),
+            np.asarray(model_years, dtype=np.float64),
+        )
+        shape = speed_mph.shape
+        speed_mph, source_types, model_years = speed_mph.ravel(), source_types.ravel(), model_years.ravel()
+
+        pos = np.searchsorted(self.source_types, source_types)
+        pos = np.minimum(pos, len(self.source_types) - 1)
+        # 车型无曲线、速度或年份缺失（NaN/无穷）的点保持NaN，不参与插值
+        known = (self.source_types[pos] == source_types) & np.isfinite(speed_mph) & np.isfinite(model_years)
+        result = np.full(len(speed_mph), np.nan)
+        if not known.any():
+            return result.reshape(shape)
+        pos, speed_mph, model_years = pos[known], speed_mph[known], model_years[known]
+
+        # 年份方向：该车型已有年份中的前后两条曲线及权重
+        first, last = self.source_spans[pos, 0], self.source_spans[pos, 1] - 1
+        year = np.clip(model_years, self.years[first], self.years[last])
+        lower = np.searchsorted(self.year_keys, pos * self.KEY_STRIDE + year, side="right") - 1
+        lower = np.clip(lower, first, last)
+        upper = np.minimum(lower + 1, last)
+        gap = self.years[upper] - self.years[lower]
+        weight = np.divide(year - self.years[lower], gap, out=np.zeros_like(gap), where=gap > 0)
+
+        rate_lower = self._evaluate_curves(lower, speed_mph)
+        rate_upper = self._evaluate_curves(upper, speed_mph)
+        result[known] = rate_lower + weight * (rate_upper - rate_lower)
+        return result.reshape(shape)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (
+            self.year_keys, self.years, self.knot_keys, self.knot_speeds,
+            self.knot_rates, self.slopes, self.curve_spans, self.source_spans,
+        ))
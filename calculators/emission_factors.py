@@ -1,9 +1,13 @@
 """
 排放因子计算器 - 修复版本
 """
+import itertools
+import numpy as np
 import pandas as pd
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
+from .ef_curves import EmissionFactorCurveIndex
+from .rate_store import DATA_ROOT, DATASET_FILES, dataset_path, get_rate_store
 
 class EmissionFactorCalculator:
     """排放因子查询计算器"""
@@ -64,14 +68,16 @@ class EmissionFactorCalculator:
         "居民区道路": 5,  # 映射到地面道路
     }
 
+    # 典型值速度 (mph)
+    TYPICAL_SPEEDS_MPH = (25, 50, 70)
+
+    # 批量查询的曲线数上限
+    MAX_BATCH_CURVES = 500
+
     def __init__(self):
         # Data is in calculators/data/emission_factors/
-        self.data_path = Path(__file__).parent / "data" / "emission_factors"
-        self.csv_files = {
-            "winter": "atlanta_2025_1_55_65.csv",
-            "spring": "atlanta_2025_4_75_65.csv",
-            "summer": "atlanta_2025_7_90_70.csv"
-        }
+        self.data_path = DATA_ROOT / "emission_factors"
+        self.csv_files = DATASET_FILES["emission_factors"]
 
     def query(self, vehicle_type: str, pollutant: str, model_year: int,
               season: str = "夏季", road_type: str = "快速路", return_curve: bool = False) -> Dict:
@@ -95,9 +101,9 @@ class EmissionFactorCalculator:
                 "valid_pollutants": list(self.POLLUTANT_TO_ID.keys())
             }
 
-        # 2. 加载数据
+        # 2. 加载速度曲线索引
         try:
-            df = self._load_data(season)
+            index = self._load_index(season)
         except FileNotFoundError as e:
             return {
                 "status": "error",
@@ -107,36 +113,12 @@ class EmissionFactorCalculator:
         # 3. 获取道路类型ID（数据库中只有4和5）
         road_type_id = self.ROAD_TYPE_MAPPING.get(road_type, 4)
 
-        # 4. 筛选数据 - 使用正确的列名
-        # 注意：Speed列的格式是 {speed}0{road_type}，例如 504 = 5mph + 道路类型4
-        mask = (
-            (df[self.COL_SOURCE_TYPE] == source_type_id) &
-            (df[self.COL_POLLUTANT] == pollutant_id) &
-            (df[self.COL_MODEL_YEAR] == model_year)
-        )
-        filtered = df[mask]
-
-        # 5. 进一步筛选道路类型并解析速度
-        # Speed格式：504 = 5mph + 0 + 4(快速路), 1005 = 10mph + 0 + 5(地面道路)
-        speed_data = []
-        for _, row in filtered.iterrows():
-            # 重要：Speed列是浮点数，需要先转int再转str
-            speed_code = str(int(row[self.COL_SPEED]))
-
-            # 解析速度编码
-            if len(speed_code) >= 2:
-                road_type_in_data = int(speed_code[-1])  # 最后1位是道路类型
-                speed_value = int(speed_code[:-2])  # 去掉最后2位（0和道路类型）
-
-                # 只保留匹配道路类型的数据
-                if road_type_in_data == road_type_id:
-                    speed_data.append({
-                        "speed_mph": speed_value,
-                        "emission_rate": row[self.COL_EMISSION]
-                    })
-
-        # 6. 检查是否有数据
-        if len(speed_data) == 0:
+        # 4. 取出速度曲线
+        # Speed格式：504 = 5mph + 0 + 4(快速路), 1005 = 10mph + 0 + 5(地面道路)，已在建索引时解码
+        curve_arrays = index.curve(road_type_id, source_type_id, pollutant_id, model_year)
+
+        # 5. 检查是否有数据
+        if curve_arrays is None:
             # 返回详细的调试信息
             return {
                 "status": "error",
@@ -152,28 +134,26 @@ class EmissionFactorCalculator:
                         "road_type": road_type,
                         "road_type_id": road_type_id,
                     },
-                    "available_years": sorted(df[self.COL_MODEL_YEAR].unique().tolist()),
-                    "available_source_types": sorted(df[self.COL_SOURCE_TYPE].unique().tolist()),
-                    "available_pollutants": sorted(df[self.COL_POLLUTANT].unique().tolist()),
+                    "available_years": index.available["model_years"],
+                    "available_source_types": index.available["source_types"],
+                    "available_pollutants": index.available["pollutants"],
                     "note": "数据库中只有道路类型4(快速路)和5(地面道路)"
                 }
             }
 
-        # 7. 按速度排序
-        speed_data.sort(key=lambda x: x["speed_mph"])
+        # 6. 曲线已按速度升序
+        speeds_mph, rates = curve_arrays
+        speed_values = speeds_mph.tolist()
 
-        # 8. 根据return_curve参数决定返回格式
+        # 7. 根据return_curve参数决定返回格式
         if return_curve:
             # 返回完整曲线数据（单位转换为g/km）
-            curve = []
-            for item in speed_data:
-                speed_kph = round(item["speed_mph"] * 1.60934, 1)
-                # 单位转换: g/mile -> g/km (除以1.60934)
-                emission_rate_g_per_km = round(item["emission_rate"] / 1.60934, 4)
-                curve.append({
-                    "speed_kph": speed_kph,
-                    "emission_rate": emission_rate_g_per_km
-                })
+            # 单位转换: g/mile -> g/km (除以1.60934)
+            rates_g_per_km = np.round(rates / 1.60934, 4).tolist()
+            curve = [
+                {"speed_kph": round(speed_mph * 1.60934, 1), "emission_rate": rate}
+                for speed_mph, rate in zip(speed_values, rates_g_per_km)
+            ]
 
             return {
                 "status": "success",
@@ -189,24 +169,24 @@ class EmissionFactorCalculator:
             }
         else:
             # 返回传统格式（包含mph和kph，单位为g/mile）
-            speed_curve = []
-            for item in speed_data:
-                speed_curve.append({
-                    "speed_mph": item["speed_mph"],
-                    "speed_kph": round(item["speed_mph"] * 1.60934, 1),
-                    "emission_rate": round(item["emission_rate"], 4),
+            speed_curve = [
+                {
+                    "speed_mph": speed_mph,
+                    "speed_kph": round(speed_mph * 1.60934, 1),
+                    "emission_rate": rate,
                     "unit": "g/mile"
-                })
-
-            # 提取典型值 (25, 50, 70 mph)
-            typical_values = []
-            for target_speed in [25, 50, 70]:
-                if speed_curve:
-                    closest = min(speed_curve, key=lambda x: abs(x["speed_mph"] - target_speed))
-                    typical_values.append({
-                        "label": f"{closest['speed_mph']} mph ({closest['speed_kph']} kph)",
-                        **closest
-                    })
+                }
+                for speed_mph, rate in zip(speed_values, np.round(rates, 4).tolist())
+            ]
+
+            # 提取典型值 (25, 50, 70 mph)：在升序曲线上二分查找最近的速度点
+            typical_values = [
+                {
+                    "label": f"{speed_curve[i]['speed_mph']} mph ({speed_curve[i]['speed_kph']} kph)",
+                    **speed_curve[i]
+                }
+                for i in index.nearest(speeds_mph, self.TYPICAL_SPEEDS_MPH).tolist()
+            ]
 
             return {
                 "status": "success",
@@ -232,14 +212,223 @@ class EmissionFactorCalculator:
                 }
             }
 
-    def _load_data(self, season: str) -> pd.DataFrame:
-        """加载CSV数据"""
-        season_code = self.SEASON_CODES.get(season, 7)
-        season_key = "winter" if season_code == 1 else ("spring" if season_code == 4 else "summer")
-        csv_file = self.csv_files[season_key]
-        csv_path = self.data_path / csv_file
+    def query_batch(self, vehicle_types: List[str], pollutants: List[str], model_years: List[int],
+                    seasons: Optional[List[str]] = None, road_types: Optional[List[str]] = None,
+                    return_curve: bool = False) -> Dict:
+        """
+        批量查询排放因子曲线（车型 × 污染物 × 年份 × 季节 × 道路类型）
 
-        if not csv_path.exists():
-            raise FileNotFoundError(f"数据文件不存在: {csv_path}")
+        每个季节的曲线索引只加载一次，全部组合在同一遍中取出，并对齐到统一的速度轴。
+        排放因子单位与 query 相同：return_curve 为 g/km，否则为 g/mile。
+
+        Returns:
+            data.dimensions: 各维度的取值（去重后保持顺序）
+            data.speed_mph / speed_kph: 统一速度轴（全部曲线速度的并集，升序）
+            data.series: 每条曲线的维度取值、对齐到速度轴的排放因子（该速度无数据为None）和典型值
+            data.missing: 无数据的组合
+        """
+        dimensions = {
+            "vehicle_types": list(dict.fromkeys(vehicle_types or [])),
+            "pollutants": list(dict.fromkeys(pollutants or [])),
+            "model_years": list(dict.fromkeys(model_years or [])),
+            "seasons": list(dict.fromkeys(seasons or ["夏季"])),
+            "road_types": list(dict.fromkeys(road_types or ["快速路"])),
+        }
+        empty = [name for name, values in dimensions.items() if not values]
+        if empty:
+            return {"status": "error", "error": f"批量查询缺少参数: {', '.join(empty)}"}
+
+        unknown_vehicles = [v for v in dimensions["vehicle_types"] if v not in self.VEHICLE_TO_SOURCE_TYPE]
+        if unknown_vehicles:
+            return {
+                "status": "error",
+                "error": f"未知车型: {', '.join(map(str, unknown_vehicles))}",
+                "valid_vehicle_types": list(self.VEHICLE_TO_SOURCE_TYPE.keys())
+            }
+        unknown_pollutants = [p for p in dimensions["pollutants"] if p not in self.POLLUTANT_TO_ID]
+        if unknown_pollutants:
+            return {
+                "status": "error",
+                "error": f"未知污染物: {', '.join(map(str, unknown_pollutants))}",
+                "valid_pollutants": list(self.POLLUTANT_TO_ID.keys())
+            }
+
+        combinations = list(itertools.product(*dimensions.values()))
+        if len(combinations) > self.MAX_BATCH_CURVES:
+            return {
+                "status": "error",
+                "error": f"批量查询组合过多 ({len(combinations)} 条曲线，上限 {self.MAX_BATCH_CURVES})，请减少车型、污染物或年份"
+            }
+
+        # 1. 每个季节文件的索引只加载一次，逐组合取出曲线
+        indexes: Dict[Path, EmissionFactorCurveIndex] = {}
+        found = []
+        missing = []
+        try:
+            for vehicle_type, pollutant, model_year, season, road_type in combinations:
+                csv_path = self._csv_path(season)
+                if csv_path not in indexes:
+                    indexes[csv_path] = self._load_index(season)
+                curve_arrays = indexes[csv_path].curve(
+                    self.ROAD_TYPE_MAPPING.get(road_type, 4),
+                    self.VEHICLE_TO_SOURCE_TYPE[vehicle_type],
+                    self.POLLUTANT_TO_ID[pollutant],
+                    model_year
+                )
+                keys = {
+                    "vehicle_type": vehicle_type,
+                    "pollutant": pollutant,
+                    "model_year": model_year,
+                    "season": season,
+                    "road_type": road_type,
+                }
+                if curve_arrays is None:
+                    missing.append(keys)
+                else:
+                    found.append((keys, *curve_arrays))
+        except FileNotFoundError as e:
+            return {"status": "error", "error": str(e)}
+
+        if not found:
+            index = next(iter(indexes.values()))
+            return {
+                "status": "error",
+                "error": "未找到匹配数据",
+                "debug": {
+                    "missing": missing,
+                    "available_years": index.available["model_years"],
+                    "note": "数据库中只有道路类型4(快速路)和5(地面道路)"
+                }
+            }
+
+        # 2. 对齐到统一速度轴（同一速度有多个点时取第一个，与 query 的典型值规则一致）
+        speed_axis = np.unique(np.concatenate([speeds for _, speeds, _ in found]))
+        aligned = np.full((len(found), len(speed_axis)), np.nan)
+        unit_factor = 1.60934 if return_curve else 1.0
+        series = []
+        for i, (keys, speeds, rates) in enumerate(found):
+            positions = np.searchsorted(speed_axis, speeds)
+            aligned[i, positions[::-1]] = rates[::-1]
+            typical = EmissionFactorCurveIndex.nearest(speeds, self.TYPICAL_SPEEDS_MPH)
+            series.append({
+                **keys,
+                "emission_rate": None,
+                "typical_values": [
+                    {
+                        "speed_mph": speed_mph,
+                        "speed_kph": round(speed_mph * 1.60934, 1),
+                        "emission_rate": rate,
+                    }
+                    for speed_mph, rate in zip(
+                        speeds[typical].tolist(), np.round(rates[typical] / unit_factor, 4).tolist()
+                    )
+                ],
+                "data_points": len(speeds),
+            })
+
+        aligned = np.round(aligned / unit_factor, 4)
+        for item, row, present in zip(series, aligned.tolist(), (~np.isnan(aligned)).tolist()):
+            item["emission_rate"] = [rate if ok else None for rate, ok in zip(row, present)]
+
+        speed_values = speed_axis.tolist()
+        return {
+            "status": "success",
+            "data": {
+                "dimensions": dimensions,
+                "speed_mph": speed_values,
+                "speed_kph": [round(speed_mph * 1.60934, 1) for speed_mph in speed_values],
+                "series": series,
+                "missing": missing,
+                "unit": "g/km" if return_curve else "g/mile",
+                "data_source": "MOVES (Atlanta)"
+            }
+        }
+
+    def interpolate(self, speeds_kph, source_types, model_years, pollutants: List[str],
+                    season: str = "夏季", road_type: str = "快速路") -> Dict:
+        """
+        任意 (速度, 车型, 年份) 点的插值排放因子（向量化，一次处理全部点）
+
+        速度方向在相邻速度档之间线性插值，超出曲线范围取端点值；年份方向在该车型
+        相邻的已有年份之间线性插值，超出范围取最近年份。
+
+        Args:
+            speeds_kph: 速度数组 (km/h)
+            source_types: 车型数组，MOVES车型ID或标准车型名（如 "Passenger Car"）
+            model_years: 年份数组（可为小数）
+            pollutants: 污染物列表
+            season: 季节
+            road_type: 道路类型
+
+        Returns:
+            data.emission_rate_g_per_km: {污染物: 排放因子数组 (g/km)}，无曲线的点为NaN
+            data.unmatched_points: {污染物: 无法插值的点数}
+        """
+        unknown_pollutants = [p for p in pollutants if p not in self.POLLUTANT_TO_ID]
+        if unknown_pollutants:
+            return {
+                "status": "error",
+                "error": f"未知污染物: {', '.join(map(str, unknown_pollutants))}",
+                "valid_pollutants": list(self.POLLUTANT_TO_ID.keys())
+            }
+
+        source_types = np.asarray(source_types)
+        if source_types.dtype.kind not in "iu":
+            # 车型名按不同取值映射一次；无法识别的车型记为-1（结果为NaN）
+            names, inverse = np.unique(source_types.astype(str), return_inverse=True)
+            ids = np.array([self.VEHICLE_TO_SOURCE_TYPE.get(name, -1) for name in names], dtype=np.int64)
+            unknown_vehicles = [name for name, source_id in zip(names.tolist(), ids.tolist()) if source_id < 0]
+            if unknown_vehicles and len(unknown_vehicles) == len(names):
+                return {
+                    "status": "error",
+                    "error": f"未知车型: {', '.join(unknown_vehicles[:10])}",
+                    "valid_vehicle_types": list(self.VEHICLE_TO_SOURCE_TYPE.keys())
+                }
+            source_types = ids[inverse].reshape(source_types.shape)
+
+        try:
+            index = self._load_index(season)
+        except FileNotFoundError as e:
+            return {"status": "error", "error": str(e)}
+
+        speed_mph = np.asarray(speeds_kph, dtype=np.float64) / 1.60934
+        road_type_id = self.ROAD_TYPE_MAPPING.get(road_type, 4)
+        rates = {}
+        unmatched = {}
+        for pollutant in pollutants:
+            interpolator = index.interpolator(road_type_id, self.POLLUTANT_TO_ID[pollutant])
+            if interpolator is None:
+                values = np.full(np.broadcast(speed_mph, source_types, model_years).shape, np.nan)
+            else:
+                values = interpolator.evaluate(speed_mph, source_types, model_years) / 1.60934
+            rates[pollutant] = values
+            unmatched[pollutant] = int(np.isnan(values).sum())
+
+        return {
+            "status": "success",
+            "data": {
+                "emission_rate_g_per_km": rates,
+                "unmatched_points": unmatched,
+                "points": int(np.size(rates[pollutants[0]])) if pollutants else 0,
+                "season": season,
+                "road_type": road_type,
+                "unit": "g/km",
+                "data_source": "MOVES (Atlanta)"
+            }
+        }
+
+    def _csv_path(self, season: str) -> Path:
+        return dataset_path("emission_factors", season)
+
+    def _load_index(self, season: str) -> EmissionFactorCurveIndex:
+        """加载速度曲线索引（进程内按季节缓存，只读共享）"""
+        return get_rate_store().get_curve_index(
+            self._csv_path(season), pd.read_csv,
+            columns=(self.COL_SPEED, self.COL_SOURCE_TYPE, self.COL_POLLUTANT, self.COL_MODEL_YEAR,
+                     self.COL_EMISSION)
+        )
 
-        return pd.read_csv(csv_path)
+    def preload(self):
+        """预加载全部季节数据（服务启动或worker初始化时调用）"""
+        for season in self.SEASON_CODES:
+            self._load_index(season)
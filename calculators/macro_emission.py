@@ -1,9 +1,19 @@
 """
 宏观排放计算器 - MOVES-Matrix 方法
 """
+import logging
+import numpy as np
 import pandas as pd
 from pathlib import Path
-from typing import Dict, List
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from .opmode_distribution import (
+    MAX_OPMODE, OPMODE_DISTRIBUTION_FILE, get_opmode_distribution, opmode_distribution_available, speed_to_bin
+)
+from .rate_store import (
+    DATA_ROOT, DATASET_FILES, FALLBACK_OPMODE, EmissionRateTensor, dataset_path, get_rate_store
+)
+
+logger = logging.getLogger(__name__)
 
 class MacroEmissionCalculator:
     """宏观排放计算器"""
@@ -15,6 +25,18 @@ class MacroEmissionCalculator:
     COL_MODEL_YEAR = 'modelYearID'
     COL_EMISSION = 'em'
 
+    # 结果格式: rows 为逐路段字典列表；columnar 为列式 DataFrame
+    RESULT_FORMATS = ("rows", "columnar")
+
+    # 排放率方法: average 为平均opMode 300
+    RATE_METHODS = ("average",)
+
+    # 按路段平均速度档的MOVES opMode分布加权，仅在分布数据文件存在时可用（见 opmode_distribution）
+    SPEED_BINNED = "speed_binned"
+
+    # 流式计算返回的逐路段预览行数
+    STREAM_PREVIEW_ROWS = 100
+
     # 车型ID映射（与micro_emission保持一致）
     VEHICLE_TO_SOURCE_TYPE = {
         "Motorcycle": 11,
@@ -55,6 +77,9 @@ class MacroEmissionCalculator:
         "冬季": 1,
     }
 
+    # 车型年份分布中表示"所有车型"的键（分布直接写成 {年份: 占比} 时使用）
+    ALL_VEHICLES = "*"
+
     # 默认车队组成（如果用户未提供）
     DEFAULT_FLEET_MIX = {
         "Passenger Car": 70.0,
@@ -65,48 +90,445 @@ class MacroEmissionCalculator:
     }
 
     def __init__(self):
-        self.data_path = Path(__file__).parent / "data" / "macro_emission"
-        self.csv_files = {
-            "winter": "atlanta_2025_1_35_60 .csv",
-            "spring": "atlanta_2025_4_75_65.csv",
-            "summer": "atlanta_2025_7_80_60.csv"
-        }
+        self.data_path = DATA_ROOT / "macro_emission"
+        self.csv_files = DATASET_FILES["macro_emission"]
 
     def calculate(self, links_data: List[Dict], pollutants: List[str],
-                 model_year: int, season: str, default_fleet_mix: Dict = None) -> Dict:
-        """执行宏观排放计算"""
+                 model_year: int, season: str, default_fleet_mix: Dict = None,
+                 result_format: str = "rows",
+                 model_year_distribution: Optional[Dict] = None,
+                 rate_method: str = "average",
+                 return_state: bool = False) -> Dict:
+        """
+        执行宏观排放计算
+
+        全部路段按矩阵一次计算（见 calculate_link_emissions）。
+        model_year_distribution 为全网车型年份（车龄）分布：
+        {车型: {年份: 占比}}，或 {年份: 占比} 表示所有车型相同；
+        路段可用 link["model_year_distribution"] 覆盖其中的车型。
+        分布中未出现的车型使用 model_year。
+        rate_method="speed_binned" 时排放率随路段平均速度变化（需要MOVES opMode分布数据，见 opmode_distribution）。
+        result_format="rows" 返回逐路段字典 data["results"]；
+        result_format="columnar" 返回列式 DataFrame data["results_columns"]
+        （列: link_id, link_length_km, traffic_flow_vph, avg_speed_kph,
+        各污染物 <污染物>_kg_per_hr 与 <污染物>_g_per_veh_km），不生成逐路段字典。
+        return_state=True 时结果附带 result["state"]，供 recalculate 只重算修改过的路段。
+        """
 
         try:
             # 1. 验证输入
             if not links_data or len(links_data) == 0:
                 raise ValueError("路段数据不能为空")
+            if result_format not in self.RESULT_FORMATS:
+                raise ValueError(f"不支持的结果格式: {result_format}")
+            self._check_rate_method(rate_method)
+            pollutants = list(dict.fromkeys(pollutants))
 
             # 2. 加载排放矩阵
             emission_matrix = self._load_emission_matrix(season)
 
-            # 3. 计算每个路段
-            results = []
-            for link in links_data:
-                result = self._calculate_link(
-                    link, pollutants, model_year, emission_matrix,
-                    default_fleet_mix or self.DEFAULT_FLEET_MIX
-                )
-                results.append(result)
+            # 3. 路段属性列与车队组成矩阵
+            links = self._links_to_columns(links_data)
+            fleet = self._build_fleet_matrix(links_data, default_fleet_mix or self.DEFAULT_FLEET_MIX)
+            year_weights = self._build_model_year_weights(
+                links_data, fleet["vehicle_names"], model_year, model_year_distribution
+            )
 
-            # 4. 汇总统计
-            summary = self._calculate_summary(results, pollutants)
+            # 4. 矩阵计算所有路段
+            computed = self.calculate_link_emissions(
+                links["link_length_km"], links["traffic_flow_vph"], links["avg_speed_kph"],
+                fleet, pollutants, model_year, emission_matrix, year_weights, rate_method
+            )
 
-            return {
+            # 5. 汇总统计
+            rounded_totals = self._round_array(computed["link_totals"], 4)
+            totals = self._sum_rounded_totals(rounded_totals)
+            summary = self._summary_from_totals(len(links_data), totals, pollutants)
+
+            data = {
+                "query_info": {
+                    "model_year": model_year,
+                    "pollutants": pollutants,
+                    "season": season,
+                    "links_count": len(links_data)
+                },
+                "summary": summary
+            }
+            if model_year_distribution:
+                data["query_info"]["model_year_distribution"] = model_year_distribution
+            if rate_method != "average":
+                data["query_info"]["rate_method"] = rate_method
+            if result_format == "columnar":
+                data["results_columns"] = self._build_result_frame(links, computed, pollutants)
+            else:
+                data["results"] = self._build_link_rows(links, fleet, computed, pollutants)
+
+            result = {
                 "status": "success",
-                "data": {
-                    "query_info": {
-                        "model_year": model_year,
+                "data": data
+            }
+            if return_state:
+                link_index: Dict[str, List[int]] = {}
+                for i, link_id in enumerate(links["link_id"]):
+                    link_index.setdefault(str(link_id), []).append(i)
+                result["state"] = {
+                    "params": {
                         "pollutants": pollutants,
+                        "model_year": model_year,
                         "season": season,
-                        "links_count": len(links_data)
+                        "default_fleet_mix": default_fleet_mix,
+                        "model_year_distribution": model_year_distribution,
+                        "rate_method": rate_method,
+                        "result_format": result_format,
+                    },
+                    "links_data": list(links_data),
+                    "link_index": link_index,
+                    "rounded_totals": rounded_totals,
+                    "totals": totals,
+                    "results": data.get("results", data.get("results_columns")),
+                }
+            return result
+
+        except Exception as e:
+            return {
+                "status": "error",
+                "error_code": "CALCULATION_ERROR",
+                "message": str(e)
+            }
+
+    def calculate_stream(self, chunks: Iterable[Dict[str, Any]], pollutants: List[str],
+                         model_year: int, season: str, default_fleet_mix: Dict = None,
+                         model_year_distribution: Optional[Dict] = None,
+                         rate_method: str = "average",
+                         on_chunk: Optional[Callable[[Dict[str, Any], pd.DataFrame], None]] = None) -> Dict:
+        """
+        流式宏观排放计算（区域级超大路网分块处理，内存占用与块大小相关）
+
+        每块为字典，chunk["links_data"] 为该块路段列表（格式同 calculate），其余键原样传给回调。
+        各块按 calculate 的列式结果计算，逐路段四舍五入后的总排放跨块按路段顺序累加，
+        汇总结果与一次性 calculate 一致。
+        逐路段结果不在内存中保留，由 on_chunk(块, 列式结果 DataFrame) 回调写出，
+        返回数据中 results 仅包含前 STREAM_PREVIEW_ROWS 个路段的预览。
+        """
+        try:
+            total_links = 0
+            totals = None
+            preview: List[Dict] = []
+            kwargs = {
+                "model_year": model_year,
+                "season": season,
+                "default_fleet_mix": default_fleet_mix,
+                "model_year_distribution": model_year_distribution,
+                "rate_method": rate_method,
+            }
+
+            # 逐块计算
+            for chunk in chunks:
+                links_data = chunk["links_data"]
+                if not links_data:
+                    continue
+
+                result = self.calculate(links_data, pollutants, result_format="columnar", **kwargs)
+                if result.get("status") == "error":
+                    raise ValueError(result["message"])
+                frame = result["data"]["results_columns"]
+                pollutants = result["data"]["query_info"]["pollutants"]
+
+                # 汇总按路段顺序累加（上一块的累计值作为首行）
+                rounded_totals = self._round_array(
+                    frame[[f"{pollutant}_kg_per_hr" for pollutant in pollutants]].to_numpy(), 4
+                )
+                if totals is not None:
+                    rounded_totals = np.vstack([totals, rounded_totals])
+                totals = self._sum_rounded_totals(rounded_totals)
+
+                if len(preview) < self.STREAM_PREVIEW_ROWS:
+                    k = self.STREAM_PREVIEW_ROWS - len(preview)
+                    preview.extend(self.calculate(links_data[:k], pollutants, **kwargs)["data"]["results"])
+
+                if on_chunk is not None:
+                    on_chunk(chunk, frame)
+
+                total_links += len(links_data)
+
+            if total_links == 0:
+                raise ValueError("路段数据不能为空")
+
+            data = {
+                "query_info": {
+                    "model_year": model_year,
+                    "pollutants": pollutants,
+                    "season": season,
+                    "links_count": total_links,
+                    "streaming": True
+                },
+                "summary": self._summary_from_totals(total_links, totals, pollutants),
+                "results": preview
+            }
+            if model_year_distribution:
+                data["query_info"]["model_year_distribution"] = model_year_distribution
+            if rate_method != "average":
+                data["query_info"]["rate_method"] = rate_method
+
+            return {
+                "status": "success",
+                "data": data
+            }
+
+        except Exception as e:
+            return {
+                "status": "error",
+                "error_code": "CALCULATION_ERROR",
+                "message": str(e)
+            }
+
+    def calculate_scenarios(self, links_data: List[Dict], scenarios: List[Dict], pollutants: List[str],
+                            model_year: int, season: str, default_fleet_mix: Dict = None,
+                            model_year_distribution: Optional[Dict] = None,
+                            rate_method: str = "average") -> Dict:
+        """
+        情景对比：同一路网在多组参数扰动下的总排放
+
+        排放率、车队组成和车型年份分布只解析一次，所有情景的流量、速度和
+        车型排放系数组成 情景×路段 / 情景×车型 矩阵批量计算。
+
+        每个情景为字典（均可省略）：
+            name: 情景名称
+            flow_scale: 流量倍数，如 1.1
+            speed_scale: 速度倍数，如 0.9
+            speed_change_kph: 速度增减 (km/h)，如 -10（在 speed_scale 之后应用）
+            speed_limit_kph: 限速 (km/h)，超过的路段速度取限速
+            electrify: {车型: 电动化比例%}，该比例的车辆尾气排放为0，如 {"Transit Bus": 30}
+
+        Returns:
+            data["scenarios"]: 基准情景及各情景的总排放 (kg/hr)、相对基准的变化量和变化百分比。
+            路段排放直接累加，不做逐路段四舍五入，与 calculate 的汇总可能有末位差异。
+        """
+        try:
+            # 1. 验证输入
+            if not links_data:
+                raise ValueError("路段数据不能为空")
+            if not scenarios:
+                raise ValueError("情景列表不能为空")
+            self._check_rate_method(rate_method)
+            pollutants = list(dict.fromkeys(pollutants))
+
+            # 2. 共享的路段属性、车队组成和排放率
+            emission_matrix = self._load_emission_matrix(season)
+            links = self._links_to_columns(links_data)
+            fleet = self._build_fleet_matrix(links_data, default_fleet_mix or self.DEFAULT_FLEET_MIX)
+            year_weights = self._build_model_year_weights(
+                links_data, fleet["vehicle_names"], model_year, model_year_distribution
+            )
+            profile_rates, _, _ = self._profile_rates(
+                emission_matrix, fleet, pollutants, model_year, year_weights, rate_method
+            )
+            n_profiles, n_bins = profile_rates.shape[:2]
+            combined_rates = profile_rates.reshape((n_profiles * n_bins,) + profile_rates.shape[2:])
+            link_profiles = year_weights["link_profiles"]
+            if link_profiles is None:
+                link_profiles = np.zeros(len(links_data), dtype=np.int64)
+
+            # 3. 情景矩阵：情景×路段 的流量、速度，情景×车型 的排放系数
+            specs = [{"name": "基准"}] + [
+                {**scenario, "name": scenario.get("name") or f"情景{i}"} for i, scenario in enumerate(scenarios, 1)
+            ]
+            flows, speeds, multipliers = self._scenario_matrices(specs, links, fleet["vehicle_names"])
+            active = flows > 0
+            bad = np.flatnonzero((active & ~(speeds > 0)).any(axis=1))
+            if len(bad):
+                raise ValueError(f"情景 {specs[bad[0]]['name']} 调整后存在有流量但速度不大于0的路段")
+
+            # 4. 批量计算：车队平均排放率按 (年份分布, 速度档) 组合分组求矩阵乘积
+            with np.errstate(divide="ignore", invalid="ignore"):
+                vehicle_seconds = np.where(
+                    active, flows * (links["link_length_km"][np.newaxis, :] / speeds) * 3600, 0.0
+                )
+            shares = fleet["shares"] / 100
+            totals = np.zeros((len(specs), len(pollutants)))
+            for k, spec in enumerate(specs):
+                bins = speed_to_bin(speeds[k]) if rate_method == "speed_binned" else 0
+                combos = link_profiles * n_bins + bins
+                weighted_shares = shares * multipliers[k]
+                fleet_rates = np.zeros((len(links_data), len(pollutants)))
+                for combo in np.unique(combos):
+                    rows = np.flatnonzero(combos == combo)
+                    fleet_rates[rows] = weighted_shares[rows] @ combined_rates[combo]
+                totals[k] = (fleet_rates * vehicle_seconds[k][:, np.newaxis]).sum(axis=0) / 1000
+
+            # 5. 对比表
+            base = totals[0]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                change_pct = np.where(base != 0, (totals - base) / base * 100, np.nan)
+            comparison = []
+            for k, spec in enumerate(specs):
+                comparison.append({
+                    "name": spec["name"],
+                    "parameters": {key: value for key, value in spec.items() if key != "name"},
+                    "total_emissions_kg_per_hr": {
+                        pollutant: round(float(totals[k, j]), 4) for j, pollutant in enumerate(pollutants)
                     },
+                    "change_kg_per_hr": {
+                        pollutant: round(float(totals[k, j] - base[j]), 4) for j, pollutant in enumerate(pollutants)
+                    },
+                    "change_pct": {
+                        pollutant: None if np.isnan(change_pct[k, j]) else round(float(change_pct[k, j]), 2)
+                        for j, pollutant in enumerate(pollutants)
+                    },
+                })
+
+            data = {
+                "query_info": {
+                    "model_year": model_year,
+                    "pollutants": pollutants,
+                    "season": season,
+                    "links_count": len(links_data),
+                    "scenarios_count": len(scenarios)
+                },
+                "scenarios": comparison
+            }
+            if model_year_distribution:
+                data["query_info"]["model_year_distribution"] = model_year_distribution
+            if rate_method != "average":
+                data["query_info"]["rate_method"] = rate_method
+
+            return {
+                "status": "success",
+                "data": data
+            }
+
+        except Exception as e:
+            return {
+                "status": "error",
+                "error_code": "CALCULATION_ERROR",
+                "message": str(e)
+            }
+
+    SCENARIO_KEYS = ("name", "flow_scale", "speed_scale", "speed_change_kph", "speed_limit_kph", "electrify")
+
+    def _scenario_matrices(self, specs: List[Dict], links: Dict[str, Any], vehicle_names: List[str]):
+        """
+        由情景参数生成 情景×路段 流量、速度矩阵和 情景×车型 排放系数矩阵
+
+        未出现在任何路段车队组成中的电动化车型被忽略；未知参数和未知车型报错。
+        """
+        n_links = len(links["link_id"])
+        flows = np.empty((len(specs), n_links))
+        speeds = np.empty((len(specs), n_links))
+        multipliers = np.ones((len(specs), len(vehicle_names)))
+        vehicle_pos = {name: v for v, name in enumerate(vehicle_names)}
+
+        for k, spec in enumerate(specs):
+            unknown = set(spec) - set(self.SCENARIO_KEYS)
+            if unknown:
+                raise ValueError(f"情景 {spec['name']} 包含不支持的参数: {sorted(unknown)}")
+
+            flows[k] = links["traffic_flow_vph"] * float(spec.get("flow_scale", 1.0))
+            speed = links["avg_speed_kph"] * float(spec.get("speed_scale", 1.0))
+            speed = speed + float(spec.get("speed_change_kph", 0.0))
+            if spec.get("speed_limit_kph") is not None:
+                speed = np.minimum(speed, float(spec["speed_limit_kph"]))
+            speeds[k] = speed
+
+            for vehicle_name, percent in (spec.get("electrify") or {}).items():
+                if vehicle_name not in self.VEHICLE_TO_SOURCE_TYPE:
+                    raise ValueError(f"情景 {spec['name']} 的电动化车型未知: {vehicle_name}")
+                percent = float(percent)
+                if not 0 <= percent <= 100:
+                    raise ValueError(f"情景 {spec['name']} 的电动化比例必须在0-100之间: {vehicle_name}={percent}")
+                if vehicle_name in vehicle_pos:
+                    multipliers[k, vehicle_pos[vehicle_name]] = 1 - percent / 100
+
+        return flows, speeds, multipliers
+
+    def recalculate(self, state: Dict[str, Any], link_updates: List[Dict]) -> Dict:
+        """
+        增量重算：只重新计算被修改的路段，并修补汇总
+
+        Args:
+            state: calculate(return_state=True) 或上一次 recalculate 返回的 state（不会被修改）
+            link_updates: [{"link_id": ..., 要修改的字段: 新值}, ...]，
+                          可修改 link_length_km, traffic_flow_vph, avg_speed_kph, fleet_mix, model_year_distribution
+
+        Returns:
+            与 calculate 相同结构的结果（data["updated_links"] 为重算的路段ID），附带新的 state。
+            汇总 = 原汇总 - 修改路段原排放 + 修改路段新排放。
+        """
+        try:
+            if not link_updates:
+                raise ValueError("没有需要修改的路段")
+            params = state["params"]
+            pollutants = params["pollutants"]
+
+            # 1. 应用修改
+            links_data = list(state["links_data"])
+            changed = set()
+            for update in link_updates:
+                positions = state["link_index"].get(str(update.get("link_id")))
+                if not positions:
+                    raise ValueError(f"未找到路段: {update.get('link_id')}")
+                for i in positions:
+                    links_data[i] = {**links_data[i], **{k: v for k, v in update.items() if k != "link_id"}}
+                    changed.add(i)
+            positions = np.array(sorted(changed), dtype=np.int64)
+            changed_links = [links_data[i] for i in positions]
+
+            # 2. 重算修改过的路段
+            emission_matrix = self._load_emission_matrix(params["season"])
+            links = self._links_to_columns(changed_links)
+            fleet = self._build_fleet_matrix(changed_links, params["default_fleet_mix"] or self.DEFAULT_FLEET_MIX)
+            year_weights = self._build_model_year_weights(
+                changed_links, fleet["vehicle_names"], params["model_year"], params["model_year_distribution"]
+            )
+            computed = self.calculate_link_emissions(
+                links["link_length_km"], links["traffic_flow_vph"], links["avg_speed_kph"],
+                fleet, pollutants, params["model_year"], emission_matrix, year_weights, params["rate_method"]
+            )
+
+            # 3. 修补汇总：减去旧贡献，加上新贡献
+            changed_rounded = self._round_array(computed["link_totals"], 4)
+            rounded_totals = state["rounded_totals"].copy()
+            totals = state["totals"] - rounded_totals[positions].sum(axis=0) + changed_rounded.sum(axis=0)
+            rounded_totals[positions] = changed_rounded
+
+            # 4. 替换结果中的对应路段
+            if params["result_format"] == "columnar":
+                results = state["results"].copy()
+                changed_frame = self._build_result_frame(links, computed, pollutants)
+                for k, column in enumerate(changed_frame.columns):
+                    results.iloc[positions, k] = changed_frame[column].to_numpy()
+                results_key = "results_columns"
+            else:
+                results = list(state["results"])
+                for i, row in zip(positions.tolist(), self._build_link_rows(links, fleet, computed, pollutants)):
+                    results[i] = row
+                results_key = "results"
+
+            data = {
+                "query_info": {
+                    "model_year": params["model_year"],
+                    "pollutants": pollutants,
+                    "season": params["season"],
+                    "links_count": len(links_data)
+                },
+                "summary": self._summary_from_totals(len(links_data), totals, pollutants),
+                results_key: results,
+                "updated_links": links["link_id"],
+            }
+            if params["model_year_distribution"]:
+                data["query_info"]["model_year_distribution"] = params["model_year_distribution"]
+            if params["rate_method"] != "average":
+                data["query_info"]["rate_method"] = params["rate_method"]
+
+            return {
+                "status": "success",
+                "data": data,
+                "state": {
+                    **state,
+                    "links_data": links_data,
+                    "rounded_totals": rounded_totals,
+                    "totals": totals,
                     "results": results,
-                    "summary": summary
                 }
             }
 
@@ -117,152 +539,650 @@ class MacroEmissionCalculator:
                 "message": str(e)
             }
 
-    def _load_emission_matrix(self, season: str) -> pd.DataFrame:
-        """加载排放矩阵"""
-        season_code = self.SEASON_CODES.get(season, 7)
-        season_key = "winter" if season_code == 1 else ("spring" if season_code == 4 else "summer")
-        csv_file = self.csv_files[season_key]
-        csv_path = self.data_path / csv_file
+    def calculate_link_emissions(self, lengths_km: np.ndarray, flows_vph: np.ndarray,
+                                 speeds_kph: np.ndarray, fleet: Dict[str, Any],
+                                 pollutants: List[str], model_year: int,
+                                 matrix: EmissionRateTensor,
+                                 year_weights: Optional[Dict[str, Any]] = None,
+                                 rate_method: str = "average") -> Dict[str, np.ndarray]:
+        """
+        路段 × 车型 × 污染物 排放矩阵计算
+
+        MOVES EmissionQuant 单位是 g/hr，按平均opMode 300（或速度档opMode分布）查询：
+        1. 单车排放率 (g/s) = Σ年份 权重 × emission_rate / 3600 → 车型×污染物 矩阵
+           （各路段分布或速度档不同时为 路段×车型×污染物）
+        2. 单车通过路段的行驶时间 (s) = 长度 / 速度 × 3600     → 路段向量
+        3. 每小时车辆数 = 流量 × 车型占比 / 100                → 路段×车型 矩阵
+        4. 路段每小时排放 (kg/hr) = 排放率 × 行驶时间 × 车辆数 / 1000
+
+        Args:
+            lengths_km, flows_vph, speeds_kph: 路段长度、流量、平均速度
+            fleet: _build_fleet_matrix 的结果（车型名、标准化后的百分比矩阵、各路段车型顺序）
+            pollutants: 污染物列表（不含重复项）
+            model_year: 车型年份
+            matrix: 排放率张量
+            year_weights: _build_model_year_weights 的结果，None 表示全部车型使用 model_year
+            rate_method: 排放率方法，见 RATE_METHODS / SPEED_BINNED
+
+        Returns:
+            vehicles_per_hour (路段×车型), emissions (路段×车型×污染物, kg/hr),
+            link_totals (路段×污染物, kg/hr), rates_g_per_veh_km (路段×污染物)
+        """
+        lengths_km = np.asarray(lengths_km, dtype=np.float64)
+        flows_vph = np.asarray(flows_vph, dtype=np.float64)
+        speeds_kph = np.asarray(speeds_kph, dtype=np.float64)
+
+        rates_g_per_sec, valid_vehicles, valid_pollutants = self._link_vehicle_rates(
+            matrix, fleet, pollutants, model_year, year_weights, rate_method, speeds_kph
+        )
+        self._check_divisors(lengths_km, flows_vph, speeds_kph, fleet, valid_vehicles, valid_pollutants)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            travel_time_sec = (lengths_km / speeds_kph) * 3600
+            vehicles_per_hour = flows_vph[:, np.newaxis] * fleet["shares"] / 100
+            emissions = (
+                (rates_g_per_sec * travel_time_sec[:, np.newaxis, np.newaxis])
+                * vehicles_per_hour[:, :, np.newaxis] / 1000
+            )
+        emissions[:, :, ~valid_pollutants] = 0.0
+
+        # 各路段按自身车型顺序累加（与逐车型循环累加的浮点结果一致）
+        link_totals = np.zeros((len(lengths_km), len(pollutants)))
+        for link_index, vehicle_columns in fleet["groups"]:
+            for col in vehicle_columns:
+                if valid_vehicles[col]:
+                    link_totals[link_index] += emissions[link_index, col]
+
+        # 单位排放率 (g/veh-km)，流量为0的路段不计算
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rates_g_per_veh_km = link_totals * 1000 / lengths_km[:, np.newaxis] / flows_vph[:, np.newaxis]
+        rates_g_per_veh_km[flows_vph <= 0] = np.nan
+
+        return {
+            "vehicles_per_hour": vehicles_per_hour,
+            "emissions": emissions,
+            "link_totals": link_totals,
+            "rates_g_per_veh_km": rates_g_per_veh_km,
+            "valid_vehicles": valid_vehicles,
+            "valid_pollutants": valid_pollutants,
+        }
+
+    def calculate_time_series(self, links_data: List[Dict], flows_vph: np.ndarray, speeds_kph: np.ndarray,
+                              pollutants: List[str], model_year: int, season: str,
+                              default_fleet_mix: Dict = None,
+                              model_year_distribution: Optional[Dict] = None,
+                              rate_method: str = "average",
+                              hours_per_chunk: int = 24,
+                              output_dir: Optional[str] = None,
+                              on_chunk: Optional[Callable[[int, Dict[str, np.ndarray]], None]] = None) -> Dict:
+        """
+        逐小时时间序列宏观排放计算（如全年 8760 小时）
+
+        路段长度、车队组成和车型年份分布只解析一次，排放率只查询一次：
+        先按车队组成求每个路段的车队平均单车排放率（路段×速度档×污染物，
+        rate_method="average" 时只有一个速度档），
+        各小时的排放 = 该小时速度档的平均排放率 × 行驶时间 × 流量，逐块（默认每天24小时）计算。
+
+        Args:
+            links_data: 路段列表（link_id, link_length_km, fleet_mix, model_year_distribution），
+                        不需要流量和速度
+            flows_vph: 流量矩阵 (路段×小时)，可为 np.memmap
+            speeds_kph: 平均速度矩阵 (路段×小时)，可为 np.memmap
+            hours_per_chunk: 每块小时数
+            output_dir: 输出目录，每个污染物写出 <污染物>_kg_per_hr.npy (路段×小时, float32)
+            on_chunk: 回调 on_chunk(起始小时, {污染物: 路段×块小时数 排放 kg/hr})
+
+        内存只保留一块的数据。既没有 output_dir 也没有 on_chunk 时，
+        完整结果矩阵返回在 data["emissions_kg_per_hr"] 中（仅适合小规模计算）。
+        流量为0的小时排放为0；流量大于0时速度必须大于0。
+        """
+        try:
+            # 1. 验证输入
+            if not links_data:
+                raise ValueError("路段数据不能为空")
+            if hours_per_chunk <= 0:
+                raise ValueError("每块小时数必须大于0")
+            self._check_rate_method(rate_method)
+            if np.ndim(flows_vph) != 2 or np.shape(flows_vph) != np.shape(speeds_kph):
+                raise ValueError("流量和速度必须是形状相同的 路段×小时 矩阵")
+            n_links, n_hours = np.shape(flows_vph)
+            if n_links != len(links_data):
+                raise ValueError(f"流量矩阵行数 ({n_links}) 与路段数 ({len(links_data)}) 不一致")
+            pollutants = list(dict.fromkeys(pollutants))
+
+            # 2. 路段属性、车队组成和排放率只解析一次
+            emission_matrix = self._load_emission_matrix(season)
+            lengths_km = np.array([link["link_length_km"] for link in links_data], dtype=np.float64)
+            fleet = self._build_fleet_matrix(links_data, default_fleet_mix or self.DEFAULT_FLEET_MIX)
+            year_weights = self._build_model_year_weights(
+                links_data, fleet["vehicle_names"], model_year, model_year_distribution
+            )
+            profile_rates, _, _ = self._profile_rates(
+                emission_matrix, fleet, pollutants, model_year, year_weights, rate_method
+            )
+            # 车队平均单车排放率 (g/s)：路段×速度档×污染物
+            link_profiles = year_weights["link_profiles"]
+            fleet_rates = np.zeros((n_links, profile_rates.shape[1], len(pollutants)))
+            for k in range(len(profile_rates)):
+                rows = slice(None) if link_profiles is None else np.flatnonzero(link_profiles == k)
+                fleet_rates[rows] = np.einsum("lv,bvp->lbp", fleet["shares"][rows] / 100, profile_rates[k])
+            link_rows = np.arange(n_links)[:, np.newaxis]
+
+            outputs = {}
+            if output_dir:
+                Path(output_dir).mkdir(parents=True, exist_ok=True)
+                for pollutant in pollutants:
+                    path = Path(output_dir) / f"{self._safe_name(pollutant)}_kg_per_hr.npy"
+                    outputs[pollutant] = np.lib.format.open_memmap(
+                        path, mode="w+", dtype=np.float32, shape=(n_links, n_hours)
+                    )
+            elif on_chunk is None:
+                outputs = {pollutant: np.zeros((n_links, n_hours)) for pollutant in pollutants}
+
+            # 3. 逐块计算
+            hourly_totals = np.zeros((n_hours, len(pollutants)))
+            for start in range(0, n_hours, hours_per_chunk):
+                stop = min(start + hours_per_chunk, n_hours)
+                flows = np.asarray(flows_vph[:, start:stop], dtype=np.float64)
+                speeds = np.asarray(speeds_kph[:, start:stop], dtype=np.float64)
+
+                active = flows > 0
+                invalid = active & ~(speeds > 0)
+                if invalid.any():
+                    link, hour = np.argwhere(invalid)[0]
+                    raise ValueError(
+                        f"路段 {links_data[link].get('link_id', link)} 第 {start + hour} 小时"
+                        f"有流量但平均速度不大于0"
+                    )
+
+                # 每小时车辆总行驶时间 (veh·s) = 流量 × 长度 / 速度 × 3600
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    vehicle_seconds = np.where(active, flows * (lengths_km[:, np.newaxis] / speeds) * 3600, 0.0)
+
+                speed_bins = speed_to_bin(speeds) if rate_method == "speed_binned" else np.zeros(speeds.shape, dtype=np.int64)
+                chunk = {}
+                for j, pollutant in enumerate(pollutants):
+                    emissions = fleet_rates[link_rows, speed_bins, j] * vehicle_seconds / 1000
+                    hourly_totals[start:stop, j] = emissions.sum(axis=0)
+                    chunk[pollutant] = emissions
+                    if pollutant in outputs:
+                        outputs[pollutant][:, start:stop] = emissions
+
+                if on_chunk is not None:
+                    on_chunk(start, chunk)
+
+            for values in outputs.values():
+                if isinstance(values, np.memmap):
+                    values.flush()
+
+            # 4. 汇总
+            peak_hours = hourly_totals.argmax(axis=0) if n_hours else np.zeros(len(pollutants), dtype=int)
+            data = {
+                "query_info": {
+                    "model_year": model_year,
+                    "pollutants": pollutants,
+                    "season": season,
+                    "links_count": n_links,
+                    "hours": n_hours
+                },
+                "summary": {
+                    "total_links": n_links,
+                    "total_hours": n_hours,
+                    "total_emissions_kg": {
+                        pollutant: round(float(hourly_totals[:, j].sum()), 4)
+                        for j, pollutant in enumerate(pollutants)
+                    },
+                    "peak_hour": {
+                        pollutant: {
+                            "hour": int(peak_hours[j]),
+                            "emissions_kg_per_hr": round(float(hourly_totals[peak_hours[j], j]), 4) if n_hours else 0
+                        }
+                        for j, pollutant in enumerate(pollutants)
+                    }
+                },
+                "hourly_totals_kg_per_hr": {
+                    pollutant: hourly_totals[:, j] for j, pollutant in enumerate(pollutants)
+                }
+            }
+            if model_year_distribution:
+                data["query_info"]["model_year_distribution"] = model_year_distribution
+            if rate_method != "average":
+                data["query_info"]["rate_method"] = rate_method
+            if output_dir:
+                data["output_files"] = {pollutant: str(values.filename) for pollutant, values in outputs.items()}
+            elif on_chunk is None:
+                data["emissions_kg_per_hr"] = outputs
+
+            return {
+                "status": "success",
+                "data": data
+            }
+
+        except Exception as e:
+            return {
+                "status": "error",
+                "error_code": "CALCULATION_ERROR",
+                "message": str(e)
+            }
+
+    @staticmethod
+    def _safe_name(pollutant: str) -> str:
+        """污染物名用作文件名（PM2.5 → PM2_5）"""
+        return "".join(ch if ch.isalnum() else "_" for ch in pollutant)
 
-        if not csv_path.exists():
-            raise FileNotFoundError(f"数据文件不存在: {csv_path}")
+    def _link_vehicle_rates(self, matrix: EmissionRateTensor, fleet: Dict[str, Any], pollutants: List[str],
+                            model_year: int, year_weights: Optional[Dict[str, Any]],
+                            rate_method: str = "average", speeds_kph: Optional[np.ndarray] = None):
+        """
+        各路段的单车排放率 (g/s)，按车型年份分布（和速度档）取值
 
-        # 读取CSV - 格式: opModeID,pollutantID,sourceTypeID,modelYearID,em,extra
+        Returns:
+            (排放率数组 (1或路段数)×车型×污染物, 有效车型掩码, 有效污染物掩码)
+        """
+        if year_weights is None:
+            year_weights = self._build_model_year_weights([], fleet["vehicle_names"], model_year, None)
+
+        profile_rates, valid_vehicles, valid_pollutants = self._profile_rates(
+            matrix, fleet, pollutants, model_year, year_weights, rate_method
+        )
+        link_profiles = year_weights["link_profiles"]
+        if rate_method == "speed_binned":
+            speed_bins = speed_to_bin(speeds_kph)
+            rates_g_per_sec = profile_rates[0 if link_profiles is None else link_profiles, speed_bins]
+        elif link_profiles is None:
+            rates_g_per_sec = profile_rates[0, 0][np.newaxis, :, :]
+        else:
+            rates_g_per_sec = profile_rates[link_profiles, 0]
+        return rates_g_per_sec, valid_vehicles, valid_pollutants
+
+    def _profile_rates(self, matrix: EmissionRateTensor, fleet: Dict[str, Any], pollutants: List[str],
+                       model_year: int, year_weights: Dict[str, Any], rate_method: str):
+        """
+        各车型年份分布下的单车排放率 (g/s)
+
+        Returns:
+            (排放率数组 分布×速度档×车型×污染物, 有效车型掩码, 有效污染物掩码)
+        """
+        rate_cube, valid_vehicles, valid_pollutants = self._vehicle_rate_matrix(
+            matrix, fleet["vehicle_names"], pollutants, year_weights["years"], rate_method
+        )
+        missing_years = sorted(
+            set(year_weights["distribution_years"].tolist())
+            - set(matrix.axis_ids["model_year"].tolist())
+        )
+        if missing_years:
+            raise ValueError(f"车型年份分布包含排放矩阵中没有的年份: {missing_years}")
+
+        # 按年份轴加权：分布×车型×年份 · 车型×污染物×年份×速度档 → 分布×速度档×车型×污染物
+        profile_rates = np.einsum("kvy,vpyb->kbvp", year_weights["weights"], rate_cube)
+        return profile_rates, valid_vehicles, valid_pollutants
+
+    def _load_emission_matrix(self, season: str) -> EmissionRateTensor:
+        """加载排放矩阵（进程内按季节缓存的排放率张量）"""
+        return get_rate_store().get_tensor(
+            dataset_path("macro_emission", season), self._read_emission_csv,
+            (self.COL_OPMODE, self.COL_POLLUTANT, self.COL_SOURCE_TYPE,
+             self.COL_MODEL_YEAR, self.COL_EMISSION)
+        )
+
+    def preload(self):
+        """预加载全部季节的排放率张量（服务启动或worker初始化时调用；opMode分布在首次使用时加载）"""
+        for season in self.SEASON_CODES:
+            self._load_emission_matrix(season)
+
+    def _check_rate_method(self, rate_method: str):
+        """校验排放率方法（speed_binned 需要MOVES opMode分布数据文件）"""
+        if rate_method in self.RATE_METHODS:
+            return
+        if rate_method == self.SPEED_BINNED:
+            if opmode_distribution_available():
+                return
+            raise ValueError(f"speed_binned 排放率方法需要MOVES opMode分布数据文件: {OPMODE_DISTRIBUTION_FILE}")
+        raise ValueError(f"不支持的排放率方法: {rate_method}")
+
+    def _read_emission_csv(self, csv_path: Path) -> pd.DataFrame:
+        """读取CSV - 格式: opModeID,pollutantID,sourceTypeID,modelYearID,em,extra"""
         return pd.read_csv(csv_path, header=None,
                           names=[self.COL_OPMODE, self.COL_POLLUTANT,
                                 self.COL_SOURCE_TYPE, self.COL_MODEL_YEAR,
                                 self.COL_EMISSION, 'extra'])
 
-    def _calculate_link(self, link: Dict, pollutants: List[str],
-                       model_year: int, matrix: pd.DataFrame,
-                       default_fleet_mix: Dict) -> Dict:
-        """计算单个路段排放"""
-
-        # 单位转换 (km -> mile)
-        length_mi = link["link_length_km"] * 0.621371
-        speed_mph = link["avg_speed_kph"] * 0.621371
-
-        # 获取车队组成
-        fleet_mix = link.get("fleet_mix", default_fleet_mix).copy()
-
-        # 归一化车队百分比到100%（修复：如果输入百分比总和不是100%，需要标准化）
-        total_percentage = sum(fleet_mix.values())
-        if total_percentage > 0 and abs(total_percentage - 100.0) > 0.01:  # 允许浮点误差
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.info(f"[MacroEmission] 车队百分比总和={total_percentage:.2f}%，标准化到100%")
-            for vehicle_name in fleet_mix:
-                fleet_mix[vehicle_name] = (fleet_mix[vehicle_name] / total_percentage) * 100.0
-
-        # 初始化结果
-        link_result = {
-            "link_id": link.get("link_id", "unknown"),
-            "link_length_km": link["link_length_km"],
-            "traffic_flow_vph": link["traffic_flow_vph"],
-            "avg_speed_kph": link["avg_speed_kph"],
-            "fleet_composition": {},
-            "emissions_by_vehicle": {},
-            "total_emissions_kg_per_hr": {p: 0.0 for p in pollutants}
+    @staticmethod
+    def _links_to_columns(links_data: List[Dict]) -> Dict[str, Any]:
+        """将路段字典列表转换为列（数值列为float64数组，原始值保留用于逐路段输出）"""
+        lengths = [link["link_length_km"] for link in links_data]
+        flows = [link["traffic_flow_vph"] for link in links_data]
+        speeds = [link["avg_speed_kph"] for link in links_data]
+        return {
+            "link_id": [link.get("link_id", "unknown") for link in links_data],
+            "raw": {"link_length_km": lengths, "traffic_flow_vph": flows, "avg_speed_kph": speeds},
+            "link_length_km": np.array(lengths, dtype=np.float64),
+            "traffic_flow_vph": np.array(flows, dtype=np.float64),
+            "avg_speed_kph": np.array(speeds, dtype=np.float64),
         }
 
-        # 对每个车型计算
-        for vehicle_name, percentage in fleet_mix.items():
-            source_type_id = self.VEHICLE_TO_SOURCE_TYPE.get(vehicle_name)
-            if source_type_id is None:
+    def _build_fleet_matrix(self, links_data: List[Dict], default_fleet_mix: Dict) -> Dict[str, Any]:
+        """
+        构建 路段×车型 百分比矩阵
+
+        车队百分比总和不是100%时按路段标准化到100%。
+        车型列按首次出现顺序排列；车型顺序相同的路段归为一组，
+        组内按该顺序累加，保证与逐路段计算的结果一致。
+
+        Returns:
+            vehicle_names: 车型列名
+            shares: 路段×车型 百分比矩阵（路段未包含的车型为0）
+            groups: [(路段下标数组, 该组车型列下标列表), ...]
+        """
+        vehicle_index: Dict[str, int] = {}
+        group_index: Dict[tuple, int] = {}
+        group_links: List[List[int]] = []
+        group_mixes: List[List[Dict]] = []
+
+        for i, link in enumerate(links_data):
+            fleet_mix = link.get("fleet_mix", default_fleet_mix)
+            key = tuple(fleet_mix)
+            g = group_index.get(key)
+            if g is None:
+                g = group_index[key] = len(group_links)
+                group_links.append([])
+                group_mixes.append([])
+                for vehicle_name in key:
+                    vehicle_index.setdefault(vehicle_name, len(vehicle_index))
+            group_links[g].append(i)
+            group_mixes[g].append(fleet_mix)
+
+        shares = np.zeros((len(links_data), len(vehicle_index)))
+        groups = []
+        for key, link_rows, mixes in zip(group_index, group_links, group_mixes):
+            link_rows = np.array(link_rows, dtype=np.int64)
+            columns = [vehicle_index[vehicle_name] for vehicle_name in key]
+            if not columns:
+                groups.append((link_rows, columns))
                 continue
 
-            vehicles_per_hour = link["traffic_flow_vph"] * percentage / 100
+            percentages = np.array([list(mix.values()) for mix in mixes], dtype=np.float64)
+            total_percentage = np.zeros(len(link_rows))
+            for j in range(len(columns)):
+                total_percentage = total_percentage + percentages[:, j]
 
-            link_result["fleet_composition"][vehicle_name] = {
-                "source_type_id": source_type_id,
-                "percentage": percentage,
-                "vehicles_per_hour": round(vehicles_per_hour, 2)
-            }
+            # 归一化车队百分比到100%（修复：如果输入百分比总和不是100%，需要标准化）
+            normalize = (total_percentage > 0) & (np.abs(total_percentage - 100.0) > 0.01)
+            if normalize.any():
+                logger.info(f"[MacroEmission] {int(normalize.sum())} 个路段车队百分比总和不是100%，已标准化")
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    normalized = (percentages / total_percentage[:, np.newaxis]) * 100.0
+                percentages = np.where(normalize[:, np.newaxis], normalized, percentages)
+
+            shares[link_rows[:, np.newaxis], columns] = percentages
+            groups.append((link_rows, columns))
+
+        return {"vehicle_names": list(vehicle_index), "shares": shares, "groups": groups}
 
-            vehicle_emissions = {}
+    def _build_model_year_weights(self, links_data: List[Dict], vehicle_names: List[str],
+                                  model_year: int, model_year_distribution: Optional[Dict]) -> Dict[str, Any]:
+        """
+        构建车型年份权重
 
-            for pollutant in pollutants:
-                pollutant_id = self.POLLUTANT_TO_ID.get(pollutant)
-                if pollutant_id is None:
+        内容相同的路段分布只保留一份，路段通过下标引用。
+
+        Returns:
+            years: 年份数组
+            distribution_years: 分布中出现的年份
+            weights: 分布×车型×年份 权重（每个车型权重和为1）
+            link_profiles: 各路段的分布下标；全网使用同一分布时为None
+        """
+        global_distribution = self._normalize_year_distribution(model_year_distribution)
+
+        profiles = [global_distribution]
+        link_profiles = None
+        if any("model_year_distribution" in link for link in links_data):
+            profile_index = {tuple(sorted(global_distribution.items())): 0}
+            by_object: Dict[int, int] = {}
+            link_profiles = np.zeros(len(links_data), dtype=np.int64)
+            for i, link in enumerate(links_data):
+                link_distribution = link.get("model_year_distribution")
+                if not link_distribution:
                     continue
+                k = by_object.get(id(link_distribution))
+                if k is None:
+                    merged = {**global_distribution, **self._normalize_year_distribution(link_distribution)}
+                    key = tuple(sorted(merged.items()))
+                    k = profile_index.get(key)
+                    if k is None:
+                        k = profile_index[key] = len(profiles)
+                        profiles.append(merged)
+                    by_object[id(link_distribution)] = k
+                link_profiles[i] = k
 
-                # 查询排放率 (使用平均opMode=300)
-                emission_rate = self._query_emission_rate(
-                    matrix, source_type_id, pollutant_id, model_year
-                )
+        distribution_years = {year for profile in profiles for shares in profile.values() for year, _ in shares}
+        years = sorted(distribution_years | {model_year})
+        year_pos = {year: pos for pos, year in enumerate(years)}
 
-                # 计算排放量
-                # MOVES EmissionQuant 单位是 g/hr (不是 g/mile)
-                # 正确的物理逻辑：
-                # 1. 单车排放率 (g/s) = emission_rate / 3600
-                # 2. 单车通过路段的行驶时间 (s) = link_length_km / avg_speed_kph * 3600
-                # 3. 单车通过路段的排放量 (g) = 排放率 × 行驶时间
-                # 4. 路段每小时总排放 = 单车排放量(g) × vehicles_per_hour / 1000 = kg/hr
-
-                # Original incorrect code:
-                # emission_kg_per_hr = emission_rate * length_mi * vehicles_per_hour / 1000
-
-                # Corrected code:
-                emission_rate_g_per_sec = emission_rate / 3600  # g/hr → g/s
-                travel_time_sec = (link["link_length_km"] / link["avg_speed_kph"]) * 3600  # 行驶时间(秒)
-                emission_g_per_veh = emission_rate_g_per_sec * travel_time_sec  # 单车排放量
-                emission_kg_per_hr = emission_g_per_veh * vehicles_per_hour / 1000  # kg/hr
-
-                link_result["total_emissions_kg_per_hr"][pollutant] += emission_kg_per_hr
-                vehicle_emissions[pollutant] = round(emission_kg_per_hr, 4)
-
-            link_result["emissions_by_vehicle"][vehicle_name] = vehicle_emissions
-
-        # 计算单位排放率 (g/veh-km)
-        link_result["emission_rates_g_per_veh_km"] = {}
-        for pollutant in pollutants:
-            total_vehicles = link["traffic_flow_vph"]
-            if total_vehicles > 0:
-                rate = (
-                    link_result["total_emissions_kg_per_hr"].get(pollutant, 0.0) * 1000 /
-                    link["link_length_km"] / total_vehicles
-                )
-                link_result["emission_rates_g_per_veh_km"][pollutant] = round(rate, 4)
-
-        # 四舍五入总排放
-        for pollutant in link_result["total_emissions_kg_per_hr"]:
-            link_result["total_emissions_kg_per_hr"][pollutant] = \
-                round(link_result["total_emissions_kg_per_hr"][pollutant], 4)
-
-        return link_result
-
-    def _query_emission_rate(self, matrix: pd.DataFrame, source_type: int,
-                            pollutant_id: int, model_year: int) -> float:
-        """查询排放率 - 使用平均opMode (300)"""
-        # 查询opMode=300的平均排放率
-        result = matrix[
-            (matrix[self.COL_OPMODE] == 300) &
-            (matrix[self.COL_POLLUTANT] == pollutant_id) &
-            (matrix[self.COL_SOURCE_TYPE] == source_type) &
-            (matrix[self.COL_MODEL_YEAR] == model_year)
-        ]
-
-        if not result.empty:
-            return float(result.iloc[0][self.COL_EMISSION])
-
-        return 0.0  # 未找到数据
-
-    def _calculate_summary(self, results: List[Dict], pollutants: List[str]) -> Dict:
-        """计算汇总统计"""
-        summary = {
-            "total_links": len(results),
-            "total_emissions_kg_per_hr": {p: 0 for p in pollutants}
+        weights = np.zeros((len(profiles), len(vehicle_names), len(years)))
+        for k, profile in enumerate(profiles):
+            for v, vehicle_name in enumerate(vehicle_names):
+                shares = profile.get(vehicle_name, profile.get(self.ALL_VEHICLES))
+                if shares is None:
+                    weights[k, v, year_pos[model_year]] = 1.0
+                    continue
+                for year, weight in shares:
+                    weights[k, v, year_pos[year]] = weight
+
+        return {
+            "years": np.array(years, dtype=np.int64),
+            "distribution_years": np.array(sorted(distribution_years), dtype=np.int64),
+            "weights": weights,
+            "link_profiles": link_profiles,
         }
 
-        for result in results:
-            for pollutant in pollutants:
-                summary["total_emissions_kg_per_hr"][pollutant] += \
-                    result["total_emissions_kg_per_hr"].get(pollutant, 0)
+    def _normalize_year_distribution(self, distribution: Optional[Dict]) -> Dict[str, tuple]:
+        """
+        标准化车型年份分布为 {车型: ((年份, 权重), ...)}，权重和为1
+
+        {年份: 占比} 形式的分布适用于所有车型（键为 ALL_VEHICLES）。
+        """
+        if not distribution:
+            return {}
+        if not isinstance(distribution, dict):
+            raise ValueError(f"车型年份分布格式错误: {distribution}")
+        if not any(isinstance(shares, dict) for shares in distribution.values()):
+            distribution = {self.ALL_VEHICLES: distribution}
+
+        normalized = {}
+        for vehicle_name, shares in distribution.items():
+            if not isinstance(shares, dict):
+                raise ValueError(f"车型 {vehicle_name} 的年份分布格式错误: {shares}")
+            merged: Dict[int, float] = {}
+            for year, share in shares.items():
+                share = float(share)
+                if share < 0:
+                    raise ValueError(f"车型 {vehicle_name} 的年份占比不能为负数: {year}={share}")
+                merged[int(year)] = merged.get(int(year), 0.0) + share
+            total = sum(merged.values())
+            if total <= 0:
+                raise ValueError(f"车型 {vehicle_name} 的年份占比总和必须大于0")
+            normalized[vehicle_name] = tuple(
+                (year, share / total) for year, share in sorted(merged.items()) if share > 0
+            )
+        return normalized
+
+    def _vehicle_rate_matrix(self, matrix: EmissionRateTensor, vehicle_names: List[str],
+                             pollutants: List[str], model_years: np.ndarray, rate_method: str = "average"):
+        """
+        车型×污染物×年份×速度档 排放率 (g/s)，未找到数据为0
 
-        # 四舍五入
-        for pollutant in pollutants:
-            summary["total_emissions_kg_per_hr"][pollutant] = \
-                round(summary["total_emissions_kg_per_hr"][pollutant], 4)
+        average: 使用平均opMode (300)，只有一个速度档；
+        speed_binned: 各速度档 = Σ opMode占比 × 该opMode排放率（缺失的opMode回退到300）
 
-        return summary
+        Returns:
+            (排放率数组, 有效车型掩码, 有效污染物掩码)
+        """
+        source_types = [self.VEHICLE_TO_SOURCE_TYPE.get(name) for name in vehicle_names]
+        pollutant_ids = [self.POLLUTANT_TO_ID.get(pollutant) for pollutant in pollutants]
+        valid_vehicles = np.array([st is not None for st in source_types], dtype=bool)
+        valid_pollutants = np.array([pid is not None for pid in pollutant_ids], dtype=bool)
 
+        distribution = get_opmode_distribution() if rate_method == "speed_binned" else None
+        n_bins = distribution.n_bins if distribution is not None else 1
+        rates = np.zeros((len(vehicle_names), len(pollutants), len(model_years), n_bins))
+        fallback = int(matrix.positions("opmode", [FALLBACK_OPMODE])[0])
+        if fallback < 0 or not rates.size:
+            return rates, valid_vehicles, valid_pollutants
+
+        src = matrix.positions("source_type", [-1 if st is None else st for st in source_types])
+        pol = matrix.positions("pollutant", [-1 if pid is None else pid for pid in pollutant_ids])
+        year = matrix.positions("model_year", model_years)
+        index = np.ix_(np.maximum(pol, 0), np.maximum(src, 0), np.maximum(year, 0))
+
+        if distribution is None:
+            # 张量切片 (污染物, 车型, 年份) → (车型, 污染物, 年份)
+            block = matrix.values[fallback][index]
+            rates[..., 0] = block.transpose(1, 0, 2) / 3600
+        else:
+            # opMode 0-40 的排放率 (opMode, 污染物, 车型, 年份)，与速度档占比 (车型, 速度档, opMode) 求点积
+            ops = matrix.positions("opmode", np.arange(MAX_OPMODE + 1))
+            block = matrix.values[np.where(ops >= 0, ops, fallback)][(slice(None),) + index]
+            shares = np.zeros((len(vehicle_names), n_bins, MAX_OPMODE + 1))
+            for i, source_type_id in enumerate(source_types):
+                vehicle_shares = distribution.shares_for(source_type_id) if source_type_id is not None else None
+                if vehicle_shares is not None:
+                    shares[i] = vehicle_shares
+            rates[:] = np.einsum("vbo,opvy->vpyb", shares, block) / 3600
+
+        # 不存在的ID为0
+        rates[src < 0] = 0.0
+        rates[:, pol < 0] = 0.0
+        rates[:, :, year < 0] = 0.0
+        return rates, valid_vehicles, valid_pollutants
+
+    @staticmethod
+    def _check_divisors(lengths_km: np.ndarray, flows_vph: np.ndarray, speeds_kph: np.ndarray,
+                        fleet: Dict[str, Any], valid_vehicles: np.ndarray, valid_pollutants: np.ndarray):
+        """参与计算的路段速度不能为0；有流量的路段长度不能为0"""
+        if not len(valid_pollutants):
+            return
+        if valid_pollutants.any():
+            computed = np.zeros(len(speeds_kph), dtype=bool)
+            for link_index, vehicle_columns in fleet["groups"]:
+                if any(valid_vehicles[col] for col in vehicle_columns):
+                    computed[link_index] = True
+            if (computed & (speeds_kph == 0)).any():
+                raise ValueError("路段平均速度不能为0")
+        if ((flows_vph > 0) & (lengths_km == 0)).any():
+            raise ValueError("路段长度不能为0")
+
+    def _query_emission_rate(self, matrix: EmissionRateTensor, source_type: int,
+                            pollutant_id: int, model_year: int) -> float:
+        """查询排放率 - 使用平均opMode (300)，未找到数据返回0"""
+        return matrix.lookup(300, pollutant_id, source_type, model_year)
+
+    @staticmethod
+    def _round_array(values: np.ndarray, digits: int) -> np.ndarray:
+        """
+        与内置 round(x, digits) 结果一致的数组四舍五入
+
+        np.round 先乘以10^digits再取整，乘法的舍入误差在 .5 边界附近可能改变进位方向，
+        这些值（以及NaN和超大值）逐个用内置 round 计算。
+        """
+        values = np.asarray(values, dtype=np.float64)
+        scale = 10.0 ** digits
+        scaled = values * scale
+        rounded = np.rint(scaled) / scale
+
+        with np.errstate(invalid="ignore"):
+            distance_to_half = np.abs(scaled - np.floor(scaled) - 0.5)
+            safe = (distance_to_half > 1e-6 + np.abs(scaled) * 1e-15) & (np.abs(scaled) < 2.0 ** 52)
+        suspect = np.flatnonzero(~safe)
+        if len(suspect):
+            flat_values = values.reshape(-1)
+            flat_rounded = rounded.reshape(-1)
+            flat_rounded[suspect] = [round(value, digits) for value in flat_values[suspect].tolist()]
+        return rounded
+
+    def _build_link_rows(self, links: Dict[str, Any], fleet: Dict[str, Any],
+                         computed: Dict[str, np.ndarray], pollutants: List[str]) -> List[Dict]:
+        """由矩阵结果生成逐路段结果字典（车型顺序相同的路段成组取值）"""
+        vehicle_names = fleet["vehicle_names"]
+        valid_pollutant_names = [p for p, valid in zip(pollutants, computed["valid_pollutants"]) if valid]
+        valid_pollutant_cols = np.flatnonzero(computed["valid_pollutants"])
+
+        vehicles_per_hour = self._round_array(computed["vehicles_per_hour"], 2)
+        totals = self._round_array(computed["link_totals"], 4).tolist()
+        rates = self._round_array(computed["rates_g_per_veh_km"], 4).tolist()
+        flows = links["traffic_flow_vph"]
+        raw = links["raw"]
+
+        results: List[Dict] = [None] * len(links["link_id"])
+        for link_index, vehicle_columns in fleet["groups"]:
+            columns = [col for col in vehicle_columns if computed["valid_vehicles"][col]]
+            names = [vehicle_names[col] for col in columns]
+            source_type_ids = [self.VEHICLE_TO_SOURCE_TYPE[name] for name in names]
+
+            group_percentages = fleet["shares"][link_index][:, columns].tolist()
+            group_vehicles = vehicles_per_hour[link_index][:, columns].tolist()
+            group_emissions = self._round_array(
+                computed["emissions"][link_index][:, columns][:, :, valid_pollutant_cols], 4
+            ).tolist()
+
+            for i, percentages, vehicles, emissions in zip(
+                link_index.tolist(), group_percentages, group_vehicles, group_emissions
+            ):
+                results[i] = {
+                    "link_id": links["link_id"][i],
+                    "link_length_km": raw["link_length_km"][i],
+                    "traffic_flow_vph": raw["traffic_flow_vph"][i],
+                    "avg_speed_kph": raw["avg_speed_kph"][i],
+                    "fleet_composition": {
+                        name: {
+                            "source_type_id": source_type_id,
+                            "percentage": percentage,
+                            "vehicles_per_hour": vph
+                        }
+                        for name, source_type_id, percentage, vph in zip(
+                            names, source_type_ids, percentages, vehicles
+                        )
+                    },
+                    "emissions_by_vehicle": {
+                        name: dict(zip(valid_pollutant_names, values))
+                        for name, values in zip(names, emissions)
+                    },
+                    "total_emissions_kg_per_hr": dict(zip(pollutants, totals[i])),
+                    "emission_rates_g_per_veh_km": dict(zip(pollutants, rates[i])) if flows[i] > 0 else {},
+                }
+
+        return results
+
+    @staticmethod
+    def _build_result_frame(links: Dict[str, Any], computed: Dict[str, np.ndarray],
+                            pollutants: List[str]) -> pd.DataFrame:
+        """列式逐路段结果"""
+        frame = pd.DataFrame({
+            "link_id": links["link_id"],
+            "link_length_km": links["link_length_km"],
+            "traffic_flow_vph": links["traffic_flow_vph"],
+            "avg_speed_kph": links["avg_speed_kph"],
+        })
+        for j, pollutant in enumerate(pollutants):
+            frame[f"{pollutant}_kg_per_hr"] = computed["link_totals"][:, j]
+        for j, pollutant in enumerate(pollutants):
+            frame[f"{pollutant}_g_per_veh_km"] = computed["rates_g_per_veh_km"][:, j]
+        return frame
+
+    @staticmethod
+    def _sum_rounded_totals(rounded_totals: np.ndarray) -> np.ndarray:
+        """按路段顺序累加各路段四舍五入后的总排放（路段×污染物 → 污染物）"""
+        if not len(rounded_totals):
+            return np.zeros(rounded_totals.shape[1:])
+        return np.cumsum(rounded_totals, axis=0)[-1]
+
+    @staticmethod
+    def _summary_from_totals(n_links: int, totals: np.ndarray, pollutants: List[str]) -> Dict:
+        """由污染物总排放生成汇总统计"""
+        return {
+            "total_links": n_links,
+            "total_emissions_kg_per_hr": {
+                pollutant: round(float(totals[j]) if n_links else 0, 4)
+                for j, pollutant in enumerate(pollutants)
+            }
+        }
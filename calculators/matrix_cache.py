@@ -0,0 +1,246 @@
+"""
+MOVES矩阵二进制列缓存
+
+首次加载时将CSV转换为每列一个 .npy 文件（ID列压缩为int16等紧凑整数类型，
+排放率列保持float64以保证计算结果不变），
+之后以内存映射方式打开，多个worker进程共享同一份页缓存，无需重复解析文本。
+由列数组派生的数组（如稠密排放率张量）同样持久化在缓存目录中并以内存映射打开。
+源CSV的校验和变化时自动重建缓存。
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR_NAME = ".cache"
+CACHE_FORMAT_VERSION = 1
+
+# 整数列按取值范围选择最紧凑的类型
+_INTEGER_DTYPES = (np.int16, np.int32, np.int64)
+
+
+def cache_dir_for(csv_path: Path) -> Path:
+    """CSV对应的缓存目录: <数据目录>/.cache/<文件名>/"""
+    csv_path = Path(csv_path)
+    return csv_path.parent / CACHE_DIR_NAME / csv_path.name
+
+
+def file_checksum(path: Path, chunk_size: int = 1 << 20) -> str:
+    """计算文件的SHA-256校验和"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _compact_id_array(values: np.ndarray) -> np.ndarray:
+    """ID列转为能容纳其取值的最小整数类型（含非整数值时保持float64）"""
+    values = np.asarray(values)
+    if len(values) == 0:
+        return values.astype(np.int16)
+    if values.dtype.kind == "f" and not (
+        np.isfinite(values).all() and np.array_equal(values, np.round(values))
+    ):
+        return values.astype(np.float64)
+    low, high = values.min(), values.max()
+    for dtype in _INTEGER_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return values.astype(dtype)
+    return values.astype(np.float64)
+
+
+def _typed_columns(df: pd.DataFrame, id_columns: Sequence[str],
+                   value_columns: Sequence[str]) -> Dict[str, np.ndarray]:
+    columns = {col: _compact_id_array(df[col].to_numpy()) for col in id_columns}
+    columns.update({col: df[col].to_numpy(dtype=np.float64) for col in value_columns})
+    return columns
+
+
+def _read_manifest(cache_dir: Path) -> Optional[Dict]:
+    try:
+        with open(cache_dir / "manifest.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json_atomic(path: Path, payload: Dict):
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp_", suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_name, path)
+
+
+def _manifest_is_fresh(manifest: Optional[Dict], csv_path: Path, columns: Sequence[str],
+                       cache_dir: Path) -> bool:
+    """
+    判断缓存是否仍对应当前CSV
+
+    文件大小和修改时间一致时直接信任缓存；否则重新计算校验和，
+    内容未变（例如仅被touch或重新检出）时刷新记录的时间戳。
+    """
+    if not manifest or manifest.get("format_version") != CACHE_FORMAT_VERSION:
+        return False
+    if not set(columns).issubset(manifest.get("columns", {})):
+        return False
+
+    stat = csv_path.stat()
+    if manifest.get("size") == stat.st_size and manifest.get("mtime_ns") == stat.st_mtime_ns:
+        return True
+
+    if manifest.get("size") != stat.st_size or manifest.get("sha256") != file_checksum(csv_path):
+        return False
+
+    manifest["mtime_ns"] = stat.st_mtime_ns
+    try:
+        _write_json_atomic(cache_dir / "manifest.json", manifest)
+    except OSError:
+        pass
+    return True
+
+
+def build_cache(csv_path: Path, reader: Callable[[Path], pd.DataFrame],
+                id_columns: Sequence[str], value_columns: Sequence[str]) -> Dict:
+    """
+    解析CSV并写出列缓存
+
+    每列先写临时文件再原子替换，多个进程同时重建也不会读到半写的文件。
+
+    Returns:
+        缓存清单 (manifest)
+    """
+    csv_path = Path(csv_path)
+    cache_dir = cache_dir_for(csv_path)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    stat = csv_path.stat()
+    checksum = file_checksum(csv_path)
+    df = reader(csv_path)
+
+    column_info = {}
+    for col, values in _typed_columns(df, id_columns, value_columns).items():
+        _write_npy_atomic(cache_dir / f"{col}.npy", values)
+        column_info[col] = str(values.dtype)
+
+    manifest = {
+        "format_version": CACHE_FORMAT_VERSION,
+        "source": csv_path.name,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": checksum,
+        "rows": len(df),
+        "columns": column_info,
+    }
+    _write_json_atomic(cache_dir / "manifest.json", manifest)
+    logger.info(f"[MatrixCache] Built binary cache for {csv_path.name}: {len(df)} rows, {column_info}")
+    return manifest
+
+
+def load_columns(csv_path: Path, reader: Callable[[Path], pd.DataFrame],
+                 id_columns: Sequence[str], value_columns: Sequence[str]) -> Dict[str, np.ndarray]:
+    """
+    以内存映射方式加载MOVES矩阵的指定列
+
+    缓存缺失或已过期时先重建；缓存目录不可写时回退为直接解析CSV。
+
+    Args:
+        csv_path: 源CSV路径
+        reader: CSV读取函数（仅在构建缓存时调用）
+        id_columns: ID列（opMode、污染物、车型、年份等，存为紧凑整数）
+        value_columns: 数值列（排放率，存为float64）
+
+    Returns:
+        列名 → 只读数组（np.memmap），顺序与 id_columns + value_columns 一致
+    """
+    csv_path = Path(csv_path)
+    if not csv_path.exists():
+        raise FileNotFoundError(f"数据文件不存在: {csv_path}")
+
+    columns = list(id_columns) + list(value_columns)
+    cache_dir = cache_dir_for(csv_path)
+    try:
+        if not _manifest_is_fresh(_read_manifest(cache_dir), csv_path, columns, cache_dir):
+            build_cache(csv_path, reader, id_columns, value_columns)
+        return {col: np.load(cache_dir / f"{col}.npy", mmap_mode="r") for col in columns}
+    except OSError as e:
+        logger.warning(f"[MatrixCache] Binary cache unavailable for {csv_path.name}, parsing CSV: {e}")
+        return _typed_columns(reader(csv_path), id_columns, value_columns)
+
+
+def _write_npy_atomic(path: Path, values: np.ndarray):
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp_", suffix=".npy")
+    with os.fdopen(fd, "wb") as f:
+        np.save(f, values)
+    os.replace(tmp_name, path)
+
+
+def load_derived(csv_path: Path, reader: Callable[[Path], pd.DataFrame],
+                 id_columns: Sequence[str], value_columns: Sequence[str], name: str,
+                 derive: Callable[[Dict[str, np.ndarray]], Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """
+    以内存映射方式加载由列数组派生的数组
+
+    派生结果保存在 <缓存目录>/<name>/ 下，记录源CSV的校验和与所用列，
+    两者不变时直接映射已有文件，多个worker进程共享同一份页缓存；
+    缓存目录不可写时回退为在进程内计算。
+
+    Args:
+        csv_path: 源CSV路径
+        reader: CSV读取函数（仅在构建列缓存时调用）
+        id_columns: 派生所需的ID列
+        value_columns: 派生所需的数值列
+        name: 派生数组的名称（缓存子目录名）
+        derive: 由列数组计算派生数组的函数，返回 名称 → 数组
+
+    Returns:
+        名称 → 只读数组（np.memmap）
+    """
+    columns = load_columns(csv_path, reader, id_columns, value_columns)
+    cache_dir = cache_dir_for(csv_path)
+    source = _read_manifest(cache_dir)
+    if source is None:
+        return derive(columns)
+
+    derived_dir = cache_dir / name
+    column_names = list(id_columns) + list(value_columns)
+    try:
+        manifest = _read_manifest(derived_dir)
+        fresh = (
+            manifest is not None
+            and manifest.get("format_version") == CACHE_FORMAT_VERSION
+            and manifest.get("sha256") == source.get("sha256")
+            and manifest.get("columns") == column_names
+        )
+        if not fresh:
+            derived_dir.mkdir(parents=True, exist_ok=True)
+            arrays = derive(columns)
+            for key, values in arrays.items():
+                _write_npy_atomic(derived_dir / f"{key}.npy", np.asarray(values))
+            manifest = {
+                "format_version": CACHE_FORMAT_VERSION,
+                "sha256": source.get("sha256"),
+                "columns": column_names,
+                "arrays": {key: str(np.asarray(values).dtype) for key, values in arrays.items()},
+            }
+            _write_json_atomic(derived_dir / "manifest.json", manifest)
+            logger.info(f"[MatrixCache] Built derived cache '{name}' for {Path(csv_path).name}")
+        return {key: np.load(derived_dir / f"{key}.npy", mmap_mode="r") for key in manifest["arrays"]}
+    except OSError as e:
+        logger.warning(f"[MatrixCache] Derived cache '{name}' unavailable for {Path(csv_path).name}: {e}")
+        return derive(columns)
+
+
+def clear_cache(csv_path: Path):
+    """删除CSV对应的列缓存"""
+    shutil.rmtree(cache_dir_for(csv_path), ignore_errors=True)
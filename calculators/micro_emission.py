@@ -1,9 +1,12 @@
 """
 微观排放计算器
 """
+import numpy as np
 import pandas as pd
+from itertools import repeat
 from pathlib import Path
-from typing import Dict, List
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from .rate_store import DATA_ROOT, DATASET_FILES, EmissionRateTensor, dataset_path, get_rate_store
 from .vsp import VSPCalculator
 
 class MicroEmissionCalculator:
@@ -16,6 +19,16 @@ class MicroEmissionCalculator:
     COL_MODEL_YEAR = 'ModelYear'
     COL_EMISSION = 'EmissionQuant'
 
+    # 逐秒计算中出现的最大opMode编号（0-40）
+    MAX_OPMODE = 40
+
+    # 流式计算时返回的逐秒结果预览行数
+    STREAM_PREVIEW_ROWS = 100
+
+    # 结果格式: rows 为逐秒字典列表；columnar 为列式 DataFrame（污染物列为float32）；
+    # summary 只返回汇总和opMode分布，不生成逐秒结果
+    RESULT_FORMATS = ("rows", "columnar", "summary")
+
     # 车型ID映射（与emission_factors保持一致）
     VEHICLE_TO_SOURCE_TYPE = {
         "Motorcycle": 11,
@@ -57,13 +70,9 @@ class MicroEmissionCalculator:
     }
 
     def __init__(self):
-        self.data_path = Path(__file__).parent / "data" / "micro_emission"
+        self.data_path = DATA_ROOT / "micro_emission"
         self.vsp_calculator = VSPCalculator()
-        self.csv_files = {
-            "winter": "atlanta_2025_1_55_65.csv",
-            "spring": "atlanta_2025_4_75_65.csv",
-            "summer": "atlanta_2025_7_90_70.csv"
-        }
+        self.csv_files = DATASET_FILES["micro_emission"]
 
     def _year_to_age_group(self, model_year: int) -> int:
         """
@@ -89,13 +98,26 @@ class MicroEmissionCalculator:
             return 9
 
     def calculate(self, trajectory_data: List[Dict], vehicle_type: str,
-                 pollutants: List[str], model_year: int, season: str) -> Dict:
-        """执行微观排放计算"""
+                 pollutants: List[str], model_year: int, season: str,
+                 result_format: str = "rows") -> Dict:
+        """
+        执行微观排放计算
+
+        result_format="columnar" 时不生成逐秒字典，逐秒结果以 DataFrame 形式放在
+        data["results_columns"]（列: t, speed_kph, speed_mph, vsp, opmode, 各污染物 g/s），
+        汇总统计仍按float64精度计算。
+
+        result_format="summary" 时不计算逐秒排放：先统计各opMode的秒数，
+        总排放为opMode直方图与排放率查找表的点积（与逐秒累加仅有浮点舍入差异），
+        同时返回 data["opmode_distribution"]。
+        """
 
         try:
             # 1. 验证输入
             if not trajectory_data or len(trajectory_data) == 0:
                 raise ValueError("轨迹数据不能为空")
+            if result_format not in self.RESULT_FORMATS:
+                raise ValueError(f"不支持的结果格式: {result_format}")
 
             # 2. 获取车型ID
             source_type_id = self.VEHICLE_TO_SOURCE_TYPE.get(vehicle_type)
@@ -106,42 +128,153 @@ class MicroEmissionCalculator:
                     "valid_vehicle_types": list(self.VEHICLE_TO_SOURCE_TYPE.keys())
                 }
 
-            # 3. 计算VSP和opMode
-            trajectory_with_vsp = self.vsp_calculator.calculate_trajectory_vsp(
-                trajectory_data, source_type_id
+            # 3. 提取轨迹列，整条轨迹一次性计算VSP和opMode
+            columns = self._trajectory_to_columns(trajectory_data)
+            vsp_result = self.vsp_calculator.calculate_trajectory_arrays(
+                columns["speed_kph"], columns["acceleration"], columns["grade_pct"],
+                columns["time_s"], source_type_id
             )
+            opmodes = vsp_result["opmode"]
+
+            # 4. 按污染物生成opMode→排放率查找表
+            rate_lookups = self._build_rate_lookups(season, pollutants, source_type_id, model_year)
+
+            # 5-6. 逐秒排放与汇总统计；仅需汇总时直接由opMode直方图计算
+            if result_format == "summary":
+                opmode_counts = np.bincount(opmodes, minlength=self.MAX_OPMODE + 1)
+                summary = self._format_summary(
+                    self._total_distance_km(columns), len(opmodes),
+                    {
+                        pollutant: float(opmode_counts @ rate_lookup)
+                        for pollutant, rate_lookup in rate_lookups.items()
+                    }
+                )
+            else:
+                emission_columns = {
+                    pollutant: rate_lookup[opmodes] for pollutant, rate_lookup in rate_lookups.items()
+                }
+                summary = self._calculate_summary(columns, emission_columns)
+
+            data = {
+                "query_info": {
+                    "vehicle_type": vehicle_type,
+                    "pollutants": pollutants,
+                    "model_year": model_year,
+                    "season": season,
+                    "trajectory_points": len(trajectory_data)
+                },
+                "summary": summary,
+            }
+            if result_format == "summary":
+                data["opmode_distribution"] = self._opmode_distribution(opmode_counts)
+            elif result_format == "columnar":
+                data["results_columns"] = self._build_result_frame(columns, vsp_result, emission_columns)
+            else:
+                data["results"] = self._build_result_rows(columns, vsp_result, emission_columns)
 
-            # 4. 加载排放矩阵
-            emission_matrix = self._load_emission_matrix(season)
+            return {
+                "status": "success",
+                "data": data
+            }
+
+        except Exception as e:
+            return {
+                "status": "error",
+                "error_code": "CALCULATION_ERROR",
+                "message": str(e)
+            }
 
-            # 5. 计算每秒排放
-            results = []
-            for point in trajectory_with_vsp:
-                emissions = {}
-                for pollutant in pollutants:
-                    pollutant_id = self.POLLUTANT_TO_ID.get(pollutant)
-                    if pollutant_id is None:
-                        continue
-
-                    emission_rate = self._query_emission_rate(
-                        emission_matrix, point["opmode"], pollutant_id,
-                        source_type_id, model_year
+    def calculate_stream(self, chunks: Iterable[Dict[str, Any]], vehicle_type: str,
+                         pollutants: List[str], model_year: int, season: str,
+                         on_chunk: Optional[Callable[[Dict[str, Any], Dict[str, np.ndarray],
+                                                      Dict[str, np.ndarray]], None]] = None) -> Dict:
+        """
+        流式微观排放计算（超大轨迹分块处理，内存占用与块大小相关）
+
+        每块为列数组字典（t, speed_kph, acceleration_mps2, grade_pct，缺失加速度为NaN）。
+        块边界处沿用上一块最后一个点补算加速度和累计距离，汇总结果与 calculate 一致。
+        逐秒结果不在内存中保留，由 on_chunk(块, VSP结果, 排放列) 回调写出，
+        返回数据中 results 仅包含前 STREAM_PREVIEW_ROWS 行预览，另附整条轨迹的 opmode_distribution。
+        """
+        try:
+            # 1. 获取车型ID
+            source_type_id = self.VEHICLE_TO_SOURCE_TYPE.get(vehicle_type)
+            if source_type_id is None:
+                return {
+                    "status": "error",
+                    "error": f"未知车型: {vehicle_type}",
+                    "valid_vehicle_types": list(self.VEHICLE_TO_SOURCE_TYPE.keys())
+                }
+
+            # 2. 排放率查找表在所有块间共享
+            rate_lookups = self._build_rate_lookups(season, pollutants, source_type_id, model_year)
+
+            total_points = 0
+            total_distance_km = 0.0
+            total_emissions = {pollutant: 0.0 for pollutant in rate_lookups}
+            opmode_counts = np.zeros(self.MAX_OPMODE + 1, dtype=np.int64)
+            preview = []
+            carry = None  # 上一块最后一个点 (speed_kph, t)
+
+            # 3. 逐块计算
+            for chunk in chunks:
+                speed_kph = np.asarray(chunk["speed_kph"], dtype=np.float64)
+                n = len(speed_kph)
+                if n == 0:
+                    continue
+                time_s = np.asarray(chunk["t"], dtype=np.float64)
+                acceleration = np.asarray(chunk["acceleration_mps2"], dtype=np.float64)
+                grade_pct = np.asarray(chunk["grade_pct"], dtype=np.float64)
+
+                # 在块首拼接上一块的最后一个点，用于补算加速度和计算距离
+                if carry is not None:
+                    speed_kph_ext = np.concatenate(([carry[0]], speed_kph))
+                    time_s_ext = np.concatenate(([carry[1]], time_s))
+                    acceleration = np.concatenate(([0.0], acceleration))
+                    grade_pct = np.concatenate(([0.0], grade_pct))
+                else:
+                    speed_kph_ext, time_s_ext = speed_kph, time_s
+                offset = len(speed_kph_ext) - n
+
+                vsp_result = self.vsp_calculator.calculate_trajectory_arrays(
+                    speed_kph_ext, acceleration, grade_pct, time_s_ext, source_type_id
+                )
+                vsp_result = {key: values[offset:] for key, values in vsp_result.items()}
+                emission_columns = {
+                    pollutant: rate_lookup[vsp_result["opmode"]]
+                    for pollutant, rate_lookup in rate_lookups.items()
+                }
+
+                # 汇总按点顺序累加，与一次性计算的结果一致
+                total_distance_km = self._sequential_sum(
+                    speed_kph_ext[1:] * np.diff(time_s_ext) / 3600, start=total_distance_km
+                )
+                for pollutant, values in emission_columns.items():
+                    total_emissions[pollutant] = self._sequential_sum(
+                        values, start=total_emissions[pollutant]
                     )
-                    # Unit conversion: MOVES EmissionQuant is in g/hr, need g/s for per-second accumulation
-                    # Original code: emissions[pollutant] = round(emission_rate, 6)
-                    emissions[pollutant] = round(emission_rate / 3600, 6)
-
-                results.append({
-                    "t": point.get("t", 0),
-                    "speed_kph": point["speed_kph"],
-                    "speed_mph": point["speed_mph"],
-                    "vsp": point["vsp"],
-                    "opmode": point["opmode"],
-                    "emissions": emissions
-                })
 
-            # 6. 汇总统计
-            summary = self._calculate_summary(results, trajectory_data)
+                opmode_counts += np.bincount(vsp_result["opmode"], minlength=self.MAX_OPMODE + 1)
+
+                if len(preview) < self.STREAM_PREVIEW_ROWS:
+                    k = self.STREAM_PREVIEW_ROWS - len(preview)
+                    preview.extend(self._build_result_rows(
+                        {"t": time_s[:k].tolist(), "speed": speed_kph[:k].tolist()},
+                        {key: values[:k] for key, values in vsp_result.items()},
+                        {pollutant: values[:k] for pollutant, values in emission_columns.items()}
+                    ))
+
+                if on_chunk is not None:
+                    on_chunk(chunk, vsp_result, emission_columns)
+
+                total_points += n
+                carry = (speed_kph[-1], time_s[-1])
+
+            if total_points == 0:
+                raise ValueError("轨迹数据不能为空")
+
+            # 4. 汇总统计
+            summary = self._format_summary(total_distance_km, total_points, total_emissions)
 
             return {
                 "status": "success",
@@ -151,10 +284,12 @@ class MicroEmissionCalculator:
                         "pollutants": pollutants,
                         "model_year": model_year,
                         "season": season,
-                        "trajectory_points": len(trajectory_data)
+                        "trajectory_points": total_points,
+                        "streaming": True
                     },
                     "summary": summary,
-                    "results": results
+                    "opmode_distribution": self._opmode_distribution(opmode_counts),
+                    "results": preview
                 }
             }
 
@@ -165,69 +300,322 @@ class MicroEmissionCalculator:
                 "message": str(e)
             }
 
-    def _load_emission_matrix(self, season: str) -> pd.DataFrame:
-        """加载排放矩阵"""
-        season_code = self.SEASON_CODES.get(season, 7)
-        season_key = "winter" if season_code == 1 else ("spring" if season_code == 4 else "summer")
-        csv_file = self.csv_files[season_key]
-        csv_path = self.data_path / csv_file
-
-        if not csv_path.exists():
-            raise FileNotFoundError(f"数据文件不存在: {csv_path}")
-
-        return pd.read_csv(csv_path)
-
-    def _query_emission_rate(self, matrix: pd.DataFrame, opmode: int,
-                            pollutant_id: int, source_type: int,
-                            model_year: int) -> float:
-        """查询排放率"""
-        # 将实际年份转换为年龄组
-        age_group = self._year_to_age_group(model_year)
-
-        # 先尝试精确匹配
-        result = matrix[
-            (matrix[self.COL_OPMODE] == opmode) &
-            (matrix[self.COL_POLLUTANT] == pollutant_id) &
-            (matrix[self.COL_SOURCE_TYPE] == source_type) &
-            (matrix[self.COL_MODEL_YEAR] == age_group)
-        ]
+    def calculate_batch(self, fleet_data: Dict[str, Any], pollutants: List[str], season: str) -> Dict:
+        """
+        多车辆批量微观排放计算（按车辆编号分组，整个车队一次向量化计算）
+
+        Args:
+            fleet_data: 按行排列的列数组字典:
+                vehicle_id, vehicle_type（标准车型名）, model_year,
+                t, speed_kph, acceleration_mps2（缺失为NaN）, grade_pct
+            pollutants: 污染物列表
+            season: 季节
+
+        Returns:
+            data 中包含每辆车的汇总 vehicle_summaries 和车队汇总 summary；
+            逐秒排放按原始行序放在顶层 emission_columns 中（供写出结果文件，不进入data）
+        """
+        try:
+            vehicle_ids = np.asarray(fleet_data["vehicle_id"])
+            n = len(vehicle_ids)
+            if n == 0:
+                raise ValueError("轨迹数据不能为空")
 
-        if not result.empty:
-            return float(result.iloc[0][self.COL_EMISSION])
+            # 1. 车型名 → 车型ID（按不同取值映射一次）
+            type_names, type_index = np.unique(np.asarray(fleet_data["vehicle_type"], dtype=str),
+                                               return_inverse=True)
+            unknown = [name for name in type_names.tolist() if name not in self.VEHICLE_TO_SOURCE_TYPE]
+            if unknown:
+                return {
+                    "status": "error",
+                    "error": f"未知车型: {', '.join(unknown)}",
+                    "valid_vehicle_types": list(self.VEHICLE_TO_SOURCE_TYPE.keys())
+                }
+            source_types = np.array([self.VEHICLE_TO_SOURCE_TYPE[name] for name in type_names.tolist()],
+                                    dtype=np.int64)[type_index]
+
+            # 2. 年份 → 年龄组
+            model_years = np.asarray(fleet_data["model_year"], dtype=np.int64)
+            years, year_index = np.unique(model_years, return_inverse=True)
+            age_groups = np.array([self._year_to_age_group(year) for year in years.tolist()],
+                                  dtype=np.int64)[year_index]
+
+            # 3. 按车辆稳定排序，组内保持原始行序
+            vehicle_names, group = np.unique(vehicle_ids.astype(str), return_inverse=True)
+            order = np.argsort(group, kind="stable")
+            group = group[order]
+            speed_kph = np.asarray(fleet_data["speed_kph"], dtype=np.float64)[order]
+            time_s = np.asarray(fleet_data["t"], dtype=np.float64)[order]
+            acceleration = np.asarray(fleet_data["acceleration_mps2"], dtype=np.float64)[order]
+            grade_pct = np.asarray(fleet_data["grade_pct"], dtype=np.float64)[order]
+            source_types = source_types[order]
+            age_groups = age_groups[order]
+
+            # 每辆车的第一个点不与前一辆车做差分
+            continues = np.zeros(n, dtype=bool)
+            continues[1:] = group[1:] == group[:-1]
+            dt = np.zeros(n)
+            dt[1:] = np.diff(time_s)
+            dt[~continues] = 0.0
+
+            missing = np.isnan(acceleration)
+            if missing.any():
+                dv = np.zeros(n)
+                dv[1:] = np.diff(speed_kph)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    derived = np.where(continues & (dt > 0), dv / (3.6 * dt), 0.0)
+                acceleration[missing] = derived[missing]
+
+            # 4. VSP / opMode（逐点车型系数）
+            vsp_result = self.vsp_calculator.calculate_trajectory_arrays(
+                speed_kph, acceleration, grade_pct, time_s, source_types
+            )
+            opmodes = vsp_result["opmode"]
+
+            # 5. 每个 (车型, 年龄组) 组合生成opMode查找表，一次二维索引得到逐秒排放
+            emission_matrix = self._load_emission_matrix(season)
+            combos, combo_index = np.unique(np.stack([source_types, age_groups], axis=1),
+                                            axis=0, return_inverse=True)
+            combo_index = combo_index.reshape(-1)
+            emission_sorted = {}
+            for pollutant in pollutants:
+                pollutant_id = self.POLLUTANT_TO_ID.get(pollutant)
+                if pollutant_id is None:
+                    continue
+                table = np.stack([
+                    self._rate_lookup_for_age_group(emission_matrix, pollutant_id, int(src), int(age))
+                    for src, age in combos.tolist()
+                ])
+                emission_sorted[pollutant] = table[combo_index, opmodes]
+
+            # 6. 按车辆汇总（bincount 按行序累加，与单车计算结果一致）
+            n_vehicles = len(vehicle_names)
+            points = np.bincount(group, minlength=n_vehicles)
+            distances = np.bincount(group, weights=speed_kph * dt / 3600, minlength=n_vehicles)
+            totals = {
+                pollutant: np.bincount(group, weights=values, minlength=n_vehicles)
+                for pollutant, values in emission_sorted.items()
+            }
+
+            first_rows = order[np.searchsorted(group, np.arange(n_vehicles))]
+            first_types = np.asarray(fleet_data["vehicle_type"])[first_rows].tolist()
+            first_years = model_years[first_rows].tolist()
+
+            vehicle_summaries = []
+            for i, vehicle_id in enumerate(vehicle_names.tolist()):
+                vehicle_summary = self._format_summary(
+                    float(distances[i]), int(points[i]),
+                    {pollutant: float(values[i]) for pollutant, values in totals.items()}
+                )
+                vehicle_summaries.append({
+                    "vehicle_id": vehicle_id,
+                    "vehicle_type": first_types[i],
+                    "model_year": first_years[i],
+                    "trajectory_points": int(points[i]),
+                    **vehicle_summary
+                })
+
+            fleet_summary = self._format_summary(
+                self._sequential_sum(distances), n,
+                {pollutant: self._sequential_sum(values) for pollutant, values in totals.items()}
+            )
+            fleet_summary["vehicle_count"] = n_vehicles
+
+            # 逐秒排放恢复为原始行序
+            emission_columns = {}
+            for pollutant, values in emission_sorted.items():
+                restored = np.empty(n)
+                restored[order] = values
+                emission_columns[pollutant] = restored
+
+            return {
+                "status": "success",
+                "data": {
+                    "query_info": {
+                        "vehicle_types": sorted(set(type_names.tolist())),
+                        "pollutants": pollutants,
+                        "model_years": years.tolist(),
+                        "season": season,
+                        "trajectory_points": n,
+                        "vehicle_count": n_vehicles
+                    },
+                    "summary": fleet_summary,
+                    "vehicle_summaries": vehicle_summaries,
+                    "results": []
+                },
+                "emission_columns": emission_columns
+            }
+
+        except Exception as e:
+            return {
+                "status": "error",
+                "error_code": "CALCULATION_ERROR",
+                "message": str(e)
+            }
 
-        # 如果没有找到，尝试使用平均值 (opModeID=300)
-        result = matrix[
-            (matrix[self.COL_OPMODE] == 300) &
-            (matrix[self.COL_POLLUTANT] == pollutant_id) &
-            (matrix[self.COL_SOURCE_TYPE] == source_type) &
-            (matrix[self.COL_MODEL_YEAR] == age_group)
+    def _build_rate_lookups(self, season: str, pollutants: List[str], source_type_id: int,
+                            model_year: int) -> Dict[str, np.ndarray]:
+        """加载排放矩阵并为每个有效污染物生成 opMode → g/s 查找表"""
+        emission_matrix = self._load_emission_matrix(season)
+
+        rate_lookups = {}
+        for pollutant in pollutants:
+            pollutant_id = self.POLLUTANT_TO_ID.get(pollutant)
+            if pollutant_id is None:
+                continue
+
+            rate_lookups[pollutant] = self._build_rate_lookup(
+                emission_matrix, pollutant_id, source_type_id, model_year
+            )
+        return rate_lookups
+
+    def _load_emission_matrix(self, season: str) -> EmissionRateTensor:
+        """加载排放矩阵（进程内按季节缓存的排放率张量）"""
+        return get_rate_store().get_tensor(
+            dataset_path("micro_emission", season), pd.read_csv,
+            (self.COL_OPMODE, self.COL_POLLUTANT, self.COL_SOURCE_TYPE,
+             self.COL_MODEL_YEAR, self.COL_EMISSION)
+        )
+
+    def preload(self):
+        """预加载全部季节的排放率张量（服务启动或worker初始化时调用）"""
+        for season in self.SEASON_CODES:
+            self._load_emission_matrix(season)
+
+    def _build_rate_lookup(self, matrix: EmissionRateTensor, pollutant_id: int,
+                           source_type: int, model_year: int) -> np.ndarray:
+        """
+        构建 opMode → 每秒排放量 (g/s) 查找表
+
+        查询规则：精确匹配 → opMode 300 → 0（回退已在张量中完成）
+        """
+        return self._rate_lookup_for_age_group(
+            matrix, pollutant_id, source_type, self._year_to_age_group(model_year)
+        )
+
+    def _rate_lookup_for_age_group(self, matrix: EmissionRateTensor, pollutant_id: int,
+                                   source_type: int, age_group: int) -> np.ndarray:
+        """按年龄组构建 opMode → g/s 查找表"""
+        rates = matrix.rates_for_opmodes(
+            np.arange(self.MAX_OPMODE + 1), pollutant_id, source_type, age_group
+        )
+        # Unit conversion: MOVES EmissionQuant is in g/hr, need g/s for per-second accumulation
+        return np.array([round(rate / 3600, 6) for rate in rates.tolist()], dtype=np.float64)
+
+    @staticmethod
+    def _trajectory_to_columns(trajectory_data: List[Dict]) -> Dict[str, Any]:
+        """将逐点字典列表转换为列数组（缺失加速度记为NaN）"""
+        speeds = [point["speed_kph"] for point in trajectory_data]
+        accelerations = [point.get("acceleration_mps2") for point in trajectory_data]
+        return {
+            "t": [point.get("t", 0) for point in trajectory_data],
+            "speed": speeds,
+            "time_s": np.array([point.get("t", i) for i, point in enumerate(trajectory_data)],
+                               dtype=np.float64),
+            "speed_kph": np.array(speeds, dtype=np.float64),
+            "acceleration": np.array([np.nan if acc is None else acc for acc in accelerations],
+                                     dtype=np.float64),
+            "grade_pct": np.array([point.get("grade_pct", 0) for point in trajectory_data],
+                                  dtype=np.float64),
+        }
+
+    @staticmethod
+    def _build_result_rows(columns: Dict[str, Any], vsp_result: Dict[str, np.ndarray],
+                           emission_columns: Dict[str, np.ndarray]) -> List[Dict]:
+        """由列数组生成逐秒结果字典"""
+        pollutant_names = list(emission_columns.keys())
+        if pollutant_names:
+            emission_rows = zip(*(col.tolist() for col in emission_columns.values()))
+        else:
+            emission_rows = repeat(())
+
+        return [
+            {
+                "t": t,
+                "speed_kph": speed_kph,
+                "speed_mph": speed_mph,
+                "vsp": vsp,
+                "opmode": opmode,
+                "emissions": dict(zip(pollutant_names, values))
+            }
+            for t, speed_kph, speed_mph, vsp, opmode, values in zip(
+                columns["t"],
+                columns["speed"],
+                np.round(vsp_result["speed_mph"], 2).tolist(),
+                vsp_result["vsp"].tolist(),
+                vsp_result["opmode"].tolist(),
+                emission_rows,
+            )
         ]
 
-        if not result.empty:
-            return float(result.iloc[0][self.COL_EMISSION])
+    @classmethod
+    def chunk_result_frame(cls, chunk: Dict[str, Any], vsp_result: Dict[str, np.ndarray],
+                           emission_columns: Dict[str, np.ndarray]) -> pd.DataFrame:
+        """calculate_stream 回调参数 → 该块的列式逐秒结果（列同 result_format="columnar"）"""
+        return cls._build_result_frame(chunk, vsp_result, emission_columns)
+
+    @staticmethod
+    def _build_result_frame(columns: Dict[str, Any], vsp_result: Dict[str, np.ndarray],
+                            emission_columns: Dict[str, np.ndarray]) -> pd.DataFrame:
+        """由列数组生成列式逐秒结果（污染物列为float32）"""
+        frame = pd.DataFrame({
+            "t": np.asarray(columns["t"], dtype=np.float64),
+            "speed_kph": columns["speed_kph"].astype(np.float32),
+            "speed_mph": np.round(vsp_result["speed_mph"], 2).astype(np.float32),
+            "vsp": vsp_result["vsp"].astype(np.float32),
+            "opmode": vsp_result["opmode"].astype(np.int16),
+        })
+        for pollutant, values in emission_columns.items():
+            frame[pollutant] = values.astype(np.float32)
+        return frame
+
+    @staticmethod
+    def _opmode_distribution(opmode_counts: np.ndarray) -> List[Dict]:
+        """opMode分布：各opMode的秒数及占比（只列出出现过的opMode）"""
+        total = int(opmode_counts.sum())
+        return [
+            {
+                "opmode": opmode,
+                "seconds": int(opmode_counts[opmode]),
+                "fraction": round(int(opmode_counts[opmode]) / total, 4)
+            }
+            for opmode in np.flatnonzero(opmode_counts).tolist()
+        ]
 
-        return 0.0  # 未找到数据
+    @staticmethod
+    def _sequential_sum(values: np.ndarray, start: float = 0.0) -> float:
+        """从start开始按顺序逐项累加（与逐点循环累加的浮点结果一致）"""
+        if len(values) == 0:
+            return start
+        return float(np.cumsum(np.concatenate(([start], values)))[-1])
 
-    def _calculate_summary(self, results: List[Dict], trajectory_data: List[Dict]) -> Dict:
+    def _calculate_summary(self, columns: Dict[str, Any],
+                           emission_columns: Dict[str, np.ndarray]) -> Dict:
         """计算汇总统计"""
-        if not results:
+        speed_kph = columns["speed_kph"]
+        if len(speed_kph) == 0:
             return {}
 
         # 计算总距离
-        total_distance_km = 0
-        for i in range(1, len(trajectory_data)):
-            dt = trajectory_data[i].get("t", i) - trajectory_data[i-1].get("t", i-1)
-            speed_kph = trajectory_data[i].get("speed_kph", 0)
-            total_distance_km += speed_kph * dt / 3600
+        total_distance_km = self._total_distance_km(columns)
 
         # 计算总排放
-        total_emissions = {}
-        for result in results:
-            for pollutant, emission in result["emissions"].items():
-                if pollutant not in total_emissions:
-                    total_emissions[pollutant] = 0
-                total_emissions[pollutant] += emission
+        total_emissions = {
+            pollutant: self._sequential_sum(values)
+            for pollutant, values in emission_columns.items()
+        }
+
+        return self._format_summary(total_distance_km, len(speed_kph), total_emissions)
+
+    def _total_distance_km(self, columns: Dict[str, Any]) -> float:
+        """按点顺序累加行驶距离 (km)"""
+        dt = np.diff(columns["time_s"])
+        return self._sequential_sum(columns["speed_kph"][1:] * dt / 3600)
 
+    @staticmethod
+    def _format_summary(total_distance_km: float, total_points: int,
+                        total_emissions: Dict[str, float]) -> Dict:
+        """由累计距离、点数和总排放生成汇总字典"""
         # 计算单位排放
         emission_rates = {}
         if total_distance_km > 0:
@@ -236,7 +624,7 @@ class MicroEmissionCalculator:
 
         return {
             "total_distance_km": round(total_distance_km, 3),
-            "total_time_s": len(results),
+            "total_time_s": total_points,
             "total_emissions_g": {k: round(v, 4) for k, v in total_emissions.items()},
             "emission_rates_g_per_km": emission_rates
         }
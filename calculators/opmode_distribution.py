@@ -0,0 +1,121 @@
+"""
+按平均速度分档的opMode分布 - 宏观路段的速度相关排放率
+
+分布来自MOVES的平均速度档opMode分布表（由MOVES行驶工况按 sourceType × avgSpeedBin 统计），
+数据文件放在 calculators/data/opmode_distribution/ 下，格式见 OPMODE_DISTRIBUTION_COLUMNS。
+仓库不附带该文件：文件不存在时 speed_binned 排放率方法不可用。
+分布只在首次使用时加载一次，进程内共享。
+"""
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# MOVES平均速度档边界 (mph)：档1 <2.5，档2 [2.5, 7.5)，…，档16 ≥72.5
+SPEED_BIN_EDGES_MPH = np.array([2.5] + [7.5 + 5.0 * i for i in range(14)])
+N_SPEED_BINS = len(SPEED_BIN_EDGES_MPH) + 1
+KPH_TO_MPH = 0.621371
+
+# 运行排放opMode 0-40（启动等其他过程的opMode被忽略）
+MAX_OPMODE = 40
+
+# MOVES平均速度档opMode分布数据文件
+OPMODE_DISTRIBUTION_FILE = Path(__file__).parent / "data" / "opmode_distribution" / "avg_speed_opmode_distribution.csv"
+
+# 数据文件的列：车型、平均速度档 (1-16)、opMode、时间占比；
+# 可另含 polProcessID 等列，同一 (车型, 速度档) 的占比汇总后归一化
+OPMODE_DISTRIBUTION_COLUMNS = ("sourceTypeID", "avgSpeedBinID", "opModeID", "opModeFraction")
+
+
+def speed_to_bin(speed_kph) -> np.ndarray:
+    """平均速度 (km/h) → 速度档下标 (0-15)"""
+    return np.searchsorted(SPEED_BIN_EDGES_MPH, np.asarray(speed_kph, dtype=np.float64) * KPH_TO_MPH,
+                           side="right")
+
+
+def opmode_distribution_available() -> bool:
+    """MOVES opMode分布数据文件是否存在（speed_binned 方法是否可用）"""
+    return OPMODE_DISTRIBUTION_FILE.exists()
+
+
+class OpModeDistribution:
+    """各车型、各平均速度档的opMode时间占比"""
+
+    def __init__(self, source_types: np.ndarray, shares: np.ndarray):
+        """
+        Args:
+            source_types: 车型ID数组
+            shares: 占比数组 (车型, 速度档, opMode 0-MAX_OPMODE)，每行和为1
+        """
+        self.source_types = source_types
+        self.shares = shares
+        self._source_pos = {int(st): i for i, st in enumerate(source_types)}
+
+    @property
+    def n_bins(self) -> int:
+        return self.shares.shape[1]
+
+    def shares_for(self, source_type: int) -> Optional[np.ndarray]:
+        """车型的 速度档×opMode 占比（未知车型为None）"""
+        pos = self._source_pos.get(int(source_type))
+        return None if pos is None else self.shares[pos]
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "OpModeDistribution":
+        """
+        由MOVES平均速度档opMode分布表构建
+
+        某车型缺少的速度档沿用最近的已有速度档。
+        """
+        missing = [col for col in OPMODE_DISTRIBUTION_COLUMNS if col not in df.columns]
+        if missing:
+            raise ValueError(f"opMode分布数据缺少列: {', '.join(missing)}")
+
+        source_col, bin_col, opmode_col, fraction_col = OPMODE_DISTRIBUTION_COLUMNS
+        df = df[(df[opmode_col] >= 0) & (df[opmode_col] <= MAX_OPMODE)
+                & (df[bin_col] >= 1) & (df[bin_col] <= N_SPEED_BINS)]
+
+        source_types, source_pos = np.unique(df[source_col].to_numpy(dtype=np.int64), return_inverse=True)
+        bins = df[bin_col].to_numpy(dtype=np.int64) - 1
+        opmodes = df[opmode_col].to_numpy(dtype=np.int64)
+        fractions = df[fraction_col].to_numpy(dtype=np.float64)
+
+        totals = np.zeros((len(source_types), N_SPEED_BINS, MAX_OPMODE + 1))
+        np.add.at(totals, (source_pos, bins, opmodes), fractions)
+
+        shares = np.zeros_like(totals)
+        for i in range(len(source_types)):
+            bin_totals = totals[i].sum(axis=1)
+            populated = np.flatnonzero(bin_totals > 0)
+            if not len(populated):
+                continue
+            nearest = populated[np.abs(np.arange(N_SPEED_BINS)[:, np.newaxis] - populated).argmin(axis=1)]
+            shares[i] = totals[i][nearest] / bin_totals[nearest][:, np.newaxis]
+
+        keep = shares.sum(axis=(1, 2)) > 0
+        return cls(source_types[keep], shares[keep])
+
+
+_distribution: Optional[OpModeDistribution] = None
+_lock = threading.Lock()
+
+
+def get_opmode_distribution() -> OpModeDistribution:
+    """获取进程级速度档opMode分布（首次调用时加载数据文件）"""
+    global _distribution
+    if _distribution is None:
+        with _lock:
+            if _distribution is None:
+                if not opmode_distribution_available():
+                    raise FileNotFoundError(f"opMode分布数据文件不存在: {OPMODE_DISTRIBUTION_FILE}")
+                _distribution = OpModeDistribution.from_frame(pd.read_csv(OPMODE_DISTRIBUTION_FILE))
+                logger.info(
+                    f"[OpModeDistribution] Loaded {_distribution.n_bins} speed bins for "
+                    f"{len(_distribution.source_types)} source types from {OPMODE_DISTRIBUTION_FILE.name}"
+                )
+    return _distribution
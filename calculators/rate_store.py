@@ -0,0 +1,420 @@
+"""
+排放率张量存储 - 每个季节的MOVES矩阵在进程内只解析一次
+
+矩阵被整理为稠密数组 (opModeID, pollutantID, sourceType, modelYear/年龄组)，
+缺失的opMode已回退到平均opMode 300，查询为O(1)数组索引。
+排放因子表同样只解码一次，整理为速度曲线索引（见 ef_curves）。
+源数据通过 matrix_cache 的二进制列缓存以内存映射方式读取；稠密张量本身也
+持久化在该缓存中并以内存映射打开，多个worker进程共享同一份页缓存。
+
+全部数据集的季节数据文件登记在 DATASET_FILES，计算器通过 dataset_path 定位，
+同一 (数据集, 季节) 的数据在进程内只有一份。
+"""
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .ef_curves import EmissionFactorCurveIndex
+from .matrix_cache import load_columns, load_derived
+
+logger = logging.getLogger(__name__)
+
+# 平均工况opMode，精确opMode缺失时的回退值
+FALLBACK_OPMODE = 300
+
+# 排放数据目录，每个数据集一个子目录
+DATA_ROOT = Path(__file__).parent / "data"
+
+# 各数据集的季节数据文件 (calculators/data/<数据集>/<文件>)
+DATASET_FILES = {
+    "micro_emission": {
+        "winter": "atlanta_2025_1_55_65.csv",
+        "spring": "atlanta_2025_4_75_65.csv",
+        "summer": "atlanta_2025_7_90_70.csv",
+    },
+    "macro_emission": {
+        "winter": "atlanta_2025_1_35_60 .csv",
+        "spring": "atlanta_2025_4_75_65.csv",
+        "summer": "atlanta_2025_7_80_60.csv",
+    },
+    "emission_factors": {
+        "winter": "atlanta_2025_1_55_65.csv",
+        "spring": "atlanta_2025_4_75_65.csv",
+        "summer": "atlanta_2025_7_90_70.csv",
+    },
+}
+
+# 季节 → 数据文件的季节（秋季使用春季数据，未知季节使用夏季数据）
+SEASON_KEYS = {
+    "春季": "spring",
+    "夏季": "summer",
+    "秋季": "spring",
+    "冬季": "winter",
+}
+
+
+def dataset_path(dataset: str, season: str) -> Path:
+    """(数据集, 季节) 对应的数据文件路径"""
+    return DATA_ROOT / dataset / DATASET_FILES[dataset][SEASON_KEYS.get(season, "summer")]
+
+
+class EmissionRateTensor:
+    """稠密排放率张量"""
+
+    AXES = ("opmode", "pollutant", "source_type", "model_year")
+
+    def __init__(self, axis_ids: Dict[str, np.ndarray], values: np.ndarray, present: np.ndarray):
+        """
+        Args:
+            axis_ids: 各轴的ID数组（升序）
+            values: 排放率数组，形状为 (opMode, 污染物, 车型, 年份/年龄组)，已完成opMode 300回退
+            present: 与values同形状的布尔数组，标记原始数据中存在的单元
+        """
+        self.axis_ids = axis_ids
+        self.values = values
+        self.present = present
+        self._positions = {axis: self._build_position_lookup(ids) for axis, ids in axis_ids.items()}
+
+    @staticmethod
+    def _build_position_lookup(ids: np.ndarray) -> np.ndarray:
+        """ID → 轴位置的直接寻址表（不存在为-1）"""
+        lookup = np.full(int(ids.max()) + 1 if len(ids) else 1, -1, dtype=np.int64)
+        lookup[ids] = np.arange(len(ids))
+        return lookup
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, opmode_col: str, pollutant_col: str,
+                   source_type_col: str, model_year_col: str, rate_col: str) -> "EmissionRateTensor":
+        """由MOVES矩阵DataFrame构建张量（重复键保留首次出现的行）"""
+        columns = [opmode_col, pollutant_col, source_type_col, model_year_col, rate_col]
+        return cls.from_columns(*(df[col].to_numpy() for col in columns))
+
+    @classmethod
+    def from_columns(cls, opmodes: np.ndarray, pollutants: np.ndarray, source_types: np.ndarray,
+                     model_years: np.ndarray, rates: np.ndarray) -> "EmissionRateTensor":
+        """由MOVES矩阵的列数组构建张量（重复键保留首次出现的行）"""
+        keys = [np.asarray(col, dtype=np.int64) for col in (opmodes, pollutants, source_types, model_years)]
+        rates = np.asarray(rates, dtype=np.float64)
+
+        axis_ids = {}
+        positions = []
+        for axis, key in zip(cls.AXES, keys):
+            ids, inverse = np.unique(key, return_inverse=True)
+            axis_ids[axis] = ids
+            positions.append(inverse)
+
+        shape = tuple(len(axis_ids[axis]) for axis in cls.AXES)
+        flat = np.ravel_multi_index(positions, shape)
+        _, first = np.unique(flat, return_index=True)
+
+        values = np.zeros(shape, dtype=np.float64)
+        present = np.zeros(shape, dtype=bool)
+        values.flat[flat[first]] = rates[first]
+        present.flat[flat[first]] = True
+
+        # 精确opMode缺失时使用opMode 300的平均排放率，两者都缺失则为0
+        fallback_pos = np.searchsorted(axis_ids["opmode"], FALLBACK_OPMODE)
+        if fallback_pos < shape[0] and axis_ids["opmode"][fallback_pos] == FALLBACK_OPMODE:
+            values = np.where(present, values, values[fallback_pos][np.newaxis])
+
+        return cls(axis_ids, values, present)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """张量的全部数组（用于持久化到二进制缓存）"""
+        arrays = {f"axis_{axis}": ids for axis, ids in self.axis_ids.items()}
+        arrays.update(values=self.values, present=self.present)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "EmissionRateTensor":
+        """由 to_arrays 的结果（可为内存映射的只读数组）恢复张量"""
+        axis_ids = {axis: np.asarray(arrays[f"axis_{axis}"]) for axis in cls.AXES}
+        return cls(axis_ids, arrays["values"], arrays["present"])
+
+    def positions(self, axis: str, ids) -> np.ndarray:
+        """批量将ID映射为轴位置（不存在为-1）"""
+        lookup = self._positions[axis]
+        ids = np.asarray(ids, dtype=np.int64)
+        valid = (ids >= 0) & (ids < len(lookup))
+        return np.where(valid, lookup[np.clip(ids, 0, len(lookup) - 1)], -1)
+
+    def _position(self, axis: str, id_value: int) -> int:
+        lookup = self._positions[axis]
+        if 0 <= id_value < len(lookup):
+            return int(lookup[id_value])
+        return -1
+
+    def lookup(self, opmode: int, pollutant_id: int, source_type: int, model_year: int) -> float:
+        """查询单个排放率（精确opMode → opMode 300 → 0）"""
+        pol = self._position("pollutant", pollutant_id)
+        src = self._position("source_type", source_type)
+        year = self._position("model_year", model_year)
+        if min(pol, src, year) < 0:
+            return 0.0
+
+        op = self._position("opmode", opmode)
+        if op < 0:
+            op = self._position("opmode", FALLBACK_OPMODE)
+            if op < 0:
+                return 0.0
+        return float(self.values[op, pol, src, year])
+
+    def rates_for_opmodes(self, opmodes, pollutant_id: int, source_type: int,
+                          model_year: int) -> np.ndarray:
+        """批量查询同一 (污染物, 车型, 年份) 下多个opMode的排放率"""
+        opmodes = np.asarray(opmodes, dtype=np.int64)
+        pol = self._position("pollutant", pollutant_id)
+        src = self._position("source_type", source_type)
+        year = self._position("model_year", model_year)
+        if min(pol, src, year) < 0:
+            return np.zeros(opmodes.shape, dtype=np.float64)
+
+        column = self.values[:, pol, src, year]
+        op = self.positions("opmode", opmodes)
+        fallback = self._position("opmode", FALLBACK_OPMODE)
+        fallback_rate = column[fallback] if fallback >= 0 else 0.0
+        return np.where(op >= 0, column[np.maximum(op, 0)], fallback_rate)
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes + self.present.nbytes
+
+
+class _CacheEntry:
+    """缓存中的一张数据表及其使用记录"""
+
+    __slots__ = ("value", "kind", "path", "loaded_at", "last_used", "hits")
+
+    def __init__(self, value: Any, kind: str, path: str, now: float):
+        self.value = value
+        self.kind = kind
+        self.path = path
+        self.loaded_at = now
+        self.last_used = now
+        self.hits = 0
+
+
+class EmissionRateStore:
+    """
+    进程级排放数据注册表
+
+    同一数据文件只解析一次，之后所有计算器实例（calculators/ 与 skills/ 两条路径）
+    共享同一份张量/曲线索引/数据表。ttl_s > 0 时，超过该时长未被使用的数据表
+    由后台定时线程（以及之后的访问）移出缓存（仍持有引用的调用方不受影响），
+    下次使用时重新加载。
+    """
+
+    def __init__(self, ttl_s: float = 0):
+        self.ttl_s = ttl_s
+        self._entries: Dict[Tuple, _CacheEntry] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self._sweeper: Optional[threading.Thread] = None
+
+    def _get(self, key: Tuple, kind: str, csv_path: Path, build: Callable[[], Any]) -> Any:
+        """取出缓存的数据表，首次使用时加载"""
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is None:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None:
+                    if not Path(csv_path).exists():
+                        raise FileNotFoundError(f"数据文件不存在: {csv_path}")
+                    entry = _CacheEntry(build(), kind, key[0], now)
+                    self._entries[key] = entry
+        entry.last_used = now
+        entry.hits += 1
+        if self.ttl_s > 0 and (self._sweeper is None or not self._sweeper.is_alive()):
+            # 首次加载后（或fork出的子进程中）启动定时清理线程
+            with self._lock:
+                self._start_sweeper()
+        self._evict_idle(now)
+        return entry.value
+
+    @property
+    def sweep_interval_s(self) -> float:
+        """空闲检查间隔"""
+        return min(self.ttl_s, 60)
+
+    def _evict_idle(self, now: float):
+        """移出超过 ttl_s 未使用的数据表（最多每 sweep_interval_s 秒检查一次）"""
+        if self.ttl_s <= 0 or now - self._last_sweep < self.sweep_interval_s:
+            return
+        self.evict_idle(now)
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """立即移出超过 ttl_s 未使用的数据表，返回移出的数量"""
+        if self.ttl_s <= 0:
+            return 0
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._last_sweep = now
+            idle = [key for key, entry in self._entries.items() if now - entry.last_used > self.ttl_s]
+            for key in idle:
+                entry = self._entries.pop(key)
+                logger.info(
+                    f"[RateStore] Evicted {entry.kind} {_table_label(entry.path)} "
+                    f"(idle {now - entry.last_used:.0f}s, {_table_nbytes(entry.value) / 1024:.0f} KB)"
+                )
+        return len(idle)
+
+    def _start_sweeper(self):
+        """启动后台定时清理线程（调用方持有锁）"""
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+        self._sweeper = threading.Thread(target=self._sweep_loop, name="rate-store-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def _sweep_loop(self):
+        """每 sweep_interval_s 秒清理一次空闲数据表，缓存清空后线程退出（下次加载时重新启动）"""
+        while True:
+            time.sleep(self.sweep_interval_s)
+            self.evict_idle()
+            with self._lock:
+                if not self._entries:
+                    self._sweeper = None
+                    return
+
+    def get_frame(self, csv_path: Path, reader: Callable[[Path], pd.DataFrame],
+                  id_columns: Optional[Sequence[str]] = None,
+                  value_columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """
+        获取解析后的数据表（只读共享，调用方不得修改）
+
+        指定 id_columns/value_columns 时只保留这些列，数据表直接建立在
+        二进制列缓存的内存映射之上；否则整表解析CSV。
+        """
+        def build():
+            if id_columns is None and value_columns is None:
+                frame = reader(Path(csv_path))
+            else:
+                columns = load_columns(csv_path, reader, id_columns or (), value_columns or ())
+                frame = pd.DataFrame(columns, copy=False)
+            logger.info(f"[RateStore] Loaded {csv_path} ({len(frame)} rows)")
+            return frame
+
+        key = (str(Path(csv_path).resolve()), tuple(id_columns or ()), tuple(value_columns or ()))
+        return self._get(key, "frame", csv_path, build)
+
+    def get_tensor(self, csv_path: Path, reader: Callable[[Path], pd.DataFrame],
+                   columns: Tuple[str, str, str, str, str]) -> EmissionRateTensor:
+        """
+        获取排放率张量
+
+        张量持久化在二进制缓存中并以内存映射方式打开（只读），各worker进程共享。
+
+        Args:
+            csv_path: MOVES矩阵CSV路径
+            reader: CSV读取函数
+            columns: (opMode列, 污染物列, 车型列, 年份列, 排放率列)
+        """
+        def derive(arrays: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+            return EmissionRateTensor.from_columns(*(arrays[col] for col in columns)).to_arrays()
+
+        def build():
+            tensor = EmissionRateTensor.from_arrays(
+                load_derived(csv_path, reader, columns[:4], columns[4:], "tensor", derive)
+            )
+            logger.info(
+                f"[RateStore] Built rate tensor for {csv_path}: "
+                f"shape={tensor.values.shape}, {tensor.nbytes / 1024:.0f} KB"
+            )
+            return tensor
+
+        key = (str(Path(csv_path).resolve()), "tensor", tuple(columns))
+        return self._get(key, "tensor", csv_path, build)
+
+    def get_curve_index(self, csv_path: Path, reader: Callable[[Path], pd.DataFrame],
+                        columns: Tuple[str, str, str, str, str]) -> EmissionFactorCurveIndex:
+        """
+        获取排放因子速度曲线索引
+
+        Args:
+            csv_path: 排放因子CSV路径
+            reader: CSV读取函数
+            columns: (速度编码列, 车型列, 污染物列, 年份列, 排放因子列)
+        """
+        def build():
+            arrays = load_columns(csv_path, reader, columns[:4], columns[4:])
+            index = EmissionFactorCurveIndex.from_columns(*(arrays[col] for col in columns))
+            logger.info(
+                f"[RateStore] Built emission factor curve index for {csv_path}: "
+                f"{len(index.groups)} curves, {index.nbytes / 1024:.0f} KB"
+            )
+            return index
+
+        key = (str(Path(csv_path).resolve()), "curve_index", tuple(columns))
+        return self._get(key, "curve_index", csv_path, build)
+
+    def memory_report(self) -> Dict[str, Any]:
+        """
+        各缓存数据表的内存占用与使用情况
+
+        内存映射的数据表按映射的列大小计算（多个进程共享同一份页缓存）。
+        """
+        now = time.monotonic()
+        with self._lock:
+            entries = list(self._entries.values())
+        tables = []
+        for entry in sorted(entries, key=lambda e: (e.path, e.kind)):
+            dataset, season = _dataset_season(entry.path)
+            tables.append({
+                "dataset": dataset,
+                "season": season,
+                "kind": entry.kind,
+                "path": entry.path,
+                "nbytes": _table_nbytes(entry.value),
+                "hits": entry.hits,
+                "idle_s": round(now - entry.last_used, 1),
+                "age_s": round(now - entry.loaded_at, 1),
+            })
+        return {
+            "pid": os.getpid(),
+            "tables": tables,
+            "total_bytes": sum(table["nbytes"] for table in tables),
+            "ttl_s": self.ttl_s,
+        }
+
+    def clear(self):
+        """清空缓存（数据文件更新后使用）"""
+        with self._lock:
+            self._entries.clear()
+
+
+def _table_nbytes(value: Any) -> int:
+    """数据表占用的字节数"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    return int(value.nbytes)
+
+
+def _dataset_season(path: str) -> Tuple[str, str]:
+    """由数据文件路径反查 (数据集, 季节)，不在 DATASET_FILES 中时为 (目录名, 文件名)"""
+    path = Path(path)
+    for season, filename in DATASET_FILES.get(path.parent.name, {}).items():
+        if filename == path.name:
+            return path.parent.name, season
+    return path.parent.name, path.name
+
+
+def _table_label(path: str) -> str:
+    return "/".join(_dataset_season(path))
+
+
+_store = None
+
+
+def get_rate_store() -> EmissionRateStore:
+    """获取进程级排放数据注册表（空闲淘汰时长见 config.emission_data_ttl_s）"""
+    global _store
+    if _store is None:
+        from config import get_config
+        _store = EmissionRateStore(ttl_s=get_config().emission_data_ttl_s)
+    return _store
@@ -0,0 +1,352 @@
+"""
+路段排放空间分配 - 网格化排放清单与分区汇总
+
+路段几何为 WKT LINESTRING / MULTILINESTRING，或坐标点列表（如起终点 [[x0, y0], [x1, y1]]）。
+每个路段的排放按其在各网格单元内的长度占比分配：线段与网格线求交后切分为小段，
+全部路段一次向量化计算。网格以坐标原点为锚点、按单元大小划分，单元行列号即空间索引，
+分块计算时只累加有排放的单元，最后才组装为 污染物×行×列 数组。
+坐标类型由调用方指定（经纬度时经向长度按线段中点纬度的 cos 修正）；
+未指定时才按坐标范围推断（全部落在 |x|≤180、|y|≤90 内视为经纬度），并记录警告。
+"""
+import json
+import logging
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 默认网格单元大小：投影坐标 (m) / 经纬度 (°)
+DEFAULT_CELL_SIZE = {"projected": 1000.0, "geographic": 0.01}
+
+# 坐标类型及别名
+COORDINATE_SYSTEMS = {
+    "geographic": "geographic", "lonlat": "geographic", "wgs84": "geographic", "epsg:4326": "geographic",
+    "projected": "projected", "planar": "projected",
+}
+
+# 稠密网格的单元数上限（超出时需要增大单元大小）
+MAX_GRID_CELLS = 50_000_000
+
+_WKT_TYPE = re.compile(r"^\s*(MULTI)?LINESTRING\s*(Z|M|ZM)?\s*\(", re.IGNORECASE)
+_WKT_PART = re.compile(r"\(([^()]*)\)")
+
+
+def _parse_wkt_points(texts: List[str]) -> np.ndarray:
+    """WKT坐标串列表 → 顶点数组 (全部2维时一次解析；Z/M 坐标只取前两维)"""
+    if all(len(text.split(",", 1)[0].split()) == 2 for text in texts):
+        return np.array(",".join(texts).replace(",", " ").split(), dtype=np.float64).reshape(-1, 2)
+    return np.concatenate([
+        np.array([point.split()[:2] for point in text.split(",")], dtype=np.float64) for text in texts
+    ])
+
+
+def links_to_segments(geometries: Sequence[Any]) -> Dict[str, np.ndarray]:
+    """
+    路段几何 → 线段数组
+
+    Args:
+        geometries: 各路段几何，WKT 字符串或坐标点列表（None 表示无几何，跳过）
+
+    Returns:
+        link: 线段所属路段下标, x0, y0, x1, y1: 线段端点
+    """
+    wkt_texts: List[str] = []
+    coordinate_parts: Dict[int, np.ndarray] = {}
+    point_counts, link_of_part = [], []
+    for i, geometry in enumerate(geometries):
+        if geometry is None:
+            continue
+        if isinstance(geometry, str):
+            if not _WKT_TYPE.match(geometry):
+                raise ValueError(
+                    f"第 {i + 1} 个路段几何无法解析（仅支持 LINESTRING / MULTILINESTRING）: {geometry[:40]}"
+                )
+            for text in _WKT_PART.findall(geometry):
+                wkt_texts.append(text)
+                point_counts.append(text.count(",") + 1)
+                link_of_part.append(i)
+        else:
+            points = np.asarray(geometry, dtype=np.float64).reshape(-1, 2)
+            coordinate_parts[len(link_of_part)] = points
+            point_counts.append(len(points))
+            link_of_part.append(i)
+
+    if not link_of_part:
+        empty = np.zeros(0)
+        return {"link": np.zeros(0, dtype=np.int64), "x0": empty, "y0": empty, "x1": empty, "y1": empty}
+
+    # WKT 坐标一次解析；与坐标列表混合时按原顺序拼接
+    points = _parse_wkt_points(wkt_texts)
+    if coordinate_parts:
+        is_wkt = np.ones(len(link_of_part), dtype=bool)
+        is_wkt[list(coordinate_parts)] = False
+        wkt_parts = iter(np.split(points, np.cumsum(np.asarray(point_counts)[is_wkt])[:-1]))
+        points = np.concatenate([
+            coordinate_parts[part] if part in coordinate_parts else next(wkt_parts)
+            for part in range(len(link_of_part))
+        ])
+    part_ids = np.repeat(np.arange(len(link_of_part)), point_counts)
+    # 同一折线内相邻顶点构成线段
+    starts = np.flatnonzero(part_ids[:-1] == part_ids[1:])
+    return {
+        "link": np.asarray(link_of_part, dtype=np.int64)[part_ids[starts]],
+        "x0": points[starts, 0], "y0": points[starts, 1],
+        "x1": points[starts + 1, 0], "y1": points[starts + 1, 1],
+    }
+
+
+def _grid_crossings(lo: np.ndarray, hi: np.ndarray, start: np.ndarray, delta: np.ndarray):
+    """各线段穿过的整数网格线（lo < k < hi）对应的线段参数 t"""
+    first = np.floor(lo) + 1
+    counts = np.maximum(np.ceil(hi) - first, 0).astype(np.int64)
+    segment = np.repeat(np.arange(len(lo)), counts)
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    k = first[segment] + (np.arange(counts.sum()) - offsets)
+    return segment, (k - start[segment]) / delta[segment]
+
+
+def split_segments(segments: Dict[str, np.ndarray], cell_size: float, geographic: bool) -> Dict[str, np.ndarray]:
+    """
+    按网格线切分线段
+
+    Returns:
+        link: 小段所属路段, row/col: 所在网格单元（以原点为锚点的行列号）,
+        length: 小段长度（经纬度时为修正后的度数，只用于计算占比）, segment_count: 路段的线段数
+    """
+    x0, y0 = segments["x0"] / cell_size, segments["y0"] / cell_size
+    x1, y1 = segments["x1"] / cell_size, segments["y1"] / cell_size
+    n = len(x0)
+
+    # 线段参数 t：端点 0、1 以及与竖直/水平网格线的交点
+    dx, dy = x1 - x0, y1 - y0
+    seg_x, t_x = _grid_crossings(np.minimum(x0, x1), np.maximum(x0, x1), x0, dx)
+    seg_y, t_y = _grid_crossings(np.minimum(y0, y1), np.maximum(y0, y1), y0, dy)
+    seg = np.concatenate([np.arange(n), np.arange(n), seg_x, seg_y])
+    t = np.concatenate([np.zeros(n), np.ones(n), t_x, t_y])
+    order = np.lexsort((t, seg))
+    seg, t = seg[order], t[order]
+
+    # 相邻参数之间为一个小段，由中点确定所在单元（角点处重复的交点长度为0，丢弃）
+    same = seg[:-1] == seg[1:]
+    piece_seg = seg[:-1][same]
+    t_a, t_b = t[:-1][same], t[1:][same]
+    fraction = t_b - t_a
+    keep = (fraction > 0) | ((dx == 0) & (dy == 0))[piece_seg]
+    piece_seg, t_a, fraction = piece_seg[keep], t_a[keep], fraction[keep]
+    t_mid = t_a + fraction / 2
+
+    col = np.floor(x0[piece_seg] + dx[piece_seg] * t_mid).astype(np.int64)
+    row = np.floor(y0[piece_seg] + dy[piece_seg] * t_mid).astype(np.int64)
+
+    x_scale = np.ones(n)
+    if geographic:
+        x_scale = np.cos(np.radians((segments["y0"] + segments["y1"]) / 2))
+    segment_length = np.hypot(dx * x_scale, dy) * cell_size
+
+    link = segments["link"]
+    return {
+        "link": link[piece_seg],
+        "row": row,
+        "col": col,
+        "length": fraction * segment_length[piece_seg],
+        "segment_count": np.bincount(link, minlength=link.max() + 1 if len(link) else 0),
+    }
+
+
+class SpatialAggregator:
+    """
+    路段排放的网格化和分区累加器（可逐块调用 add）
+
+    网格只累加有排放的单元（稀疏），to_grid / save 时组装为覆盖全部单元的稠密数组。
+    """
+
+    def __init__(self, pollutants: List[str], cell_size: Optional[float] = None,
+                 coordinates: Optional[str] = None):
+        """
+        Args:
+            pollutants: 污染物列表
+            cell_size: 网格单元大小（坐标单位），默认见 DEFAULT_CELL_SIZE
+            coordinates: 坐标类型 "geographic"（经纬度）或 "projected"（投影/局部坐标），
+                见 COORDINATE_SYSTEMS；为None时按第一批坐标的范围推断
+        """
+        if cell_size is not None and not cell_size > 0:
+            raise ValueError("网格单元大小必须大于0")
+        self.pollutants = list(pollutants)
+        self.cell_size = cell_size
+        self.geographic: Optional[bool] = None
+        self.coordinates_inferred = coordinates is None
+        if coordinates is not None:
+            system = COORDINATE_SYSTEMS.get(str(coordinates).strip().lower())
+            if system is None:
+                raise ValueError(f"不支持的坐标类型: {coordinates}（可选 geographic / projected）")
+            self.geographic = system == "geographic"
+        self.links_with_geometry = 0
+        self.links_without_geometry = 0
+        self._cells = np.zeros((0, 2), dtype=np.int64)
+        self._cell_values = np.zeros((0, len(self.pollutants)))
+        self._zone_totals: Dict[str, np.ndarray] = {}
+
+    def add(self, link_totals: np.ndarray, geometries: Optional[Sequence[Any]] = None,
+            zones: Optional[Sequence[Any]] = None):
+        """
+        累加一批路段
+
+        Args:
+            link_totals: 路段×污染物 排放 (kg/hr)
+            geometries: 各路段几何（None 为无几何）
+            zones: 各路段所属分区（None 为不属于任何分区）
+        """
+        link_totals = np.asarray(link_totals, dtype=np.float64)
+        if zones is not None:
+            self._add_zones(link_totals, zones)
+        if geometries is not None:
+            self._add_grid(link_totals, geometries)
+
+    def _add_zones(self, link_totals: np.ndarray, zones: Sequence[Any]):
+        keys = np.array(["" if zone is None else str(zone) for zone in zones], dtype=object)
+        has_zone = keys != ""
+        if not has_zone.any():
+            return
+        names, inverse = np.unique(keys[has_zone], return_inverse=True)
+        sums = np.zeros((len(names), link_totals.shape[1]))
+        np.add.at(sums, inverse, link_totals[has_zone])
+        for name, values in zip(names.tolist(), sums):
+            if name in self._zone_totals:
+                self._zone_totals[name] = self._zone_totals[name] + values
+            else:
+                self._zone_totals[name] = values
+
+    def _add_grid(self, link_totals: np.ndarray, geometries: Sequence[Any]):
+        segments = links_to_segments(geometries)
+        n_with = len(np.unique(segments["link"]))
+        self.links_with_geometry += n_with
+        self.links_without_geometry += len(geometries) - n_with
+        if not len(segments["link"]):
+            return
+
+        if self.geographic is None:
+            # 未指定坐标类型：按第一批坐标的范围推断（小范围的投影/局部坐标也会被判为经纬度）
+            coords = np.concatenate([segments["x0"], segments["x1"], segments["y0"], segments["y1"]])
+            half = len(coords) // 2
+            self.geographic = bool((np.abs(coords[:half]) <= 180).all() and (np.abs(coords[half:]) <= 90).all())
+            logger.warning(
+                f"[SpatialGrid] Coordinate system not given, inferred "
+                f"{'geographic' if self.geographic else 'projected'} from the coordinate range"
+            )
+        if self.cell_size is None:
+            self.cell_size = DEFAULT_CELL_SIZE["geographic" if self.geographic else "projected"]
+            logger.info(
+                f"[SpatialGrid] {'Geographic' if self.geographic else 'Projected'} coordinates, "
+                f"cell size {self.cell_size}"
+            )
+
+        pieces = split_segments(segments, self.cell_size, self.geographic)
+
+        # 小段长度占路段总长的比例；零长度路段均分到其线段所在单元
+        link_length = np.bincount(pieces["link"], weights=pieces["length"], minlength=len(geometries))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weights = pieces["length"] / link_length[pieces["link"]]
+        zero_length = link_length[pieces["link"]] == 0
+        weights[zero_length] = 1.0 / pieces["segment_count"][pieces["link"][zero_length]]
+
+        cells = np.column_stack([pieces["row"], pieces["col"]])
+        values = weights[:, np.newaxis] * link_totals[pieces["link"]]
+        self._merge_cells(cells, values)
+
+    def _merge_cells(self, cells: np.ndarray, values: np.ndarray):
+        """按单元合并（与已有累计值一起重新归约）"""
+        cells = np.concatenate([self._cells, cells])
+        values = np.concatenate([self._cell_values, values])
+        # 行列号编码为一个 uint64 键（各加 2^31 偏移以容纳负数）
+        keys = ((cells[:, 0] + 2 ** 31).astype(np.uint64) << np.uint64(32)) | (cells[:, 1] + 2 ** 31).astype(np.uint64)
+        unique_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        merged = np.column_stack([
+            np.bincount(inverse, weights=values[:, j], minlength=len(unique_keys))
+            for j in range(values.shape[1])
+        ]) if values.shape[1] else np.zeros((len(unique_keys), 0))
+        self._cells, self._cell_values = cells[first], merged
+
+    @property
+    def zone_totals(self) -> Dict[str, Dict[str, float]]:
+        """各分区的总排放 (kg/hr)"""
+        return {
+            zone: {pollutant: round(float(value), 4) for pollutant, value in zip(self.pollutants, values)}
+            for zone, values in sorted(self._zone_totals.items())
+        }
+
+    def to_grid(self) -> Optional[Dict[str, Any]]:
+        """
+        稠密网格（无带几何的路段时为None）
+
+        Returns:
+            emissions: 污染物×行×列 (kg/hr)，行对应 y 递增
+            x_edges, y_edges: 单元边界坐标
+        """
+        if not len(self._cells):
+            return None
+        row_min, col_min = self._cells.min(axis=0)
+        row_max, col_max = self._cells.max(axis=0)
+        n_rows, n_cols = int(row_max - row_min + 1), int(col_max - col_min + 1)
+        if n_rows * n_cols > MAX_GRID_CELLS:
+            raise ValueError(
+                f"网格过大 ({n_rows}×{n_cols} 个单元)，请增大网格单元大小（当前 {self.cell_size}）"
+            )
+
+        emissions = np.zeros((len(self.pollutants), n_rows, n_cols))
+        emissions[:, self._cells[:, 0] - row_min, self._cells[:, 1] - col_min] = self._cell_values.T
+        return {
+            "emissions": emissions,
+            "x_edges": (np.arange(n_cols + 1) + col_min) * self.cell_size,
+            "y_edges": (np.arange(n_rows + 1) + row_min) * self.cell_size,
+        }
+
+    def grid_info(self) -> Optional[Dict[str, Any]]:
+        """网格元数据与各污染物分配到网格的总量"""
+        if not len(self._cells):
+            return None
+        row_min, col_min = self._cells.min(axis=0)
+        row_max, col_max = self._cells.max(axis=0)
+        return {
+            "cell_size": self.cell_size,
+            "coordinates": "geographic" if self.geographic else "projected",
+            "coordinates_inferred": self.coordinates_inferred,
+            "shape": [int(row_max - row_min + 1), int(col_max - col_min + 1)],
+            "origin": [float(col_min * self.cell_size), float(row_min * self.cell_size)],
+            "cells_with_emissions": int(len(self._cells)),
+            "links_with_geometry": self.links_with_geometry,
+            "links_without_geometry": self.links_without_geometry,
+            "total_emissions_kg_per_hr": {
+                pollutant: round(float(value), 4)
+                for pollutant, value in zip(self.pollutants, self._cell_values.sum(axis=0))
+            },
+        }
+
+    def save(self, path: str) -> Optional[str]:
+        """
+        写出网格排放清单 (.npz，类似 NetCDF 的 维度 + 坐标 + 属性 结构)
+
+        数组: emissions (污染物×y×x, float32, kg/hr), x_edges, y_edges, pollutants；
+        attrs 为 JSON 字符串（维度名、单位、单元大小、坐标类型）。无网格时不写出，返回None。
+        """
+        grid = self.to_grid()
+        if grid is None:
+            return None
+        attrs = {
+            "dims": ["pollutant", "y", "x"],
+            "units": "kg/hr",
+            "cell_size": self.cell_size,
+            "coordinates": "geographic" if self.geographic else "projected",
+            "coordinates_inferred": self.coordinates_inferred,
+            "links_with_geometry": self.links_with_geometry,
+        }
+        np.savez_compressed(
+            path,
+            emissions=grid["emissions"].astype(np.float32),
+            x_edges=grid["x_edges"],
+            y_edges=grid["y_edges"],
+            pollutants=np.array(self.pollutants),
+            attrs=np.array(json.dumps(attrs, ensure_ascii=False)),
+        )
+        return path
@@ -2,14 +2,23 @@
 VSP (Vehicle Specific Power) 计算器
 严格按照 MOVES 模型实现
 """
+import numpy as np
 from shared.standardizer.constants import VSP_PARAMETERS, VSP_BINS
 
+# VSP Bin上界（按Bin编号升序，不含最高Bin），Bin区间为 (lower, upper]
+VSP_BIN_UPPER_EDGES = np.array([VSP_BINS[bin_id][1] for bin_id in sorted(VSP_BINS)][:-1])
+
+# opMode分段边界：速度段 (mph) 与三个速度段VSP阈值的并集，区间均为左闭右开
+OPMODE_SPEED_EDGES = np.array([1.0, 25.0, 50.0])
+OPMODE_VSP_EDGES = np.array([0.0, 3.0, 6.0, 9.0, 12.0, 15.0, 18.0, 21.0, 24.0, 30.0])
+
 class VSPCalculator:
     """VSP计算器"""
 
     def __init__(self):
         self.params = VSP_PARAMETERS
         self.g = 9.81  # 重力加速度 m/s²
+        self._opmode_table = self._build_opmode_table()
 
     def calculate_vsp(self, speed_mps: float, acc: float, grade_pct: float,
                      vehicle_type_id: int) -> float:
@@ -95,54 +104,176 @@ class VSPCalculator:
             elif vsp < 30:   return 39
             else:            return 40
 
+    def _build_opmode_table(self) -> np.ndarray:
+        """
+        预计算 (速度段, VSP段) → opMode 查找表
+
+        表中每个单元取该区间左端点代入 vsp_to_opmode，保证与逐点规则一致。
+        """
+        speed_points = np.concatenate([[0.0], OPMODE_SPEED_EDGES])
+        vsp_points = np.concatenate([[-np.inf], OPMODE_VSP_EDGES])
+        return np.array([
+            [self.vsp_to_opmode(speed_mph, vsp) for vsp in vsp_points]
+            for speed_mph in speed_points
+        ], dtype=np.int64)
+
     def calculate_trajectory_vsp(self, trajectory: list, vehicle_type_id: int) -> list:
         """
         批量计算轨迹的VSP和opMode
 
+        整条轨迹按列一次性计算，再由列数组组装结果行（不修改传入的轨迹点）。
+
         Args:
             trajectory: 轨迹数据列表
             vehicle_type_id: 车型ID
 
         Returns:
-            添加了vsp和opmode字段的轨迹列表
+            添加了vsp和opmode字段的轨迹列表（新列表）
         """
-        results = []
-
-        for i, point in enumerate(trajectory):
-            # 获取速度
-            speed_kph = point.get("speed_kph", 0)
-            speed_mps = speed_kph / 3.6
-            speed_mph = speed_kph * 0.621371
-
-            # 获取或计算加速度
-            acc = point.get("acceleration_mps2")
-            if acc is None and i > 0:
-                # 从速度差计算
-                prev_speed = trajectory[i-1].get("speed_kph", speed_kph)
-                dt = point.get("t", i) - trajectory[i-1].get("t", i-1)
-                if dt > 0:
-                    acc = (speed_kph - prev_speed) / (3.6 * dt)
-                else:
-                    acc = 0
-            elif acc is None:
-                acc = 0
-
-            # 获取坡度
-            grade = point.get("grade_pct", 0)
-
-            # 计算VSP和opMode
-            vsp = self.calculate_vsp(speed_mps, acc, grade, vehicle_type_id)
-            vsp_bin = self.vsp_to_bin(vsp)
-            opmode = self.vsp_to_opmode(speed_mph, vsp)
-
-            results.append({
+        n = len(trajectory)
+        speed_kph = np.fromiter((point.get("speed_kph", 0) for point in trajectory),
+                                dtype=np.float64, count=n)
+        time_s = np.fromiter((point.get("t", i) for i, point in enumerate(trajectory)),
+                             dtype=np.float64, count=n)
+        grade_pct = np.fromiter((point.get("grade_pct", 0) for point in trajectory),
+                                dtype=np.float64, count=n)
+        given_acc = [point.get("acceleration_mps2") for point in trajectory]
+        acc = np.array([np.nan if a is None else a for a in given_acc], dtype=np.float64)
+
+        # 缺失加速度由速度差补算（前一点缺少速度时按当前速度计，即加速度为0）
+        missing = np.isnan(acc)
+        if missing.any():
+            derived = np.zeros(n)
+            if n > 1:
+                prev_speed = np.fromiter(
+                    (trajectory[i - 1].get("speed_kph", speed_kph[i]) for i in range(1, n)),
+                    dtype=np.float64, count=n - 1
+                )
+                prev_time = np.fromiter(
+                    (trajectory[i - 1].get("t", i - 1) for i in range(1, n)),
+                    dtype=np.float64, count=n - 1
+                )
+                dt = time_s[1:] - prev_time
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    derived[1:] = np.where(dt > 0, (speed_kph[1:] - prev_speed) / (3.6 * dt), 0.0)
+            acc[missing] = derived[missing]
+
+        arrays = self.calculate_trajectory_arrays(speed_kph, acc, grade_pct, time_s, vehicle_type_id)
+
+        columns = zip(
+            arrays["speed_mps"].tolist(), arrays["speed_mph"].tolist(), acc.tolist(),
+            arrays["vsp"].tolist(), arrays["vsp_bin"].tolist(), arrays["opmode"].tolist()
+        )
+        return [
+            {
                 **point,
                 "speed_mps": round(speed_mps, 2),
                 "speed_mph": round(speed_mph, 2),
-                "acceleration_calculated": acc if point.get("acceleration_mps2") is None else None,
+                "acceleration_calculated": a if given is None else None,
                 "vsp": vsp,
                 "vsp_bin": vsp_bin,
                 "opmode": opmode
-            })
+            }
+            for point, given, (speed_mps, speed_mph, a, vsp, vsp_bin, opmode) in zip(trajectory, given_acc, columns)
+        ]
+
+    def calculate_vsp_array(self, speed_mps: np.ndarray, acc: np.ndarray,
+                            grade_pct: np.ndarray, vehicle_type_id) -> np.ndarray:
+        """
+        向量化计算整条轨迹的VSP值
+
+        运算顺序与 calculate_vsp 完全一致，保证逐点结果相同。
+
+        Args:
+            speed_mps: 速度数组 (m/s)
+            acc: 加速度数组 (m/s²)
+            grade_pct: 坡度数组 (%)
+            vehicle_type_id: 车型ID，或与速度等长的车型ID数组（多车型混合轨迹）
+
+        Returns:
+            VSP数组 (kW/ton)，保留3位小数
+        """
+        p = self._vsp_coefficients(vehicle_type_id)
+        v = speed_mps
+
+        vsp = (
+            p["A"] * v +
+            p["B"] * v ** 2 +
+            p["C"] * v ** 3 +
+            p["M"] * v * acc +
+            p["M"] * v * self.g * (grade_pct / 100.0)
+        ) / p["m"]
+
+        return np.round(vsp, 3)
+
+    def _vsp_coefficients(self, vehicle_type_id) -> dict:
+        """车型ID（标量或数组）→ VSP系数（标量或逐点数组）"""
+        ids = np.asarray(vehicle_type_id)
+        if ids.ndim == 0:
+            if vehicle_type_id not in self.params:
+                raise ValueError(f"不支持的车型ID: {vehicle_type_id}")
+            return self.params[vehicle_type_id]
+
+        unique_ids, inverse = np.unique(ids, return_inverse=True)
+        for type_id in unique_ids.tolist():
+            if type_id not in self.params:
+                raise ValueError(f"不支持的车型ID: {type_id}")
+        return {
+            key: np.array([self.params[type_id][key] for type_id in unique_ids.tolist()])[inverse]
+            for key in ("A", "B", "C", "M", "m")
+        }
+
+    def vsp_to_bin_array(self, vsp: np.ndarray) -> np.ndarray:
+        """VSP数组 → Bin编号数组 (1-14)，与 vsp_to_bin 一致"""
+        return np.searchsorted(VSP_BIN_UPPER_EDGES, vsp, side="left") + 1
+
+    def vsp_to_opmode_array(self, speed_mph: np.ndarray, vsp: np.ndarray) -> np.ndarray:
+        """VSP和速度数组 → opMode数组（按分段边界二分查表，与 vsp_to_opmode 一致）"""
+        speed_band = np.searchsorted(OPMODE_SPEED_EDGES, speed_mph, side="right")
+        vsp_band = np.searchsorted(OPMODE_VSP_EDGES, vsp, side="right")
+        return self._opmode_table[speed_band, vsp_band]
+
+    def calculate_trajectory_arrays(self, speed_kph: np.ndarray, acceleration: np.ndarray,
+                                    grade_pct: np.ndarray, time_s: np.ndarray,
+                                    vehicle_type_id) -> dict:
+        """
+        列式计算整条轨迹的速度、加速度、VSP、VSP Bin和opMode
+
+        加速度缺失（NaN）的点按 calculate_trajectory_vsp 的规则由相邻速度差补算。
+
+        Args:
+            speed_kph: 速度数组 (km/h)
+            acceleration: 加速度数组 (m/s²)，缺失值为NaN
+            grade_pct: 坡度数组 (%)
+            time_s: 时间数组 (s)，仅在补算加速度时使用
+            vehicle_type_id: 车型ID，或逐点车型ID数组
+
+        Returns:
+            包含 speed_mps, speed_mph, acceleration, vsp, vsp_bin, opmode 数组的字典
+        """
+        speed_kph = np.asarray(speed_kph, dtype=np.float64)
+        speed_mps = speed_kph / 3.6
+        speed_mph = speed_kph * 0.621371
+
+        acc = np.array(acceleration, dtype=np.float64)
+        missing = np.isnan(acc)
+        if missing.any():
+            derived = np.zeros_like(speed_kph)
+            if len(speed_kph) > 1:
+                dt = np.diff(np.asarray(time_s, dtype=np.float64))
+                dv = np.diff(speed_kph)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    derived[1:] = np.where(dt > 0, dv / (3.6 * dt), 0.0)
+            acc[missing] = derived[missing]
+
+        vsp = self.calculate_vsp_array(speed_mps, acc, np.asarray(grade_pct, dtype=np.float64),
+                                       vehicle_type_id)
 
-        return results
+        return {
+            "speed_mps": speed_mps,
+            "speed_mph": speed_mph,
+            "acceleration": acc,
+            "vsp": vsp,
+            "vsp_bin": self.vsp_to_bin_array(vsp),
+            "opmode": self.vsp_to_opmode_array(speed_mph, vsp),
+        }
@@ -84,6 +84,44 @@ class Config:
         self.rerank_model = os.getenv("RERANK_MODEL", "gte-rerank")
         self.rerank_top_n = int(os.getenv("RERANK_TOP_N", "5"))
 
+        # ============ 大文件流式计算配置 ============
+        # CSV轨迹文件超过该大小时，微观排放按块流式计算并直接写出结果文件
+        self.micro_streaming_threshold_mb = float(os.getenv("MICRO_STREAMING_THRESHOLD_MB", "50"))
+        self.micro_streaming_chunk_rows = int(os.getenv("MICRO_STREAMING_CHUNK_ROWS", "200000"))
+        # 轨迹点数超过该值时，逐秒结果以列式DataFrame返回（不生成逐秒字典）
+        self.micro_columnar_threshold_points = int(os.getenv("MICRO_COLUMNAR_THRESHOLD_POINTS", "10000"))
+        # CSV/Parquet路段文件超过该大小时，宏观排放按块流式计算，结果逐块写出为CSV或Parquet
+        self.macro_streaming_threshold_mb = float(os.getenv("MACRO_STREAMING_THRESHOLD_MB", "20"))
+        self.macro_streaming_chunk_rows = int(os.getenv("MACRO_STREAMING_CHUNK_ROWS", "50000"))
+        self.macro_streaming_output_format = os.getenv("MACRO_STREAMING_OUTPUT_FORMAT", "csv").lower()
+        # 宏观结果文件行数超过该值时改为写出CSV（openpyxl逐单元格写入过慢）；设为0时始终写出CSV
+        self.macro_excel_max_rows = int(os.getenv("MACRO_EXCEL_MAX_ROWS", "100000"))
+        # 排放数据表（季节矩阵/曲线索引）超过该秒数未被使用时移出进程缓存；设为0时常驻
+        self.emission_data_ttl_s = float(os.getenv("EMISSION_DATA_TTL_S", "0"))
+
+        # ============ 工具执行进程池配置 ============
+        # CPU密集型工具在worker进程中执行，不阻塞API事件循环；设为0时改用线程执行
+        self.tool_worker_processes = int(os.getenv("TOOL_WORKER_PROCESSES", str(min(4, os.cpu_count() or 1))))
+        self.tool_worker_start_method = os.getenv("TOOL_WORKER_START_METHOD", "spawn")
+        self.tool_worker_tools = [
+            name.strip() for name in os.getenv(
+                "TOOL_WORKER_TOOLS", "calculate_micro_emission,calculate_macro_emission,compare_macro_scenarios,query_emission_factors,interpolate_emission_factors"
+            ).split(",") if name.strip()
+        ]
+        # 排队+执行中的任务上限，超出时直接返回"服务繁忙"
+        self.tool_queue_limit = int(os.getenv("TOOL_QUEUE_LIMIT", "32"))
+        # 单个工具的并发上限，格式: 工具名=数量,工具名=数量
+        # （批量接口的任务名为 bulk_emission_factors / bulk_micro / bulk_macro）
+        self.tool_concurrency_limits = {
+            name.strip(): int(limit)
+            for name, limit in (
+                item.split("=", 1) for item in os.getenv(
+                    "TOOL_CONCURRENCY_LIMITS",
+                    "calculate_micro_emission=2,calculate_macro_emission=2,bulk_micro=2,bulk_macro=2"
+                ).split(",") if "=" in item
+            )
+        }
+
 _config = None
 def get_config():
     global _config
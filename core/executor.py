@@ -5,6 +5,7 @@ import logging
 from typing import Dict, Any
 from tools.registry import get_registry
 from services.standardizer import get_standardizer
+from core.worker_pool import ToolQueueFullError, get_worker_pool
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +24,10 @@ class ToolExecutor:
     def __init__(self):
         self.registry = get_registry()
         self.standardizer = get_standardizer()
+        self.worker_pool = get_worker_pool()
+
+        # Per-session tool state (ToolResult.session_state), keyed by tool name
+        self.session_state: Dict[str, Any] = {}
 
         # Initialize tools if not already done
         if not self.registry.list_tools():
@@ -83,10 +88,22 @@ class ToolExecutor:
             standardized_args["file_path"] = file_path
             logger.info(f"[Executor] Auto-injected file_path: {file_path}")
 
-        # 4. Execute tool
+        # 4. Execute tool (CPU-bound tools run in the worker pool, off the event loop)
         try:
             logger.info(f"Executing {tool_name} with standardized args")
-            result = await tool.execute(**standardized_args)
+            if tool.wants_session_state(standardized_args):
+                result = await tool.execute(**standardized_args, _session_state=self.session_state.get(tool_name))
+            else:
+                # A new full run replaces the previous state even if it fails, so follow-up
+                # calls never silently operate on an earlier result
+                self.session_state.pop(tool_name, None)
+                if self.worker_pool.handles(tool_name):
+                    result = await self.worker_pool.run(tool_name, standardized_args)
+                else:
+                    result = await tool.execute(**standardized_args)
+
+            if result.session_state is not None:
+                self.session_state[tool_name] = result.session_state
 
             logger.info(f"{tool_name} execution completed. Success: {result.success}")
             if not result.success:
@@ -102,6 +119,15 @@ class ToolExecutor:
                 "table_data": result.table_data,
                 "download_file": result.download_file,
                 "message": result.error if result.error else result.summary
+            }
+
+        except ToolQueueFullError as e:
+            logger.warning(f"Worker pool full, rejected {tool_name} ({e.pending} pending)")
+            return {
+                "success": False,
+                "error": True,
+                "error_type": "busy",
+                "message": str(e)
             }
 
         except MissingParameterError as e:
@@ -153,6 +179,19 @@ class ToolExecutor:
                 standardized[key] = std_value
                 logger.debug(f"Standardized vehicle: '{value}' -> '{std_value}'")
 
+            elif key == "vehicle_types" and value:
+                # Standardize vehicle type list (batched comparison queries)
+                std_list = []
+                for vehicle in value:
+                    std_value = self.standardizer.standardize_vehicle(vehicle)
+                    if std_value is None:
+                        raise StandardizationError(
+                            f"Cannot recognize vehicle type: '{vehicle}'",
+                            suggestions=self.standardizer.get_vehicle_suggestions()
+                        )
+                    std_list.append(std_value)
+                standardized[key] = std_list
+
             elif key == "pollutant" and value:
                 # Standardize single pollutant
                 std_value = self.standardizer.standardize_pollutant(value)
@@ -438,6 +438,10 @@ class UnifiedRouter:
         if tool_name == "query_emission_factors":
             data = result.get("data", {})
 
+            # 批量对比查询
+            if "series" in data:
+                return self._render_emission_factor_comparison(data)
+
             # 判断单污染物 vs 多污染物
             if "query_summary" in data:
                 # 单污染物格式
@@ -544,6 +548,49 @@ class UnifiedRouter:
         # For non-calculation tools, keep original summary
         return result.get("summary") or "执行完成。"
 
+    def _render_emission_factor_comparison(self, data: Dict) -> str:
+        """批量排放因子查询：各曲线在典型速度下的对比表"""
+        dims = data.get("dimensions", {})
+        unit = data.get("unit", "g/mile")
+        series = data.get("series", [])
+        speed_headers = [
+            f"{tv['speed_kph']} km/h" for tv in (series[0]["typical_values"] if series else [])
+        ]
+
+        lines = [
+            "## 排放因子对比结果",
+            "",
+            "**查询参数**",
+            f"- 车型: {', '.join(map(str, dims.get('vehicle_types', [])))}",
+            f"- 年份: {', '.join(map(str, dims.get('model_years', [])))}",
+            f"- 季节: {', '.join(map(str, dims.get('seasons', [])))}",
+            f"- 道路类型: {', '.join(map(str, dims.get('road_types', [])))}",
+            f"- 污染物: {', '.join(map(str, dims.get('pollutants', [])))}",
+            "",
+            f"**典型速度排放因子 ({unit})**",
+            "",
+            "| 车型 | 污染物 | 年份 | 季节 | 道路类型 | " + " | ".join(speed_headers) + " |",
+            "|" + " --- |" * (5 + len(speed_headers)),
+        ]
+        for item in series:
+            values = [f"{tv['emission_rate']:.4f}" for tv in item.get("typical_values", [])]
+            lines.append(
+                f"| {item['vehicle_type']} | {item['pollutant']} | {item['model_year']} | "
+                f"{item['season']} | {item['road_type']} | " + " | ".join(values) + " |"
+            )
+
+        missing = data.get("missing", [])
+        if missing:
+            lines.append("")
+            lines.append(f"以下 {len(missing)} 个组合无数据:")
+            for item in missing:
+                lines.append(
+                    f"- {item['vehicle_type']} / {item['pollutant']} / {item['model_year']} / "
+                    f"{item['season']} / {item['road_type']}"
+                )
+
+        return "\n".join(lines)
+
     def _filter_results_for_synthesis(self, tool_results: list) -> Dict:
         """
         过滤工具结果，只保留关键信息供 Synthesis 使用
@@ -588,15 +635,35 @@ class UnifiedRouter:
                 filtered[tool_name] = {
                     "success": True,
                     "summary": result.get("summary", "计算完成"),
-                    "num_points": len(results_list),
+                    "num_points": data.get("query_info", {}).get(
+                        "trajectory_points", data.get("query_info", {}).get("links_count", len(results_list))
+                    ),
                     "total_emissions": summary.get("total_emissions_g", {}) or summary.get("total_emissions", {}),
                     "total_distance_km": summary.get("total_distance_km"),
                     "total_time_s": summary.get("total_time_s"),
                     "query_params": query_params,
                     "has_download_file": bool(data.get("download_file"))
                 }
+                if data.get("opmode_distribution"):
+                    filtered[tool_name]["opmode_distribution"] = data["opmode_distribution"]
 
             # 对于排放因子查询
+            elif tool_name == "query_emission_factors" and "series" in data:
+                # 批量对比查询：对齐的整条曲线数据量大，只保留维度和典型值
+                filtered[tool_name] = {
+                    "success": True,
+                    "summary": result.get("summary", "查询完成"),
+                    "data": {
+                        "dimensions": data.get("dimensions"),
+                        "unit": data.get("unit"),
+                        "series": [
+                            {key: value for key, value in item.items() if key != "emission_rate"}
+                            for item in data.get("series", [])
+                        ],
+                        "missing": data.get("missing", []),
+                    }
+                }
+
             elif tool_name == "query_emission_factors":
                 filtered[tool_name] = {
                     "success": True,
@@ -761,6 +828,40 @@ class UnifiedRouter:
 
     def _format_emission_factors_chart(self, data: Dict) -> Dict:
         """Format emission factors data for chart display"""
+        # Batched comparison: one curve per series, keyed by its label
+        if "series" in data:
+            dims = data.get("dimensions", {})
+            # Only dimensions with several values go into the label
+            varying = [
+                key for key, dim in (
+                    ("vehicle_type", "vehicle_types"), ("pollutant", "pollutants"),
+                    ("model_year", "model_years"), ("season", "seasons"), ("road_type", "road_types"),
+                ) if len(dims.get(dim, [])) > 1
+            ] or ["pollutant"]
+            formatted_series = {}
+            for item in data["series"]:
+                label = " / ".join(str(item[key]) for key in varying)
+                formatted_series[label] = {
+                    "curve": [
+                        {"speed_mph": mph, "speed_kph": kph, "emission_rate": rate}
+                        for mph, kph, rate in zip(data["speed_mph"], data["speed_kph"], item["emission_rate"])
+                        if rate is not None
+                    ],
+                    "unit": data.get("unit", "g/mile")
+                }
+
+            return {
+                "type": "emission_factors",
+                "vehicle_type": ", ".join(map(str, dims.get("vehicle_types", []))),
+                "model_year": ", ".join(map(str, dims.get("model_years", []))),
+                "pollutants": formatted_series,
+                "metadata": {
+                    "data_source": data.get("data_source", ""),
+                    "seasons": dims.get("seasons", []),
+                    "road_types": dims.get("road_types", [])
+                }
+            }
+
         # Check if it's multi-pollutant format
         if "pollutants" in data:
             # 转换多污染物数据格式：speed_curve -> curve
@@ -910,6 +1011,59 @@ class UnifiedRouter:
                 results = data.get("results", [])
                 summary = data.get("summary", {})
 
+                # 多车辆批量计算：按车辆汇总预览
+                vehicle_summaries = data.get("vehicle_summaries")
+                if vehicle_summaries:
+                    pollutant_names = list(summary.get("total_emissions_g", {}).keys())
+                    columns = ["vehicle_id", "vehicle_type", "distance_km"] + [f"{p}_g" for p in pollutant_names]
+                    preview_rows = []
+                    for vehicle in vehicle_summaries[:MAX_PREVIEW_ROWS]:
+                        row_data = {
+                            "vehicle_id": vehicle.get("vehicle_id", ""),
+                            "vehicle_type": vehicle.get("vehicle_type", ""),
+                            "distance_km": f"{vehicle.get('total_distance_km', 0):.3f}",
+                        }
+                        for pol in pollutant_names:
+                            row_data[f"{pol}_g"] = f"{vehicle.get('total_emissions_g', {}).get(pol, 0):.4f}"
+                        preview_rows.append(row_data)
+
+                    return {
+                        "type": r["name"],
+                        "columns": columns,
+                        "preview_rows": preview_rows,
+                        "total_rows": len(vehicle_summaries),
+                        "total_columns": len(columns),
+                        "summary": summary,
+                        "total_emissions": summary.get("total_emissions_g", {})
+                    }
+
+                # 列式逐秒结果：直接读取DataFrame前几行
+                results_frame = data.get("results_columns")
+                if results_frame is not None and len(results_frame) > 0:
+                    base_columns = {"t", "speed_kph", "speed_mph", "vsp", "opmode"}
+                    pollutant_names = [col for col in results_frame.columns if col not in base_columns]
+                    columns = ["t", "speed_kph", "VSP"] + pollutant_names
+                    preview_rows = []
+                    for row in results_frame.head(MAX_PREVIEW_ROWS).to_dict("records"):
+                        row_data = {
+                            "t": row["t"],
+                            "speed_kph": f"{row['speed_kph']:.1f}",
+                            "VSP": f"{row['vsp']:.2f}",
+                        }
+                        for pol in pollutant_names:
+                            row_data[pol] = f"{row[pol]:.4f}"
+                        preview_rows.append(row_data)
+
+                    return {
+                        "type": r["name"],
+                        "columns": columns,
+                        "preview_rows": preview_rows,
+                        "total_rows": len(results_frame),
+                        "total_columns": len(columns),
+                        "summary": summary,
+                        "total_emissions": summary.get("total_emissions_g", {})
+                    }
+
                 if not results:
                     # 如果没有详细结果，至少返回汇总
                     if summary:
@@ -1002,7 +1156,9 @@ class UnifiedRouter:
                     "type": r["name"],
                     "columns": columns,
                     "preview_rows": preview_rows,
-                    "total_rows": len(results),
+                    "total_rows": data.get("query_info", {}).get(
+                        "trajectory_points", data.get("query_info", {}).get("links_count", len(results))
+                    ),
                     "total_columns": len(columns),
                     "summary": summary,
                     "total_emissions": summary.get("total_emissions_g", {}) or summary.get("total_emissions", {})
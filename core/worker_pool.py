@@ -0,0 +1,265 @@
+"""
+Tool Worker Pool - Runs CPU-bound tools off the event loop
+
+Emission tools read files with pandas, run the calculators and write Excel
+results synchronously. Awaiting them directly in the API event loop stalls
+every other session (and the stream heartbeat) until they finish, so the
+executor dispatches them here instead:
+
+- worker processes create their own tool instances and preload the
+  emission rate tensors once at startup
+- TOOL_WORKER_PROCESSES=0 runs the tools in a thread pool instead
+- calls beyond the queue limit are rejected immediately
+- per-tool concurrency limits keep one tool from occupying every worker
+- a cancelled call (client disconnected) is dropped if it has not started
+
+Module-level functions (e.g. the bulk API calculations in tools.bulk) can be
+run through the same queue with run_task.
+"""
+import asyncio
+import contextlib
+import logging
+import multiprocessing
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Type
+
+from tools.base import BaseTool, ToolResult
+from tools.registry import get_registry
+
+logger = logging.getLogger(__name__)
+
+# Tool instances owned by a worker process (filled by _init_worker)
+_worker_tools: Dict[str, BaseTool] = {}
+
+
+def _preload_tool(tool: BaseTool):
+    """Load emission matrices for tools backed by a calculator"""
+    preload = getattr(getattr(tool, "_calculator", None), "preload", None)
+    if preload is None:
+        return
+    try:
+        preload()
+    except FileNotFoundError as e:
+        logger.warning(f"[WorkerPool] Preload skipped for {type(tool).__name__}: {e}")
+
+
+def _init_worker(tool_classes: Dict[str, Type[BaseTool]]):
+    """Worker process initializer: create tool instances and preload their data"""
+    for name, tool_class in tool_classes.items():
+        tool = tool_class()
+        _preload_tool(tool)
+        _worker_tools[name] = tool
+    logger.info(f"[WorkerPool] Worker ready with tools: {list(_worker_tools)}")
+
+
+def _run_tool(tool: BaseTool, arguments: Dict[str, Any]) -> ToolResult:
+    """Run an async tool to completion on a private event loop"""
+    return asyncio.run(tool.execute(**arguments))
+
+
+def _run_worker_tool(tool_name: str, arguments: Dict[str, Any]) -> ToolResult:
+    """Process pool entry point"""
+    return _run_tool(_worker_tools[tool_name], arguments)
+
+
+def _worker_memory_report(hold_s: float) -> Dict[str, Any]:
+    """
+    Pool task: emission data held by this worker process
+
+    The task is held for hold_s so that each idle worker picks up one of the
+    report tasks instead of one worker answering all of them.
+    """
+    time.sleep(hold_s)
+    from calculators.rate_store import get_rate_store
+    return get_rate_store().memory_report()
+
+
+class ToolQueueFullError(Exception):
+    """Raised when the worker pool queue is full"""
+    def __init__(self, message: str, pending: int = 0):
+        super().__init__(message)
+        self.pending = pending
+
+
+class ToolWorkerPool:
+    """
+    Bounded worker pool for CPU-bound tools
+
+    Usage:
+        pool = get_worker_pool()
+        if pool.handles(tool_name):
+            result = await pool.run(tool_name, arguments)
+    """
+
+    def __init__(
+        self,
+        worker_processes: int,
+        pooled_tools: List[str],
+        queue_limit: int,
+        concurrency_limits: Optional[Dict[str, int]] = None,
+        start_method: str = "spawn"
+    ):
+        """
+        Args:
+            worker_processes: Number of worker processes (0 = run in threads)
+            pooled_tools: Names of tools dispatched to the pool
+            queue_limit: Maximum number of queued + running calls
+            concurrency_limits: Maximum concurrent calls per tool name
+            start_method: multiprocessing start method for worker processes
+        """
+        self.worker_processes = worker_processes
+        self.pooled_tools = set(pooled_tools)
+        self.queue_limit = queue_limit
+        self.concurrency_limits = concurrency_limits or {}
+        self.start_method = start_method
+
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    @property
+    def pending(self) -> int:
+        """Number of queued + running calls"""
+        return self._pending
+
+    def handles(self, tool_name: str) -> bool:
+        """Whether calls to this tool are dispatched to the pool"""
+        return tool_name in self.pooled_tools
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            registry = get_registry()
+            tools = {name: registry.get(name) for name in self.pooled_tools if registry.get(name)}
+
+            if self.worker_processes > 0:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.worker_processes,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                    initializer=_init_worker,
+                    initargs=({name: type(tool) for name, tool in tools.items()},)
+                )
+                logger.info(f"[WorkerPool] Started {self.worker_processes} worker processes for {sorted(tools)}")
+            else:
+                self._executor = ThreadPoolExecutor(thread_name_prefix="tool-worker")
+                for tool in tools.values():
+                    self._executor.submit(_preload_tool, tool)
+                logger.info(f"[WorkerPool] Running {sorted(tools)} in worker threads")
+        return self._executor
+
+    def _concurrency_guard(self, tool_name: str):
+        limit = self.concurrency_limits.get(tool_name)
+        if not limit or limit <= 0:
+            return contextlib.nullcontext()
+        semaphore = self._semaphores.get(tool_name)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(limit)
+            self._semaphores[tool_name] = semaphore
+        return semaphore
+
+    def _submit(self, tool_name: str, arguments: Dict[str, Any]) -> Future:
+        executor = self._get_executor()
+        if isinstance(executor, ProcessPoolExecutor):
+            return executor.submit(_run_worker_tool, tool_name, arguments)
+        return executor.submit(_run_tool, get_registry().get(tool_name), arguments)
+
+    async def run(self, tool_name: str, arguments: Dict[str, Any]) -> ToolResult:
+        """
+        Run a tool in the pool and await its result
+
+        Raises:
+            ToolQueueFullError: If queue_limit calls are already pending
+            asyncio.CancelledError: If the awaiting task is cancelled; the call
+                is dropped when it has not started yet, otherwise it runs to
+                completion in the worker and its result is discarded
+        """
+        return await self._dispatch(tool_name, lambda: self._submit(tool_name, arguments))
+
+    async def run_task(self, task_name: str, func: Callable[..., Any], *args) -> Any:
+        """
+        Run a module-level function in the pool and await its result
+
+        The call counts against the same queue limit as tool calls, task_name
+        selects its concurrency limit. func and args must be picklable when the
+        pool runs worker processes.
+
+        Raises:
+            ToolQueueFullError: If queue_limit calls are already pending
+        """
+        return await self._dispatch(task_name, lambda: self._get_executor().submit(func, *args))
+
+    async def _dispatch(self, name: str, submit: Callable[[], Future]) -> Any:
+        if self._pending >= self.queue_limit:
+            raise ToolQueueFullError(
+                f"Server is busy ({self._pending} calculations in progress), please retry shortly",
+                pending=self._pending
+            )
+
+        self._pending += 1
+        try:
+            async with self._concurrency_guard(name):
+                future = submit()
+                try:
+                    return await asyncio.wrap_future(future)
+                except asyncio.CancelledError:
+                    if not future.cancel():
+                        logger.info(f"[WorkerPool] {name} cancelled while running, result will be discarded")
+                    raise
+                except BrokenProcessPool:
+                    # A worker died (e.g. killed by the OOM killer); start a fresh pool next time
+                    logger.error("[WorkerPool] Worker process pool is broken, restarting on next call")
+                    self._executor = None
+                    raise
+        finally:
+            self._pending -= 1
+
+    async def memory_reports(self, timeout: float = 5.0, hold_s: float = 0.2) -> List[Dict[str, Any]]:
+        """
+        Emission data memory reports of the worker processes (one per pid)
+
+        One short task per worker is submitted outside the queue limit; workers
+        still busy with a calculation after timeout are missing from the result.
+        Returns [] when no worker processes are running (thread mode or before
+        the first pooled call), the tools then share the caller's rate store.
+        """
+        if not isinstance(self._executor, ProcessPoolExecutor):
+            return []
+        futures = [
+            asyncio.wrap_future(self._executor.submit(_worker_memory_report, hold_s))
+            for _ in range(self.worker_processes)
+        ]
+        done, pending = await asyncio.wait(futures, timeout=timeout)
+        for future in pending:
+            future.cancel()
+        reports = {}
+        for future in done:
+            if future.exception() is None:
+                report = future.result()
+                reports[report["pid"]] = report
+        return [reports[pid] for pid in sorted(reports)]
+
+    def shutdown(self):
+        """Stop the pool (pending calls are cancelled)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_worker_pool: Optional[ToolWorkerPool] = None
+
+
+def get_worker_pool() -> ToolWorkerPool:
+    """Get the process-wide tool worker pool"""
+    global _worker_pool
+    if _worker_pool is None:
+        from config import get_config
+        config = get_config()
+        _worker_pool = ToolWorkerPool(
+            worker_processes=config.tool_worker_processes,
+            pooled_tools=config.tool_worker_tools,
+            queue_limit=config.tool_queue_limit,
+            concurrency_limits=config.tool_concurrency_limits,
+            start_method=config.tool_worker_start_method
+        )
+    return _worker_pool
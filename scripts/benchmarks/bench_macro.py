@@ -0,0 +1,320 @@
+"""
+Macro emission benchmark
+
+Runs MacroEmissionTool.execute on synthetic link networks (see
+link_networks.py) and times its steps through the tool's stage hook, so
+whatever execute does (streaming threshold, spatial output, Excel/CSV
+fallback) is what gets measured:
+
+    read              read the file, column mapping + per-link parsing (ExcelHandler)
+    fleet_fill        fleet-mix fixup, standardization and default fill (_normalize_links)
+    calculate         MacroEmissionCalculator.calculate (rows format, with session state)
+    calculate_stream  chunked read + calculate + result write (files above MACRO_STREAMING_THRESHOLD_MB)
+    excel_write       ExcelHandler.generate_result_excel (CSV above MACRO_EXCEL_MAX_ROWS)
+    spatial           gridded inventory / zone totals (links with geometry or zone)
+    summary           MacroEmissionTool._build_summary
+    other             rest of execute outside the stages above
+
+"total" is the wall time of execute; stages a run does not reach are absent.
+
+Each (naming, size) case runs in a fresh process so the reported peak RSS
+belongs to that case alone. Emission matrices and the vehicle standardizer
+are loaded and the LLM column mapping is disabled before timing starts.
+With --profile-dir, every case is sampled and written as collapsed stacks
+(<naming>_<links>.folded, one root frame per stage, harness frames cut off)
+for flamegraph.pl / speedscope, and the hottest frames of each stage are
+added to the results.
+
+    python scripts/benchmarks/bench_macro.py --sizes 1e2 1e4 1e6 --output macro.json
+    python scripts/benchmarks/bench_macro.py --profile-dir profiles/ --sizes 1e5
+    python scripts/benchmarks/bench_macro.py --compare macro.json   # exit 1 on regression
+
+Results are written as JSON (stdout unless --output is given); a readable
+table goes to stderr.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Ensure repo root is on sys.path
+REPO_ROOT = Path(__file__).resolve().parents[2]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import numpy as np
+import pandas as pd
+
+from scripts.benchmarks.bench_micro import peak_rss_mb
+from scripts.benchmarks.link_networks import NAMING_STYLES, generate_link_network, write_link_network
+from scripts.benchmarks.sampling_profiler import SamplingProfiler
+
+STAGES = ("read", "fleet_fill", "calculate", "calculate_stream", "excel_write", "spatial", "summary", "other")
+DEFAULT_SIZES = (1e2, 1e3, 1e4, 1e5)
+DEFAULT_POLLUTANTS = ["CO2", "NOx", "PM2.5"]
+
+
+def run_pipeline(input_path: Path, options: Dict, output_dir: Path,
+                 profiler: Optional[SamplingProfiler]) -> Tuple[Dict[str, float], float, bool]:
+    """
+    Run MacroEmissionTool.execute on one file
+
+    Returns:
+        (seconds per stage, execute wall time, whether execute streamed the file)
+    """
+    from config import get_config
+    from services.standardizer import get_standardizer
+    from skills.macro_emission.excel_handler import ExcelHandler
+    from tools.macro_emission import MacroEmissionTool
+
+    # Result files go to the case's temporary directory
+    get_config().outputs_dir = output_dir
+    tool = MacroEmissionTool()
+    tool._excel_handler = ExcelHandler(llm_client=None)
+    tool._calculator._load_emission_matrix(options["season"])
+    get_standardizer()
+
+    timings: Dict[str, float] = {}
+
+    @contextmanager
+    def timed(stage: str):
+        with profiler.stage(stage) if profiler else _no_stage():
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+    async def timed_execute():
+        # Timed inside the event loop: asyncio.run's own setup/teardown is not execute
+        start = time.perf_counter()
+        result = await tool.execute(
+            input_file=str(input_path),
+            pollutants=options["pollutants"],
+            model_year=2020,
+            season=options["season"],
+            rate_method=options["rate_method"],
+        )
+        return result, time.perf_counter() - start
+
+    tool.stage_hook = timed
+    result, elapsed = asyncio.run(timed_execute())
+    if not result.success:
+        raise RuntimeError(result.error)
+
+    timings["other"] = max(0.0, elapsed - sum(timings.values()))
+    streamed = bool(result.data["query_info"].get("streaming"))
+    return (
+        {stage: seconds for stage, seconds in timings.items() if stage in options["stages"]},
+        elapsed,
+        streamed,
+    )
+
+
+@contextmanager
+def _no_stage():
+    yield
+
+
+def run_case(case: Dict, options: Dict) -> List[Dict]:
+    """Run one benchmark case (executed in its own process); one result per stage plus total"""
+    import logging
+    logging.disable(logging.WARNING)
+
+    frame = generate_link_network(case["links"], naming=case["naming"], seed=options["seed"])
+    with tempfile.TemporaryDirectory(prefix="bench_macro_") as workdir:
+        workdir = Path(workdir)
+        input_path = write_link_network(frame, workdir / f"links.{options['input_format']}")
+        del frame
+
+        profiler = (
+            SamplingProfiler(options["profile_interval"], root=run_pipeline) if options["profile_dir"] else None
+        )
+        stdout = sys.stdout
+        try:
+            # The Excel handler prints debug lines; keep the JSON output clean
+            sys.stdout = open(os.devnull, "w")
+            best: Dict[str, float] = {}
+            best_total = None
+            for _ in range(options["repeat"]):
+                if profiler:
+                    profiler.start()
+                try:
+                    timings, elapsed, streamed = run_pipeline(input_path, options, workdir, profiler)
+                finally:
+                    if profiler:
+                        profiler.stop()
+                for stage, seconds in timings.items():
+                    best[stage] = min(seconds, best.get(stage, seconds))
+                best_total = elapsed if best_total is None else min(elapsed, best_total)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    profile_path = None
+    if profiler:
+        profile_path = str(profiler.write_collapsed(
+            Path(options["profile_dir"]) / f"{case['naming']}_{case['links']}.folded"
+        ))
+
+    peak = peak_rss_mb()
+    total = best_total
+    results = []
+    for stage in list(best) + ["total"]:
+        seconds = total if stage == "total" else best[stage]
+        result = {
+            **case,
+            "streamed": streamed,
+            "stage": stage,
+            "seconds": round(seconds, 6),
+            "links_per_sec": round(case["links"] / seconds, 1) if seconds > 0 else None,
+            "share": round(seconds / total, 3) if total > 0 else None,
+            "peak_rss_mb": peak,
+        }
+        if profiler and stage != "total":
+            result["hotspots"] = profiler.hotspots(stage, top=3)
+        if profile_path and stage == "total":
+            result["profile"] = profile_path
+        results.append(result)
+    return results
+
+
+def build_cases(args) -> List[Dict]:
+    return [
+        {"naming": naming, "links": int(float(size))}
+        for naming in args.naming
+        for size in args.sizes
+    ]
+
+
+def _case_key(result: Dict):
+    return result["naming"], result["links"], result["stage"]
+
+
+def compare_results(baseline: Dict, current: Dict, tolerance: float, min_seconds: float) -> List[str]:
+    """Stages whose time grew by more than tolerance (fraction) against the baseline"""
+    previous = {_case_key(r): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in current["results"]:
+        old = previous.get(_case_key(result))
+        if not old or not old.get("seconds"):
+            continue
+        # Sub-millisecond stages are dominated by noise
+        if max(old["seconds"], result["seconds"]) < min_seconds:
+            continue
+        ratio = result["seconds"] / old["seconds"]
+        if ratio > 1 + tolerance:
+            regressions.append(
+                f"{result['stage']} {result['naming']} {result['links']} links: "
+                f"{old['seconds']:.4f} -> {result['seconds']:.4f} s ({ratio:.0%})"
+            )
+    return regressions
+
+
+def print_header():
+    header = f"{'naming':<9}{'links':>9}  {'stage':<18}{'seconds':>11}{'share':>8}{'links/s':>14}{'peak MB':>10}"
+    print(header, file=sys.stderr)
+    print("-" * len(header), file=sys.stderr)
+
+
+def print_row(r: Dict):
+    lps = f"{r['links_per_sec']:.0f}" if r["links_per_sec"] else "-"
+    share = f"{r['share']:.0%}" if r["share"] is not None else "-"
+    print(f"{r['naming']:<9}{r['links']:>9}  {r['stage']:<18}{r['seconds']:>11.4f}{share:>8}"
+          f"{lps:>14}{str(r['peak_rss_mb']):>10}", file=sys.stderr)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the macro emission pipeline on synthetic link networks")
+    parser.add_argument("--naming", nargs="+", choices=NAMING_STYLES, default=list(NAMING_STYLES),
+                        help="column naming styles of the generated files")
+    parser.add_argument("--sizes", nargs="+", default=[str(s) for s in DEFAULT_SIZES],
+                        help="network sizes in links (e.g. 1e2 1e6)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES),
+                        help="stages to report (execute always runs all of them)")
+    parser.add_argument("--pollutants", nargs="+", default=DEFAULT_POLLUTANTS)
+    parser.add_argument("--season", default="夏季")
+    parser.add_argument("--rate-method", default="average", choices=["average", "speed_binned"])
+    parser.add_argument("--input-format", default="csv", choices=["csv", "xlsx"])
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case, the fastest run of each stage is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--profile-dir", help="write collapsed-stack profiles (.folded) of each case here")
+    parser.add_argument("--profile-interval", type=float, default=0.001, help="sampling interval in seconds")
+    parser.add_argument("--in-process", action="store_true",
+                        help="run all cases in this process (faster, but peak RSS accumulates)")
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--compare", help="baseline JSON to compare stage times against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed stage time increase against --compare (fraction)")
+    parser.add_argument("--min-seconds", type=float, default=0.01,
+                        help="ignore stages faster than this in --compare")
+    args = parser.parse_args()
+
+    if args.profile_dir:
+        Path(args.profile_dir).mkdir(parents=True, exist_ok=True)
+
+    options = {
+        "pollutants": args.pollutants,
+        "season": args.season,
+        "rate_method": args.rate_method,
+        "input_format": args.input_format,
+        "stages": args.stages,
+        "repeat": max(1, args.repeat),
+        "seed": args.seed,
+        "profile_dir": args.profile_dir,
+        "profile_interval": args.profile_interval,
+    }
+
+    results = []
+    print_header()
+    for case in build_cases(args):
+        if args.in_process:
+            case_results = run_case(case, options)
+        else:
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                case_results = pool.submit(run_case, case, options).result()
+        results.extend(case_results)
+        for result in case_results:
+            print_row(result)
+
+    report = {
+        "benchmark": "macro_emission",
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "options": options,
+        "results": results,
+    }
+
+    payload = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(payload, encoding="utf-8")
+    else:
+        print(payload)
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        regressions = compare_results(baseline, report, args.tolerance, args.min_seconds)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,270 @@
+"""
+Micro emission benchmark
+
+Times the micro emission pipeline on synthetic drive cycles, stage by stage:
+
+    vsp          VSPCalculator.calculate_trajectory_arrays (VSP + opMode)
+    calculate    MicroEmissionCalculator.calculate (list of points in, result out)
+    excel_read   ExcelHandler.read_trajectory_from_excel
+    excel_write  ExcelHandler.write_result_frame_to_excel
+
+Each (cycle, frequency, size, stage) case runs in a fresh process so the
+reported peak RSS belongs to that case alone (it includes the stage inputs,
+which is what a worker holding the request also pays). Emission matrices
+are loaded before timing starts.
+
+    python scripts/benchmarks/bench_micro.py --sizes 1e3 1e5 1e6 --output micro.json
+    python scripts/benchmarks/bench_micro.py --compare micro.json   # exit 1 on regression
+
+Results are written as JSON (stdout unless --output is given); a readable
+table goes to stderr.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Ensure repo root is on sys.path
+REPO_ROOT = Path(__file__).resolve().parents[2]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import numpy as np
+import pandas as pd
+
+from scripts.benchmarks.drive_cycles import CYCLE_KINDS, generate_drive_cycle, to_trajectory_points
+
+STAGES = ("vsp", "calculate", "excel_read", "excel_write")
+DEFAULT_SIZES = (1e3, 1e4, 1e5, 1e6)
+DEFAULT_POLLUTANTS = ["CO2", "NOx", "PM2.5"]
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process (None if not measurable)"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS bytes
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)
+    except ImportError:
+        return None
+
+
+def _prepare_stage(stage: str, cycle: Dict[str, np.ndarray], options: Dict, workdir: Path):
+    """Build the inputs of a stage (not timed); returns a zero-argument callable"""
+    from calculators.micro_emission import MicroEmissionCalculator
+    from calculators.vsp import VSPCalculator
+    from skills.micro_emission.excel_handler import ExcelHandler
+
+    n = len(cycle["t"])
+    pollutants = options["pollutants"]
+
+    if stage == "vsp":
+        vsp_calculator = VSPCalculator()
+        acceleration = np.full(n, np.nan)
+        return lambda: vsp_calculator.calculate_trajectory_arrays(
+            cycle["speed_kph"], acceleration, cycle["grade_pct"], cycle["t"], 21
+        )
+
+    calculator = MicroEmissionCalculator()
+    calculator._load_emission_matrix(options["season"])
+
+    if stage == "calculate":
+        trajectory = to_trajectory_points(cycle)
+        return lambda: calculator.calculate(
+            trajectory, "Passenger Car", pollutants, 2020, options["season"],
+            result_format=options["result_format"]
+        )
+
+    handler = ExcelHandler(llm_client=None)
+    suffix = f".{options['excel_format']}"
+
+    if stage == "excel_read":
+        input_path = workdir / f"trajectory{suffix}"
+        frame = pd.DataFrame(cycle)
+        if suffix == ".csv":
+            frame.to_csv(input_path, index=False)
+        else:
+            frame.to_excel(input_path, index=False)
+        return lambda: handler.read_trajectory_from_excel(str(input_path))
+
+    if stage == "excel_write":
+        result = calculator.calculate(
+            to_trajectory_points(cycle), "Passenger Car", pollutants, 2020, options["season"],
+            result_format="columnar"
+        )
+        results_frame = result["data"]["results_columns"]
+        output_path = workdir / f"results{suffix}"
+        return lambda: handler.write_result_frame_to_excel(str(output_path), results_frame, pollutants)
+
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+def run_case(case: Dict, options: Dict) -> Dict:
+    """Run one benchmark case (executed in its own process)"""
+    import logging
+    logging.disable(logging.WARNING)
+
+    cycle = generate_drive_cycle(case["cycle"], case["points"], case["hz"], seed=options["seed"])
+    with tempfile.TemporaryDirectory(prefix="bench_micro_") as workdir:
+        stdout = sys.stdout
+        try:
+            # The Excel reader prints debug lines; keep the JSON output clean
+            sys.stdout = open(os.devnull, "w")
+            func = _prepare_stage(case["stage"], cycle, options, Path(workdir))
+            rss_before = peak_rss_mb()
+
+            timings = []
+            for _ in range(options["repeat"]):
+                start = time.perf_counter()
+                func()
+                timings.append(time.perf_counter() - start)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    seconds = min(timings)
+    return {
+        **case,
+        "seconds": round(seconds, 6),
+        "points_per_sec": round(case["points"] / seconds, 1) if seconds > 0 else None,
+        "rss_before_mb": rss_before,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def build_cases(args) -> List[Dict]:
+    cases = []
+    for cycle in args.cycles:
+        for hz in args.hz:
+            for size in args.sizes:
+                points = int(float(size))
+                for stage in args.stages:
+                    if stage.startswith("excel") and points > args.excel_max_points:
+                        continue
+                    cases.append({"cycle": cycle, "hz": hz, "points": points, "stage": stage})
+    return cases
+
+
+def _case_key(result: Dict):
+    return result["cycle"], result["hz"], result["points"], result["stage"]
+
+
+def compare_results(baseline: Dict, current: Dict, tolerance: float) -> List[str]:
+    """Cases whose throughput dropped by more than tolerance (fraction) against the baseline"""
+    previous = {_case_key(r): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in current["results"]:
+        old = previous.get(_case_key(result))
+        if not old or not old.get("points_per_sec") or not result.get("points_per_sec"):
+            continue
+        ratio = result["points_per_sec"] / old["points_per_sec"]
+        if ratio < 1 - tolerance:
+            regressions.append(
+                f"{result['stage']} {result['cycle']} {result['hz']}Hz {result['points']} points: "
+                f"{old['points_per_sec']:.0f} -> {result['points_per_sec']:.0f} points/s ({ratio:.0%})"
+            )
+    return regressions
+
+
+def print_header():
+    header = f"{'stage':<12}{'cycle':<9}{'hz':>4}{'points':>11}{'seconds':>11}{'points/s':>14}{'peak MB':>10}"
+    print(header, file=sys.stderr)
+    print("-" * len(header), file=sys.stderr)
+
+
+def print_row(r: Dict):
+    pps = f"{r['points_per_sec']:.0f}" if r["points_per_sec"] else "-"
+    print(f"{r['stage']:<12}{r['cycle']:<9}{r['hz']:>4}{r['points']:>11}{r['seconds']:>11.4f}"
+          f"{pps:>14}{str(r['peak_rss_mb']):>10}", file=sys.stderr)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the micro emission pipeline on synthetic drive cycles")
+    parser.add_argument("--cycles", nargs="+", choices=CYCLE_KINDS, default=list(CYCLE_KINDS))
+    parser.add_argument("--hz", nargs="+", type=int, default=[1, 10], help="sampling frequencies")
+    parser.add_argument("--sizes", nargs="+", default=[str(s) for s in DEFAULT_SIZES],
+                        help="trajectory lengths in points (e.g. 1e3 1e7)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--pollutants", nargs="+", default=DEFAULT_POLLUTANTS)
+    parser.add_argument("--season", default="夏季")
+    parser.add_argument("--result-format", default="columnar", choices=["rows", "columnar", "summary"],
+                        help="result format for the calculate stage")
+    parser.add_argument("--excel-format", default="xlsx", choices=["xlsx", "csv"])
+    parser.add_argument("--excel-max-points", type=float, default=1e5,
+                        help="skip Excel stages above this size (xlsx holds at most 1,048,575 rows)")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case, the fastest is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--in-process", action="store_true",
+                        help="run all cases in this process (faster, but peak RSS accumulates)")
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--compare", help="baseline JSON to compare throughput against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed throughput drop against --compare (fraction)")
+    args = parser.parse_args()
+
+    options = {
+        "pollutants": args.pollutants,
+        "season": args.season,
+        "result_format": args.result_format,
+        "excel_format": args.excel_format,
+        "repeat": max(1, args.repeat),
+        "seed": args.seed,
+    }
+
+    results = []
+    print_header()
+    for case in build_cases(args):
+        if args.in_process:
+            result = run_case(case, options)
+        else:
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                result = pool.submit(run_case, case, options).result()
+        results.append(result)
+        print_row(result)
+
+    report = {
+        "benchmark": "micro_emission",
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "options": options,
+        "results": results,
+    }
+
+    payload = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(payload, encoding="utf-8")
+    else:
+        print(payload)
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        regressions = compare_results(baseline, report, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+Synthetic drive cycles for benchmarks
+
+Speed profiles are piecewise linear between randomly drawn knots (speeds
+and durations in plausible ranges) plus smooth low-amplitude noise, so
+acceleration stays physically reasonable and the opMode distribution looks
+like real logs:
+
+    idle      - engine idling with occasional creeping (queues, parking lots)
+    urban     - stop-and-go: accelerate, cruise at 20-55 km/h, brake, wait
+    highway   - cruising at 80-120 km/h with gradual speed changes
+
+Usage:
+    from scripts.benchmarks.drive_cycles import generate_drive_cycle
+    cycle = generate_drive_cycle("urban", n_points=100_000, hz=10)
+"""
+from typing import Dict
+
+import numpy as np
+
+CYCLE_KINDS = ("idle", "urban", "highway")
+
+
+def _urban_knots(rng: np.random.Generator, duration_s: float):
+    """One stop-and-go trip per iteration: idle → accelerate → cruise → brake"""
+    times, speeds = [0.0], [0.0]
+    while times[-1] < duration_s:
+        cruise_kph = rng.uniform(20, 55)
+        idle_s = rng.uniform(5, 40)
+        accel_s = cruise_kph / 3.6 / rng.uniform(0.8, 1.8)
+        cruise_s = rng.uniform(10, 90)
+        decel_s = cruise_kph / 3.6 / rng.uniform(1.0, 2.5)
+        for dt, v in ((idle_s, 0.0), (accel_s, cruise_kph), (cruise_s, cruise_kph), (decel_s, 0.0)):
+            times.append(times[-1] + dt)
+            speeds.append(v)
+    return np.array(times), np.array(speeds)
+
+
+def _highway_knots(rng: np.random.Generator, duration_s: float):
+    """Speed changes every 20-120 s, limited to ±0.6 m/s²"""
+    times, speeds = [0.0], [rng.uniform(90, 110)]
+    while times[-1] < duration_s:
+        target = rng.uniform(80, 120)
+        change_s = abs(target - speeds[-1]) / 3.6 / rng.uniform(0.2, 0.6)
+        hold_s = rng.uniform(20, 120)
+        times += [times[-1] + change_s, times[-1] + change_s + hold_s]
+        speeds += [target, target]
+    return np.array(times), np.array(speeds)
+
+
+def _idle_knots(rng: np.random.Generator, duration_s: float):
+    """Mostly stationary, with short creeps up to 8 km/h"""
+    times, speeds = [0.0], [0.0]
+    while times[-1] < duration_s:
+        wait_s = rng.uniform(20, 180)
+        creep_kph = rng.uniform(2, 8)
+        creep_s = rng.uniform(3, 10)
+        for dt, v in ((wait_s, 0.0), (2.0, creep_kph), (creep_s, creep_kph), (2.0, 0.0)):
+            times.append(times[-1] + dt)
+            speeds.append(v)
+    return np.array(times), np.array(speeds)
+
+
+_KNOT_GENERATORS = {
+    "idle": _idle_knots,
+    "urban": _urban_knots,
+    "highway": _highway_knots,
+}
+
+
+def _smooth_noise(rng: np.random.Generator, n_points: int, hz: float, amplitude: float,
+                  period_s: float) -> np.ndarray:
+    """Low-frequency noise: random values every period_s seconds, linearly interpolated"""
+    step = max(1, int(period_s * hz))
+    anchors = rng.normal(0, amplitude, n_points // step + 2)
+    return np.interp(np.arange(n_points), np.arange(len(anchors)) * step, anchors)
+
+
+def generate_drive_cycle(kind: str, n_points: int, hz: float = 1.0, seed: int = 0) -> Dict[str, np.ndarray]:
+    """
+    Generate a synthetic drive cycle
+
+    Args:
+        kind: "idle", "urban" or "highway"
+        n_points: Number of samples
+        hz: Sampling frequency (1 = second-by-second, 10 = 0.1 s logs)
+        seed: Random seed (same arguments always give the same cycle)
+
+    Returns:
+        {"t": seconds, "speed_kph": km/h, "grade_pct": %} as float64 arrays
+    """
+    if kind not in _KNOT_GENERATORS:
+        raise ValueError(f"Unknown cycle kind: {kind} (expected one of {CYCLE_KINDS})")
+
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_points, dtype=np.float64) / hz
+    duration_s = t[-1] if n_points else 0.0
+
+    knot_t, knot_v = _KNOT_GENERATORS[kind](rng, duration_s)
+    speed_kph = np.interp(t, knot_t, knot_v)
+
+    # Noise fades out below 10 km/h, so stops stay exactly at 0 km/h without speed jumps
+    speed_kph += _smooth_noise(rng, n_points, hz, 1.5, period_s=5) * np.clip(speed_kph / 10, 0.0, 1.0)
+    np.clip(speed_kph, 0.0, None, out=speed_kph)
+
+    grade_pct = np.zeros(n_points) if kind == "idle" else _smooth_noise(rng, n_points, hz, 1.0, period_s=60)
+
+    return {"t": t, "speed_kph": speed_kph, "grade_pct": grade_pct}
+
+
+def to_trajectory_points(cycle: Dict[str, np.ndarray]) -> list:
+    """Convert a cycle to the list-of-dicts format taken by MicroEmissionCalculator.calculate"""
+    return [
+        {"t": t, "speed_kph": speed, "grade_pct": grade}
+        for t, speed, grade in zip(cycle["t"].tolist(), cycle["speed_kph"].tolist(),
+                                   cycle["grade_pct"].tolist())
+    ]
@@ -0,0 +1,138 @@
+"""
+Synthetic road link networks for benchmarks
+
+Each link belongs to a road class that sets its speed range, flow range and
+base fleet profile; per-link fleet shares are drawn around the class profile
+(Dirichlet), and a fraction of links leave the fleet columns blank so the
+default-fleet fill path is exercised. Column headers follow one of several
+naming styles seen in uploaded files:
+
+    english   - link_id, link_length_km, ... and MOVES vehicle names (plus Taxi)
+    chinese   - 路段编号, 路段长度, ... and Chinese vehicle names (小汽车, 公交车, ...)
+    short     - id, length, flow, speed and percentage columns (car%, taxi%,
+                bus%, truck%), including an aggregate truck column and two
+                columns that map to the same vehicle
+
+Usage:
+    from scripts.benchmarks.link_networks import generate_link_network, write_link_network
+    frame = generate_link_network(100_000, naming="chinese")
+    write_link_network(frame, "links.csv")
+"""
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+NAMING_STYLES = ("english", "chinese", "short")
+
+FIELD_COLUMNS = {
+    "english": {"link_id": "link_id", "length": "link_length_km", "flow": "traffic_flow_vph", "speed": "avg_speed_kph"},
+    "chinese": {"link_id": "路段编号", "length": "路段长度", "flow": "交通流量", "speed": "平均速度"},
+    "short": {"link_id": "id", "length": "length", "flow": "flow", "speed": "speed"},
+}
+
+# Fleet column header per vehicle group; groups are the keys of ROAD_CLASSES profiles
+VEHICLE_COLUMNS = {
+    "english": {
+        "car": "Passenger Car", "taxi": "Taxi", "bus": "Transit Bus", "coach": "Intercity Bus",
+        "light_truck": "Light Commercial Truck", "heavy_truck": "Combination Long-haul Truck", "motorcycle": "Motorcycle",
+    },
+    "chinese": {
+        "car": "小汽车", "taxi": "出租车", "bus": "公交车", "coach": "长途客车",
+        "light_truck": "小货车", "heavy_truck": "大货车", "motorcycle": "摩托车",
+    },
+    "short": {
+        "car": "car%", "taxi": "taxi%", "bus": "bus%", "coach": "coach%",
+        "light_truck": "truck%", "heavy_truck": None, "motorcycle": "motorcycle%",
+    },
+}
+
+# Road classes: share of links, speed (km/h), flow (veh/h), base fleet profile (%)
+ROAD_CLASSES = {
+    "local": {
+        "share": 0.35, "speed": (10, 40), "flow": (50, 800),
+        "fleet": {"car": 72, "taxi": 10, "bus": 4, "coach": 1, "light_truck": 8, "heavy_truck": 1, "motorcycle": 4},
+    },
+    "arterial": {
+        "share": 0.35, "speed": (25, 60), "flow": (400, 2500),
+        "fleet": {"car": 65, "taxi": 12, "bus": 6, "coach": 2, "light_truck": 9, "heavy_truck": 4, "motorcycle": 2},
+    },
+    "freeway": {
+        "share": 0.2, "speed": (60, 110), "flow": (1500, 6000),
+        "fleet": {"car": 60, "taxi": 6, "bus": 1, "coach": 5, "light_truck": 10, "heavy_truck": 17, "motorcycle": 1},
+    },
+    "freight": {
+        "share": 0.1, "speed": (30, 80), "flow": (200, 1500),
+        "fleet": {"car": 30, "taxi": 2, "bus": 1, "coach": 2, "light_truck": 25, "heavy_truck": 39, "motorcycle": 1},
+    },
+}
+
+
+def generate_link_network(n_links: int, naming: str = "english", seed: int = 0,
+                          blank_fleet_share: float = 0.1, fleet_concentration: float = 40.0) -> pd.DataFrame:
+    """
+    Generate a link table as an uploaded file would contain it
+
+    Args:
+        n_links: Number of links
+        naming: Column naming style (see NAMING_STYLES)
+        seed: Random seed
+        blank_fleet_share: Fraction of links with empty fleet columns (filled with the default mix)
+        fleet_concentration: Dirichlet concentration around the class profile (higher = less spread)
+
+    Returns:
+        DataFrame with link id, length (km), flow (veh/h), speed (km/h) and fleet share columns (%)
+    """
+    if naming not in NAMING_STYLES:
+        raise ValueError(f"Unknown naming style: {naming}")
+
+    rng = np.random.default_rng(seed)
+    class_names = list(ROAD_CLASSES)
+    classes = rng.choice(len(class_names), size=n_links, p=[ROAD_CLASSES[c]["share"] for c in class_names])
+
+    lengths = np.clip(rng.lognormal(mean=-0.7, sigma=0.8, size=n_links), 0.02, 8.0)
+    speeds = np.empty(n_links)
+    flows = np.empty(n_links)
+    groups = list(VEHICLE_COLUMNS[naming])
+    shares = np.empty((n_links, len(groups)))
+    for k, class_name in enumerate(class_names):
+        road_class = ROAD_CLASSES[class_name]
+        mask = classes == k
+        count = int(mask.sum())
+        speeds[mask] = rng.uniform(*road_class["speed"], size=count)
+        flows[mask] = rng.uniform(*road_class["flow"], size=count)
+        profile = np.array([road_class["fleet"][g] for g in groups], dtype=float)
+        shares[mask] = rng.dirichlet(profile / profile.sum() * fleet_concentration, size=count) * 100
+
+    fields = FIELD_COLUMNS[naming]
+    frame = pd.DataFrame({
+        fields["link_id"]: [f"L{i + 1}" for i in range(n_links)],
+        fields["length"]: np.round(lengths, 3),
+        fields["flow"]: np.round(flows),
+        fields["speed"]: np.round(speeds, 1),
+    })
+
+    shares = np.round(shares, 1)
+    blank = rng.uniform(size=n_links) < blank_fleet_share
+    columns: Dict[str, np.ndarray] = {}
+    for j, group in enumerate(groups):
+        # Groups without their own column are merged into the previous one (aggregate truck share)
+        header = VEHICLE_COLUMNS[naming][group] or VEHICLE_COLUMNS[naming][groups[j - 1]]
+        columns[header] = columns.get(header, 0) + shares[:, j]
+    for header, values in columns.items():
+        frame[header] = np.where(blank, np.nan, np.round(values, 1))
+    return frame
+
+
+def write_link_network(frame: pd.DataFrame, path: str, file_format: Optional[str] = None) -> Path:
+    """Write a generated network as CSV or Excel (format from the suffix unless given)"""
+    path = Path(path)
+    file_format = file_format or path.suffix.lstrip(".").lower()
+    if file_format == "csv":
+        frame.to_csv(path, index=False)
+    elif file_format in ("xlsx", "xls"):
+        frame.to_excel(path, index=False)
+    else:
+        raise ValueError(f"Unsupported network file format: {file_format}")
+    return path
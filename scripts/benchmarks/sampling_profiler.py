@@ -0,0 +1,117 @@
+"""
+Sampling profiler with collapsed-stack output
+
+A daemon thread samples the Python stack of the profiled thread at a fixed
+interval and counts identical stacks. Samples are written in the collapsed
+("folded") format read by flamegraph.pl, inferno and speedscope: one line per
+distinct stack, frames root first separated by ';', then the sample count.
+The current stage name (see SamplingProfiler.stage) is the root frame, and
+frames above `root` (e.g. the benchmark harness) are left out:
+
+    calculate;macro_emission.py:MacroEmissionCalculator.calculate;... 42
+
+Time spent in C code that releases the GIL (NumPy, pandas I/O) is attributed
+to the Python frame that called it.
+
+Usage:
+    profiler = SamplingProfiler(interval=0.001, root=run_pipeline)
+    with profiler:
+        with profiler.stage("calculate"):
+            ...
+    profiler.write_collapsed("macro.folded")
+"""
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class SamplingProfiler:
+    """Stack sampler for one thread (the thread that calls start by default)"""
+
+    def __init__(self, interval: float = 0.001, thread_id: Optional[int] = None,
+                 root: Optional[Callable] = None):
+        self.interval = interval
+        self.thread_id = thread_id
+        self._root_code = getattr(root, "__code__", None)
+        self.samples: Counter = Counter()
+        self._stage: Optional[str] = None
+        self._frame_names: Dict = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Attribute samples taken inside the block to stage `name`"""
+        previous, self._stage = self._stage, name
+        try:
+            yield
+        finally:
+            self._stage = previous
+
+    def _frame_name(self, code) -> str:
+        name = self._frame_names.get(code)
+        if name is None:
+            qualname = getattr(code, "co_qualname", code.co_name)
+            name = self._frame_names[code] = f"{Path(code.co_filename).name}:{qualname}"
+        return name
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stage = self._stage
+            if frame is None or stage is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_name(frame.f_code))
+                if frame.f_code is self._root_code:
+                    break
+                frame = frame.f_back
+            stack.append(stage)
+            self.samples[";".join(reversed(stack))] += 1
+
+    def stage_samples(self) -> Dict[str, int]:
+        """Sample count per stage"""
+        counts: Counter = Counter()
+        for stack, count in self.samples.items():
+            counts[stack.split(";", 1)[0]] += count
+        return dict(counts)
+
+    def hotspots(self, stage: str, top: int = 5) -> List[Tuple[str, float]]:
+        """Leaf frames with the largest share of a stage's samples (self time)"""
+        leaves: Counter = Counter()
+        for stack, count in self.samples.items():
+            if stack.split(";", 1)[0] == stage:
+                leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values())
+        return [(frame, round(count / total, 3)) for frame, count in leaves.most_common(top)] if total else []
+
+    def write_collapsed(self, path: str) -> Path:
+        """Write samples in collapsed-stack format"""
+        path = Path(path)
+        lines = [f"{stack} {count}" for stack, count in sorted(self.samples.items())]
+        path.write_text("\n".join(lines) + ("\n" if lines else ""), encoding="utf-8")
+        return path
@@ -0,0 +1,60 @@
+"""
+Build the binary column cache for the MOVES emission matrices.
+
+Run once after deployment (or after updating the CSVs) so that server
+workers memory-map the cached columns instead of parsing CSV text:
+
+    python scripts/build_emission_cache.py [--force]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Ensure repo root is on sys.path
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from calculators.emission_factors import EmissionFactorCalculator
+from calculators.macro_emission import MacroEmissionCalculator
+from calculators.matrix_cache import cache_dir_for, clear_cache
+from calculators.micro_emission import MicroEmissionCalculator
+from calculators.rate_store import get_rate_store
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Build binary caches for MOVES emission matrices")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the cache is up to date")
+    args = parser.parse_args()
+
+    failed = 0
+    for calculator in (MicroEmissionCalculator(), MacroEmissionCalculator(), EmissionFactorCalculator()):
+        name = type(calculator).__name__
+        csv_paths = [calculator.data_path / csv_file for csv_file in calculator.csv_files.values()]
+        if args.force:
+            for csv_path in csv_paths:
+                clear_cache(csv_path)
+
+        start = time.perf_counter()
+        try:
+            calculator.preload()
+        except FileNotFoundError as e:
+            print(f"[{name}] skipped: {e}")
+            failed += 1
+            continue
+
+        print(f"[{name}] ready in {time.perf_counter() - start:.2f}s")
+        for csv_path in csv_paths:
+            print(f"    {cache_dir_for(csv_path)}")
+
+    report = get_rate_store().memory_report()
+    print(f"Resident emission tables: {len(report['tables'])}, {report['total_bytes'] / 1e6:.1f} MB")
+    for table in report["tables"]:
+        print(f"    {table['dataset']}/{table['season']} [{table['kind']}] {table['nbytes'] / 1e6:.1f} MB")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
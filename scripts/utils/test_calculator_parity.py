@@ -0,0 +1,484 @@
+"""
+计算器一致性测试：向量化引擎 vs 逐点参考实现
+
+参考实现按原来的逐点/逐行算法编写（DataFrame布尔筛选查排放率、iterrows解析速度编码），
+用来核对向量化计算结果：
+1. 微观排放 calculate 的 rows / columnar / summary 三种结果格式
+2. 宏观排放 calculate，不带/带 model_year_distribution
+3. 宏观排放 recalculate 与修改后全量重算
+4. 排放因子 query 与 iterrows 速度编码解析
+5. 排放因子 interpolate 在数据速度档上的取值
+
+需要 calculators/data 下的MOVES数据文件。
+"""
+import math
+import sys
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Add project root to path
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from calculators.emission_factors import EmissionFactorCalculator
+from calculators.macro_emission import MacroEmissionCalculator
+from calculators.micro_emission import MicroEmissionCalculator
+from calculators.rate_store import dataset_path
+from calculators.vsp import VSPCalculator
+import logging
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+SEASONS = ["夏季", "冬季"]
+MICRO_POLLUTANTS = ["CO2", "NOx", "PM2.5"]
+MACRO_POLLUTANTS = ["CO2", "NOx"]
+VEHICLE_TYPES = ["Passenger Car", "Transit Bus", "Combination Long-haul Truck"]
+
+
+def assert_close(actual, expected, path="result", rel_tol=1e-9, abs_tol=1e-12):
+    """递归比较嵌套的字典/列表，浮点数按容差比较"""
+    if isinstance(expected, dict):
+        assert isinstance(actual, dict), f"{path}: 应为字典，实际: {type(actual)}"
+        assert set(actual) == set(expected), f"{path}: 键不一致 {sorted(actual)} != {sorted(expected)}"
+        for key in expected:
+            assert_close(actual[key], expected[key], f"{path}.{key}", rel_tol, abs_tol)
+    elif isinstance(expected, (list, tuple)):
+        assert len(actual) == len(expected), f"{path}: 长度不一致 {len(actual)} != {len(expected)}"
+        for i, (a, e) in enumerate(zip(actual, expected)):
+            assert_close(a, e, f"{path}[{i}]", rel_tol, abs_tol)
+    elif isinstance(expected, float):
+        assert math.isclose(actual, expected, rel_tol=rel_tol, abs_tol=abs_tol), \
+            f"{path}: {actual} != {expected}"
+    else:
+        assert actual == expected, f"{path}: {actual!r} != {expected!r}"
+
+
+# ==================== 逐点参考实现 ====================
+
+def reference_micro(trajectory, vehicle_type, pollutants, model_year, season):
+    """逐点计算VSP/opMode，逐点逐污染物筛选排放率"""
+    calc = MicroEmissionCalculator()
+    vsp_calc = VSPCalculator()
+    source_type = calc.VEHICLE_TO_SOURCE_TYPE[vehicle_type]
+    age_group = calc._year_to_age_group(model_year)
+    matrix = pd.read_csv(dataset_path("micro_emission", season))
+
+    def query_rate(opmode, pollutant_id):
+        for mode in (opmode, 300):
+            found = matrix[
+                (matrix[calc.COL_OPMODE] == mode) &
+                (matrix[calc.COL_POLLUTANT] == pollutant_id) &
+                (matrix[calc.COL_SOURCE_TYPE] == source_type) &
+                (matrix[calc.COL_MODEL_YEAR] == age_group)
+            ]
+            if not found.empty:
+                return float(found.iloc[0][calc.COL_EMISSION])
+        return 0.0
+
+    results = []
+    for i, point in enumerate(trajectory):
+        speed_kph = point.get("speed_kph", 0)
+        acc = point.get("acceleration_mps2")
+        if acc is None and i > 0:
+            prev_speed = trajectory[i - 1].get("speed_kph", speed_kph)
+            dt = point.get("t", i) - trajectory[i - 1].get("t", i - 1)
+            acc = (speed_kph - prev_speed) / (3.6 * dt) if dt > 0 else 0
+        elif acc is None:
+            acc = 0
+        speed_mph = speed_kph * 0.621371
+        vsp = vsp_calc.calculate_vsp(speed_kph / 3.6, acc, point.get("grade_pct", 0), source_type)
+        opmode = vsp_calc.vsp_to_opmode(speed_mph, vsp)
+
+        emissions = {}
+        for pollutant in pollutants:
+            emissions[pollutant] = round(query_rate(opmode, calc.POLLUTANT_TO_ID[pollutant]) / 3600, 6)
+        results.append({
+            "t": point.get("t", 0),
+            "speed_kph": point["speed_kph"],
+            "speed_mph": round(speed_mph, 2),
+            "vsp": vsp,
+            "opmode": opmode,
+            "emissions": emissions
+        })
+
+    distance_km = 0
+    for i in range(1, len(trajectory)):
+        dt = trajectory[i].get("t", i) - trajectory[i - 1].get("t", i - 1)
+        distance_km += trajectory[i].get("speed_kph", 0) * dt / 3600
+    totals = {}
+    for row in results:
+        for pollutant, value in row["emissions"].items():
+            totals[pollutant] = totals.get(pollutant, 0) + value
+    summary = {
+        "total_distance_km": round(distance_km, 3),
+        "total_time_s": len(results),
+        "total_emissions_g": {p: round(v, 4) for p, v in totals.items()},
+        "emission_rates_g_per_km": (
+            {p: round(v / distance_km, 4) for p, v in totals.items()} if distance_km > 0 else {}
+        )
+    }
+    return results, summary
+
+
+def reference_macro(links_data, pollutants, model_year, season, model_year_distribution=None):
+    """
+    逐路段逐车型计算；有年份分布时按分布对各年份排放率加权
+
+    Returns:
+        (逐路段结果, 汇总, 各路段未四舍五入的总排放 [{污染物: kg/hr}])
+    """
+    calc = MacroEmissionCalculator()
+    matrix = pd.read_csv(dataset_path("macro_emission", season), header=None,
+                         names=[calc.COL_OPMODE, calc.COL_POLLUTANT, calc.COL_SOURCE_TYPE,
+                                calc.COL_MODEL_YEAR, calc.COL_EMISSION, "extra"])
+    matrix = matrix[matrix[calc.COL_OPMODE] == 300]
+
+    def query_rate(source_type, pollutant_id, year):
+        found = matrix[
+            (matrix[calc.COL_POLLUTANT] == pollutant_id) &
+            (matrix[calc.COL_SOURCE_TYPE] == source_type) &
+            (matrix[calc.COL_MODEL_YEAR] == year)
+        ]
+        return float(found.iloc[0][calc.COL_EMISSION]) if not found.empty else 0.0
+
+    def by_vehicle(distribution):
+        if not distribution:
+            return {}
+        if not any(isinstance(shares, dict) for shares in distribution.values()):
+            return {calc.ALL_VEHICLES: distribution}
+        return distribution
+
+    global_years = by_vehicle(model_year_distribution)
+    results = []
+    raw_totals = []
+    for link in links_data:
+        year_shares = {**global_years, **by_vehicle(link.get("model_year_distribution"))}
+        fleet_mix = dict(link.get("fleet_mix", calc.DEFAULT_FLEET_MIX))
+        total_percentage = sum(fleet_mix.values())
+        if total_percentage > 0 and abs(total_percentage - 100.0) > 0.01:
+            fleet_mix = {name: pct / total_percentage * 100.0 for name, pct in fleet_mix.items()}
+
+        row = {
+            "link_id": link.get("link_id", "unknown"),
+            "link_length_km": link["link_length_km"],
+            "traffic_flow_vph": link["traffic_flow_vph"],
+            "avg_speed_kph": link["avg_speed_kph"],
+            "fleet_composition": {},
+            "emissions_by_vehicle": {},
+            "total_emissions_kg_per_hr": {p: 0.0 for p in pollutants}
+        }
+        for vehicle_name, percentage in fleet_mix.items():
+            source_type = calc.VEHICLE_TO_SOURCE_TYPE.get(vehicle_name)
+            if source_type is None:
+                continue
+            vehicles_per_hour = link["traffic_flow_vph"] * percentage / 100
+            row["fleet_composition"][vehicle_name] = {
+                "source_type_id": source_type,
+                "percentage": percentage,
+                "vehicles_per_hour": round(vehicles_per_hour, 2)
+            }
+            shares = year_shares.get(vehicle_name, year_shares.get(calc.ALL_VEHICLES)) or {model_year: 1}
+            share_total = sum(shares.values())
+
+            vehicle_emissions = {}
+            for pollutant in pollutants:
+                pollutant_id = calc.POLLUTANT_TO_ID[pollutant]
+                rate = sum(query_rate(source_type, pollutant_id, int(year)) * share / share_total
+                           for year, share in shares.items())
+                travel_time_sec = (link["link_length_km"] / link["avg_speed_kph"]) * 3600
+                emission_kg_per_hr = rate / 3600 * travel_time_sec * vehicles_per_hour / 1000
+                row["total_emissions_kg_per_hr"][pollutant] += emission_kg_per_hr
+                vehicle_emissions[pollutant] = round(emission_kg_per_hr, 4)
+            row["emissions_by_vehicle"][vehicle_name] = vehicle_emissions
+
+        row["emission_rates_g_per_veh_km"] = {}
+        if link["traffic_flow_vph"] > 0:
+            for pollutant in pollutants:
+                row["emission_rates_g_per_veh_km"][pollutant] = round(
+                    row["total_emissions_kg_per_hr"][pollutant] * 1000
+                    / link["link_length_km"] / link["traffic_flow_vph"], 4
+                )
+        raw_totals.append(dict(row["total_emissions_kg_per_hr"]))
+        row["total_emissions_kg_per_hr"] = {p: round(v, 4) for p, v in row["total_emissions_kg_per_hr"].items()}
+        results.append(row)
+
+    summary_totals = {p: 0.0 for p in pollutants}
+    for row in results:
+        for pollutant in pollutants:
+            summary_totals[pollutant] += row["total_emissions_kg_per_hr"][pollutant]
+    summary = {
+        "total_links": len(results),
+        "total_emissions_kg_per_hr": {p: round(v, 4) for p, v in summary_totals.items()}
+    }
+    return results, summary, raw_totals
+
+
+def reference_ef_curve(vehicle_type, pollutant, model_year, season, road_type):
+    """iterrows逐行解析速度编码 {速度mph}0{道路类型}，返回按速度排序的 [(mph, 排放率)]"""
+    calc = EmissionFactorCalculator()
+    df = pd.read_csv(dataset_path("emission_factors", season))
+    road_type_id = calc.ROAD_TYPE_MAPPING.get(road_type, 4)
+    filtered = df[
+        (df[calc.COL_SOURCE_TYPE] == calc.VEHICLE_TO_SOURCE_TYPE[vehicle_type]) &
+        (df[calc.COL_POLLUTANT] == calc.POLLUTANT_TO_ID[pollutant]) &
+        (df[calc.COL_MODEL_YEAR] == model_year)
+    ]
+    curve = []
+    for _, row in filtered.iterrows():
+        speed_code = str(int(row[calc.COL_SPEED]))
+        if len(speed_code) >= 2 and int(speed_code[-1]) == road_type_id:
+            curve.append((int(speed_code[:-2]), row[calc.COL_EMISSION]))
+    curve.sort(key=lambda item: item[0])
+    return curve
+
+
+# ==================== 测试数据 ====================
+
+def make_trajectory(rng, n_points):
+    """随机轨迹：部分点缺少加速度，含坡度和停车段"""
+    speeds = np.clip(np.cumsum(rng.normal(0, 3, n_points)) + 40, 0, 110)
+    speeds[rng.random(n_points) < 0.05] = 0
+    trajectory = []
+    for i, speed in enumerate(speeds.tolist()):
+        point = {"t": i, "speed_kph": round(speed, 1), "grade_pct": round(float(rng.normal(0, 2)), 1)}
+        if rng.random() < 0.5:
+            point["acceleration_mps2"] = round(float(rng.normal(0, 0.8)), 2)
+        trajectory.append(point)
+    return trajectory
+
+
+def make_links(rng, n_links):
+    """随机路段：部分路段自带车队组成（百分比和不一定为100），部分缺少link_id"""
+    vehicle_names = list(MacroEmissionCalculator.VEHICLE_TO_SOURCE_TYPE)
+    links = []
+    for i in range(n_links):
+        link = {
+            "link_length_km": round(float(rng.uniform(0.1, 5.0)), 3),
+            "traffic_flow_vph": int(rng.integers(0, 3000)),
+            "avg_speed_kph": round(float(rng.uniform(10, 110)), 1),
+        }
+        if i % 7 != 3:
+            link["link_id"] = f"L{i:03d}"
+        if i % 3 == 0:
+            chosen = rng.choice(vehicle_names, size=3, replace=False).tolist()
+            link["fleet_mix"] = {name: float(rng.integers(5, 60)) for name in chosen}
+        links.append(link)
+    return links
+
+
+# ==================== 测试 ====================
+
+def test_micro_parity(rng):
+    """微观排放三种结果格式 vs 逐点参考"""
+    calc = MicroEmissionCalculator()
+    for vehicle_type, model_year, season in [("Passenger Car", 2020, "夏季"),
+                                             ("Transit Bus", 2012, "冬季"),
+                                             ("Combination Long-haul Truck", 2003, "夏季")]:
+        trajectory = make_trajectory(rng, 300)
+        ref_rows, ref_summary = reference_micro(trajectory, vehicle_type, MICRO_POLLUTANTS, model_year, season)
+
+        rows = calc.calculate(trajectory, vehicle_type, MICRO_POLLUTANTS, model_year, season)
+        assert rows["status"] == "success", rows
+        assert_close(rows["data"]["results"], ref_rows, "micro.results")
+        assert_close(rows["data"]["summary"], ref_summary, "micro.summary")
+
+        columnar = calc.calculate(trajectory, vehicle_type, MICRO_POLLUTANTS, model_year, season,
+                                  result_format="columnar")
+        assert columnar["status"] == "success", columnar
+        frame = columnar["data"]["results_columns"]
+        assert frame["opmode"].tolist() == [row["opmode"] for row in ref_rows], "columnar opmode 不一致"
+        assert np.array_equal(frame["vsp"].to_numpy(),
+                              np.array([row["vsp"] for row in ref_rows], dtype=np.float32)), "columnar vsp 不一致"
+        for pollutant in MICRO_POLLUTANTS:
+            expected = np.array([row["emissions"][pollutant] for row in ref_rows])
+            assert np.allclose(frame[pollutant].to_numpy(dtype=np.float64), expected, rtol=1e-6, atol=1e-9), \
+                f"columnar {pollutant} 不一致"
+        assert_close(columnar["data"]["summary"], ref_summary, "micro.columnar.summary")
+
+        summary = calc.calculate(trajectory, vehicle_type, MICRO_POLLUTANTS, model_year, season,
+                                 result_format="summary")
+        assert summary["status"] == "success", summary
+        assert_close(summary["data"]["summary"], ref_summary, "micro.summary_mode", rel_tol=0, abs_tol=1e-4)
+        ref_counts = Counter(row["opmode"] for row in ref_rows)
+        counts = {item["opmode"]: item["seconds"] for item in summary["data"]["opmode_distribution"]}
+        assert counts == dict(ref_counts), "opmode_distribution 不一致"
+
+        logger.info(f"[OK] {vehicle_type} {model_year} {season}: rows/columnar/summary 一致")
+
+
+def test_macro_parity(rng):
+    """宏观排放 vs 逐路段参考（不带/带年份分布）"""
+    calc = MacroEmissionCalculator()
+    links = make_links(rng, 40)
+
+    for season in SEASONS:
+        ref_rows, ref_summary, _ = reference_macro(links, MACRO_POLLUTANTS, 2020, season)
+        result = calc.calculate(links, MACRO_POLLUTANTS, 2020, season)
+        assert result["status"] == "success", result
+        assert_close(result["data"]["results"], ref_rows, "macro.results")
+        assert_close(result["data"]["summary"], ref_summary, "macro.summary")
+        logger.info(f"[OK] {season}: 单一年份 rows 一致")
+
+    distributions = [
+        {2010: 20, 2015: 30, 2020: 50},
+        {"Passenger Car": {2018: 0.6, 2022: 0.4}, "Transit Bus": {2005: 1, 2012: 3}},
+    ]
+    links[5]["model_year_distribution"] = {"Passenger Car": {2000: 1.0}}
+    links[11]["model_year_distribution"] = {2024: 1, 1999: 1}
+    for distribution in distributions:
+        _, ref_summary, raw_totals = reference_macro(links, MACRO_POLLUTANTS, 2020, "夏季", distribution)
+        result = calc.calculate(links, MACRO_POLLUTANTS, 2020, "夏季", result_format="columnar",
+                                model_year_distribution=distribution)
+        assert result["status"] == "success", result
+        frame = result["data"]["results_columns"]
+        for pollutant in MACRO_POLLUTANTS:
+            expected = np.array([totals[pollutant] for totals in raw_totals])
+            assert np.allclose(frame[f"{pollutant}_kg_per_hr"].to_numpy(), expected, rtol=1e-9, atol=1e-12), \
+                f"{pollutant}_kg_per_hr 不一致: {distribution}"
+        assert_close(result["data"]["summary"]["total_emissions_kg_per_hr"],
+                     ref_summary["total_emissions_kg_per_hr"], "macro.distribution.summary", rel_tol=0, abs_tol=1e-3)
+        logger.info(f"[OK] 年份分布 {distribution}: columnar 一致")
+
+
+def test_recalculate_parity(rng):
+    """recalculate 与修改后全量重算"""
+    calc = MacroEmissionCalculator()
+    links = make_links(rng, 60)
+    for i, link in enumerate(links):
+        link["link_id"] = f"L{i:03d}"
+
+    for result_format in calc.RESULT_FORMATS:
+        first = calc.calculate(links, MACRO_POLLUTANTS, 2018, "夏季", result_format=result_format,
+                               return_state=True)
+        assert first["status"] == "success", first
+        state = first["state"]
+        modified = [dict(link) for link in links]
+        for _ in range(3):
+            positions = rng.choice(len(links), size=5, replace=False).tolist()
+            updates = []
+            for i in positions:
+                update = {"link_id": links[i]["link_id"],
+                          "traffic_flow_vph": int(rng.integers(1, 3000)),
+                          "avg_speed_kph": round(float(rng.uniform(10, 110)), 1)}
+                if i % 2 == 0:
+                    update["fleet_mix"] = {"Passenger Car": 80.0, "Refuse Truck": 20.0}
+                updates.append(update)
+                modified[i].update({k: v for k, v in update.items() if k != "link_id"})
+
+            patched = calc.recalculate(state, updates)
+            assert patched["status"] == "success", patched
+            state = patched["state"]
+            rerun = calc.calculate(modified, MACRO_POLLUTANTS, 2018, "夏季", result_format=result_format)
+
+            if result_format == "columnar":
+                pd.testing.assert_frame_equal(patched["data"]["results_columns"],
+                                              rerun["data"]["results_columns"], check_dtype=False)
+            else:
+                assert_close(patched["data"]["results"], rerun["data"]["results"], "recalculate.results")
+            assert_close(patched["data"]["summary"], rerun["data"]["summary"], "recalculate.summary",
+                         rel_tol=0, abs_tol=1e-4)
+        logger.info(f"[OK] {result_format}: recalculate 与全量重算一致")
+
+
+def test_ef_query_parity():
+    """排放因子 query vs iterrows 速度编码解析"""
+    calc = EmissionFactorCalculator()
+    checked = 0
+    for vehicle_type in VEHICLE_TYPES:
+        for pollutant in ["CO2", "NOx", "PM2.5"]:
+            for model_year in [2005, 2020]:
+                for season in SEASONS:
+                    for road_type in ["快速路", "地面道路"]:
+                        reference = reference_ef_curve(vehicle_type, pollutant, model_year, season, road_type)
+                        result = calc.query(vehicle_type, pollutant, model_year, season, road_type)
+                        curve = calc.query(vehicle_type, pollutant, model_year, season, road_type,
+                                           return_curve=True)
+                        if not reference:
+                            assert result["status"] == "error" and curve["status"] == "error"
+                            continue
+
+                        assert result["status"] == "success", result
+                        assert_close(
+                            [(p["speed_mph"], p["speed_kph"], p["emission_rate"]) for p in result["data"]["speed_curve"]],
+                            [(mph, round(mph * 1.60934, 1), round(rate, 4)) for mph, rate in reference],
+                            "ef.speed_curve"
+                        )
+                        assert curve["status"] == "success", curve
+                        assert_close(
+                            [(p["speed_kph"], p["emission_rate"]) for p in curve["data"]["curve"]],
+                            [(round(mph * 1.60934, 1), round(rate / 1.60934, 4)) for mph, rate in reference],
+                            "ef.curve"
+                        )
+                        checked += 1
+    assert checked > 0, "没有可核对的曲线"
+    logger.info(f"[OK] {checked} 条曲线与 iterrows 解析一致")
+
+
+def test_interpolate_parity():
+    """interpolate 在数据速度档和已有年份上应等于原始排放率"""
+    calc = EmissionFactorCalculator()
+    for season in SEASONS:
+        for road_type in ["快速路", "地面道路"]:
+            speeds, source_types, model_years, expected = [], [], [], {p: [] for p in ["CO2", "NOx"]}
+            for vehicle_type in VEHICLE_TYPES:
+                for model_year in [2001, 2015, 2024]:
+                    curves = {p: reference_ef_curve(vehicle_type, p, model_year, season, road_type)
+                              for p in expected}
+                    if not all(curves.values()):
+                        continue
+                    mph = [m for m, _ in curves["CO2"]]
+                    if any([m for m, _ in curve] != mph for curve in curves.values()):
+                        continue
+                    speeds.extend(m * 1.60934 for m in mph)
+                    source_types.extend([calc.VEHICLE_TO_SOURCE_TYPE[vehicle_type]] * len(mph))
+                    model_years.extend([model_year] * len(mph))
+                    for pollutant, curve in curves.items():
+                        expected[pollutant].extend(rate / 1.60934 for _, rate in curve)
+
+            assert speeds, "没有可核对的速度点"
+            result = calc.interpolate(np.array(speeds), np.array(source_types), np.array(model_years),
+                                      list(expected), season, road_type)
+            assert result["status"] == "success", result
+            for pollutant, values in expected.items():
+                actual = result["data"]["emission_rate_g_per_km"][pollutant]
+                assert np.allclose(actual, values, rtol=1e-9, atol=1e-12), \
+                    f"interpolate {pollutant} {season} {road_type} 不一致"
+            logger.info(f"[OK] {season} {road_type}: {len(speeds)} 个数据点插值一致")
+
+
+def main():
+    rng = np.random.default_rng(20240601)
+
+    logger.info("=" * 60)
+    logger.info("Calculator Parity Test")
+    logger.info("=" * 60)
+
+    logger.info("\n[Test 1] Micro calculate (rows / columnar / summary)")
+    test_micro_parity(rng)
+
+    logger.info("\n[Test 2] Macro calculate (with / without model_year_distribution)")
+    test_macro_parity(rng)
+
+    logger.info("\n[Test 3] Macro recalculate vs full rerun")
+    test_recalculate_parity(rng)
+
+    logger.info("\n[Test 4] Emission factor query vs iterrows decoding")
+    test_ef_query_parity()
+
+    logger.info("\n[Test 5] Emission factor interpolate at tabulated speeds")
+    test_interpolate_parity()
+
+    logger.info("\n" + "=" * 60)
+    logger.info("[PASS] Calculator Parity Test PASSED")
+    logger.info("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
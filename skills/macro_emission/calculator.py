@@ -4,6 +4,7 @@
 import pandas as pd
 from pathlib import Path
 from typing import Dict, List
+from calculators.rate_store import DATA_ROOT, DATASET_FILES, dataset_path, get_rate_store
 
 class MacroEmissionCalculator:
     """宏观排放计算器"""
@@ -65,12 +66,9 @@ class MacroEmissionCalculator:
     }
 
     def __init__(self):
-        self.data_path = Path(__file__).parent / "data"
-        self.csv_files = {
-            "winter": "atlanta_2025_1_35_60 .csv",
-            "spring": "atlanta_2025_4_75_65.csv",
-            "summer": "atlanta_2025_7_80_60.csv"
-        }
+        # 与 calculators/ 共用同一份排放数据（进程内注册表，见 calculators.rate_store）
+        self.data_path = DATA_ROOT / "macro_emission"
+        self.csv_files = DATASET_FILES["macro_emission"]
 
     def calculate(self, links_data: List[Dict], pollutants: List[str],
                  model_year: int, season: str, default_fleet_mix: Dict = None) -> Dict:
@@ -118,16 +116,15 @@ class MacroEmissionCalculator:
             }
 
     def _load_emission_matrix(self, season: str) -> pd.DataFrame:
-        """加载排放矩阵"""
-        season_code = self.SEASON_CODES.get(season, 7)
-        season_key = "winter" if season_code == 1 else ("spring" if season_code == 4 else "summer")
-        csv_file = self.csv_files[season_key]
-        csv_path = self.data_path / csv_file
-
-        if not csv_path.exists():
-            raise FileNotFoundError(f"数据文件不存在: {csv_path}")
-
-        # 读取CSV - 格式: opModeID,pollutantID,sourceTypeID,modelYearID,em,extra
+        """加载排放矩阵（共享的只读数据表，建立在二进制列缓存的内存映射之上）"""
+        return get_rate_store().get_frame(
+            dataset_path("macro_emission", season), self._read_emission_csv,
+            id_columns=(self.COL_OPMODE, self.COL_POLLUTANT, self.COL_SOURCE_TYPE, self.COL_MODEL_YEAR),
+            value_columns=(self.COL_EMISSION,)
+        )
+
+    def _read_emission_csv(self, csv_path: Path) -> pd.DataFrame:
+        """读取CSV - 格式: opModeID,pollutantID,sourceTypeID,modelYearID,em,extra"""
         return pd.read_csv(csv_path, header=None,
                           names=[self.COL_OPMODE, self.COL_POLLUTANT,
                                 self.COL_SOURCE_TYPE, self.COL_MODEL_YEAR,
@@ -1,19 +1,85 @@
 """
 Excel输入/输出处理器
-支持宏观排放计算的Excel文件读写
+支持宏观排放计算的Excel文件读写，以及超大路网文件（CSV/Parquet）的分块读取和结果流式写出
 """
 import difflib
 import json
 import logging
 import re
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
 logger = logging.getLogger(__name__)
 
 
+def parquet_available() -> bool:
+    """是否可读写Parquet（需要pyarrow）"""
+    try:
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class ResultChunkWriter:
+    """
+    逐块追加写出结果表，内存中只保留当前块
+
+    按扩展名写出 .csv（默认utf-8-sig）、.jsonl（每行一个JSON对象）
+    或 .parquet（需要pyarrow，各块按首块的列类型写入）。
+    """
+
+    def __init__(self, output_path: str, bom: bool = True):
+        """
+        Args:
+            output_path: 输出文件路径
+            bom: CSV是否写入UTF-8 BOM（便于Excel打开；供程序读取时可关闭）
+        """
+        self.output_path = output_path
+        self.rows_written = 0
+        suffix = Path(output_path).suffix.lower()
+        self._parquet = suffix == ".parquet"
+        self._jsonl = suffix == ".jsonl"
+        self._bom = bom
+        self._parquet_writer = None
+
+    def write(self, frame: pd.DataFrame):
+        if self._parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.output_path, table.schema)
+            else:
+                table = table.cast(self._parquet_writer.schema)
+            self._parquet_writer.write_table(table)
+        elif self._jsonl:
+            text = frame.to_json(orient="records", lines=True, force_ascii=False)
+            with open(self.output_path, 'w' if self.rows_written == 0 else 'a', encoding='utf-8') as f:
+                f.write(text if not text or text.endswith("\n") else text + "\n")
+        else:
+            first = self.rows_written == 0
+            frame.to_csv(
+                self.output_path, mode='w' if first else 'a', header=first,
+                index=False, encoding='utf-8-sig' if first and self._bom else 'utf-8'
+            )
+        self.rows_written += len(frame)
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
 class ExcelHandler:
     """Excel文件处理器"""
 
@@ -29,6 +95,16 @@ class ExcelHandler:
         "link_id": ["link_id", "segment_id", "id", "link", "路段id", "路段编号", "编号", "名称", "name"],
     }
 
+    # 可选的路段几何（WKT 或起终点坐标）和分区列，只按列名精确匹配
+    SPATIAL_ALIASES = {
+        "geometry": ["geometry", "geom", "wkt", "the_geom", "shape", "几何", "路段几何"],
+        "start_x": ["start_x", "start_lon", "start_lng", "from_x", "from_lon", "x1", "lon1", "起点经度", "起点x"],
+        "start_y": ["start_y", "start_lat", "from_y", "from_lat", "y1", "lat1", "起点纬度", "起点y"],
+        "end_x": ["end_x", "end_lon", "end_lng", "to_x", "to_lon", "x2", "lon2", "终点经度", "终点x"],
+        "end_y": ["end_y", "end_lat", "to_y", "to_lat", "y2", "lat2", "终点纬度", "终点y"],
+        "zone": ["zone", "zone_id", "taz", "district", "区域", "分区", "行政区"],
+    }
+
     STANDARD_VEHICLE_TYPES = [
         "Motorcycle",
         "Passenger Car",
@@ -114,8 +190,12 @@ class ExcelHandler:
                 df = pd.read_csv(file_path)
             elif path.suffix.lower() in [".xlsx", ".xls"]:
                 df = pd.read_excel(file_path)
+            elif path.suffix.lower() == ".parquet":
+                if not parquet_available():
+                    return False, None, "读取 .parquet 文件需要安装 pyarrow"
+                df = pd.read_parquet(file_path)
             else:
-                return False, None, f"不支持的文件格式: {path.suffix}，仅支持 .xlsx, .xls, .csv"
+                return False, None, f"不支持的文件格式: {path.suffix}，仅支持 .xlsx, .xls, .csv, .parquet"
 
             if df.empty:
                 return False, None, "Excel文件为空"
@@ -130,37 +210,248 @@ class ExcelHandler:
             if missing_fields:
                 return False, None, self._build_mapping_error(df, mapping_result, missing_fields)
 
-            vehicle_columns = mapping_result["fleet_columns"]
-            links_data: List[Dict] = []
+            links_data = self._frame_to_links(
+                df, field_to_column, mapping_result["fleet_columns"], spatial_columns=mapping_result["spatial_columns"]
+            )
+            return True, links_data, None
 
-            for i, row in df.iterrows():
-                flow_raw = row[field_to_column["traffic_flow_vph"]]
-                flow_vph = self._normalize_flow_to_vph(
-                    flow_raw,
-                    field_to_column["traffic_flow_vph"]
-                )
-                link_data = {
-                    "link_length_km": self._safe_float(row[field_to_column["link_length_km"]]),
-                    "traffic_flow_vph": flow_vph,
-                    "avg_speed_kph": self._safe_float(row[field_to_column["avg_speed_kph"]]),
-                }
-
-                link_id_col = field_to_column.get("link_id")
-                if link_id_col is not None and pd.notna(row[link_id_col]):
-                    link_data["link_id"] = str(row[link_id_col]).strip()
-                else:
-                    link_data["link_id"] = f"Link_{i + 1}"
+        except Exception as e:
+            return False, None, f"读取Excel文件失败: {str(e)}"
+
+    def iter_link_chunks(self, file_path: str, chunk_size: int = 50000) -> Iterator[Dict[str, Any]]:
+        """
+        分块读取路段文件（用于区域级超大路网的流式计算）
 
-                fleet_mix = self._parse_fleet_mix(row, vehicle_columns)
-                if fleet_mix:
-                    link_data["fleet_mix"] = fleet_mix
+        列映射只在首块的表头和样例行上解析一次，之后各块按列向量化转换，
+        路段字段与 read_links_from_excel 相同（缺少link_id时按文件行号编号，
+        有几何/分区列时附带 geometry 和 zone）。
 
-                links_data.append(link_data)
+        Args:
+            file_path: .csv 或 .parquet 文件路径（Parquet需要pyarrow）；
+                .xlsx/.xls 不能分块读取，整表读入后分块转换
+            chunk_size: 每块行数
 
-            return True, links_data, None
+        Yields:
+            links_data: 该块路段列表
+            source: 该块原始数据行（用于写出结果）
+            row_offset: 该块首行在文件中的行下标
+        """
+        path = Path(file_path)
+        if not path.exists():
+            raise FileNotFoundError(f"文件不存在: {file_path}")
+
+        mapping_result = None
+        row_offset = 0
+        for raw in self._iter_frames(path, chunk_size):
+            raw.columns = [str(col).strip() for col in raw.columns]
+            if mapping_result is None:
+                mapping_result = self._resolve_column_mapping(raw)
+                logger.info(f"[MacroEmission] 分块读取列名: {list(raw.columns)}")
+                missing_fields = [f for f in self.REQUIRED_FIELDS if f not in mapping_result["field_to_column"]]
+                if missing_fields:
+                    raise ValueError(self._build_mapping_error(raw, mapping_result, missing_fields))
+            if raw.empty:
+                continue
 
-        except Exception as e:
-            return False, None, f"读取Excel文件失败: {str(e)}"
+            links_data = self._frame_to_links(
+                raw, mapping_result["field_to_column"], mapping_result["fleet_columns"], row_offset,
+                mapping_result["spatial_columns"]
+            )
+            yield {"links_data": links_data, "source": raw, "row_offset": row_offset}
+            row_offset += len(raw)
+
+        if row_offset == 0:
+            raise ValueError("路段文件为空")
+
+    @staticmethod
+    def _iter_frames(path: Path, chunk_size: int) -> Iterator[pd.DataFrame]:
+        """按块读取 CSV / Parquet 为 DataFrame（Excel整表读入后切块）"""
+        suffix = path.suffix.lower()
+        if suffix == ".csv":
+            yield from pd.read_csv(path, chunksize=chunk_size)
+        elif suffix in (".xlsx", ".xls"):
+            df = pd.read_excel(path)
+            if df.empty:
+                yield df
+            for start in range(0, len(df), chunk_size):
+                yield df.iloc[start:start + chunk_size]
+        elif suffix == ".parquet":
+            if not parquet_available():
+                raise ValueError("读取 .parquet 文件需要安装 pyarrow")
+            import pyarrow.parquet as pq
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+                yield batch.to_pandas()
+        else:
+            raise ValueError(f"不支持的文件格式: {suffix}，仅支持 .xlsx, .xls, .csv, .parquet")
+
+    def _frame_to_links(
+        self,
+        df: pd.DataFrame,
+        field_to_column: Dict[str, str],
+        vehicle_columns: Dict[str, List[str]],
+        row_offset: int = 0,
+        spatial_columns: Optional[Dict[str, str]] = None,
+    ) -> List[Dict]:
+        """
+        按列向量化解析路段（数值规则同 _safe_float，日交通量换算为每小时）
+
+        有几何列时路段附带 geometry（WKT字符串，或由起终点坐标组成的 [[x0, y0], [x1, y1]]），
+        有分区列时附带 zone。
+        """
+        length_col = field_to_column["link_length_km"]
+        flow_col = field_to_column["traffic_flow_vph"]
+        speed_col = field_to_column["avg_speed_kph"]
+
+        lengths = self._float_column(df[length_col])
+        flows = self._float_column(df[flow_col])
+        speeds = self._float_column(df[speed_col])
+
+        # 空值或无法解析的单元格：按原逐行顺序重新转换，抛出与逐行解析相同的错误
+        for i in np.flatnonzero(np.isnan(lengths) | np.isnan(flows) | np.isnan(speeds)):
+            for col in (length_col, flow_col, speed_col):
+                self._safe_float(df[col].iloc[i])
+
+        if self._is_daily_flow_column(flow_col):
+            flows = flows / 24.0
+
+        n = len(df)
+        link_id_col = field_to_column.get("link_id")
+        if link_id_col is not None:
+            ids = df[link_id_col]
+            present = ids.notna().to_numpy()
+            id_text = ids.astype(str).str.strip().tolist()
+            link_ids = [
+                id_text[i] if present[i] else f"Link_{row_offset + i + 1}"
+                for i in range(n)
+            ]
+        else:
+            link_ids = [f"Link_{row_offset + i + 1}" for i in range(n)]
+
+        fleet_mixes = self._fleet_mix_column(df, vehicle_columns)
+        geometries, zones = self._spatial_columns(df, spatial_columns or {})
+
+        links_data: List[Dict] = []
+        for i, (link_id, length, flow, speed, fleet_mix) in enumerate(zip(
+            link_ids, lengths.tolist(), flows.tolist(), speeds.tolist(), fleet_mixes
+        )):
+            link_data = {
+                "link_length_km": length,
+                "traffic_flow_vph": flow,
+                "avg_speed_kph": speed,
+                "link_id": link_id,
+            }
+            if fleet_mix:
+                link_data["fleet_mix"] = fleet_mix
+            if geometries is not None and geometries[i] is not None:
+                link_data["geometry"] = geometries[i]
+            if zones is not None and zones[i] is not None:
+                link_data["zone"] = zones[i]
+            links_data.append(link_data)
+        return links_data
+
+    def _spatial_columns(self, df: pd.DataFrame, spatial_columns: Dict[str, str]):
+        """各行几何与分区（无对应列时为None；WKT为空的行回退到起终点坐标）"""
+        n = len(df)
+        geometries = None
+        if "start_x" in spatial_columns:
+            coords = np.column_stack([
+                self._float_column(df[spatial_columns[field]]) for field in ("start_x", "start_y", "end_x", "end_y")
+            ])
+            complete = ~np.isnan(coords).any(axis=1)
+            geometries = [
+                [[row[0], row[1]], [row[2], row[3]]] if ok else None
+                for row, ok in zip(coords.tolist(), complete.tolist())
+            ]
+        if "geometry" in spatial_columns:
+            wkt = df[spatial_columns["geometry"]]
+            present = wkt.notna().to_numpy()
+            wkt_text = wkt.astype(str).str.strip().tolist()
+            geometries = [
+                wkt_text[i] if present[i] and wkt_text[i] else (geometries[i] if geometries else None)
+                for i in range(n)
+            ]
+
+        zones = None
+        if "zone" in spatial_columns:
+            zone = df[spatial_columns["zone"]]
+            present = zone.notna().to_numpy()
+            zone_text = zone.astype(str).str.strip().tolist()
+            zones = [zone_text[i] if present[i] else None for i in range(n)]
+        return geometries, zones
+
+    def _float_column(self, series: pd.Series) -> np.ndarray:
+        """
+        列的向量化 _safe_float：数值列直接转换，文本列统一去除千分位和百分号后解析；
+        空值和无法解析的单元格为NaN（个别 pandas 不接受但 float() 接受的写法逐个补算）
+        """
+        if pd.api.types.is_numeric_dtype(series):
+            return series.to_numpy(dtype=np.float64, na_value=np.nan)
+
+        text = (
+            series.astype(str).str.strip()
+            .str.replace(",", "", regex=False)
+            .str.replace("％", "%", regex=False)
+            .str.replace(r"%$", "", regex=True)
+        )
+        values = pd.to_numeric(text, errors="coerce").to_numpy(dtype=np.float64, copy=True)
+        parsed = ~np.isnan(values)
+        try:
+            # pandas 的快速解析末位可能与 float() 不同，可解析的值再用 numpy 精确转换一次
+            values[parsed] = text.to_numpy(dtype=str)[parsed].astype(np.float64)
+        except ValueError:
+            values[parsed] = np.nan
+        retry = np.flatnonzero(np.isnan(values) & series.notna().to_numpy())
+        for i in retry:
+            try:
+                values[i] = self._safe_float(series.iloc[i])
+            except (TypeError, ValueError):
+                pass
+        return values
+
+    def _fleet_mix_column(self, df: pd.DataFrame, vehicle_columns: Dict[str, List[str]]) -> List[Optional[Dict[str, float]]]:
+        """
+        各行车型分布（每列只解析一次）
+
+        同一车型的多列正值相加，“货车”等聚合列按 TRUCK_DISTRIBUTION 拆分，
+        总和不是100%时标准化；没有正值的行为None。
+        """
+        if not vehicle_columns:
+            return [None] * len(df)
+
+        names = list(vehicle_columns)
+        values = np.zeros((len(df), len(names)))
+        for j, col_names in enumerate(vehicle_columns.values()):
+            if isinstance(col_names, str):
+                col_names = [col_names]
+            for col_name in col_names:
+                parsed = self._float_column(df[col_name])
+                values[:, j] += np.where(parsed > 0, parsed, 0.0)
+
+        dist_total = sum(self.TRUCK_DISTRIBUTION.values())
+        fleet_mixes: List[Optional[Dict[str, float]]] = []
+        for row in values.tolist():
+            fleet_mix = {}
+            total = 0.0
+            for name, value in zip(names, row):
+                if value > 0:
+                    fleet_mix[name] = value
+                    total += value
+
+            # “Truck%”等聚合列拆分到可计算的MOVES标准车型
+            truck_total = fleet_mix.pop(self.AGGREGATE_TRUCK_KEY, 0.0)
+            if truck_total > 0:
+                for vehicle_type, ratio in self.TRUCK_DISTRIBUTION.items():
+                    fleet_mix[vehicle_type] = fleet_mix.get(vehicle_type, 0.0) + truck_total * ratio / dist_total
+
+            if not fleet_mix or total == 0:
+                fleet_mixes.append(None)
+                continue
+
+            if abs(total - 100.0) > 1e-6:
+                for vehicle_type in fleet_mix:
+                    fleet_mix[vehicle_type] = (fleet_mix[vehicle_type] / total) * 100.0
+            fleet_mixes.append(fleet_mix)
+        return fleet_mixes
 
     @staticmethod
     def write_results_to_excel(
@@ -243,11 +534,15 @@ class ExcelHandler:
             selected_meta[field] = {"score": cand["score"], "source": cand["source"]}
             used_columns.add(col)
 
+        spatial_columns = self._resolve_spatial_columns(columns, used_columns)
+        used_columns.update(spatial_columns.values())
+
         fleet_columns = self._resolve_fleet_columns(columns, ai_result, used_columns)
 
         return {
             "field_to_column": selected,
             "fleet_columns": fleet_columns,
+            "spatial_columns": spatial_columns,
             "meta": selected_meta,
             "ai_used": bool(ai_result.get("used")),
         }
@@ -265,6 +560,23 @@ class ExcelHandler:
                     break
         return candidates
 
+    def _resolve_spatial_columns(self, columns: List[str], used_columns: set) -> Dict[str, str]:
+        """几何/起终点坐标/分区列（起终点坐标须四列齐全）"""
+        lookup = {self._normalize_text(col): col for col in columns if col not in used_columns}
+        spatial: Dict[str, str] = {}
+        for field, aliases in self.SPATIAL_ALIASES.items():
+            for alias in aliases:
+                col = lookup.get(self._normalize_text(alias))
+                if col is not None and col not in spatial.values():
+                    spatial[field] = col
+                    break
+
+        coordinate_fields = ("start_x", "start_y", "end_x", "end_y")
+        if not all(field in spatial for field in coordinate_fields):
+            for field in coordinate_fields:
+                spatial.pop(field, None)
+        return spatial
+
     def _fuzzy_mapping_candidates(self, columns: List[str]) -> List[Dict[str, Any]]:
         candidates: List[Dict[str, Any]] = []
         for field, aliases in self.FIELD_ALIASES.items():
@@ -456,22 +768,18 @@ class ExcelHandler:
             text = text[:-1]
         return float(text)
 
-    def _normalize_flow_to_vph(self, value: Any, source_column: str) -> float:
+    def _is_daily_flow_column(self, source_column: str) -> bool:
         """
-        Normalize traffic flow to vehicles per hour.
+        Whether a flow column holds daily traffic (to be divided by 24).
         Supports common daily-traffic semantics such as `daily_traffic`, `aadt`, `日交通量`.
         """
-        flow = self._safe_float(value)
         col_norm = self._normalize_text(source_column)
 
         daily_markers = [
             "daily", "per_day", "day", "aadt", "adt", "daily_traffic",
             "日", "天", "每日", "日均", "日交通量"
         ]
-        if any(marker in col_norm for marker in daily_markers):
-            return flow / 24.0
-
-        return flow
+        return any(marker in col_norm for marker in daily_markers)
 
     def _standardize_vehicle_name(self, name: str) -> Optional[str]:
         if not name:
@@ -506,55 +814,14 @@ class ExcelHandler:
             return best_std
         return None
 
-    def _parse_fleet_mix(self, row: pd.Series, vehicle_columns: Dict[str, List[str]]) -> Optional[Dict[str, float]]:
-        """解析车型分布"""
-        if not vehicle_columns:
-            return None
-
-        fleet_mix = {}
-        total = 0.0
-
-        for standard_name, col_names in vehicle_columns.items():
-            if isinstance(col_names, str):
-                col_names = [col_names]
-            aggregated_value = 0.0
-            for col_name in col_names:
-                value = row[col_name]
-                if pd.isna(value):
-                    continue
-                try:
-                    parsed = self._safe_float(value)
-                except Exception:
-                    continue
-                if parsed > 0:
-                    aggregated_value += parsed
-            if aggregated_value > 0:
-                fleet_mix[standard_name] = aggregated_value
-                total += aggregated_value
-
-        # “Truck%”等聚合列拆分到可计算的MOVES标准车型
-        truck_total = fleet_mix.pop(self.AGGREGATE_TRUCK_KEY, 0.0)
-        if truck_total > 0:
-            dist_total = sum(self.TRUCK_DISTRIBUTION.values())
-            for vehicle_type, ratio in self.TRUCK_DISTRIBUTION.items():
-                fleet_mix[vehicle_type] = fleet_mix.get(vehicle_type, 0.0) + truck_total * ratio / dist_total
-
-        if not fleet_mix or total == 0:
-            return None
-
-        if abs(total - 100.0) > 1e-6:
-            for vehicle_type in fleet_mix:
-                fleet_mix[vehicle_type] = (fleet_mix[vehicle_type] / total) * 100.0
-
-        return fleet_mix
-
     def generate_result_excel(
         self,
         original_file_path: str,
         emission_results: List[Dict],
         pollutants: List[str],
         output_dir: str,
-        fleet_fill_info: Optional[Dict[str, Any]] = None
+        fleet_fill_info: Optional[Dict[str, Any]] = None,
+        max_excel_rows: Optional[int] = None
     ) -> Tuple[bool, Optional[str], Optional[str], Optional[str]]:
         """
         生成包含排放结果的增强版Excel文件（原始数据 + 排放列）
@@ -564,6 +831,7 @@ class ExcelHandler:
             emission_results: 排放计算结果列表（每个路段的排放量）
             pollutants: 污染物列表
             output_dir: 输出目录
+            max_excel_rows: 行数超过该值时写出CSV而不是Excel（None 表示不限制）
 
         Returns:
             (success, output_path, filename, error_message)
@@ -578,6 +846,8 @@ class ExcelHandler:
                 df_original = pd.read_csv(original_file_path)
             elif path.suffix.lower() in ['.xlsx', '.xls']:
                 df_original = pd.read_excel(original_file_path)
+            elif path.suffix.lower() == '.parquet':
+                df_original = pd.read_parquet(original_file_path)
             else:
                 return False, None, None, f"不支持的文件格式: {path.suffix}"
 
@@ -644,14 +914,18 @@ class ExcelHandler:
                             if pd.isna(df_original.at[idx, col]) or str(df_original.at[idx, col]).strip() == "":
                                 df_original.at[idx, col] = round(value, 4)
 
-            # 3. 生成输出文件名
+            # 3. 生成输出文件名（超过行数上限时写出CSV）
+            write_excel = max_excel_rows is None or len(df_original) <= max_excel_rows
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             original_name = path.stem  # 不含扩展名的文件名
-            output_filename = f"{original_name}_emission_results_{timestamp}.xlsx"
+            output_filename = f"{original_name}_emission_results_{timestamp}.{'xlsx' if write_excel else 'csv'}"
             output_path = os.path.join(output_dir, output_filename)
 
-            # 4. 保存Excel
-            df_original.to_excel(output_path, index=False, engine='openpyxl')
+            # 4. 保存Excel / CSV
+            if write_excel:
+                df_original.to_excel(output_path, index=False, engine='openpyxl')
+            else:
+                df_original.to_csv(output_path, index=False, encoding='utf-8-sig')
 
             return True, output_path, output_filename, None
 
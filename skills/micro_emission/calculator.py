@@ -2,8 +2,8 @@
 微观排放计算器
 """
 import pandas as pd
-from pathlib import Path
 from typing import Dict, List
+from calculators.rate_store import DATA_ROOT, DATASET_FILES, dataset_path, get_rate_store
 from .vsp import VSPCalculator
 
 class MicroEmissionCalculator:
@@ -57,13 +57,10 @@ class MicroEmissionCalculator:
     }
 
     def __init__(self):
-        self.data_path = Path(__file__).parent / "data"
+        # 与 calculators/ 共用同一份排放数据（进程内注册表，见 calculators.rate_store）
+        self.data_path = DATA_ROOT / "micro_emission"
         self.vsp_calculator = VSPCalculator()
-        self.csv_files = {
-            "winter": "atlanta_2025_1_55_65.csv",
-            "spring": "atlanta_2025_4_75_65.csv",
-            "summer": "atlanta_2025_7_90_70.csv"
-        }
+        self.csv_files = DATASET_FILES["micro_emission"]
 
     def _year_to_age_group(self, model_year: int) -> int:
         """
@@ -164,16 +161,12 @@ class MicroEmissionCalculator:
             }
 
     def _load_emission_matrix(self, season: str) -> pd.DataFrame:
-        """加载排放矩阵"""
-        season_code = self.SEASON_CODES.get(season, 7)
-        season_key = "winter" if season_code == 1 else ("spring" if season_code == 4 else "summer")
-        csv_file = self.csv_files[season_key]
-        csv_path = self.data_path / csv_file
-
-        if not csv_path.exists():
-            raise FileNotFoundError(f"数据文件不存在: {csv_path}")
-
-        return pd.read_csv(csv_path)
+        """加载排放矩阵（共享的只读数据表，建立在二进制列缓存的内存映射之上）"""
+        return get_rate_store().get_frame(
+            dataset_path("micro_emission", season), pd.read_csv,
+            id_columns=(self.COL_OPMODE, self.COL_POLLUTANT, self.COL_SOURCE_TYPE, self.COL_MODEL_YEAR),
+            value_columns=(self.COL_EMISSION,)
+        )
 
     def _query_emission_rate(self, matrix: pd.DataFrame, opmode: int,
                             pollutant_id: int, source_type: int,
@@ -2,10 +2,11 @@
 Excel输入/输出处理器
 支持微观排放计算的Excel文件读写
 """
+import numpy as np
 import pandas as pd
 import logging
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Dict, Iterator, List, Optional, Tuple, Any
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +28,11 @@ class ExcelHandler:
     ACCELERATION_COLUMNS = ["acceleration", "acc", "acceleration_mps2", "acceleration_m_s2", "加速度"]  # 添加 acceleration_m_s2
     GRADE_COLUMNS = ["grade_pct", "grade", "坡度"]
     TIME_COLUMNS = ["t", "time", "time_sec", "时间"]  # 添加 time_sec
+    # 多车辆轨迹文件的分组列（不含 "vehicle"、"year" 等含义不明确的列名：
+    # 单车轨迹中的 vehicle 列常为车型标签，year 列可能是日历年份）
+    VEHICLE_ID_COLUMNS = ["vehicle_id", "veh_id", "vin", "车辆编号", "车辆ID", "车牌号", "车牌"]
+    VEHICLE_TYPE_COLUMNS = ["vehicle_type", "veh_type", "车型", "车辆类型"]
+    MODEL_YEAR_COLUMNS = ["model_year", "车辆年份", "年款"]
 
     def read_trajectory_from_excel(self, file_path: str) -> Tuple[bool, Optional[List[Dict]], Optional[str]]:
         """
@@ -178,6 +184,55 @@ class ExcelHandler:
         except Exception as e:
             return False, f"写入Excel文件失败: {str(e)}"
 
+    @staticmethod
+    def write_result_frame_to_excel(
+        file_path: str,
+        results_frame: pd.DataFrame,
+        pollutants: List[str]
+    ) -> Tuple[bool, Optional[str]]:
+        """
+        将列式计算结果写入Excel/CSV文件（列格式与 write_results_to_excel 一致）
+
+        Args:
+            file_path: 输出文件路径
+            results_frame: 列式逐秒结果（t, speed_kph, vsp 及各污染物 g/s 列）
+            pollutants: 污染物列表
+
+        Returns:
+            (success, error_message)
+        """
+        try:
+            n = len(results_frame)
+            df = pd.DataFrame({
+                "t": results_frame["t"].to_numpy(),
+                "speed_kph": results_frame["speed_kph"].to_numpy(),
+                "acc_mps2": np.zeros(n),
+                "grade_pct": np.zeros(n),
+                "VSP": results_frame["vsp"].to_numpy(),
+            })
+            for pollutant in pollutants:
+                # float32列还原为6位小数，与逐秒字典结果的取值一致
+                values = (np.round(results_frame[pollutant].to_numpy(dtype=np.float64), 6)
+                          if pollutant in results_frame else np.zeros(n))
+                # 根据污染物类型确定单位
+                if pollutant == "CO2":
+                    df[f"{pollutant}_g_per_s"] = values
+                else:
+                    df[f"{pollutant}_mg_per_s"] = values * 1000  # g -> mg
+
+            path = Path(file_path)
+            if path.suffix.lower() == '.csv':
+                df.to_csv(file_path, index=False, encoding='utf-8-sig')
+            elif path.suffix.lower() in ['.xlsx', '.xls']:
+                df.to_excel(file_path, index=False, engine='openpyxl')
+            else:
+                return False, f"不支持的输出格式: {path.suffix}，仅支持 .xlsx, .csv"
+
+            return True, None
+
+        except Exception as e:
+            return False, f"写入Excel文件失败: {str(e)}"
+
     def _find_column(self, df: pd.DataFrame, possible_names: List[str]) -> Optional[str]:
         """
         在DataFrame中查找列名
@@ -198,6 +253,266 @@ class ExcelHandler:
 
         return None
 
+    def iter_trajectory_chunks(self, file_path: str, chunk_size: int = 200000) -> Iterator[Dict[str, Any]]:
+        """
+        分块读取CSV轨迹（用于超大GPS日志的流式计算）
+
+        列识别规则与 read_trajectory_from_excel 相同。缺少加速度列时按中心差分计算，
+        每块最后一行暂存到下一块，保证块边界处的差分与整表读取一致。
+        .xlsx/.xls 不能分块读取，整表读入后按块输出。
+
+        Args:
+            file_path: CSV（或Excel）文件路径
+            chunk_size: 每块行数
+
+        Yields:
+            列数组字典: t, speed_kph, acceleration_mps2, grade_pct，
+            以及 source（该块对应的原始数据行，用于写出结果）
+        """
+        path = Path(file_path)
+        if not path.exists():
+            raise FileNotFoundError(f"文件不存在: {file_path}")
+        suffix = path.suffix.lower()
+        if suffix == '.csv':
+            frames = pd.read_csv(file_path, chunksize=chunk_size)
+        elif suffix in ['.xlsx', '.xls']:
+            df = pd.read_excel(file_path)
+            frames = (df.iloc[start:start + chunk_size] for start in range(0, len(df), chunk_size))
+        else:
+            raise ValueError(f"不支持的文件格式: {path.suffix}，仅支持 .xlsx, .xls, .csv")
+
+        speed_col = acc_col = grade_col = time_col = None
+        pending = None      # 尚未输出的行（等待下一块的速度做中心差分）
+        prev_speed = None   # pending 之前一行的速度
+        row_offset = 0
+
+        for raw in frames:
+            raw.columns = [str(col).strip() for col in raw.columns]
+            if speed_col is None:
+                speed_col = self._find_column(raw, self.SPEED_COLUMNS)
+                if speed_col is None:
+                    raise ValueError(f"未找到速度列，支持的列名: {', '.join(self.SPEED_COLUMNS)}")
+                acc_col = self._find_column(raw, self.ACCELERATION_COLUMNS)
+                grade_col = self._find_column(raw, self.GRADE_COLUMNS)
+                time_col = self._find_column(raw, self.TIME_COLUMNS)
+
+            n = len(raw)
+            if n == 0:
+                continue
+            chunk = {
+                "t": (raw[time_col].to_numpy(dtype=np.float64) if time_col is not None
+                      else np.arange(row_offset, row_offset + n, dtype=np.float64)),
+                "speed_kph": raw[speed_col].to_numpy(dtype=np.float64),
+                "grade_pct": (raw[grade_col].to_numpy(dtype=np.float64) if grade_col is not None
+                              else np.zeros(n)),
+                "source": raw,
+            }
+            row_offset += n
+
+            if acc_col is not None:
+                chunk["acceleration_mps2"] = raw[acc_col].to_numpy(dtype=np.float64)
+                yield chunk
+                continue
+
+            if pending is not None:
+                chunk = {key: (pd.concat([pending[key], value]) if key == "source"
+                               else np.concatenate([pending[key], value]))
+                         for key, value in chunk.items()}
+            if len(chunk["speed_kph"]) < 2:
+                pending = chunk
+                continue
+
+            speeds = chunk["speed_kph"]
+            acc = self._central_difference_acceleration(speeds, prev_speed, None)
+            emit = {key: value[:-1] if key != "source" else value.iloc[:-1] for key, value in chunk.items()}
+            emit["acceleration_mps2"] = acc[:-1]
+            prev_speed = speeds[-2]
+            pending = {key: value[-1:] if key != "source" else value.iloc[-1:] for key, value in chunk.items()}
+            yield emit
+
+        if speed_col is None:
+            raise ValueError("轨迹文件为空")
+
+        if pending is not None:
+            pending["acceleration_mps2"] = self._central_difference_acceleration(
+                pending["speed_kph"], prev_speed, None
+            )
+            yield pending
+
+    @staticmethod
+    def _central_difference_acceleration(speeds: np.ndarray, prev_speed: Optional[float],
+                                         next_speed: Optional[float], dt: float = 1.0) -> np.ndarray:
+        """
+        向量化的 _calculate_acceleration，可指定块外的前后相邻速度
+
+        有前后两点时用中心差分，只有一侧时用前向/后向差分，孤立点为0。
+        """
+        speeds = np.asarray(speeds, dtype=np.float64)
+        n = len(speeds)
+        left = np.empty(n)
+        right = np.empty(n)
+        left[1:] = speeds[:-1]
+        right[:-1] = speeds[1:]
+        left[0] = 0.0 if prev_speed is None else prev_speed
+        right[-1] = 0.0 if next_speed is None else next_speed
+
+        has_left = np.ones(n, dtype=bool)
+        has_right = np.ones(n, dtype=bool)
+        has_left[0] = prev_speed is not None
+        has_right[-1] = next_speed is not None
+
+        return ExcelHandler._neighbor_difference_acceleration(speeds, left, right, has_left, has_right, dt)
+
+    @staticmethod
+    def _neighbor_difference_acceleration(speeds: np.ndarray, left: np.ndarray, right: np.ndarray,
+                                          has_left: np.ndarray, has_right: np.ndarray,
+                                          dt: float = 1.0) -> np.ndarray:
+        """由前后相邻速度计算加速度 (m/s²)，规则同 _calculate_acceleration"""
+        speed_diff = np.where(
+            has_left & has_right, (right - left) / 2.0,
+            np.where(has_right, right - speeds, np.where(has_left, speeds - left, 0.0))
+        )
+        return (speed_diff / 3.6) / dt
+
+    def find_vehicle_id_column(self, file_path: str) -> Optional[str]:
+        """
+        只读取表头，判断文件是否为按车辆编号区分的多车辆轨迹
+
+        Returns:
+            车辆编号列名，单车轨迹或无法读取时返回None
+        """
+        try:
+            header = self._read_frame(file_path, nrows=0)
+        except Exception:
+            return None
+        if header is None:
+            return None
+        header.columns = header.columns.astype(str).str.strip()
+        return self._find_column(header, self.VEHICLE_ID_COLUMNS)
+
+    def read_fleet_trajectory(self, file_path: str) -> Tuple[bool, Optional[Dict[str, Any]], Optional[str]]:
+        """
+        读取多车辆轨迹文件（按车辆编号分组）
+
+        时间列缺失时按每辆车内的行序生成；加速度列缺失时在每辆车内按中心差分计算，
+        不跨越车辆边界。车型和年份列为可选，缺失的单元为None/NaN，由调用方填充默认值。
+
+        Returns:
+            (success, fleet_data, error_message)
+            fleet_data 为按原始行序排列的列数组字典: vehicle_id, vehicle_type, model_year,
+            t, speed_kph, acceleration_mps2, grade_pct，以及原始数据表 source
+        """
+        try:
+            path = Path(file_path)
+            if not path.exists():
+                return False, None, f"文件不存在: {file_path}"
+
+            df = self._read_frame(file_path)
+            if df is None:
+                return False, None, f"不支持的文件格式: {path.suffix}，仅支持 .xlsx, .xls, .csv"
+            if df.empty:
+                return False, None, "Excel文件为空"
+            df.columns = df.columns.astype(str).str.strip()
+
+            id_col = self._find_column(df, self.VEHICLE_ID_COLUMNS)
+            if id_col is None:
+                return False, None, f"未找到车辆编号列，支持的列名: {', '.join(self.VEHICLE_ID_COLUMNS)}"
+            speed_col = self._find_column(df, self.SPEED_COLUMNS)
+            if speed_col is None:
+                return False, None, f"未找到速度列，支持的列名: {', '.join(self.SPEED_COLUMNS)}"
+
+            acc_col = self._find_column(df, self.ACCELERATION_COLUMNS)
+            grade_col = self._find_column(df, self.GRADE_COLUMNS)
+            time_col = self._find_column(df, self.TIME_COLUMNS)
+            type_col = self._find_column(df, self.VEHICLE_TYPE_COLUMNS)
+            year_col = self._find_column(df, self.MODEL_YEAR_COLUMNS)
+
+            n = len(df)
+            vehicle_ids = df[id_col].astype(str).str.strip().to_numpy()
+            speeds = df[speed_col].to_numpy(dtype=np.float64)
+
+            # 按车辆稳定排序，组内保持原始行序
+            _, group = np.unique(vehicle_ids, return_inverse=True)
+            order = np.argsort(group, kind="stable")
+            sorted_group = group[order]
+            same_prev = np.zeros(n, dtype=bool)
+            same_prev[1:] = sorted_group[1:] == sorted_group[:-1]
+            same_next = np.zeros(n, dtype=bool)
+            same_next[:-1] = same_prev[1:]
+
+            if time_col is not None:
+                times = df[time_col].to_numpy(dtype=np.float64)
+            else:
+                # 每辆车内的行序号
+                group_start = np.maximum.accumulate(np.where(same_prev, 0, np.arange(n)))
+                times = np.empty(n)
+                times[order] = np.arange(n) - group_start
+
+            if acc_col is not None:
+                accelerations = df[acc_col].to_numpy(dtype=np.float64)
+            else:
+                sorted_speeds = speeds[order]
+                sorted_acc = self._neighbor_difference_acceleration(
+                    sorted_speeds, np.roll(sorted_speeds, 1), np.roll(sorted_speeds, -1),
+                    same_prev, same_next
+                )
+                accelerations = np.empty(n)
+                accelerations[order] = sorted_acc
+
+            fleet_data = {
+                "vehicle_id": vehicle_ids,
+                "vehicle_type": (df[type_col].where(df[type_col].notna(), None).to_numpy(dtype=object)
+                                 if type_col is not None else np.full(n, None, dtype=object)),
+                "model_year": (pd.to_numeric(df[year_col], errors="coerce").to_numpy(dtype=np.float64)
+                               if year_col is not None else np.full(n, np.nan)),
+                "t": times,
+                "speed_kph": speeds,
+                "acceleration_mps2": accelerations,
+                "grade_pct": (df[grade_col].to_numpy(dtype=np.float64) if grade_col is not None
+                              else np.zeros(n)),
+                "source": df,
+            }
+            return True, fleet_data, None
+
+        except Exception as e:
+            return False, None, f"读取Excel文件失败: {str(e)}"
+
+    @staticmethod
+    def _read_frame(file_path: str, nrows: Optional[int] = None) -> Optional[pd.DataFrame]:
+        """按扩展名读取CSV/Excel，不支持的格式返回None"""
+        suffix = Path(file_path).suffix.lower()
+        if suffix == '.csv':
+            return pd.read_csv(file_path, nrows=nrows)
+        if suffix in ['.xlsx', '.xls']:
+            return pd.read_excel(file_path, nrows=nrows)
+        return None
+
+    @staticmethod
+    def append_result_chunk(
+        output_path: str,
+        source_chunk: pd.DataFrame,
+        emission_columns: Dict[str, np.ndarray],
+        pollutants: List[str],
+        write_header: bool
+    ):
+        """
+        追加写出一块结果（原始数据 + 排放列），列格式与 generate_result_excel 一致
+
+        Args:
+            output_path: 输出CSV路径
+            source_chunk: 该块原始数据行
+            emission_columns: 污染物 → 每秒排放量数组 (g)
+            pollutants: 污染物列表
+            write_header: 是否写表头（第一块）
+        """
+        output = source_chunk.copy()
+        for pollutant in pollutants:
+            output[f"{pollutant}_g"] = emission_columns.get(pollutant, 0)
+        output.to_csv(
+            output_path, mode='w' if write_header else 'a', header=write_header,
+            index=False, encoding='utf-8-sig' if write_header else 'utf-8'
+        )
+
     def _calculate_acceleration(self, speeds: List[float], dt: float = 1.0) -> List[float]:
         """
         根据速度序列计算加速度
@@ -236,7 +551,7 @@ class ExcelHandler:
     def generate_result_excel(
         self,
         original_file_path: str,
-        emission_results: List[Dict],
+        emission_results,
         pollutants: List[str],
         output_dir: str
     ) -> Tuple[bool, Optional[str], Optional[str], Optional[str]]:
@@ -245,7 +560,8 @@ class ExcelHandler:
 
         Args:
             original_file_path: 原始输入文件路径
-            emission_results: 排放计算结果列表（每个时间点的排放量）
+            emission_results: 排放计算结果列表（每个时间点的排放量），
+                或列式结果 DataFrame（每个污染物一列）
             pollutants: 污染物列表
             output_dir: 输出目录
 
@@ -268,7 +584,11 @@ class ExcelHandler:
             # 2. 添加排放列
             for pollutant in pollutants:
                 # 提取该污染物的排放值
-                emission_values = [point.get(pollutant, 0) for point in emission_results]
+                if isinstance(emission_results, pd.DataFrame):
+                    emission_values = (np.round(emission_results[pollutant].to_numpy(dtype=np.float64), 6)
+                                       if pollutant in emission_results else 0)
+                else:
+                    emission_values = [point.get(pollutant, 0) for point in emission_results]
 
                 # 微观排放单位: g（克）
                 col_name = f"{pollutant}_g"
@@ -1,10 +1,10 @@
-from pathlib import Path
 from typing import Dict, Tuple, Optional, List
 import logging
 from ..base import BaseSkill, SkillResult, HealthCheckResult
 from shared.standardizer.vehicle import get_vehicle_standardizer
 from shared.standardizer.pollutant import get_pollutant_standardizer
 from shared.standardizer.constants import SEASON_MAPPING
+from calculators.rate_store import DATA_ROOT, DATASET_FILES
 from .calculator import MicroEmissionCalculator
 from .excel_handler import ExcelHandler
 from llm.client import get_llm
@@ -351,13 +351,12 @@ class MicroEmissionSkill(BaseSkill):
         errors = []
 
         # 检查数据文件
-        data_path = Path(__file__).parent / "data"
+        data_path = DATA_ROOT / "micro_emission"
         checks["data_directory"] = data_path.exists()
         if not checks["data_directory"]:
             errors.append(f"数据目录不存在: {data_path}")
 
-        csv_files = ["atlanta_2025_1_55_65.csv", "atlanta_2025_4_75_65.csv", "atlanta_2025_7_90_70.csv"]
-        for csv_file in csv_files:
+        for csv_file in DATASET_FILES["micro_emission"].values():
             csv_path = data_path / csv_file
             checks[f"csv_{csv_file}"] = csv_path.exists()
             if not csv_path.exists():
@@ -24,6 +24,7 @@ class ToolResult:
     chart_data: Optional[Dict] = None  # Chart data for visualization
     table_data: Optional[Dict] = None  # Table data for display
     download_file: Optional[str] = None  # File path for download
+    session_state: Optional[Any] = None  # Kept by the executor for this tool's next call (not sent to clients)
 
 
 class BaseTool(ABC):
@@ -54,6 +55,15 @@ class BaseTool(ABC):
         """
         pass
 
+    def wants_session_state(self, arguments: Dict[str, Any]) -> bool:
+        """
+        Whether this call needs the session state returned by the previous call
+
+        Such calls receive it as the `_session_state` argument and run in the
+        API process (they are expected to be cheap).
+        """
+        return False
+
     def _success(
         self,
         data: Dict[str, Any],
@@ -0,0 +1,91 @@
+"""
+Bulk Calculations - Worker pool entry points of the /api/bulk endpoints
+
+Module-level (picklable) functions the API runs with ToolWorkerPool.run_task,
+so bulk requests share the worker processes, queue limit and preloaded
+emission data of the LLM tools instead of running in the API process.
+Micro and macro results are written chunk by chunk to a result file
+(.csv or .jsonl) that the API streams back; only totals stay in memory.
+"""
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from skills.macro_emission.excel_handler import ResultChunkWriter
+
+# Instances owned by this process (emission data is shared through the rate store)
+_instances: Dict[str, Any] = {}
+
+
+def _get_instance(kind: str):
+    if kind not in _instances:
+        if kind == "emission_factors":
+            from calculators.emission_factors import EmissionFactorCalculator
+            _instances[kind] = EmissionFactorCalculator()
+        elif kind == "micro":
+            from tools.micro_emission import MicroEmissionTool
+            _instances[kind] = MicroEmissionTool()
+        elif kind == "macro":
+            from tools.macro_emission import MacroEmissionTool
+            _instances[kind] = MacroEmissionTool(llm_column_mapping=False)
+    return _instances[kind]
+
+
+def query_emission_factor_curves(vehicle_types: List[str], pollutants: List[str], model_years: List[int],
+                                 seasons: List[str], road_types: List[str]) -> Dict:
+    """Emission factor curves for every combination (EmissionFactorCalculator.query_batch)"""
+    return _get_instance("emission_factors").query_batch(
+        vehicle_types, pollutants, model_years, seasons, road_types, True
+    )
+
+
+def interpolate_emission_factors(speed_kph: np.ndarray, source_types: np.ndarray, model_years: np.ndarray,
+                                 pollutants: List[str], season: str, road_type: str) -> Dict:
+    """Emission factors at arbitrary points (EmissionFactorCalculator.interpolate)"""
+    return _get_instance("emission_factors").interpolate(
+        speed_kph, source_types, model_years, pollutants, season, road_type
+    )
+
+
+def calculate_micro_to_file(output_path: str, vehicle_type: str, pollutants: List[str],
+                            model_year: int, season: str,
+                            trajectory_data: Optional[List[Dict]] = None,
+                            input_file: Optional[str] = None) -> Dict:
+    """
+    Per-second micro emissions written to output_path
+
+    Returns:
+        Calculator result dict; data["rows_written"] is the number of result rows
+    """
+    with ResultChunkWriter(output_path, bom=False) as writer:
+        result = _get_instance("micro").calculate_trajectory(
+            vehicle_type, pollutants, model_year, season,
+            trajectory_data=trajectory_data, input_file=input_file, on_chunk=writer.write
+        )
+    if result.get("status") != "error":
+        result["data"]["rows_written"] = writer.rows_written
+    return result
+
+
+def calculate_macro_to_file(output_path: str, pollutants: List[str], model_year: int, season: str,
+                            links_data: Optional[List[Dict]] = None, input_file: Optional[str] = None,
+                            fleet_mix: Optional[Dict] = None, default_fleet_mix: Optional[Dict] = None,
+                            model_year_distribution: Optional[Dict] = None,
+                            rate_method: str = "average") -> Dict:
+    """
+    Per-link macro emissions written to output_path
+
+    Returns:
+        Calculator result dict; data["rows_written"] is the number of result rows
+    """
+    with ResultChunkWriter(output_path, bom=False) as writer:
+        result = _get_instance("macro").calculate_links(
+            pollutants, model_year, season,
+            links_data=links_data, input_file=input_file,
+            fleet_mix=fleet_mix, default_fleet_mix=default_fleet_mix,
+            model_year_distribution=model_year_distribution, rate_method=rate_method,
+            on_chunk=writer.write
+        )
+    if result.get("status") != "error":
+        result["data"]["rows_written"] = writer.rows_written
+    return result
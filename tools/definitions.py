@@ -36,9 +36,72 @@ TOOL_DEFINITIONS = [
                     "return_curve": {
                         "type": "boolean",
                         "description": "Whether to return full curve data. Default false."
+                    },
+                    "vehicle_types": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Several vehicle types to compare in one call (e.g., ['小汽车', '公交车']). Use instead of vehicle_type for comparisons."
+                    },
+                    "model_years": {
+                        "type": "array",
+                        "items": {"type": "integer"},
+                        "description": "Several model years to compare in one call (e.g., [2010, 2015, 2020]). Use instead of model_year for comparisons."
+                    },
+                    "seasons": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Several seasons to compare in one call (e.g., ['夏季', '冬季'])."
+                    },
+                    "road_types": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Several road types to compare in one call (e.g., ['快速路', '地面道路'])."
                     }
                 },
-                "required": ["vehicle_type", "model_year"]
+                "required": []
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "interpolate_emission_factors",
+            "description": "Evaluate emission factors (g/km) at arbitrary speeds and model years by interpolating between the tabulated speed bins and model years. Use for traffic simulation outputs or many (speed, vehicle type, model year) points; file inputs get a result file with one factor column per pollutant.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "file_path": {
+                        "type": "string",
+                        "description": "Path to a CSV/Excel file with a speed column (km/h) and optional vehicle type and model year columns."
+                    },
+                    "points": {
+                        "type": "array",
+                        "items": {"type": "object"},
+                        "description": "Points to evaluate, each with 'speed_kph' and optional 'vehicle_type' and 'model_year'. Use if user provides values directly."
+                    },
+                    "vehicle_type": {
+                        "type": "string",
+                        "description": "Vehicle type for rows without their own. Pass user's original expression."
+                    },
+                    "model_year": {
+                        "type": "integer",
+                        "description": "Model year for rows without their own. Defaults to 2020."
+                    },
+                    "pollutants": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "List of pollutants. Defaults to [CO2, NOx]."
+                    },
+                    "season": {
+                        "type": "string",
+                        "description": "Season (春季/夏季/秋季/冬季). Optional, defaults to summer."
+                    },
+                    "road_type": {
+                        "type": "string",
+                        "description": "Road type (快速路/地面道路). Optional, defaults to expressway."
+                    }
+                },
+                "required": []
             }
         }
     },
@@ -46,7 +109,7 @@ TOOL_DEFINITIONS = [
         "type": "function",
         "function": {
             "name": "calculate_micro_emission",
-            "description": "Calculate second-by-second emissions from vehicle trajectory data (time + speed). Use file_path for uploaded files.",
+            "description": "Calculate second-by-second emissions from vehicle trajectory data (time + speed). Use file_path for uploaded files. Files with a vehicle id column are computed per vehicle in one batch, returning per-vehicle summaries and a fleet total.",
             "parameters": {
                 "type": "object",
                 "properties": {
@@ -61,7 +124,7 @@ TOOL_DEFINITIONS = [
                     },
                     "vehicle_type": {
                         "type": "string",
-                        "description": "Vehicle type. Pass user's original expression. REQUIRED."
+                        "description": "Vehicle type. Pass user's original expression. REQUIRED. For multi-vehicle files, used for rows without their own vehicle type column value."
                     },
                     "pollutants": {
                         "type": "array",
@@ -75,6 +138,10 @@ TOOL_DEFINITIONS = [
                     "season": {
                         "type": "string",
                         "description": "Season. Optional."
+                    },
+                    "summary_only": {
+                        "type": "boolean",
+                        "description": "Set true when only totals are needed (e.g. 'total NOx for this trip'). Returns total emissions and the opMode distribution without per-second results or result files. Defaults to false."
                     }
                 },
                 "required": ["vehicle_type"]
@@ -96,7 +163,7 @@ TOOL_DEFINITIONS = [
                     "links_data": {
                         "type": "array",
                         "items": {"type": "object"},
-                        "description": "Road link data array. Each link should have 'link_length_km', 'traffic_flow_vph', 'avg_speed_kph'. Use this if user provides data directly."
+                        "description": "Road link data array. Each link should have 'link_length_km', 'traffic_flow_vph', 'avg_speed_kph', and may have 'geometry' (WKT LINESTRING or [[x, y], ...]) and 'zone'. Use this if user provides data directly."
                     },
                     "pollutants": {
                         "type": "array",
@@ -107,10 +174,28 @@ TOOL_DEFINITIONS = [
                         "type": "object",
                         "description": "Fleet composition (vehicle type percentages). Optional, uses default if not provided."
                     },
+                    "grid_cell_size": {
+                        "type": "number",
+                        "description": "Grid cell size for the gridded emission inventory built when links have geometry (metres for projected coordinates, degrees for lon/lat). Optional, defaults to 1000 m / 0.01 degree."
+                    },
+                    "coordinates": {
+                        "type": "string",
+                        "enum": ["geographic", "projected"],
+                        "description": "Coordinate system of the link geometries: 'geographic' for lon/lat degrees, 'projected' for metres or other planar/local coordinates. Pass it when the user or the file states it; if omitted it is guessed from the coordinate range."
+                    },
                     "model_year": {
                         "type": "integer",
                         "description": "Vehicle model year."
                     },
+                    "model_year_distribution": {
+                        "type": "object",
+                        "description": "Fleet age mix as model year shares, e.g. {\"2015\": 30, \"2020\": 70} for all vehicles or {\"Passenger Car\": {\"2015\": 30, \"2020\": 70}} per vehicle type. Optional, overrides model_year for the listed vehicles."
+                    },
+                    "link_updates": {
+                        "type": "array",
+                        "items": {"type": "object"},
+                        "description": "Edits to links of the previous macro result in this conversation, e.g. [{\"link_id\": \"L3\", \"traffic_flow_vph\": 1200}]. Each item needs link_id plus the fields to change (traffic_flow_vph, avg_speed_kph, link_length_km, fleet_mix). Only those links are recalculated; do not pass file_path or links_data with it."
+                    },
                     "season": {
                         "type": "string",
                         "description": "Season. Optional."
@@ -120,6 +205,64 @@ TOOL_DEFINITIONS = [
             }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "compare_macro_scenarios",
+            "description": "Compare road network emissions between the base case and several scenarios (fleet electrification, speed changes, speed limits, flow changes) in one call. Use for what-if questions instead of calling calculate_macro_emission repeatedly.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "file_path": {
+                        "type": "string",
+                        "description": "Path to road link data file."
+                    },
+                    "links_data": {
+                        "type": "array",
+                        "items": {"type": "object"},
+                        "description": "Road link data array, as in calculate_macro_emission."
+                    },
+                    "scenarios": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "name": {"type": "string", "description": "Scenario label, e.g. '30% electric buses'."},
+                                "flow_scale": {"type": "number", "description": "Multiply all link flows, e.g. 0.9 for -10%."},
+                                "speed_scale": {"type": "number", "description": "Multiply all link speeds."},
+                                "speed_change_kph": {"type": "number", "description": "Add to all link speeds (km/h, may be negative)."},
+                                "speed_limit_kph": {"type": "number", "description": "Cap link speeds at this value (km/h)."},
+                                "electrify": {"type": "object", "description": "Percent of each vehicle type switched to zero-tailpipe electric, e.g. {\"Transit Bus\": 30}."}
+                            }
+                        },
+                        "description": "Scenarios to compare against the base case. Each applies its perturbations to every link."
+                    },
+                    "pollutants": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "List of pollutants to calculate."
+                    },
+                    "fleet_mix": {
+                        "type": "object",
+                        "description": "Fleet composition (vehicle type percentages). Optional, uses default if not provided."
+                    },
+                    "model_year": {
+                        "type": "integer",
+                        "description": "Vehicle model year."
+                    },
+                    "model_year_distribution": {
+                        "type": "object",
+                        "description": "Fleet age mix as model year shares, as in calculate_macro_emission. Optional."
+                    },
+                    "season": {
+                        "type": "string",
+                        "description": "Season. Optional."
+                    }
+                },
+                "required": ["scenarios"]
+            }
+        }
+    },
     {
         "type": "function",
         "function": {
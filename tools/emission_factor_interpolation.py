@@ -0,0 +1,309 @@
+"""
+Emission Factor Interpolation Tool
+
+Evaluates emission factors (g/km) at arbitrary speeds and model years, e.g. for
+every row of a traffic simulation export, by interpolating between the MOVES
+speed bins and model years. Standardization is handled by the executor layer.
+"""
+from typing import Dict, List, Optional
+from pathlib import Path
+from datetime import datetime
+import logging
+import numpy as np
+import pandas as pd
+from .base import BaseTool, ToolResult
+from calculators.emission_factors import EmissionFactorCalculator
+
+logger = logging.getLogger(__name__)
+
+
+class EmissionFactorInterpolationTool(BaseTool):
+    """Interpolate emission factors at arbitrary (speed, vehicle type, model year) points"""
+
+    # Input column aliases (matched case-insensitively after stripping)
+    SPEED_COLUMNS = ["speed_kph", "speed", "avg_speed_kph", "speed_kmh", "速度", "车速", "平均速度", "速度(km/h)"]
+    # No generic "vehicle" alias: simulation exports use it for vehicle IDs
+    VEHICLE_COLUMNS = ["vehicle_type", "source_type", "sourcetypeid", "车型", "车辆类型"]
+    MODEL_YEAR_COLUMNS = ["model_year", "modelyear", "modelyearid", "year", "年份", "车型年份"]
+
+    # Rows shown in the preview table / returned inline for points input
+    PREVIEW_ROWS = 10
+    MAX_INLINE_POINTS = 1000
+
+    def __init__(self):
+        self._calculator = EmissionFactorCalculator()
+
+    @property
+    def name(self) -> str:
+        return "interpolate_emission_factors"
+
+    @property
+    def description(self) -> str:
+        return "Interpolate emission factors at arbitrary speeds and model years"
+
+    async def execute(self, **kwargs) -> ToolResult:
+        """
+        Execute emission factor interpolation
+
+        Parameters (already standardized by executor):
+            file_path: str (optional) - CSV/Excel file with a speed column (km/h) and
+                optional vehicle type / model year columns
+            points: List[Dict] (optional) - Points with speed_kph and optional
+                vehicle_type / model_year
+            vehicle_type: str (optional) - Vehicle type for rows without their own
+            model_year: int (optional) - Model year for rows without their own (default: 2020)
+            pollutants: List[str] (optional) - Pollutants (default: ["CO2", "NOx"])
+            season: str (optional) - Season (default: "夏季")
+            road_type: str (optional) - Road type (default: "快速路")
+        """
+        try:
+            input_file = kwargs.get("input_file") or kwargs.get("file_path")
+            points = kwargs.get("points")
+            vehicle_type = kwargs.get("vehicle_type")
+            model_year = kwargs.get("model_year", 2020)
+            pollutants = kwargs.get("pollutants") or ["CO2", "NOx"]
+            season = kwargs.get("season", "夏季")
+            road_type = kwargs.get("road_type", "快速路")
+
+            # 1. Load points as a frame
+            if input_file:
+                frame, read_error = self._read_points_file(input_file)
+            elif points:
+                if not isinstance(points, list) or not all(isinstance(p, dict) for p in points):
+                    return ToolResult(success=False, error="points must be a list of objects", data=None)
+                frame, read_error = pd.DataFrame(points), None
+            else:
+                return ToolResult(
+                    success=False,
+                    error="Missing required parameter: file_path or points",
+                    data=None
+                )
+            if read_error:
+                return ToolResult(success=False, error=read_error, data={"input_file": input_file})
+
+            # 2. Resolve speed / vehicle type / model year columns
+            columns = self._resolve_columns(frame)
+            if columns["speed"] is None:
+                return ToolResult(
+                    success=False,
+                    error=f"No speed column found. Expected one of: {', '.join(self.SPEED_COLUMNS)}",
+                    data={"columns": [str(c) for c in frame.columns]}
+                )
+            if columns["vehicle_type"] is None and not vehicle_type:
+                return ToolResult(
+                    success=False,
+                    error="Missing required parameter: vehicle_type (the input has no vehicle type column)",
+                    data={"columns": [str(c) for c in frame.columns]}
+                )
+
+            speeds = pd.to_numeric(frame[columns["speed"]], errors="coerce").to_numpy(dtype=np.float64)
+            source_types, unrecognized, type_error = self._resolve_source_types(
+                frame, columns["vehicle_type"], vehicle_type
+            )
+            if type_error:
+                return ToolResult(success=False, error=type_error, data={"columns_used": columns})
+            if columns["model_year"] is not None:
+                model_years = pd.to_numeric(frame[columns["model_year"]], errors="coerce").fillna(model_year)
+                model_years = model_years.to_numpy(dtype=np.float64)
+            else:
+                model_years = np.full(len(frame), float(model_year))
+
+            # 3. Interpolate all points at once
+            result = self._calculator.interpolate(
+                speeds_kph=speeds,
+                source_types=source_types,
+                model_years=model_years,
+                pollutants=pollutants,
+                season=season,
+                road_type=road_type
+            )
+            if result.get("status") == "error":
+                return ToolResult(success=False, error=result.get("error"), data=None)
+
+            rates = result["data"]["emission_rate_g_per_km"]
+            rate_columns = {pollutant: f"{pollutant}_g_per_km" for pollutant in pollutants}
+            for pollutant, values in rates.items():
+                frame[rate_columns[pollutant]] = np.round(values, 6)
+
+            data = {
+                "query_info": {
+                    "points": len(frame),
+                    "pollutants": pollutants,
+                    "season": season,
+                    "road_type": road_type,
+                    "vehicle_type": vehicle_type,
+                    "model_year": model_year,
+                    "columns_used": columns,
+                },
+                "statistics_g_per_km": self._statistics(rates),
+                "unmatched_points": result["data"]["unmatched_points"],
+                "unrecognized_vehicle_types": unrecognized,
+                "unit": "g/km",
+            }
+
+            # 4. Results: result file for file input, inline values for small point lists
+            if input_file:
+                data["download_file"] = self._write_results(frame, input_file)
+            elif len(frame) <= self.MAX_INLINE_POINTS:
+                data["results"] = frame.replace({np.nan: None}).to_dict(orient="records")
+
+            return ToolResult(
+                success=True,
+                error=None,
+                data=data,
+                summary=self._build_summary(data),
+                table_data=self._build_table(frame, columns, rate_columns)
+            )
+
+        except Exception as e:
+            logger.exception("Emission factor interpolation failed")
+            return ToolResult(
+                success=False,
+                error=f"Emission factor interpolation failed: {str(e)}",
+                data=None
+            )
+
+    @staticmethod
+    def _read_points_file(input_file: str):
+        """Read a CSV/Excel points file; returns (frame, error)"""
+        path = Path(input_file)
+        if not path.exists():
+            return None, f"File not found: {input_file}"
+        suffix = path.suffix.lower()
+        if suffix == ".csv":
+            frame = pd.read_csv(path)
+        elif suffix in (".xlsx", ".xls"):
+            frame = pd.read_excel(path)
+        else:
+            return None, f"Unsupported file format: {path.suffix}. Supported: .csv, .xlsx, .xls"
+        if frame.empty:
+            return None, "File is empty"
+        frame.columns = [str(c).strip() for c in frame.columns]
+        return frame, None
+
+    def _resolve_columns(self, frame: pd.DataFrame) -> Dict[str, Optional[str]]:
+        """Find the speed / vehicle type / model year columns by alias"""
+        lowered = {str(c).strip().lower(): c for c in frame.columns}
+
+        def find(aliases: List[str]) -> Optional[str]:
+            for alias in aliases:
+                if alias.lower() in lowered:
+                    return lowered[alias.lower()]
+            return None
+
+        return {
+            "speed": find(self.SPEED_COLUMNS),
+            "vehicle_type": find(self.VEHICLE_COLUMNS),
+            "model_year": find(self.MODEL_YEAR_COLUMNS),
+        }
+
+    def _resolve_source_types(self, frame: pd.DataFrame, column: Optional[str],
+                              default_vehicle: Optional[str]) -> tuple:
+        """
+        MOVES source type ID per row (-1 when unknown); returns (ids, unrecognized names, error)
+
+        Numeric columns are accepted only if every value is a valid MOVES source type
+        ID; names are standardized once per distinct value. Empty cells use the
+        default vehicle type.
+        """
+        default_id = self._calculator.VEHICLE_TO_SOURCE_TYPE.get(default_vehicle, -1) if default_vehicle else -1
+        if column is None:
+            return np.full(len(frame), default_id, dtype=np.int64), [], None
+
+        values = frame[column]
+        if pd.api.types.is_numeric_dtype(values):
+            valid_ids = set(self._calculator.VEHICLE_TO_SOURCE_TYPE.values())
+            invalid = sorted({v for v in values.dropna().unique() if v not in valid_ids})
+            if invalid:
+                return None, [], (
+                    f"Column '{column}' is numeric but contains values that are not MOVES source type IDs "
+                    f"({', '.join(str(v) for v in invalid[:10])}). Use vehicle type names or valid IDs "
+                    f"({', '.join(str(i) for i in sorted(valid_ids))})."
+                )
+            return values.fillna(default_id).to_numpy(dtype=np.int64), [], None
+
+        from services.standardizer import get_standardizer
+        standardizer = get_standardizer()
+        names = values.astype("string").str.strip()
+        mapping = {}
+        unrecognized = []
+        for raw_name in names.dropna().unique():
+            std_name = standardizer.standardize_vehicle(raw_name)
+            source_id = self._calculator.VEHICLE_TO_SOURCE_TYPE.get(std_name, -1) if std_name else -1
+            mapping[raw_name] = source_id
+            if source_id < 0:
+                unrecognized.append(raw_name)
+        source_types = names.map(mapping).fillna(default_id).to_numpy(dtype=np.int64)
+        return source_types, sorted(unrecognized), None
+
+    @staticmethod
+    def _statistics(rates: Dict[str, np.ndarray]) -> Dict[str, Dict]:
+        """Mean / min / max of the interpolated factors (points without a curve excluded)"""
+        stats = {}
+        for pollutant, values in rates.items():
+            valid = values[~np.isnan(values)]
+            stats[pollutant] = {
+                "mean": round(float(valid.mean()), 4),
+                "min": round(float(valid.min()), 4),
+                "max": round(float(valid.max()), 4),
+            } if len(valid) else {"mean": None, "min": None, "max": None}
+        return stats
+
+    @staticmethod
+    def _write_results(frame: pd.DataFrame, input_file: str) -> Dict:
+        """Write the input rows with factor columns appended (CSV, any size)"""
+        from config import get_config
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_filename = f"{Path(input_file).stem}_emission_factors_{timestamp}.csv"
+        output_path = str(Path(get_config().outputs_dir) / output_filename)
+        frame.to_csv(output_path, index=False, encoding="utf-8-sig")
+        return {"path": output_path, "filename": output_filename}
+
+    def _build_table(self, frame: pd.DataFrame, columns: Dict[str, Optional[str]],
+                     rate_columns: Dict[str, str]) -> Dict:
+        """First rows in the frontend table format"""
+        input_columns = [c for c in (columns["speed"], columns["vehicle_type"], columns["model_year"]) if c]
+        preview = frame[input_columns + list(rate_columns.values())].head(self.PREVIEW_ROWS)
+        table_columns = [str(c) for c in input_columns] + [f"{p} (g/km)" for p in rate_columns]
+        preview.columns = table_columns
+
+        rows = []
+        for record in preview.to_dict(orient="records"):
+            rows.append({
+                key: ("-" if pd.isna(value) else f"{value:.4f}" if key.endswith("(g/km)") else str(value))
+                for key, value in record.items()
+            })
+        return {
+            "type": "interpolate_emission_factors",
+            "columns": table_columns,
+            "preview_rows": rows,
+            "total_rows": len(frame),
+            "total_columns": len(table_columns),
+        }
+
+    @staticmethod
+    def _build_summary(data: Dict) -> str:
+        """Text summary shown to the user"""
+        info = data["query_info"]
+        lines = [
+            f"已完成 {info['points']} 个点的排放因子插值",
+            f"**计算参数:**",
+            f"  - 季节: {info['season']}，道路类型: {info['road_type']}",
+            f"  - 污染物: {', '.join(info['pollutants'])}",
+            "**排放因子 (g/km):**",
+        ]
+        for pollutant, stats in data["statistics_g_per_km"].items():
+            if stats["mean"] is None:
+                lines.append(f"  - {pollutant}: 无可用数据")
+            else:
+                lines.append(
+                    f"  - {pollutant}: 平均 {stats['mean']:.4f}，范围 {stats['min']:.4f} ~ {stats['max']:.4f}"
+                )
+        unmatched = max(data["unmatched_points"].values(), default=0)
+        if unmatched:
+            lines.append(f"⚠️ {unmatched} 个点缺少车型或速度数据，未能插值")
+        if data["unrecognized_vehicle_types"]:
+            lines.append(f"⚠️ 无法识别的车型: {', '.join(data['unrecognized_vehicle_types'][:10])}")
+        if data.get("download_file"):
+            lines.append(f"结果文件: {data['download_file']['filename']}")
+        return "\n".join(lines)
@@ -13,6 +13,9 @@ from calculators.emission_factors import EmissionFactorCalculator
 class EmissionFactorsTool(BaseTool):
     """Query emission factors from MOVES database"""
 
+    # List parameters that switch to a batched comparison query
+    BATCH_PARAMS = ("vehicle_types", "model_years", "seasons", "road_types")
+
     def __init__(self):
         self._calculator = EmissionFactorCalculator()
 
@@ -36,6 +39,9 @@ class EmissionFactorsTool(BaseTool):
             season: str (optional) - Season (default: "夏季")
             road_type: str (optional) - Road type (default: "快速路")
             return_curve: bool (optional) - Return full speed-emission curve (default: False)
+            vehicle_types / model_years / seasons / road_types: List (optional) - Compare several
+                values in one batched query (see _execute_batch); the singular parameters
+                are used for dimensions without a list
         """
         try:
             # 1. Extract parameters
@@ -58,6 +64,9 @@ class EmissionFactorsTool(BaseTool):
                     data=None
                 )
 
+            if any(kwargs.get(key) for key in self.BATCH_PARAMS):
+                return self._execute_batch(kwargs, pollutants_list, return_curve)
+
             # 3. Validate required parameters
             if not vehicle_type or not model_year:
                 missing = []
@@ -139,3 +148,96 @@ class EmissionFactorsTool(BaseTool):
                 data=None
             )
 
+    def _execute_batch(self, kwargs: Dict, pollutants: List[str], return_curve: bool) -> ToolResult:
+        """
+        Batched comparison query: every combination of vehicle types, pollutants,
+        model years, seasons and road types is read in one pass over the curve index
+        and aligned to a common speed axis.
+        """
+        vehicle_types = kwargs.get("vehicle_types") or [kwargs.get("vehicle_type")]
+        model_years = kwargs.get("model_years") or [kwargs.get("model_year")]
+        seasons = kwargs.get("seasons") or [kwargs.get("season", "夏季")]
+        road_types = kwargs.get("road_types") or [kwargs.get("road_type", "快速路")]
+
+        missing = []
+        if not all(vehicle_types):
+            missing.append("vehicle_type or vehicle_types")
+        if not all(model_years):
+            missing.append("model_year or model_years")
+        if missing:
+            return ToolResult(
+                success=False,
+                error=f"Missing required parameters: {', '.join(missing)}",
+                data=None
+            )
+        try:
+            model_years = [int(year) for year in model_years]
+        except (TypeError, ValueError):
+            return ToolResult(
+                success=False,
+                error=f"Invalid model_years: {model_years}",
+                data=None
+            )
+
+        result = self._calculator.query_batch(
+            vehicle_types=vehicle_types,
+            pollutants=pollutants,
+            model_years=model_years,
+            seasons=seasons,
+            road_types=road_types,
+            return_curve=return_curve
+        )
+        if result.get("status") == "error":
+            return ToolResult(
+                success=False,
+                error=result.get("error"),
+                data=result.get("debug")
+            )
+
+        data = result["data"]
+        dims = data["dimensions"]
+        summary = (
+            f"Compared {len(data['series'])} emission factor curves "
+            f"({len(dims['vehicle_types'])} vehicle types x {len(dims['pollutants'])} pollutants x "
+            f"{len(dims['model_years'])} model years x {len(dims['seasons'])} seasons x "
+            f"{len(dims['road_types'])} road types). Unit: {data['unit']}."
+        )
+        if data["missing"]:
+            summary += f" {len(data['missing'])} combinations have no data."
+
+        return ToolResult(
+            success=True,
+            error=None,
+            data=data,
+            summary=summary,
+            table_data=self._build_batch_table(data)
+        )
+
+    def _build_batch_table(self, data: Dict) -> Dict:
+        """Typical values of every curve in the frontend table format"""
+        key_columns = ["车型", "污染物", "年份", "季节", "道路类型"]
+        speed_columns = []
+        if data["series"]:
+            speed_columns = [
+                f"{tv['speed_kph']} km/h ({data['unit']})" for tv in data["series"][0]["typical_values"]
+            ]
+
+        rows = []
+        for series in data["series"]:
+            row = dict(zip(key_columns, (
+                series["vehicle_type"], series["pollutant"], str(series["model_year"]),
+                series["season"], series["road_type"]
+            )))
+            for column, tv in zip(speed_columns, series["typical_values"]):
+                row[column] = f"{tv['emission_rate']:.4f}"
+            rows.append(row)
+
+        columns = key_columns + speed_columns
+        return {
+            "type": "query_emission_factors",
+            "columns": columns,
+            "preview_rows": rows,
+            "total_rows": len(rows),
+            "total_columns": len(columns),
+        }
+
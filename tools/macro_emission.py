@@ -4,13 +4,18 @@ Macro Emission Calculation Tool
 Simplified tool for calculating road link-level emissions using MOVES-Matrix method.
 Standardization is handled by the executor layer.
 """
-from typing import Dict, Optional, List
+from typing import Any, Callable, ContextManager, Dict, Optional, List
 from pathlib import Path
+from datetime import datetime
+import contextlib
 import logging
+import numpy as np
+import pandas as pd
 from .base import BaseTool, ToolResult
 from .formatter import format_emission_multi_unit, calculate_stats, build_emission_table_summary
 from calculators.macro_emission import MacroEmissionCalculator
-from skills.macro_emission.excel_handler import ExcelHandler
+from calculators.spatial_grid import SpatialAggregator
+from skills.macro_emission.excel_handler import ExcelHandler, ResultChunkWriter, parquet_available
 
 logger = logging.getLogger(__name__)
 
@@ -18,17 +23,32 @@ logger = logging.getLogger(__name__)
 class MacroEmissionTool(BaseTool):
     """Calculate macro-scale emissions for road links"""
 
-    def __init__(self):
+    def __init__(self, llm_column_mapping: bool = True):
+        """
+        Args:
+            llm_column_mapping: Let the LLM map unrecognized input columns (False keeps
+                file reading LLM-free, e.g. for the bulk API)
+        """
         self._calculator = MacroEmissionCalculator()
         # Excel handler for file I/O
-        try:
-            from llm.client import get_llm
-            llm_client = get_llm("agent")
-            self._excel_handler = ExcelHandler(llm_client=llm_client)
-            logger.info("[MacroEmission] Intelligent column mapping enabled")
-        except Exception as e:
-            logger.warning(f"[MacroEmission] Using hardcoded mapping: {e}")
+        if not llm_column_mapping:
             self._excel_handler = ExcelHandler(llm_client=None)
+        else:
+            try:
+                from llm.client import get_llm
+                llm_client = get_llm("agent")
+                self._excel_handler = ExcelHandler(llm_client=llm_client)
+                logger.info("[MacroEmission] Intelligent column mapping enabled")
+            except Exception as e:
+                logger.warning(f"[MacroEmission] Using hardcoded mapping: {e}")
+                self._excel_handler = ExcelHandler(llm_client=None)
+        # Optional stage hook (stage name -> context manager) wrapped around each step of
+        # execute: read, fleet_fill, calculate / calculate_stream, excel_write, spatial, summary
+        self.stage_hook: Optional[Callable[[str], ContextManager]] = None
+
+    def _stage(self, name: str) -> ContextManager:
+        """Context for one execute step (no-op unless stage_hook is set)"""
+        return self.stage_hook(name) if self.stage_hook else contextlib.nullcontext()
 
     @property
     def name(self) -> str:
@@ -38,33 +58,46 @@ class MacroEmissionTool(BaseTool):
     def description(self) -> str:
         return "Calculate road link-level emissions using MOVES-Matrix method"
 
+    def wants_session_state(self, arguments: Dict[str, Any]) -> bool:
+        """link_updates calls patch the previous result of this session"""
+        return bool(arguments.get("link_updates"))
+
+    # Field name mapping: correct_name -> possible_wrong_names
+    FIELD_ALIASES = {
+        "link_length_km": ["length", "link_length", "length_km", "road_length"],
+        "traffic_flow_vph": ["traffic_volume_veh_h", "traffic_flow", "flow", "volume", "traffic_volume"],
+        "avg_speed_kph": ["avg_speed_kmh", "speed", "avg_speed", "average_speed"],
+        "fleet_mix": ["vehicle_composition", "vehicle_mix", "composition", "fleet_composition"],
+        "model_year_distribution": ["age_distribution", "age_mix", "model_year_mix"],
+        "link_id": ["id", "road_id", "segment_id"],
+        "geometry": ["geom", "wkt", "coordinates"],
+        "zone": ["zone_id", "district", "taz"]
+    }
+
     def _fix_common_errors(self, links_data: List[Dict]) -> List[Dict]:
-        """Auto-fix common parameter errors"""
+        """Auto-fix common parameter errors (the field mapping is resolved once per distinct key set)"""
         fixed_links = []
+        plans: Dict[tuple, List[tuple]] = {}
 
         for link in links_data:
-            fixed_link = {}
-
-            # Field name mapping: correct_name -> possible_wrong_names
-            field_mapping = {
-                "link_length_km": ["length", "link_length", "length_km", "road_length"],
-                "traffic_flow_vph": ["traffic_volume_veh_h", "traffic_flow", "flow", "volume", "traffic_volume"],
-                "avg_speed_kph": ["avg_speed_kmh", "speed", "avg_speed", "average_speed"],
-                "fleet_mix": ["vehicle_composition", "vehicle_mix", "composition", "fleet_composition"],
-                "link_id": ["id", "road_id", "segment_id"]
-            }
-
-            for correct_name, possible_names in field_mapping.items():
-                # Check correct name first
-                if correct_name in link:
-                    fixed_link[correct_name] = link[correct_name]
-                else:
-                    # Check possible wrong names
-                    for wrong_name in possible_names:
-                        if wrong_name in link:
-                            fixed_link[correct_name] = link[wrong_name]
-                            logger.info(f"Auto-fixed field name: {wrong_name} -> {correct_name}")
-                            break
+            keys = tuple(link)
+            plan = plans.get(keys)
+            if plan is None:
+                plan = []
+                for correct_name, possible_names in self.FIELD_ALIASES.items():
+                    # Check correct name first
+                    if correct_name in link:
+                        plan.append((correct_name, correct_name))
+                    else:
+                        # Check possible wrong names
+                        for wrong_name in possible_names:
+                            if wrong_name in link:
+                                plan.append((correct_name, wrong_name))
+                                logger.info(f"Auto-fixed field name: {wrong_name} -> {correct_name}")
+                                break
+                plans[keys] = plan
+
+            fixed_link = {correct_name: link[source] for correct_name, source in plan}
 
             # Fix fleet_mix format (convert array to object if needed)
             if "fleet_mix" in fixed_link:
@@ -86,13 +119,26 @@ class MacroEmissionTool(BaseTool):
 
         return fixed_links
 
-    def _standardize_fleet_mix(self, fleet_mix: Optional[Dict]) -> Optional[Dict]:
+    def _vehicle_resolver(self):
+        """Memoized vehicle name standardization (each distinct name hits the standardizer once)"""
+        from services.standardizer import get_standardizer
+        standardizer = get_standardizer()
+        cache: Dict[str, Optional[str]] = {}
+
+        def resolve(raw_name: Any) -> Optional[str]:
+            key = str(raw_name)
+            if key not in cache:
+                cache[key] = standardizer.standardize_vehicle(key)
+            return cache[key]
+
+        return resolve
+
+    def _standardize_fleet_mix(self, fleet_mix: Optional[Dict], resolve=None) -> Optional[Dict]:
         """Standardize fleet mix using centralized standardizer."""
         if not fleet_mix or not isinstance(fleet_mix, dict):
             return None
 
-        from services.standardizer import get_standardizer
-        standardizer = get_standardizer()
+        resolve = resolve or self._vehicle_resolver()
         supported = set(self._calculator.VEHICLE_TO_SOURCE_TYPE.keys())
 
         result = {}
@@ -103,7 +149,7 @@ class MacroEmissionTool(BaseTool):
                 continue
             if pct <= 0:
                 continue
-            std_name = standardizer.standardize_vehicle(str(raw_name))
+            std_name = resolve(raw_name)
             if std_name and std_name in supported:
                 result[std_name] = result.get(std_name, 0) + pct
             else:
@@ -111,77 +157,215 @@ class MacroEmissionTool(BaseTool):
 
         return result if result else None
 
-    def _apply_global_fleet_mix(self, links_data: List[Dict], global_fleet_mix: Optional[Dict]) -> List[Dict]:
+    def _standardize_model_year_distribution(self, distribution: Optional[Dict], resolve=None) -> Optional[Dict]:
+        """Standardize vehicle names in a model year distribution ({year: share} applies to all vehicles)."""
+        if not distribution or not isinstance(distribution, dict):
+            return None
+        if not any(isinstance(shares, dict) for shares in distribution.values()):
+            return distribution
+
+        resolve = resolve or self._vehicle_resolver()
+        supported = set(self._calculator.VEHICLE_TO_SOURCE_TYPE.keys())
+
+        result = {}
+        for raw_name, shares in distribution.items():
+            std_name = resolve(raw_name)
+            if std_name and std_name in supported:
+                result[std_name] = shares
+            else:
+                logger.warning(f"Unsupported vehicle in model_year_distribution: {raw_name}")
+
+        return result if result else None
+
+    @staticmethod
+    def _parse_shares(values: List[Any]) -> np.ndarray:
+        """Fleet shares as float64 (same parsing as float(); NaN where it fails)"""
+        try:
+            return np.array(values, dtype=np.float64).reshape(len(values))
+        except (TypeError, ValueError):
+            shares = np.full(len(values), np.nan)
+            for i, value in enumerate(values):
+                try:
+                    shares[i] = float(value)
+                except Exception:
+                    continue
+            return shares
+
+    def _standardize_link_fleet_mixes(self, links_data: List[Dict], global_fleet_mix: Optional[Dict],
+                                      fallback_fleet_mix: Dict, resolve) -> Dict:
         """
-        Apply top-level fleet mix to each link when link-level fleet_mix is missing.
-        This fixes cases where LLM passes `fleet_mix` at top-level instead of per-link.
+        Standardize link-level fleet mixes in one columnar pass and fill the missing ones
+
+        All (link, vehicle, share) entries form a sparse share matrix: distinct vehicle
+        names are resolved once, unparsable / non-positive shares and unsupported vehicles
+        are masked out and duplicate vehicles of a link are summed with bincount (same
+        result as _standardize_fleet_mix per link). Links without a valid mix get the
+        top-level fleet_mix (this fixes cases where the LLM passes `fleet_mix` at top-level
+        instead of per-link), the rest of the invalid ones the fallback mix.
+        Links are updated in place.
+
+        Returns:
+            links_data and fill metadata for transparency/output export
         """
-        standardized_global = self._standardize_fleet_mix(global_fleet_mix)
-
-        updated_links = []
-        applied_count = 0
-        standardized_count = 0
-        for link in links_data:
-            new_link = dict(link)
-            link_mix = self._standardize_fleet_mix(new_link.get("fleet_mix"))
-            if link_mix:
-                # Always normalize link-level fleet mix when present.
-                new_link["fleet_mix"] = link_mix
-                standardized_count += 1
-            elif standardized_global:
-                # Fallback to global fleet mix for links without valid link-level mix.
-                new_link["fleet_mix"] = dict(standardized_global)
-                applied_count += 1
-            updated_links.append(new_link)
-
-        if applied_count > 0:
-            logger.info(f"[MacroEmission] Applied global fleet_mix to {applied_count} links")
-        if standardized_count > 0:
-            logger.info(f"[MacroEmission] Standardized link-level fleet_mix for {standardized_count} links")
-
-        return updated_links
+        n_links = len(links_data)
+        entry_links: List[int] = []
+        entry_names: List[int] = []
+        entry_values: List[Any] = []
+        name_codes: Dict[Any, int] = {}
+        for i, link in enumerate(links_data):
+            fleet_mix = link.get("fleet_mix")
+            if isinstance(fleet_mix, dict):
+                for raw_name, raw_pct in fleet_mix.items():
+                    entry_links.append(i)
+                    entry_names.append(name_codes.setdefault(raw_name, len(name_codes)))
+                    entry_values.append(raw_pct)
+
+        entry_links = np.array(entry_links, dtype=np.int64)
+        entry_names = np.array(entry_names, dtype=np.int64)
+        shares = self._parse_shares(entry_values)
+        positive = shares > 0
+
+        # Resolve each distinct raw name once; -1 marks unsupported vehicles
+        supported = self._calculator.VEHICLE_TO_SOURCE_TYPE
+        raw_names = list(name_codes)
+        std_names = [resolve(raw_name) for raw_name in raw_names]
+        vehicle_columns = list(dict.fromkeys(name for name in std_names if name and name in supported))
+        column_of = {name: j for j, name in enumerate(vehicle_columns)}
+        name_to_column = np.array([column_of.get(name, -1) for name in std_names], dtype=np.int64)
+
+        entry_columns = name_to_column[entry_names] if len(entry_names) else entry_names
+        unsupported = positive & (entry_columns < 0)
+        if unsupported.any():
+            counts = np.bincount(entry_names[unsupported], minlength=len(raw_names))
+            for code in np.flatnonzero(counts):
+                logger.warning(f"Unsupported vehicle in fleet_mix: {raw_names[code]} ({counts[code]} links)")
 
-    def _fill_missing_link_fleet_mix(
-        self,
-        links_data: List[Dict],
-        fallback_fleet_mix: Dict,
-    ) -> Dict:
-        """
-        Fill links that still miss fleet_mix after all standardization.
-        Returns updated links and fill metadata for transparency/output export.
-        """
+        # Sum shares per (link, vehicle); keep each link's vehicles in order of first appearance
+        valid = positive & (entry_columns >= 0)
+        keys = entry_links[valid] * max(len(vehicle_columns), 1) + entry_columns[valid]
+        cell_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        cell_shares = np.bincount(inverse.reshape(-1), weights=shares[valid], minlength=len(cell_keys))
+        order = np.argsort(first, kind="stable")
+        cell_links = (cell_keys // max(len(vehicle_columns), 1))[order]
+        cell_columns = (cell_keys % max(len(vehicle_columns), 1))[order].tolist()
+        cell_shares = cell_shares[order].tolist()
+
+        has_mix = np.zeros(n_links, dtype=bool)
+        starts = np.flatnonzero(np.r_[True, cell_links[1:] != cell_links[:-1]]) if len(cell_links) else cell_links
+        ends = np.r_[starts[1:], len(cell_links)].astype(np.int64)
+        for link_idx, start, end in zip(cell_links[starts].tolist(), starts.tolist(), ends.tolist()):
+            # Always normalize link-level fleet mix when present.
+            links_data[link_idx]["fleet_mix"] = {
+                vehicle_columns[column]: share
+                for column, share in zip(cell_columns[start:end], cell_shares[start:end])
+            }
+            has_mix[link_idx] = True
+
+        # Fallback to global fleet mix for links without valid link-level mix.
+        standardized_global = self._standardize_fleet_mix(global_fleet_mix, resolve)
+        use_global = ~has_mix if standardized_global else np.zeros(n_links, dtype=bool)
+        for link_idx in np.flatnonzero(use_global).tolist():
+            links_data[link_idx]["fleet_mix"] = dict(standardized_global)
+
+        if use_global.any():
+            logger.info(f"[MacroEmission] Applied global fleet_mix to {int(use_global.sum())} links")
+        if has_mix.any():
+            logger.info(f"[MacroEmission] Standardized link-level fleet_mix for {int(has_mix.sum())} links")
+
+        # Links that still miss a fleet_mix (no positive share at all) get the fallback mix
+        raw_has_share = np.bincount(entry_links[positive], minlength=n_links) > 0
+        missing = ~has_mix & ~use_global & ~raw_has_share
         if not fallback_fleet_mix:
-            return {"links_data": links_data, "filled_count": 0, "filled_link_ids": [], "filled_row_indices": []}
-
-        updated_links: List[Dict] = []
-        filled_link_ids: List[str] = []
-        filled_row_indices: List[int] = []
-
-        for idx, link in enumerate(links_data):
-            new_link = dict(link)
-            link_mix = new_link.get("fleet_mix")
-            has_valid_mix = False
-            if isinstance(link_mix, dict):
-                for raw_value in link_mix.values():
-                    try:
-                        if float(raw_value) > 0:
-                            has_valid_mix = True
-                            break
-                    except Exception:
-                        continue
-            if not has_valid_mix:
-                new_link["fleet_mix"] = dict(fallback_fleet_mix)
-                filled_row_indices.append(idx)
-                filled_link_ids.append(str(new_link.get("link_id", f"Link_{idx + 1}")))
-            updated_links.append(new_link)
+            missing[:] = False
+        filled_row_indices = np.flatnonzero(missing).tolist()
+        filled_link_ids = []
+        for idx in filled_row_indices:
+            link = links_data[idx]
+            link["fleet_mix"] = dict(fallback_fleet_mix)
+            filled_link_ids.append(str(link.get("link_id", f"Link_{idx + 1}")))
 
         return {
-            "links_data": updated_links,
+            "links_data": links_data,
             "filled_count": len(filled_row_indices),
             "filled_link_ids": filled_link_ids,
             "filled_row_indices": filled_row_indices,
         }
 
+    def _prepare_links(self, links_data: Optional[List[Dict]], input_file: Optional[str],
+                       global_fleet_mix: Optional[Dict], default_fleet_mix: Optional[Dict]):
+        """
+        Read, validate and normalize links data
+
+        Returns:
+            (prepared, None) with links_data, fill_info and the effective default_fleet_mix,
+            or (None, error ToolResult)
+        """
+        # 2. Get links data (from parameter or file)
+        if input_file:
+            # Read from Excel file
+            with self._stage("read"):
+                success, links_data, read_error = self._excel_handler.read_links_from_excel(input_file)
+            if not success:
+                return None, ToolResult(
+                    success=False,
+                    error=f"Failed to read input file: {read_error}",
+                    data={"input_file": input_file}
+                )
+        elif not links_data:
+            return None, ToolResult(
+                success=False,
+                error="Missing required parameter: links_data or input_file",
+                data=None
+            )
+
+        # 3. Validate links data
+        if not isinstance(links_data, list) or len(links_data) == 0:
+            return None, ToolResult(
+                success=False,
+                error="links_data must be a non-empty list",
+                data=None
+            )
+
+        with self._stage("fleet_fill"):
+            return self._normalize_links(links_data, global_fleet_mix, default_fleet_mix), None
+
+    def _normalize_links(self, links_data: List[Dict], global_fleet_mix: Optional[Dict],
+                         default_fleet_mix: Optional[Dict]) -> Dict:
+        """
+        Fix, standardize and fill links (steps 4-4.3 of _prepare_links)
+
+        Returns:
+            links_data, fill_info and the effective default_fleet_mix
+        """
+        # 4. Auto-fix common errors
+        links_data = self._fix_common_errors(links_data)
+        resolve = self._vehicle_resolver()
+
+        # 4.1 Standardize fleet names in link-level model year distributions
+        for link in links_data:
+            if "model_year_distribution" in link:
+                link["model_year_distribution"] = self._standardize_model_year_distribution(
+                    link["model_year_distribution"], resolve
+                )
+
+        # 4.2 Standardize default_fleet_mix names if provided
+        if default_fleet_mix:
+            default_fleet_mix = self._standardize_fleet_mix(default_fleet_mix, resolve) or default_fleet_mix
+
+        # 4.3 Standardize link fleet mixes (top-level fleet_mix as fallback) and fill the
+        # remaining missing ones explicitly for deterministic behavior
+        effective_default_fleet_mix = default_fleet_mix or dict(self._calculator.DEFAULT_FLEET_MIX)
+        fill_info = self._standardize_link_fleet_mixes(
+            links_data, global_fleet_mix, effective_default_fleet_mix, resolve
+        )
+        links_data = fill_info["links_data"]
+
+        return {
+            "links_data": links_data,
+            "fill_info": fill_info,
+            "default_fleet_mix": effective_default_fleet_mix,
+        }
+
     async def execute(self, **kwargs) -> ToolResult:
         """
         Execute macro emission calculation
@@ -190,12 +374,26 @@ class MacroEmissionTool(BaseTool):
             links_data: List[Dict] - Road link data
             pollutants: List[str] - List of pollutants (default: ["CO2", "NOx"])
             model_year: int - Vehicle model year (default: 2020)
+            model_year_distribution: Dict (optional) - Model year shares, {vehicle: {year: share}}
+                or {year: share} for all vehicles; links may override it per vehicle
+            rate_method: str (optional) - "average" (opMode 300) or "speed_binned" (MOVES opMode mix by
+                link speed; needs the opMode distribution data file, not offered to the LLM)
             season: str - Season (default: "夏季")
             default_fleet_mix: Dict (optional) - Default fleet composition
-            input_file: str (optional) - Path to Excel input file
+            input_file: str (optional) - Path to Excel input file; CSV/Parquet files above
+                MACRO_STREAMING_THRESHOLD_MB are processed in chunks (see _execute_streaming)
             output_file: str (optional) - Path to Excel output file
+            link_updates: List[Dict] (optional) - Edits to links of the previous result in this
+                session ({"link_id": ..., field: new value}); only those links are recalculated
+            grid_cell_size: float (optional) - Cell size of the gridded inventory built for links
+                with geometry (metres, or degrees for lon/lat coordinates)
+            coordinates: str (optional) - Coordinate system of the link geometries, "geographic"
+                (lon/lat) or "projected"; inferred from the coordinate range if omitted
         """
         try:
+            if kwargs.get("link_updates"):
+                return self._execute_link_updates(kwargs["link_updates"], kwargs.get("_session_state"), kwargs)
+
             # 参数名兼容：file_path → input_file
             if "file_path" in kwargs and "input_file" not in kwargs:
                 kwargs["input_file"] = kwargs["file_path"]
@@ -205,60 +403,45 @@ class MacroEmissionTool(BaseTool):
             links_data = kwargs.get("links_data")
             pollutants = kwargs.get("pollutants", ["CO2", "NOx"])
             model_year = kwargs.get("model_year", 2020)
+            model_year_distribution = self._standardize_model_year_distribution(
+                kwargs.get("model_year_distribution")
+            )
             season = kwargs.get("season", "夏季")
+            rate_method = kwargs.get("rate_method") or "average"
             default_fleet_mix = kwargs.get("default_fleet_mix")
             global_fleet_mix = kwargs.get("fleet_mix")
             input_file = kwargs.get("input_file")
             output_file = kwargs.get("output_file")
-
-            # 2. Get links data (from parameter or file)
-            if input_file:
-                # Read from Excel file
-                success, links_data, read_error = self._excel_handler.read_links_from_excel(input_file)
-                if not success:
-                    return ToolResult(
-                        success=False,
-                        error=f"Failed to read input file: {read_error}",
-                        data={"input_file": input_file}
-                    )
-            elif not links_data:
-                return ToolResult(
-                    success=False,
-                    error="Missing required parameter: links_data or input_file",
-                    data=None
+            grid_cell_size = kwargs.get("grid_cell_size")
+            coordinates = kwargs.get("coordinates")
+
+            if input_file and self._should_stream(input_file):
+                # Region-scale link files are processed chunk by chunk with bounded memory
+                return self._execute_streaming(
+                    input_file, pollutants, model_year, model_year_distribution, season,
+                    rate_method, global_fleet_mix, default_fleet_mix, output_file, grid_cell_size, coordinates
                 )
 
-            # 3. Validate links data
-            if not isinstance(links_data, list) or len(links_data) == 0:
-                return ToolResult(
-                    success=False,
-                    error="links_data must be a non-empty list",
-                    data=None
-                )
-
-            # 4. Auto-fix common errors
-            links_data = self._fix_common_errors(links_data)
-
-            # 4.1 Apply top-level fleet_mix and standardize fleet names
-            links_data = self._apply_global_fleet_mix(links_data, global_fleet_mix)
-
-            # 4.2 Standardize default_fleet_mix names if provided
-            if default_fleet_mix:
-                default_fleet_mix = self._standardize_fleet_mix(default_fleet_mix) or default_fleet_mix
-
-            # 4.3 Fill per-link missing fleet_mix explicitly for deterministic behavior
-            effective_default_fleet_mix = default_fleet_mix or dict(self._calculator.DEFAULT_FLEET_MIX)
-            fill_info = self._fill_missing_link_fleet_mix(links_data, effective_default_fleet_mix)
-            links_data = fill_info["links_data"]
+            # 2-4. Get, validate and normalize links data (from parameter or file)
+            prepared, error_result = self._prepare_links(links_data, input_file, global_fleet_mix, default_fleet_mix)
+            if error_result:
+                return error_result
+            links_data = prepared["links_data"]
+            fill_info = prepared["fill_info"]
+            effective_default_fleet_mix = prepared["default_fleet_mix"]
 
             # 5. Execute calculation
-            result = self._calculator.calculate(
-                links_data=links_data,
-                pollutants=pollutants,
-                model_year=model_year,
-                season=season,
-                default_fleet_mix=effective_default_fleet_mix
-            )
+            with self._stage("calculate"):
+                result = self._calculator.calculate(
+                    links_data=links_data,
+                    pollutants=pollutants,
+                    model_year=model_year,
+                    season=season,
+                    default_fleet_mix=effective_default_fleet_mix,
+                    model_year_distribution=model_year_distribution,
+                    rate_method=rate_method,
+                    return_state=True
+                )
 
             # 6. Handle calculation errors
             if result.get("status") == "error":
@@ -310,13 +493,15 @@ class MacroEmissionTool(BaseTool):
 
                     results_data = result["data"].get("results", [])  # 修复：使用 "results" 而不是 "links"
 
-                    success, output_path, filename, error = self._excel_handler.generate_result_excel(
-                        input_file,  # 添加原始文件路径作为第一个参数
-                        results_data,
-                        pollutants,
-                        outputs_dir,
-                        fleet_fill_info=result["data"].get("fleet_mix_fill"),
-                    )
+                    with self._stage("excel_write"):
+                        success, output_path, filename, error = self._excel_handler.generate_result_excel(
+                            input_file,  # 添加原始文件路径作为第一个参数
+                            results_data,
+                            pollutants,
+                            outputs_dir,
+                            fleet_fill_info=result["data"].get("fleet_mix_fill"),
+                            max_excel_rows=config.macro_excel_max_rows,
+                        )
 
                     if success:
                         result["data"]["download_file"] = {
@@ -326,70 +511,33 @@ class MacroEmissionTool(BaseTool):
                 except Exception as e:
                     logger.warning(f"Failed to generate download file: {e}")
 
-            # 9. Return success result
-            # Create enhanced summary with multi-unit formatting
-            links_results = result["data"].get("results", [])
-            summary_data = result["data"].get("summary", {})
-
-            num_links = len(links_results)
-            pollutant_names = ", ".join(pollutants)
-            total_emissions = summary_data.get("total_emissions_kg_per_hr", {})
-
-            # Build enhanced summary with multi-unit display
-            summary_parts = [
-                f"已完成宏观排放计算，共 {num_links} 个路段",
-                f"车型年份: {model_year}，季节: {season}，污染物: {pollutant_names}"
-            ]
-
-            # Total emissions with multi-unit display
-            if total_emissions:
-                summary_parts.append("**总排放量:**")
-                for pollutant, value_kg in total_emissions.items():
-                    # Convert kg to g for formatter
-                    value_g = value_kg * 1000
-                    formatted = format_emission_multi_unit(value_g, "hour")
-                    summary_parts.append(f"  - {pollutant}: {formatted}")
-                if all(float(v) == 0.0 for v in total_emissions.values()):
-                    summary_parts.append("⚠️ 所有污染物结果为 0。请检查车型映射、污染物选择或输入参数是否有效。")
-
-            fill_count = result["data"].get("fleet_mix_fill", {}).get("filled_count", 0)
-            if fill_count > 0:
-                summary_parts.append(f"**缺失车型分布处理:** 已对 {fill_count} 个路段使用默认车队组成填补空白行")
-
-            # Unit emission rates (average across all links)
-            emission_rates = {}
-            for link in links_results:
-                for pol, rate in link.get("emission_rates_g_per_veh_km", {}).items():
-                    if pol not in emission_rates:
-                        emission_rates[pol] = []
-                    emission_rates[pol].append(rate)
-
-            if emission_rates:
-                summary_parts.append("**单位排放率 (平均):**")
-                for pollutant, rates in emission_rates.items():
-                    avg_rate = sum(rates) / len(rates)
-                    summary_parts.append(f"  - {pollutant}: {avg_rate:.2f} g/(veh·km)")
-
-            # Link statistics
-            main_pollutant = pollutants[0] if pollutants else "CO2"
-            link_emissions = [
-                link.get("total_emissions_kg_per_hr", {}).get(main_pollutant, 0)
-                for link in links_results
-            ]
-            stats = calculate_stats(link_emissions)
-            if stats and stats.get("count", 0) > 0:
-                summary_parts.append(f"**路段统计 ({main_pollutant}):**")
-                summary_parts.append(f"  - 单路段平均: {stats['avg']:.2f} kg/h")
-                summary_parts.append(f"  - 单路段最高: {stats['max']:.2f} kg/h")
-                summary_parts.append(f"  - 单路段最低: {stats['min']:.2f} kg/h")
-
-            summary = "\n".join(summary_parts)
-
+            # 8.1 Gridded inventory and zone totals (links with geometry or zone)
+            if any("geometry" in link or "zone" in link for link in links_data):
+                pollutant_names = result["data"]["query_info"]["pollutants"]
+                aggregator = self._new_spatial_aggregator(pollutant_names, grid_cell_size, coordinates)
+                if aggregator:
+                    with self._stage("spatial"):
+                        link_totals = np.array([
+                            [row["total_emissions_kg_per_hr"][p] for p in pollutant_names]
+                            for row in result["data"]["results"]
+                        ]).reshape(len(links_data), len(pollutant_names))
+                        self._add_spatial(aggregator, links_data, link_totals)
+                        self._attach_spatial(result["data"], aggregator, input_file)
+
+            # 9. Return success result (the calculator state lets follow-up link edits skip a full run)
+            session_state = {
+                "calculator": result.pop("state"),
+                "fleet_mix_fill": result["data"]["fleet_mix_fill"],
+                "input_file": input_file,
+            }
+            with self._stage("summary"):
+                summary = self._build_summary(result["data"], pollutants, model_year_distribution or model_year, season)
             return ToolResult(
                 success=True,
                 error=None,
                 data=result["data"],
-                summary=summary
+                summary=summary,
+                session_state=session_state
             )
 
         except Exception as e:
@@ -399,3 +547,417 @@ class MacroEmissionTool(BaseTool):
                 data=None
             )
 
+    def calculate_links(self, pollutants: List[str], model_year: int = 2020, season: str = "夏季",
+                        links_data: Optional[List[Dict]] = None, input_file: Optional[str] = None,
+                        fleet_mix: Optional[Dict] = None, default_fleet_mix: Optional[Dict] = None,
+                        model_year_distribution: Optional[Dict] = None, rate_method: str = "average",
+                        on_chunk: Optional[Callable[[pd.DataFrame], None]] = None,
+                        chunk_rows: Optional[int] = None) -> Dict:
+        """
+        Calculate links without building a ToolResult (entry point of the bulk API)
+
+        input_file (CSV/Parquet read in chunks, Excel read once and split) or links_data
+        is fixed, standardized and filled chunk by chunk as in execute and calculated with
+        calculate_stream. The columnar per-link results (link_id, length, flow, speed,
+        <pollutant>_kg_per_hr / _g_per_veh_km) of each chunk are passed to on_chunk.
+
+        Returns:
+            Calculator result dict (totals and preview rows, or status "error")
+        """
+        from config import get_config
+        config = get_config()
+
+        if input_file:
+            chunks = (
+                chunk["links_data"]
+                for chunk in self._excel_handler.iter_link_chunks(
+                    input_file, chunk_rows or config.macro_streaming_chunk_rows
+                )
+            )
+        elif isinstance(links_data, list) and links_data:
+            chunks = [links_data]
+        else:
+            return {
+                "status": "error",
+                "error_code": "INVALID_INPUT",
+                "message": "links_data must be a non-empty list"
+            }
+
+        if default_fleet_mix:
+            default_fleet_mix = self._standardize_fleet_mix(default_fleet_mix) or default_fleet_mix
+        effective_default_fleet_mix = default_fleet_mix or dict(self._calculator.DEFAULT_FLEET_MIX)
+
+        def normalized_chunks():
+            for links in chunks:
+                prepared = self._normalize_links(links, fleet_mix, effective_default_fleet_mix)
+                yield {"links_data": prepared["links_data"]}
+
+        return self._calculator.calculate_stream(
+            normalized_chunks(),
+            pollutants=pollutants,
+            model_year=model_year,
+            season=season,
+            default_fleet_mix=effective_default_fleet_mix,
+            model_year_distribution=self._standardize_model_year_distribution(model_year_distribution),
+            rate_method=rate_method,
+            on_chunk=None if on_chunk is None else (lambda chunk, frame: on_chunk(frame))
+        )
+
+    def _should_stream(self, input_file: str) -> bool:
+        """Use streaming mode for CSV/Parquet inputs above the configured size threshold"""
+        from config import get_config
+        path = Path(input_file)
+        if path.suffix.lower() not in (".csv", ".parquet") or not path.exists():
+            return False
+        threshold_bytes = get_config().macro_streaming_threshold_mb * 1024 * 1024
+        return path.stat().st_size >= threshold_bytes
+
+    def _execute_streaming(self, input_file: str, pollutants: List[str], model_year: int,
+                           model_year_distribution: Optional[Dict], season: str, rate_method: str,
+                           global_fleet_mix: Optional[Dict], default_fleet_mix: Optional[Dict],
+                           output_file: Optional[str], grid_cell_size: Optional[float] = None,
+                           coordinates: Optional[str] = None) -> ToolResult:
+        """
+        Streaming calculation for large CSV/Parquet link files
+
+        Columns are mapped once, links are read, normalized and calculated chunk by
+        chunk, and each chunk (original columns + emission columns) is appended to the
+        result file (CSV, or Parquet when MACRO_STREAMING_OUTPUT_FORMAT=parquet and
+        pyarrow is installed); only totals and a short preview stay in memory.
+        Rows that fell back to the default fleet mix are counted but their fleet
+        columns are not back-filled as in the Excel result. Link geometries and
+        zones are accumulated per chunk into a sparse grid / zone totals.
+        """
+        from config import get_config
+        config = get_config()
+
+        output_format = config.macro_streaming_output_format
+        if output_format == "parquet" and not parquet_available():
+            logger.warning("[MacroEmission] pyarrow is not installed, writing streaming results as CSV")
+            output_format = "csv"
+        elif output_format not in ("csv", "parquet"):
+            output_format = "csv"
+
+        path = Path(input_file)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_filename = f"{path.stem}_emission_results_{timestamp}.{output_format}"
+        output_path = str(Path(config.outputs_dir) / output_filename)
+        logger.info(f"[MacroEmission] Streaming mode: {input_file} -> {output_path}")
+
+        if default_fleet_mix:
+            default_fleet_mix = self._standardize_fleet_mix(default_fleet_mix) or default_fleet_mix
+        effective_default_fleet_mix = default_fleet_mix or dict(self._calculator.DEFAULT_FLEET_MIX)
+        fill_info = {"filled_count": 0, "filled_link_ids": [], "filled_row_indices": []}
+        spatial = {"aggregator": None}
+
+        def normalized_chunks():
+            for chunk in self._excel_handler.iter_link_chunks(input_file, config.macro_streaming_chunk_rows):
+                prepared = self._normalize_links(chunk["links_data"], global_fleet_mix, effective_default_fleet_mix)
+                chunk_fill = prepared["fill_info"]
+                fill_info["filled_count"] += chunk_fill["filled_count"]
+                # Only the first rows are listed; the count covers the whole file
+                room = self._calculator.STREAM_PREVIEW_ROWS - len(fill_info["filled_link_ids"])
+                if room > 0:
+                    fill_info["filled_link_ids"] += chunk_fill["filled_link_ids"][:room]
+                    fill_info["filled_row_indices"] += [
+                        chunk["row_offset"] + idx for idx in chunk_fill["filled_row_indices"][:room]
+                    ]
+                yield {"links_data": prepared["links_data"], "source": chunk["source"]}
+
+        def write_chunk(chunk, frame):
+            output = chunk["source"].copy()
+            for pollutant in dict.fromkeys(pollutants):
+                # 宏观排放单位: kg/h（列名和4位小数与 generate_result_excel 一致）
+                output[f"{pollutant}_kg_h"] = frame[f"{pollutant}_kg_per_hr"].round(4).to_numpy()
+            writer.write(output)
+
+            links = chunk["links_data"]
+            if any("geometry" in link or "zone" in link for link in links):
+                if spatial["aggregator"] is None:
+                    pollutant_names = list(dict.fromkeys(pollutants))
+                    spatial["aggregator"] = self._new_spatial_aggregator(
+                        pollutant_names, grid_cell_size, coordinates
+                    ) or False
+                if spatial["aggregator"]:
+                    columns = [f"{p}_kg_per_hr" for p in spatial["aggregator"].pollutants]
+                    self._add_spatial(spatial["aggregator"], links, frame[columns].to_numpy())
+
+        with self._stage("calculate_stream"), ResultChunkWriter(output_path) as writer:
+            result = self._calculator.calculate_stream(
+                normalized_chunks(),
+                pollutants=pollutants,
+                model_year=model_year,
+                season=season,
+                default_fleet_mix=effective_default_fleet_mix,
+                model_year_distribution=model_year_distribution,
+                rate_method=rate_method,
+                on_chunk=write_chunk
+            )
+
+        if result.get("status") == "error":
+            return ToolResult(
+                success=False,
+                error=result.get("message", result.get("error")),
+                data={
+                    "error_code": result.get("error_code"),
+                    "input_file": input_file,
+                    "query_params": {
+                        "pollutants": pollutants,
+                        "model_year": model_year,
+                        "season": season,
+                        "filled_fleet_mix_links": fill_info["filled_count"],
+                    }
+                }
+            )
+
+        result["data"]["fleet_mix_fill"] = {
+            "strategy": "default_fleet_mix",
+            **fill_info,
+            "default_fleet_mix_used": effective_default_fleet_mix,
+        }
+        result["data"]["download_file"] = {
+            "path": output_path,
+            "filename": output_filename
+        }
+        if output_file:
+            result["data"]["output_file_warning"] = (
+                f"Streaming mode writes per-link results to {output_filename} only"
+            )
+        if spatial["aggregator"]:
+            self._attach_spatial(result["data"], spatial["aggregator"], input_file)
+
+        with self._stage("summary"):
+            summary = self._build_summary(result["data"], pollutants, model_year_distribution or model_year, season)
+        # Per-link state is not kept for streamed runs; the marker makes link_updates reject them
+        return ToolResult(
+            success=True,
+            error=None,
+            data=result["data"],
+            summary=summary,
+            session_state={"streamed": True, "input_file": input_file}
+        )
+
+    def _new_spatial_aggregator(self, pollutants: List[str],
+                                grid_cell_size: Optional[float],
+                                coordinates: Optional[str] = None) -> Optional[SpatialAggregator]:
+        """Spatial aggregator for this run (None with a warning if grid_cell_size or coordinates is invalid)"""
+        try:
+            cell_size = float(grid_cell_size) if grid_cell_size is not None else None
+            return SpatialAggregator(pollutants, cell_size, coordinates)
+        except (TypeError, ValueError) as e:
+            logger.warning(
+                f"[MacroEmission] Invalid grid_cell_size {grid_cell_size!r} or coordinates {coordinates!r}, "
+                f"skipping spatial output: {e}"
+            )
+            return None
+
+    def _add_spatial(self, aggregator: SpatialAggregator, links: List[Dict], link_totals):
+        """Add one batch of link totals (links x pollutants, kg/h) by geometry and zone"""
+        geometries = [link.get("geometry") for link in links]
+        zones = [link.get("zone") for link in links]
+        aggregator.add(
+            link_totals,
+            geometries=geometries if any(g is not None for g in geometries) else None,
+            zones=zones if any(z is not None for z in zones) else None
+        )
+
+    def _attach_spatial(self, data: Dict, aggregator: SpatialAggregator, input_file: Optional[str]):
+        """Write the gridded inventory (.npz) and add grid metadata / zone totals to the result"""
+        try:
+            from config import get_config
+            spatial = {}
+            grid = aggregator.grid_info()
+            if grid:
+                stem = Path(input_file).stem if input_file else "macro"
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                filename = f"{stem}_emission_grid_{timestamp}.npz"
+                path = aggregator.save(str(Path(get_config().outputs_dir) / filename))
+                spatial["grid"] = {**grid, "file": {"path": path, "filename": filename}}
+            zones = aggregator.zone_totals
+            if zones:
+                spatial["zones"] = zones
+            if spatial:
+                data["spatial"] = spatial
+        except Exception as e:
+            logger.warning(f"Failed to build gridded emissions: {e}")
+            data["spatial_warning"] = f"Failed to build gridded emissions: {e}"
+
+    def _execute_link_updates(self, link_updates: List[Dict], session_state: Optional[Dict],
+                              kwargs: Dict) -> ToolResult:
+        """Recalculate only the edited links of the previous result and patch the totals"""
+        if not session_state:
+            return ToolResult(
+                success=False,
+                error="No previous macro emission result in this session. Run a full calculation before editing links.",
+                data=None
+            )
+
+        if session_state.get("streamed"):
+            return ToolResult(
+                success=False,
+                error=f"link_updates is not available for streamed runs: the previous result "
+                      f"({Path(session_state['input_file']).name}) was calculated in chunks without "
+                      f"per-link state. Edit the input file and run the calculation again.",
+                data=None
+            )
+
+        # The edits must target the network of the previous result, not a newly supplied one
+        if kwargs.get("links_data"):
+            return ToolResult(
+                success=False,
+                error="link_updates edits the previous result and cannot be combined with links_data. "
+                      "Run a full calculation without link_updates for a new network.",
+                data=None
+            )
+        input_file = kwargs.get("input_file") or kwargs.get("file_path")
+        previous_file = session_state.get("input_file")
+        if input_file and (not previous_file or Path(input_file).resolve() != Path(previous_file).resolve()):
+            source = f"file {Path(previous_file).name}" if previous_file else "links_data"
+            return ToolResult(
+                success=False,
+                error=f"The previous macro emission result was calculated from {source}, "
+                      f"not from {Path(input_file).name}. Run a full calculation on the new file first.",
+                data=None
+            )
+
+        params = session_state["calculator"]["params"]
+        for key in ("pollutants", "model_year", "season"):
+            if kwargs.get(key) is not None and kwargs[key] != params[key]:
+                return ToolResult(
+                    success=False,
+                    error=f"link_updates keeps the previous {key} ({params[key]}). "
+                          f"Run a full calculation without link_updates to change {key}.",
+                    data=None
+                )
+
+        if not isinstance(link_updates, list) or not all(isinstance(u, dict) for u in link_updates):
+            return ToolResult(success=False, error="link_updates must be a list of objects", data=None)
+
+        updates = []
+        for update in self._fix_common_errors(link_updates):
+            if "link_id" not in update:
+                return ToolResult(success=False, error="Each link update needs a link_id", data=None)
+            if "fleet_mix" in update:
+                fleet_mix = self._standardize_fleet_mix(update["fleet_mix"])
+                if fleet_mix:
+                    update["fleet_mix"] = fleet_mix
+                else:
+                    del update["fleet_mix"]
+            if "model_year_distribution" in update:
+                update["model_year_distribution"] = self._standardize_model_year_distribution(
+                    update["model_year_distribution"]
+                )
+            updates.append(update)
+
+        result = self._calculator.recalculate(session_state["calculator"], updates)
+        if result.get("status") == "error":
+            return ToolResult(
+                success=False,
+                error=result.get("message", result.get("error")),
+                data={"error_code": result.get("error_code")}
+            )
+
+        result["data"]["fleet_mix_fill"] = session_state["fleet_mix_fill"]
+        summary = self._build_summary(
+            result["data"], params["pollutants"],
+            params["model_year_distribution"] or params["model_year"], params["season"]
+        )
+        updated_links = result["data"]["updated_links"]
+        summary = "\n".join([
+            f"已更新 {len(updated_links)} 个路段并重新计算: {', '.join(str(i) for i in updated_links[:20])}"
+            + (" ..." if len(updated_links) > 20 else ""),
+            summary,
+            "（结果文件未重新生成，如需下载更新后的结果请重新完整计算）"
+        ])
+        return ToolResult(
+            success=True,
+            error=None,
+            data=result["data"],
+            summary=summary,
+            session_state={**session_state, "calculator": result["state"]}
+        )
+
+    def _build_summary(self, result_data: Dict, pollutants: List[str], model_year, season: str) -> str:
+        """Create enhanced summary with multi-unit formatting"""
+        links_results = result_data.get("results", [])
+        summary_data = result_data.get("summary", {})
+        query_info = result_data.get("query_info", {})
+
+        num_links = query_info.get("links_count", len(links_results))
+        if query_info.get("streaming"):
+            # Per-link statistics below would only cover the preview rows
+            links_results = []
+        pollutant_names = ", ".join(pollutants)
+        total_emissions = summary_data.get("total_emissions_kg_per_hr", {})
+
+        # Build enhanced summary with multi-unit display
+        summary_parts = [
+            f"已完成宏观排放计算，共 {num_links} 个路段",
+            f"车型年份: {'按年份分布' if isinstance(model_year, dict) else model_year}，季节: {season}，污染物: {pollutant_names}"
+        ]
+
+        # Total emissions with multi-unit display
+        if total_emissions:
+            summary_parts.append("**总排放量:**")
+            for pollutant, value_kg in total_emissions.items():
+                # Convert kg to g for formatter
+                value_g = value_kg * 1000
+                formatted = format_emission_multi_unit(value_g, "hour")
+                summary_parts.append(f"  - {pollutant}: {formatted}")
+            if all(float(v) == 0.0 for v in total_emissions.values()):
+                summary_parts.append("⚠️ 所有污染物结果为 0。请检查车型映射、污染物选择或输入参数是否有效。")
+
+        fill_count = result_data.get("fleet_mix_fill", {}).get("filled_count", 0)
+        if fill_count > 0:
+            summary_parts.append(f"**缺失车型分布处理:** 已对 {fill_count} 个路段使用默认车队组成填补空白行")
+
+        # Unit emission rates (average across all links)
+        emission_rates = {}
+        for link in links_results:
+            for pol, rate in link.get("emission_rates_g_per_veh_km", {}).items():
+                if pol not in emission_rates:
+                    emission_rates[pol] = []
+                emission_rates[pol].append(rate)
+
+        if emission_rates:
+            summary_parts.append("**单位排放率 (平均):**")
+            for pollutant, rates in emission_rates.items():
+                avg_rate = sum(rates) / len(rates)
+                summary_parts.append(f"  - {pollutant}: {avg_rate:.2f} g/(veh·km)")
+
+        # Link statistics
+        main_pollutant = pollutants[0] if pollutants else "CO2"
+        link_emissions = [
+            link.get("total_emissions_kg_per_hr", {}).get(main_pollutant, 0)
+            for link in links_results
+        ]
+        stats = calculate_stats(link_emissions)
+        if stats and stats.get("count", 0) > 0:
+            summary_parts.append(f"**路段统计 ({main_pollutant}):**")
+            summary_parts.append(f"  - 单路段平均: {stats['avg']:.2f} kg/h")
+            summary_parts.append(f"  - 单路段最高: {stats['max']:.2f} kg/h")
+            summary_parts.append(f"  - 单路段最低: {stats['min']:.2f} kg/h")
+
+        spatial = result_data.get("spatial", {})
+        grid = spatial.get("grid")
+        if grid:
+            unit = "°" if grid["coordinates"] == "geographic" else " m"
+            summary_parts.append(
+                f"**网格排放清单:** {grid['shape'][0]}×{grid['shape'][1]} 个单元（单元 {grid['cell_size']}{unit}），"
+                f"{grid['links_with_geometry']} 个路段有几何，{grid['cells_with_emissions']} 个单元有排放"
+            )
+            if grid.get("coordinates_inferred"):
+                summary_parts.append(
+                    f"⚠️ 未指定坐标类型，按坐标范围推断为{'经纬度' if grid['coordinates'] == 'geographic' else '投影坐标'}；"
+                    f"如不正确请指定 coordinates 参数"
+                )
+        zones = spatial.get("zones")
+        if zones and pollutants:
+            main_pollutant = pollutants[0]
+            top = sorted(zones.items(), key=lambda item: item[1].get(main_pollutant, 0), reverse=True)[:5]
+            summary_parts.append(f"**分区汇总 ({main_pollutant}, 共 {len(zones)} 个分区):**")
+            for zone, totals in top:
+                summary_parts.append(f"  - {zone}: {totals.get(main_pollutant, 0):.2f} kg/h")
+
+        return "\n".join(summary_parts)
+
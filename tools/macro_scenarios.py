@@ -0,0 +1,152 @@
+"""
+Macro Emission Scenario Tool
+
+Compares total road network emissions under several parameter perturbations
+(fleet electrification, speed changes, speed limits, flow changes) in one call.
+Links are read and normalized exactly like calculate_macro_emission.
+"""
+from typing import Dict, List
+import logging
+from .base import ToolResult
+from .formatter import format_emission_multi_unit
+from .macro_emission import MacroEmissionTool
+
+logger = logging.getLogger(__name__)
+
+
+class MacroScenarioTool(MacroEmissionTool):
+    """Compare macro-scale emissions of a road network across scenarios"""
+
+    @property
+    def name(self) -> str:
+        return "compare_macro_scenarios"
+
+    @property
+    def description(self) -> str:
+        return "Compare road network emissions across fleet, speed and flow scenarios"
+
+    def _standardize_scenarios(self, scenarios: List[Dict]) -> List[Dict]:
+        """Standardize vehicle names in electrify maps"""
+        from services.standardizer import get_standardizer
+        standardizer = get_standardizer()
+
+        standardized = []
+        for scenario in scenarios:
+            scenario = dict(scenario)
+            electrify = scenario.get("electrify")
+            if isinstance(electrify, dict):
+                mapped = {}
+                for raw_name, percent in electrify.items():
+                    std_name = standardizer.standardize_vehicle(str(raw_name)) or raw_name
+                    mapped[std_name] = percent
+                scenario["electrify"] = mapped
+            standardized.append(scenario)
+        return standardized
+
+    def _build_table(self, scenarios: List[Dict], pollutants: List[str]) -> Dict:
+        """Comparison table in the frontend table format"""
+        columns = ["情景"]
+        for pollutant in pollutants:
+            columns += [f"{pollutant} (kg/h)", f"{pollutant} 变化 (%)"]
+
+        rows = []
+        for scenario in scenarios:
+            row = {"情景": scenario["name"]}
+            for pollutant in pollutants:
+                change = scenario["change_pct"][pollutant]
+                row[f"{pollutant} (kg/h)"] = f"{scenario['total_emissions_kg_per_hr'][pollutant]:.2f}"
+                row[f"{pollutant} 变化 (%)"] = "-" if change is None else f"{change:+.2f}"
+            rows.append(row)
+
+        return {
+            "type": "compare_macro_scenarios",
+            "columns": columns,
+            "preview_rows": rows,
+            "total_rows": len(rows),
+            "total_columns": len(columns),
+        }
+
+    async def execute(self, **kwargs) -> ToolResult:
+        """
+        Execute scenario comparison
+
+        Parameters (already standardized by executor):
+            scenarios: List[Dict] - Perturbations, each with optional name, flow_scale,
+                speed_scale, speed_change_kph, speed_limit_kph, electrify ({vehicle: percent})
+            links_data / file_path / fleet_mix / default_fleet_mix: Base network, as in
+                calculate_macro_emission
+            pollutants, model_year, model_year_distribution, season, rate_method: As in
+                calculate_macro_emission
+        """
+        try:
+            scenarios = kwargs.get("scenarios")
+            if not isinstance(scenarios, list) or not scenarios or not all(isinstance(s, dict) for s in scenarios):
+                return ToolResult(
+                    success=False,
+                    error="scenarios must be a non-empty list of objects",
+                    data=None
+                )
+
+            pollutants = kwargs.get("pollutants", ["CO2", "NOx"])
+            model_year = kwargs.get("model_year", 2020)
+            season = kwargs.get("season", "夏季")
+            model_year_distribution = self._standardize_model_year_distribution(
+                kwargs.get("model_year_distribution")
+            )
+
+            prepared, error_result = self._prepare_links(
+                kwargs.get("links_data"),
+                kwargs.get("input_file") or kwargs.get("file_path"),
+                kwargs.get("fleet_mix"),
+                kwargs.get("default_fleet_mix")
+            )
+            if error_result:
+                return error_result
+
+            result = self._calculator.calculate_scenarios(
+                links_data=prepared["links_data"],
+                scenarios=self._standardize_scenarios(scenarios),
+                pollutants=pollutants,
+                model_year=model_year,
+                season=season,
+                default_fleet_mix=prepared["default_fleet_mix"],
+                model_year_distribution=model_year_distribution,
+                rate_method=kwargs.get("rate_method") or "average"
+            )
+            if result.get("status") == "error":
+                return ToolResult(
+                    success=False,
+                    error=result.get("message", result.get("error")),
+                    data={"error_code": result.get("error_code")}
+                )
+
+            data = result["data"]
+            pollutants = data["query_info"]["pollutants"]
+            summary_parts = [
+                f"已完成 {len(data['scenarios']) - 1} 个情景的宏观排放对比，共 {data['query_info']['links_count']} 个路段",
+                f"车型年份: {'按年份分布' if model_year_distribution else model_year}，季节: {season}"
+            ]
+            for scenario in data["scenarios"]:
+                summary_parts.append(f"**{scenario['name']}:**")
+                for pollutant in pollutants:
+                    value_g = scenario["total_emissions_kg_per_hr"][pollutant] * 1000
+                    change = scenario["change_pct"][pollutant]
+                    change_text = "" if change is None or scenario is data["scenarios"][0] else f"（{change:+.2f}%）"
+                    summary_parts.append(
+                        f"  - {pollutant}: {format_emission_multi_unit(value_g, 'hour')}{change_text}"
+                    )
+
+            return ToolResult(
+                success=True,
+                error=None,
+                data=data,
+                summary="\n".join(summary_parts),
+                table_data=self._build_table(data["scenarios"], pollutants)
+            )
+
+        except Exception as e:
+            return ToolResult(
+                success=False,
+                error=f"Macro scenario comparison failed: {str(e)}",
+                data=None
+            )
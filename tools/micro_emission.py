@@ -4,9 +4,11 @@ Micro Emission Calculation Tool
 Simplified tool for calculating second-by-second emissions from trajectory data.
 Standardization is handled by the executor layer.
 """
-from typing import Dict, Optional, List
+from typing import Callable, Dict, Optional, List
 from pathlib import Path
+from datetime import datetime
 import logging
+import pandas as pd
 from .base import BaseTool, ToolResult
 from .formatter import format_emission, calculate_stats
 from calculators.micro_emission import MicroEmissionCalculator
@@ -50,6 +52,8 @@ class MicroEmissionTool(BaseTool):
             trajectory_data: List[Dict] (optional) - Trajectory data points
             input_file: str (optional) - Path to Excel input file
             output_file: str (optional) - Path to Excel output file
+            summary_only: bool (optional) - Only compute totals and the opMode
+                distribution; no per-second rows or result files are produced
         """
         try:
             # 参数名兼容：file_path → input_file
@@ -72,6 +76,14 @@ class MicroEmissionTool(BaseTool):
             input_file = kwargs.get("input_file")
             output_file = kwargs.get("output_file")
             trajectory_data = kwargs.get("trajectory_data")
+            summary_only = bool(kwargs.get("summary_only", False))
+
+            # Multi-vehicle files (with a vehicle id column) are computed per vehicle;
+            # vehicle_type/model_year then only fill rows without their own values
+            if input_file and self._excel_handler.find_vehicle_id_column(input_file):
+                return self._execute_batch(
+                    input_file, vehicle_type, pollutants, model_year, season, summary_only
+                )
 
             # 2. Validate required parameters
             if not vehicle_type:
@@ -82,7 +94,12 @@ class MicroEmissionTool(BaseTool):
                 )
 
             # 3. Get trajectory data (from parameter or file)
-            if input_file:
+            if input_file and self._should_stream(input_file):
+                # Large CSV logs are processed chunk by chunk with bounded memory
+                return self._execute_streaming(
+                    input_file, vehicle_type, pollutants, model_year, season, output_file, summary_only
+                )
+            elif input_file:
                 # Read from Excel file
                 success, trajectory_data, read_error = self._excel_handler.read_trajectory_from_excel(input_file)
                 if not success:
@@ -106,14 +123,24 @@ class MicroEmissionTool(BaseTool):
                     data=None
                 )
 
-            # 5. Execute calculation
+            # 5. Execute calculation (long trajectories use the compact columnar result,
+            #    summary-only requests skip per-second results entirely)
+            from config import get_config
+            if summary_only:
+                result_format = "summary"
+            elif len(trajectory_data) >= get_config().micro_columnar_threshold_points:
+                result_format = "columnar"
+            else:
+                result_format = "rows"
             result = self._calculator.calculate(
                 trajectory_data=trajectory_data,
                 vehicle_type=vehicle_type,
                 pollutants=pollutants,
                 model_year=model_year,
-                season=season
+                season=season,
+                result_format=result_format
             )
+            results_frame = result.get("data", {}).get("results_columns")
 
             # 6. Handle calculation errors
             if result.get("status") == "error":
@@ -133,7 +160,20 @@ class MicroEmissionTool(BaseTool):
                 )
 
             # 7. Write output file (if specified)
-            if output_file:
+            if output_file and summary_only:
+                result["data"]["output_file_warning"] = "Summary-only mode does not write per-second results"
+
+            elif output_file and results_frame is not None:
+                write_success, write_error = self._excel_handler.write_result_frame_to_excel(
+                    output_file, results_frame, pollutants
+                )
+
+                if not write_success:
+                    result["data"]["output_file_warning"] = f"Failed to write output file: {write_error}"
+                else:
+                    result["data"]["output_file"] = output_file
+
+            elif output_file:
                 results_data = result["data"].get("results", [])
 
                 # Build trajectory data with VSP
@@ -163,14 +203,17 @@ class MicroEmissionTool(BaseTool):
                     result["data"]["output_file"] = output_file
 
             # 8. Generate download file (if input_file provided)
-            if input_file:
+            if input_file and not summary_only:
                 try:
                     from config import get_config
                     config = get_config()
                     outputs_dir = str(config.outputs_dir)
 
-                    results_data = result["data"].get("results", [])
-                    emission_list = [point.get("emissions", {}) for point in results_data]
+                    if results_frame is not None:
+                        emission_list = results_frame
+                    else:
+                        results_data = result["data"].get("results", [])
+                        emission_list = [point.get("emissions", {}) for point in results_data]
 
                     success, output_path, filename, error = self._excel_handler.generate_result_excel(
                         input_file,  # 修复：传递文件路径而不是轨迹数据
@@ -188,48 +231,10 @@ class MicroEmissionTool(BaseTool):
                     logger.warning(f"Failed to generate download file: {e}")
 
             # 9. Return success result with enhanced summary
-            results_data = result["data"].get("results", [])
-            summary_data = result["data"].get("summary", {})
-
-            num_points = len(results_data)
-            pollutant_names = ", ".join(pollutants)
-            total_emissions = summary_data.get("total_emissions_g", {})
-
-            # Build enhanced summary with multi-unit display
-            summary_parts = [
-                f"已完成微观排放计算",
-                f"**计算参数:**",
-                f"  - 车型: {vehicle_type} ({model_year}年)",
-                f"  - 季节: {season}",
-                f"  - 污染物: {pollutant_names}",
-                f"  - 轨迹数据点: {num_points} 个"
-            ]
-
-            # Total emissions with multi-unit display
-            if total_emissions:
-                summary_parts.append("**总排放量:**")
-                for pollutant, value_g in total_emissions.items():
-                    formatted = format_emission(value_g, "", "")
-                    summary_parts.append(f"  - {pollutant}: {formatted}")
-
-            # Additional statistics
-            total_distance_km = summary_data.get("total_distance_km", 0)
-            total_time_s = summary_data.get("total_time_s", 0)
-            emission_rates = summary_data.get("emission_rates_g_per_km", {})
-
-            if total_distance_km > 0:
-                avg_speed_kph = (total_distance_km / (total_time_s / 3600)) if total_time_s > 0 else 0
-                summary_parts.append("**运行统计:**")
-                summary_parts.append(f"  - 总距离: {total_distance_km:.2f} km")
-                summary_parts.append(f"  - 总时间: {total_time_s} 秒 ({total_time_s/60:.1f} 分钟)")
-                summary_parts.append(f"  - 平均速度: {avg_speed_kph:.1f} km/h")
-
-            if emission_rates:
-                summary_parts.append("**排放率:**")
-                for pollutant, rate in emission_rates.items():
-                    summary_parts.append(f"  - {pollutant}: {rate:.2f} g/km")
-
-            summary = "\n".join(summary_parts)
+            summary = self._build_summary(
+                vehicle_type, model_year, season, pollutants,
+                result["data"]["query_info"]["trajectory_points"], result["data"].get("summary", {})
+            )
 
             return ToolResult(
                 success=True,
@@ -244,3 +249,288 @@ class MicroEmissionTool(BaseTool):
                 error=f"Micro emission calculation failed: {str(e)}",
                 data=None
             )
+
+    def calculate_trajectory(self, vehicle_type: str, pollutants: List[str], model_year: int = 2020,
+                             season: str = "夏季", trajectory_data: Optional[List[Dict]] = None,
+                             input_file: Optional[str] = None,
+                             on_chunk: Optional[Callable[[pd.DataFrame], None]] = None,
+                             chunk_rows: Optional[int] = None) -> Dict:
+        """
+        Calculate a trajectory without building a ToolResult (entry point of the bulk API)
+
+        input_file (CSV read in chunks, Excel read once and split) is calculated with
+        calculate_stream, trajectory_data in one piece. The columnar per-second results
+        (t, speed_kph, speed_mph, vsp, opmode, <pollutant> g/s) are passed to on_chunk.
+
+        Returns:
+            Calculator result dict (summary and preview rows, or status "error")
+        """
+        if input_file:
+            from config import get_config
+
+            def write_chunk(chunk, vsp_result, emission_columns):
+                on_chunk(self._calculator.chunk_result_frame(chunk, vsp_result, emission_columns))
+
+            return self._calculator.calculate_stream(
+                self._excel_handler.iter_trajectory_chunks(
+                    input_file, chunk_rows or get_config().micro_streaming_chunk_rows
+                ),
+                vehicle_type=vehicle_type,
+                pollutants=pollutants,
+                model_year=model_year,
+                season=season,
+                on_chunk=None if on_chunk is None else write_chunk
+            )
+
+        result = self._calculator.calculate(
+            trajectory_data=trajectory_data,
+            vehicle_type=vehicle_type,
+            pollutants=pollutants,
+            model_year=model_year,
+            season=season,
+            result_format="columnar"
+        )
+        if result.get("status") != "error":
+            frame = result["data"].pop("results_columns")
+            if on_chunk is not None:
+                on_chunk(frame)
+        return result
+
+    def _should_stream(self, input_file: str) -> bool:
+        """Use streaming mode for CSV inputs above the configured size threshold"""
+        from config import get_config
+        path = Path(input_file)
+        if path.suffix.lower() != ".csv" or not path.exists():
+            return False
+        threshold_bytes = get_config().micro_streaming_threshold_mb * 1024 * 1024
+        return path.stat().st_size >= threshold_bytes
+
+    def _execute_streaming(self, input_file: str, vehicle_type: str, pollutants: List[str],
+                           model_year: int, season: str, output_file: Optional[str],
+                           summary_only: bool = False) -> ToolResult:
+        """
+        Streaming calculation for large CSV trajectories
+
+        Rows are read in chunks, emissions are computed per chunk and appended
+        to the result CSV directly; only totals and a short preview stay in memory.
+        In summary-only mode no result CSV is written.
+        """
+        from config import get_config
+        config = get_config()
+
+        path = Path(input_file)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_filename = f"{path.stem}_emission_results_{timestamp}.csv"
+        output_path = str(Path(config.outputs_dir) / output_filename)
+        logger.info(f"[MicroEmission] Streaming mode: {input_file} -> {output_path}")
+
+        chunks_written = [0]
+
+        def write_chunk(chunk, vsp_result, emission_columns):
+            self._excel_handler.append_result_chunk(
+                output_path, chunk["source"], emission_columns, pollutants,
+                write_header=chunks_written[0] == 0
+            )
+            chunks_written[0] += 1
+
+        result = self._calculator.calculate_stream(
+            self._excel_handler.iter_trajectory_chunks(input_file, config.micro_streaming_chunk_rows),
+            vehicle_type=vehicle_type,
+            pollutants=pollutants,
+            model_year=model_year,
+            season=season,
+            on_chunk=None if summary_only else write_chunk
+        )
+
+        if result.get("status") == "error":
+            return ToolResult(
+                success=False,
+                error=result.get("message", result.get("error")),
+                data={
+                    "error_code": result.get("error_code"),
+                    "input_file": input_file,
+                    "query_params": {
+                        "vehicle_type": vehicle_type,
+                        "pollutants": pollutants,
+                        "model_year": model_year,
+                        "season": season
+                    }
+                }
+            )
+
+        if summary_only:
+            result["data"]["results"] = []
+            if output_file:
+                result["data"]["output_file_warning"] = "Summary-only mode does not write per-second results"
+        else:
+            result["data"]["download_file"] = {
+                "path": output_path,
+                "filename": output_filename
+            }
+            if output_file:
+                result["data"]["output_file_warning"] = (
+                    f"Streaming mode writes per-second results to {output_filename} only"
+                )
+
+        summary = self._build_summary(
+            vehicle_type, model_year, season, pollutants,
+            result["data"]["query_info"]["trajectory_points"], result["data"].get("summary", {})
+        )
+
+        return ToolResult(
+            success=True,
+            error=None,
+            data=result["data"],
+            summary=summary
+        )
+
+    def _execute_batch(self, input_file: str, vehicle_type: Optional[str], pollutants: List[str],
+                       model_year: int, season: str, summary_only: bool = False) -> ToolResult:
+        """
+        Batch calculation for multi-vehicle trajectory files
+
+        Rows are grouped by vehicle id; vehicle type and model year come from
+        their own columns when present. Each distinct vehicle type name is
+        standardized once. Per-second emissions are written to a CSV download
+        unless summary_only is set.
+        """
+        import numpy as np
+        from config import get_config
+
+        success, fleet_data, read_error = self._excel_handler.read_fleet_trajectory(input_file)
+        if not success:
+            return ToolResult(
+                success=False,
+                error=f"Failed to read input file: {read_error}",
+                data={"input_file": input_file}
+            )
+
+        # Standardize each distinct vehicle type name once
+        raw_types = fleet_data["vehicle_type"]
+        type_mapping, unrecognized = self._standardize_vehicle_names(raw_types)
+        if unrecognized and not vehicle_type:
+            return ToolResult(
+                success=False,
+                error=f"Cannot recognize vehicle types: {', '.join(unrecognized)}",
+                data={"input_file": input_file, "unrecognized_vehicle_types": unrecognized}
+            )
+        missing_type = [name is None for name in raw_types]
+        if any(missing_type) and not vehicle_type:
+            return ToolResult(
+                success=False,
+                error="Missing required parameter: vehicle_type (some rows have no vehicle type)",
+                data={"input_file": input_file}
+            )
+        fleet_data["vehicle_type"] = np.array([
+            vehicle_type if name is None else type_mapping.get(str(name).strip(), vehicle_type)
+            for name in raw_types
+        ], dtype=object)
+
+        years = fleet_data["model_year"]
+        fleet_data["model_year"] = np.where(np.isnan(years), model_year, years).astype(np.int64)
+
+        result = self._calculator.calculate_batch(fleet_data, pollutants=pollutants, season=season)
+        if result.get("status") == "error":
+            return ToolResult(
+                success=False,
+                error=result.get("message", result.get("error")),
+                data={
+                    "error_code": result.get("error_code"),
+                    "input_file": input_file,
+                    "valid_vehicle_types": result.get("valid_vehicle_types")
+                }
+            )
+
+        data = result["data"]
+        if unrecognized:
+            data["vehicle_type_fallbacks"] = {name: vehicle_type for name in unrecognized}
+
+        # Per-second results: original rows + emission columns
+        if not summary_only:
+            try:
+                config = get_config()
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                output_filename = f"{Path(input_file).stem}_fleet_emission_results_{timestamp}.csv"
+                output_path = str(Path(config.outputs_dir) / output_filename)
+                self._excel_handler.append_result_chunk(
+                    output_path, fleet_data["source"], result["emission_columns"], pollutants,
+                    write_header=True
+                )
+                data["download_file"] = {"path": output_path, "filename": output_filename}
+            except Exception as e:
+                logger.warning(f"Failed to generate download file: {e}")
+
+        fleet_summary = data["summary"]
+        summary = self._build_summary(
+            ", ".join(data["query_info"]["vehicle_types"]),
+            ", ".join(str(year) for year in data["query_info"]["model_years"]),
+            season, pollutants, data["query_info"]["trajectory_points"], fleet_summary,
+            title=f"已完成微观排放批量计算（{fleet_summary['vehicle_count']} 辆车）"
+        )
+
+        return ToolResult(
+            success=True,
+            error=None,
+            data=data,
+            summary=summary
+        )
+
+    @staticmethod
+    def _standardize_vehicle_names(raw_names) -> tuple:
+        """Map each distinct raw vehicle type name to its standard name"""
+        from services.standardizer import get_standardizer
+        standardizer = get_standardizer()
+
+        mapping = {}
+        unrecognized = []
+        for raw_name in {str(name).strip() for name in raw_names if name is not None}:
+            std_name = standardizer.standardize_vehicle(raw_name)
+            if std_name:
+                mapping[raw_name] = std_name
+            else:
+                unrecognized.append(raw_name)
+        return mapping, sorted(unrecognized)
+
+    @staticmethod
+    def _build_summary(vehicle_type: str, model_year: int, season: str, pollutants: List[str],
+                       num_points: int, summary_data: Dict,
+                       title: str = "已完成微观排放计算") -> str:
+        """Build the multi-unit text summary shown to the user"""
+        pollutant_names = ", ".join(pollutants)
+        total_emissions = summary_data.get("total_emissions_g", {})
+
+        # Build enhanced summary with multi-unit display
+        summary_parts = [
+            title,
+            f"**计算参数:**",
+            f"  - 车型: {vehicle_type} ({model_year}年)",
+            f"  - 季节: {season}",
+            f"  - 污染物: {pollutant_names}",
+            f"  - 轨迹数据点: {num_points} 个"
+        ]
+
+        # Total emissions with multi-unit display
+        if total_emissions:
+            summary_parts.append("**总排放量:**")
+            for pollutant, value_g in total_emissions.items():
+                formatted = format_emission(value_g, "", "")
+                summary_parts.append(f"  - {pollutant}: {formatted}")
+
+        # Additional statistics
+        total_distance_km = summary_data.get("total_distance_km", 0)
+        total_time_s = summary_data.get("total_time_s", 0)
+        emission_rates = summary_data.get("emission_rates_g_per_km", {})
+
+        if total_distance_km > 0:
+            avg_speed_kph = (total_distance_km / (total_time_s / 3600)) if total_time_s > 0 else 0
+            summary_parts.append("**运行统计:**")
+            summary_parts.append(f"  - 总距离: {total_distance_km:.2f} km")
+            summary_parts.append(f"  - 总时间: {total_time_s} 秒 ({total_time_s/60:.1f} 分钟)")
+            summary_parts.append(f"  - 平均速度: {avg_speed_kph:.1f} km/h")
+
+        if emission_rates:
+            summary_parts.append("**排放率:**")
+            for pollutant, rate in emission_rates.items():
+                summary_parts.append(f"  - {pollutant}: {rate:.2f} g/km")
+
+        return "\n".join(summary_parts)
@@ -86,6 +86,12 @@ def init_tools():
     except Exception as e:
         logger.error(f"Failed to register emission_factors tool: {e}")
 
+    try:
+        from tools.emission_factor_interpolation import EmissionFactorInterpolationTool
+        register_tool("interpolate_emission_factors", EmissionFactorInterpolationTool())
+    except Exception as e:
+        logger.error(f"Failed to register emission_factor_interpolation tool: {e}")
+
     try:
         from tools.micro_emission import MicroEmissionTool
         register_tool("calculate_micro_emission", MicroEmissionTool())
@@ -98,6 +104,12 @@ def init_tools():
     except Exception as e:
         logger.error(f"Failed to register macro_emission tool: {e}")
 
+    try:
+        from tools.macro_scenarios import MacroScenarioTool
+        register_tool("compare_macro_scenarios", MacroScenarioTool())
+    except Exception as e:
+        logger.error(f"Failed to register macro_scenarios tool: {e}")
+
     try:
         from tools.file_analyzer import FileAnalyzerTool
         register_tool("analyze_file", FileAnalyzerTool())